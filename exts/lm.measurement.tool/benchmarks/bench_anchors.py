@@ -0,0 +1,73 @@
+'''
+Cost of keeping anchored measurements on moving prims. Rulers are placed
+between random points of random meshes under /World, then one mesh is dragged
+for a number of frames and, for comparison, /World itself, which moves every
+ruler. Each frame applies the change notices and moves the points in the model:
+    python benchmarks/bench_anchors.py --meshes 100 --rulers 10000 --frames 100
+Needs numpy and usd-core only.
+'''
+
+import argparse
+import time
+
+import numpy as np
+from pxr import Gf, UsdGeom
+
+import fakes
+from scenes import make_stage
+
+
+# Per frame milliseconds of dragging the prim at path, one translation step per frame
+def drag(stage, anchors, model, path, frames):
+    op = UsdGeom.Xformable(stage.GetPrimAtPath(path)).AddTranslateOp(opSuffix="drag")
+    samples = []
+    moved = 0
+    for frame in range(frames):
+        op.Set(Gf.Vec3d(0.0, 0.0, float(frame + 1)))
+        start = time.perf_counter()
+        for move in anchors.update():
+            model.move_points(move.indices, move.positions, move.group_id, move.segment_transforms)
+            moved += len(move.indices)
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return np.array(samples), moved / max(frames, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--meshes", type=int, default=100)
+    parser.add_argument("--rulers", type=int, default=10000)
+    parser.add_argument("--frames", type=int, default=100)
+    args = parser.parse_args()
+
+    stage = make_stage(args.meshes, 2)
+    UsdGeom.Xform.Define(stage, "/World")
+    fakes.install(stage)
+    from lm.measurement.tool.anchors import PointAnchors
+    from lm.measurement.tool.ruler_model import RulerModel
+
+    anchors = PointAnchors(stage)
+    model = RulerModel()
+    rng = np.random.default_rng(0)
+    meshes = rng.integers(0, args.meshes, (args.rulers, 2))
+    x = rng.random((args.rulers, 2)) * 100.0 + meshes * 120.0
+    points = np.stack((x, rng.random((args.rulers, 2)) * 100.0, np.zeros((args.rulers, 2))), axis=2)
+    start = time.perf_counter()
+    for ruler in range(args.rulers):
+        group_id = model.new_group()
+        for end in range(2):
+            path = f"/World/Mesh_{meshes[ruler, end]}"
+            model.add_point(points[ruler, end], group_id, path)
+            anchors.add(group_id, end, path, points[ruler, end])
+    anchors.update()
+    print(f"{args.rulers} rulers on {args.meshes} meshes, anchored in {(time.perf_counter() - start) * 1000.0:.1f} ms")
+
+    for path in ("/World/Mesh_0", "/World"):
+        samples, moved = drag(stage, anchors, model, path, args.frames)
+        print(
+            f"drag {path:>14}: {moved:8.0f} points moved per frame"
+            f" | p50 {np.percentile(samples, 50):8.3f} ms p95 {np.percentile(samples, 95):8.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+'''
+Cost of area and volume readouts over an assembly of closed UV spheres of
+radius 10, each resolution x 2 resolution faces (triangles at the poles, quads
+elsewhere), compared with the exact area and volume of the sphere's polyhedron.
+Times the first measurement of every mesh on the thread pool, measuring the
+assembly again from the cache and one mesh after an edit. --python also sums
+the first mesh in a plain Python loop over its triangles:
+    python benchmarks/bench_area_volume.py --meshes 10 --resolution 700 --workers 1,4
+    python benchmarks/bench_area_volume.py --meshes 2 --resolution 100 --python
+Needs numpy and usd-core only.
+'''
+
+import argparse
+import time
+
+import numpy as np
+
+from fakes import load_tool_package
+from scenes import MeshBackend, make_sphere
+
+
+# Triangle by triangle, the loop the vectorized sums replace
+def python_area_volume(points, triangles):
+    area = volume = 0.0
+    for i0, i1, i2 in triangles.tolist():
+        a, b, c = points[i0].tolist(), points[i1].tolist(), points[i2].tolist()
+        u = [b[k] - a[k] for k in range(3)]
+        v = [c[k] - a[k] for k in range(3)]
+        cross = [u[1] * v[2] - u[2] * v[1], u[2] * v[0] - u[0] * v[2], u[0] * v[1] - u[1] * v[0]]
+        area += 0.5 * (cross[0] ** 2 + cross[1] ** 2 + cross[2] ** 2) ** 0.5
+        volume += (
+            a[0] * (b[1] * c[2] - b[2] * c[1]) + a[1] * (b[2] * c[0] - b[0] * c[2]) + a[2] * (b[0] * c[1] - b[1] * c[0])
+        ) / 6.0
+    return area, volume
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--meshes", type=int, default=10)
+    parser.add_argument(
+        "--resolution", type=int, default=700, help="stacks per sphere, about 4 * resolution^2 triangles each"
+    )
+    parser.add_argument("--workers", default="1", help="comma separated thread pool sizes")
+    parser.add_argument("--python", action="store_true", help="also time a plain Python loop over the first mesh")
+    args = parser.parse_args()
+
+    load_tool_package()
+    from lm.measurement.tool.area_volume import AreaVolumeCache
+
+    meshes = [
+        make_sphere(f"/World/Sphere_{i}", args.resolution, np.array((i * 25.0, 0.0, 0.0))) for i in range(args.meshes)
+    ]
+    start = time.perf_counter()
+    for data in meshes:
+        data.triangles
+    triangles = sum(len(data.triangles) for data in meshes)
+    elapsed = (time.perf_counter() - start) * 1000.0
+    print(f"{args.meshes} meshes, {triangles} triangles | triangulation {elapsed:.1f} ms")
+
+    # Exact values for the polyhedron, the sphere's ring of quads between polar angles t0 and t1 is a frustum band
+    resolution = args.resolution
+    theta = np.linspace(0.0, np.pi, resolution + 1)
+    slices = 2 * resolution
+    radii = 10.0 * np.sin(theta)
+    heights = 10.0 * np.cos(theta)
+    side = 2.0 * np.sin(np.pi / slices)
+    apothem = np.cos(np.pi / slices)
+    slant = np.sqrt((np.diff(heights)) ** 2 + (np.diff(radii) * apothem) ** 2)
+    area = float(slices * (0.5 * side * (radii[:-1] + radii[1:]) * slant).sum())
+    polygon = 0.5 * slices * np.sin(2.0 * np.pi / slices) * radii ** 2
+    volume = float((-np.diff(heights) * (polygon[:-1] + polygon[1:] + np.sqrt(polygon[:-1] * polygon[1:])) / 3.0).sum())
+
+    paths = ["/World"] + [data.path for data in meshes[:2]]
+    for workers in [int(value) for value in args.workers.split(",") if value]:
+        backend = MeshBackend(meshes)
+        cache = AreaVolumeCache(backend, workers)
+        start = time.perf_counter()
+        result = cache.measure(paths)[0]
+        first = (time.perf_counter() - start) * 1000.0
+        start = time.perf_counter()
+        cache.measure(paths)
+        again = (time.perf_counter() - start) * 1000.0
+        cache.invalidate([meshes[0].path])
+        start = time.perf_counter()
+        cache.measure(paths)
+        edited = (time.perf_counter() - start) * 1000.0
+        cache.shutdown()
+        mesh = result.meshes[0]
+        print(
+            f"workers {workers}: first {first:8.1f} ms ({result.triangle_count / first / 1e3:.1f} M triangles/s),"
+            f" cached {again:.3f} ms, one mesh edited {edited:.1f} ms"
+            f" | area {mesh.area:.6f} (exact {area:.6f}) volume {mesh.volume:.6f} (exact {volume:.6f})"
+            f" closed {result.closed}"
+        )
+
+    if args.python:
+        start = time.perf_counter()
+        python_area_volume(meshes[0].world_points, meshes[0].triangles)
+        elapsed = (time.perf_counter() - start) * 1000.0
+        rate = len(meshes[0].triangles) / elapsed / 1e3
+        print(f"python loop over one mesh: {elapsed:.1f} ms ({rate:.3f} M triangles/s)")
+
+
+if __name__ == "__main__":
+    main()
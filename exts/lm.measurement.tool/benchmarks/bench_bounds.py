@@ -0,0 +1,88 @@
+'''
+Cost of box dimensions: measuring a prim's axis aligned and oriented box the
+first time, selecting it again (a cache lookup) and measuring it again after a
+stage edit. Each mesh is a wavy grid tilted by a random rotation, so its
+oriented box is much smaller than its axis aligned one. --check compares each
+oriented box with the best of a brute force sweep over rotations:
+    python benchmarks/bench_bounds.py --meshes 4 --resolution 700
+    python benchmarks/bench_bounds.py --meshes 8 --resolution 30 --check
+Needs numpy and usd-core only.
+'''
+
+import argparse
+import time
+
+import numpy as np
+from pxr import Gf, UsdGeom
+
+from fakes import load_tool_package
+from scenes import make_stage
+
+
+# Smallest box volume over a grid of rotations, only feasible for small point sets
+def brute_force(points, steps=24):
+    angles = np.linspace(0.0, np.pi, steps, endpoint=False)
+    best = np.inf
+    for a in angles:
+        for b in angles:
+            for c in angles:
+                rotation = Gf.Matrix3d(
+                    Gf.Rotation(Gf.Vec3d(1, 0, 0), np.degrees(a))
+                    * Gf.Rotation(Gf.Vec3d(0, 1, 0), np.degrees(b))
+                    * Gf.Rotation(Gf.Vec3d(0, 0, 1), np.degrees(c))
+                )
+                projected = points @ np.array(rotation)
+                best = min(best, float(np.prod(np.ptp(projected, axis=0))))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--meshes", type=int, default=4)
+    parser.add_argument(
+        "--resolution", type=int, default=700, help="quads per side, points per mesh = (resolution + 1)^2"
+    )
+    parser.add_argument("--check", action="store_true", help="compare with a brute force sweep over rotations")
+    args = parser.parse_args()
+
+    load_tool_package()
+    from lm.measurement.tool.bounds import BoundsCache
+
+    stage = make_stage(args.meshes, args.resolution)
+    rng = np.random.default_rng(0)
+    for i in range(args.meshes):
+        xformable = UsdGeom.Xformable(stage.GetPrimAtPath(f"/World/Mesh_{i}"))
+        xformable.AddRotateXYZOp().Set(Gf.Vec3f(*rng.uniform(0.0, 90.0, 3)))
+    cache = BoundsCache(stage)
+    paths = [f"/World/Mesh_{i}" for i in range(args.meshes)] + ["/World"]
+
+    for path in paths:
+        samples = []
+        start = time.perf_counter()
+        bounds = cache.get(path)
+        samples.append((time.perf_counter() - start) * 1000.0)
+        start = time.perf_counter()
+        cache.get(path)
+        samples.append((time.perf_counter() - start) * 1000.0)
+        line = (
+            f"{path:>14}: {bounds.point_count:8d} points, first {samples[0]:8.1f} ms, again {samples[1]:.4f} ms"
+            f" | aligned {np.round(bounds.aligned_size, 2)} oriented {np.round(bounds.size, 2)}"
+        )
+        if args.check and path != "/World":
+            points = np.concatenate([cache._gprim_points(stage.GetPrimAtPath(path))])
+            line += f" | volume {float(np.prod(bounds.size)):.1f}, rotation sweep {brute_force(points):.1f}"
+        print(line)
+
+    # Moving one mesh drops its box and the box of /World, the others stay cached
+    xformable = UsdGeom.Xformable(stage.GetPrimAtPath("/World/Mesh_0"))
+    xformable.AddTranslateOp().Set(Gf.Vec3d(0.0, 0.0, 50.0))
+    dropped = cache.update()
+    start = time.perf_counter()
+    for path in paths:
+        cache.get(path)
+    elapsed = (time.perf_counter() - start) * 1000.0
+    print(f"after moving /World/Mesh_0: dropped {sorted(dropped)}, measured again in {elapsed:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
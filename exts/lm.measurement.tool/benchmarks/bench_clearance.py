@@ -0,0 +1,81 @@
+'''
+Cost of clearance queries: the exact closest pair of points between two wavy
+grid meshes, placed side by side, stacked nearly parallel (the hardest case
+for the bounds, large areas lie at almost the closest distance) and
+interpenetrating. BVH builds are timed separately, the raycast backend has
+usually built them already. The first query of a mesh pair also computes the
+per triangle bounds and leaf slabs the search uses, later ones reuse them.
+--check compares small meshes with brute force:
+    python benchmarks/bench_clearance.py --resolution 700
+    python benchmarks/bench_clearance.py --resolution 20 --check
+Needs numpy and usd-core only.
+'''
+
+import argparse
+import time
+
+import numpy as np
+
+from fakes import load_tool_package
+
+
+# Wavy grid of resolution x resolution quads, phase shifts the waves and offset moves the whole grid
+def make_mesh(path, resolution, phase, offset):
+    from lm.measurement.tool.mesh_data import MeshData
+
+    u, v = np.meshgrid(np.linspace(0.0, 100.0, resolution + 1), np.linspace(0.0, 100.0, resolution + 1))
+    cells = np.arange(resolution * resolution)
+    corner = (cells // resolution) * (resolution + 1) + cells % resolution
+    indices = np.stack((corner, corner + 1, corner + resolution + 2, corner + resolution + 1), axis=1).ravel()
+    u, v = u.ravel(), v.ravel()
+    points = np.stack((u, v, 5.0 * np.sin(u * 0.1 + phase) * np.cos(v * 0.07)), axis=1) + offset
+    return MeshData(path, points, np.full(resolution * resolution, 4), indices)
+
+
+# Every triangle pair, only feasible for small meshes
+def brute_force(data_a, data_b):
+    from lm.measurement.tool.bvh import closest_points_between_triangles
+
+    a = data_a.world_points[data_a.triangles]
+    b = data_b.world_points[data_b.triangles]
+    ia, ib = (index.ravel() for index in np.meshgrid(np.arange(len(a)), np.arange(len(b)), indexing="ij"))
+    distance_sq, _, _ = closest_points_between_triangles(a[ia, 0], a[ia, 1], a[ia, 2], b[ib, 0], b[ib, 1], b[ib, 2])
+    return float(np.sqrt(distance_sq.min()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--resolution", type=int, default=700, help="quads per side, faces per mesh = 2 * resolution^2")
+    parser.add_argument("--check", action="store_true", help="compare with brute force")
+    args = parser.parse_args()
+
+    load_tool_package()
+    layouts = {
+        "side by side": (3.0, (110.0, 5.0, 0.0)),
+        "parallel": (1.3, (3.0, 7.0, 12.0)),
+        "interpenetrating": (1.3, (3.0, 7.0, 2.0)),
+    }
+    base = make_mesh("/World/A", args.resolution, 0.0, np.zeros(3))
+    start = time.perf_counter()
+    base.bvh
+    print(f"{len(base.triangles)} faces per mesh | BVH build {(time.perf_counter() - start) * 1000.0:.1f} ms")
+
+    for name, (phase, offset) in layouts.items():
+        other = make_mesh("/World/B", args.resolution, phase, np.array(offset))
+        other.bvh
+        samples = []
+        for _ in range(2):
+            start = time.perf_counter()
+            distance, point_a, point_b, _, _ = base.bvh.closest_pair(other.bvh)
+            samples.append((time.perf_counter() - start) * 1000.0)
+        line = (
+            f"{name:>16}: first {samples[0]:8.1f} ms, again {samples[1]:8.1f} ms"
+            f" | distance {distance:.6f} between {np.round(point_a, 3)} and {np.round(point_b, 3)}"
+        )
+        if args.check:
+            line += f" | brute force {brute_force(base, other):.6f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
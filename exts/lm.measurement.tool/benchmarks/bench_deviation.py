@@ -0,0 +1,103 @@
+'''
+Cost of deviation maps: the signed distance from every vertex of a noisy "scan"
+grid to the nearest surface of a "CAD" grid with slightly different waves, on
+one thread and spread over worker threads. Reference surface builds (the BVH and
+the triangle grid) are timed separately, they are cached per mesh. --check
+compares a sample of vertices with brute force. --large-face adds one oblique
+triangle of that size to the reference, as a CAD face much larger than the
+fine scan-sized ones:
+    python benchmarks/bench_deviation.py --cad-resolution 700 --scan-resolution 1000 --workers 1,4
+    python benchmarks/bench_deviation.py --cad-resolution 40 --scan-resolution 100 --check
+    python benchmarks/bench_deviation.py --cad-resolution 700 --scan-resolution 300 --large-face 50 --check
+Needs numpy and usd-core only.
+'''
+
+import argparse
+import resource
+import time
+
+import numpy as np
+
+from fakes import load_tool_package
+
+
+# Wavy grid of resolution x resolution quads over 100 x 100 units, plus one oblique triangle large_face units
+# across below it when large_face is set
+def make_mesh(path, resolution, phase, large_face=0.0):
+    from lm.measurement.tool.mesh_data import MeshData
+
+    u, v = np.meshgrid(np.linspace(0.0, 100.0, resolution + 1), np.linspace(0.0, 100.0, resolution + 1))
+    cells = np.arange(resolution * resolution)
+    corner = (cells // resolution) * (resolution + 1) + cells % resolution
+    indices = np.stack((corner, corner + 1, corner + resolution + 2, corner + resolution + 1), axis=1).ravel()
+    u, v = u.ravel(), v.ravel()
+    points = np.stack((u, v, 5.0 * np.sin(u * 0.1 + phase) * np.cos(v * 0.07)), axis=1)
+    counts = np.full(resolution * resolution, 4)
+    if large_face:
+        face = np.array(((0.0, 0.0, 0.0), (1.0, 0.3, -0.2), (0.4, 1.0, -0.6))) * large_face - (0.0, 0.0, 10.0)
+        indices = np.append(indices, np.arange(3) + len(points))
+        points = np.vstack((points, face))
+        counts = np.append(counts, 3)
+    return MeshData(path, points, counts, indices)
+
+
+def brute_force(data, points):
+    from lm.measurement.tool.bvh import closest_points_on_triangles
+
+    corners = data.world_points[data.triangles]
+    distances = []
+    for point in points:
+        closest = closest_points_on_triangles(
+            np.broadcast_to(point, corners[:, 0].shape), corners[:, 0], corners[:, 1], corners[:, 2]
+        )
+        distances.append(np.linalg.norm(closest - point, axis=1).min())
+    return np.array(distances)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cad-resolution", type=int, default=700, help="quads per side of the reference mesh")
+    parser.add_argument("--scan-resolution", type=int, default=1000, help="quads per side of the measured mesh")
+    parser.add_argument("--noise", type=float, default=0.02, help="standard deviation of the scan vertex noise")
+    parser.add_argument("--workers", default="1", help="comma separated worker thread counts")
+    parser.add_argument("--memory-mb", type=float, default=256.0)
+    parser.add_argument("--check", action="store_true", help="compare 200 vertices with brute force")
+    parser.add_argument(
+        "--large-face", type=float, default=0.0, help="size of one large oblique reference triangle, 0 for none"
+    )
+    args = parser.parse_args()
+
+    load_tool_package()
+    from lm.measurement.tool.deviation import ReferenceSurface, DeviationResult, compute_deviation
+
+    cad = make_mesh("/World/Cad", args.cad_resolution, 0.3, args.large_face)
+    scan = make_mesh("/World/Scan", args.scan_resolution, 0.31)
+    points = scan.world_points + np.random.default_rng(0).normal(0.0, args.noise, scan.world_points.shape)
+    start = time.perf_counter()
+    surface = ReferenceSurface(cad.world_points, cad.triangles, cad.bvh)
+    build = (time.perf_counter() - start) * 1000.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+    print(
+        f"{len(cad.triangles)} reference faces, {len(points)} vertices"
+        f" | reference surface build {build:.1f} ms, peak RSS {peak:.0f} MiB"
+    )
+
+    for workers in [int(value) for value in args.workers.split(",") if value]:
+        start = time.perf_counter()
+        distances, used = compute_deviation([surface], points, args.memory_mb * (1 << 20), workers)
+        elapsed = time.perf_counter() - start
+        stats = DeviationResult("/World/Scan", ["/World/Cad"], distances, used).statistics()
+        print(
+            f"workers {used}: {elapsed * 1000.0:9.1f} ms, {len(points) / elapsed / 1e6:.3f} M vertices/s"
+            f" | peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10:.0f} MiB"
+            f" | mean {stats['mean']:.5f} rms {stats['rms']:.5f} p5 {stats['p5']:.5f} p95 {stats['p95']:.5f}"
+        )
+
+    if args.check:
+        sample = np.random.default_rng(1).choice(len(points), min(200, len(points)), replace=False)
+        error = np.abs(np.abs(distances[sample]) - brute_force(cad, points[sample])).max()
+        print(f"largest difference from brute force over {len(sample)} vertices: {error:.3g}")
+
+
+if __name__ == "__main__":
+    main()
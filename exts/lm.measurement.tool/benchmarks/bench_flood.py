@@ -0,0 +1,90 @@
+'''
+Cost of flood sampling a selection of meshes with the BVH backend, streamed in
+blocks into a summary (and a file with --export) against building the whole
+result as two Python lists, mesh by mesh, as get_flood_data used to. Reports
+the time to the first block, the total time and the peak of traced memory:
+    python benchmarks/bench_flood.py --meshes 8 --resolution 100 --density 10 --workers 1,4
+    python benchmarks/bench_flood.py --meshes 8 --density 50 --max-points 1000000 --no-lists --export /tmp/flood.ply
+Needs numpy and usd-core only.
+'''
+
+import argparse
+import time
+import tracemalloc
+
+from fakes import load_tool_package
+from scenes import make_stage
+
+
+# Milliseconds of a call, then the peak of traced megabytes of a second call (tracing slows allocations down)
+def measure(fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = (time.perf_counter() - start) * 1000.0
+    tracemalloc.start()
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+# Every mesh's samples appended to two growing lists of points, the whole result held before it can be used
+def list_flood(mesh_raycast, mesh_paths, density):
+    positions = []
+    normals = []
+    for mesh_path in mesh_paths:
+        for block in mesh_raycast.iter_flood_data([mesh_path], density):
+            positions.extend(block.positions.tolist())
+            normals.extend(block.normals.tolist())
+    return positions, normals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--meshes", type=int, default=8)
+    parser.add_argument("--resolution", type=int, default=100)
+    parser.add_argument("--density", type=float, default=10.0, help="points per square unit of surface")
+    parser.add_argument("--workers", default="1,4", help="comma separated sampling thread counts")
+    parser.add_argument("--memory", type=float, default=64.0, help="megabytes of samples waiting to be consumed")
+    parser.add_argument("--max-points", type=int, default=0, help="cap on the sampled points, 0 for none")
+    parser.add_argument("--export", default="", help=".csv or .ply file the streamed samples are written to")
+    parser.add_argument(
+        "--no-lists", action="store_true", help="skip the Python lists, which need about 300 bytes a point"
+    )
+    args = parser.parse_args()
+
+    load_tool_package()
+    from lm.measurement.tool.bvh_raycast import BvhMeshRaycast
+    from lm.measurement.tool.flood import consume_flood
+
+    mesh_raycast = BvhMeshRaycast(make_stage(args.meshes, args.resolution))
+    mesh_raycast.createScene("/World", None)
+    mesh_paths = mesh_raycast.get_mesh_paths()
+    consume_flood(mesh_raycast.iter_flood_data(mesh_paths, 1e-3))
+
+    if not args.no_lists:
+        (positions, _), elapsed, peak = measure(lambda: list_flood(mesh_raycast, mesh_paths, args.density))
+        print(f"python lists: {len(positions)} points in {elapsed:.0f} ms, peak {peak:.0f} MB")
+        del positions
+
+    max_points = args.max_points or None
+    budget = args.memory * (1 << 20)
+    for workers in [int(value) for value in args.workers.split(",") if value]:
+        start = time.perf_counter()
+        blocks = mesh_raycast.iter_flood_data(mesh_paths, args.density, max_points, budget, workers)
+        next(blocks)
+        first = (time.perf_counter() - start) * 1000.0
+        blocks.close()
+        stream = lambda: consume_flood(
+            mesh_raycast.iter_flood_data(mesh_paths, args.density, max_points, budget, workers), args.export or None
+        )
+        summary, elapsed, peak = measure(stream)
+        written = f", written to {args.export}" if args.export else ""
+        print(
+            f"stream, {workers} workers: {summary.count} points in {elapsed:.0f} ms, first block after {first:.1f} ms,"
+            f" peak {peak:.0f} MB{written}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+'''
+Cost of surface distance queries: building the edge graph of a wavy grid mesh
+and finding shortest paths between random point pairs on it, compared with the
+straight line distance and the length of the straight line draped over the
+surface (an upper bound on the true geodesic):
+    python benchmarks/bench_geodesic.py --resolution 1000 --queries 10
+Needs numpy and usd-core only.
+'''
+
+import argparse
+import time
+
+import numpy as np
+
+from fakes import load_tool_package
+
+
+# Height of the grid meshes from scenes.make_stage, for the first mesh
+def surface(x, y):
+    return np.stack((x, y, 5.0 * np.sin(x * 0.1)), axis=-1)
+
+
+def make_mesh(resolution):
+    from lm.measurement.tool.mesh_data import MeshData
+
+    u, v = np.meshgrid(np.linspace(0.0, 100.0, resolution + 1), np.linspace(0.0, 100.0, resolution + 1))
+    cells = np.arange(resolution * resolution)
+    corner = (cells // resolution) * (resolution + 1) + cells % resolution
+    indices = np.stack((corner, corner + 1, corner + resolution + 2, corner + resolution + 1), axis=1).ravel()
+    return MeshData("/World/Mesh_0", surface(u.ravel(), v.ravel()), np.full(resolution * resolution, 4), indices)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--resolution", type=int, default=1000, help="quads per side, faces = 2 * resolution^2")
+    parser.add_argument("--queries", type=int, default=10)
+    args = parser.parse_args()
+
+    load_tool_package()
+    from lm.measurement.tool.geodesic import MeshGraph
+
+    data = make_mesh(args.resolution)
+    start = time.perf_counter()
+    graph = MeshGraph(data.world_points, data.triangles)
+    build = (time.perf_counter() - start) * 1000.0
+    print(f"{len(graph.triangles)} faces, {graph.edge_count} edges | graph build {build:.1f} ms")
+
+    rng = np.random.default_rng(0)
+    samples = []
+    for a, b in rng.uniform(0.0, 100.0, (args.queries, 2, 2)):
+        start = time.perf_counter()
+        path, length = graph.shortest_path(surface(*a), surface(*b))
+        samples.append(time.perf_counter() - start)
+        line = surface(*(a[:, None] * (1.0 - np.linspace(0.0, 1.0, 10001)) + b[:, None] * np.linspace(0.0, 1.0, 10001)))
+        draped = np.linalg.norm(np.diff(line, axis=0), axis=1).sum()
+        straight = np.linalg.norm(surface(*a) - surface(*b))
+        print(
+            f"    {samples[-1] * 1000.0:8.1f} ms | path {length:8.3f} over {len(path):5} points"
+            f" | straight {straight:8.3f}, draped {draped:8.3f}"
+        )
+    ms = np.array(samples) * 1000.0
+    print(f"query p50 {np.percentile(ms, 50):.1f} ms p95 {np.percentile(ms, 95):.1f} ms max {ms.max():.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+'''
+MeshRaycast.overlap_vertices with cached mesh paths and bulk vertex gathers,
+compared with the previous per-vertex get_vertex_local_position calls.
+Runs headless against the fake raycast interface on a single grid mesh:
+    python benchmarks/bench_overlap_vertices.py --resolution 1000
+A resolution of 1000 gives a mesh with about 1M vertices. The fake interface answers
+each call from Python, so the per-vertex timings understate real engine round trips.
+'''
+
+import argparse
+import time
+
+import numpy as np
+
+import fakes
+from scenes import make_stage
+
+
+# overlap_vertices as it was before path and vertex caching
+def legacy_overlap_vertices(mr, origin, radius):
+    overlap_result = mr.overlap_vertices(origin, radius)
+    overlap_report = {"overlap": bool(len(overlap_result)), "collisions": {}, "collision_vert_positions": {}}
+    for r in overlap_result:
+        mesh_path = mr.get_mesh_path_from_index(r.meshIndex)
+        overlap_report["collisions"][mesh_path] = r.vertexIndices
+        overlap_report["collision_vert_positions"][mesh_path] = [
+            mr.get_vertex_local_position(mesh_path, i) for i in r.vertexIndices
+        ]
+    return overlap_report
+
+
+def best_of(repeats, fn):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return min(samples) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--resolution", type=int, default=1000)
+    parser.add_argument("--radius", type=float, default=10.0)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    stage = make_stage(1, args.resolution)
+    interface = fakes.install(stage)
+    from lm.measurement.tool.mesh_raycast import MeshRaycast
+
+    mr = MeshRaycast()
+    origin = (50.0, 50.0, 0.0)
+
+    # Warm up so the BVH and vertex arrays are built, then replay one engine result so only the
+    # path and position lookups that differ between the two versions are timed
+    report = mr.overlap_vertices(origin, args.radius)
+    vertices = sum(len(indices) for indices in report["collisions"].values())
+    overlap_result = interface.overlap_vertices(origin, args.radius)
+    interface.overlap_vertices = lambda *args: overlap_result
+
+    interface.calls.clear()
+    legacy = best_of(args.repeats, lambda: legacy_overlap_vertices(interface, origin, args.radius))
+    legacy_calls = sum(interface.calls.values()) // args.repeats
+    interface.calls.clear()
+    cached = best_of(args.repeats, lambda: mr.overlap_vertices(origin, args.radius))
+    cached_calls = sum(interface.calls.values()) // args.repeats
+
+    mesh_vertices = (args.resolution + 1) ** 2
+    print(f"mesh vertices {mesh_vertices}, vertices in radius {vertices}")
+    print(f"per-vertex lookups {legacy:9.3f} ms, {legacy_calls} interface calls")
+    print(f"cached bulk gather {cached:9.3f} ms, {cached_calls} interface calls")
+    print(f"speedup {legacy / cached:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
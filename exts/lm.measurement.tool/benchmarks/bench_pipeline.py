@@ -0,0 +1,229 @@
+'''
+Headless timing of the click -> raycast -> model -> draw pipeline.
+RulerManipulator and RulerModel run against the fakes in fakes.py and fake_ui.py
+and are driven through scripted sessions. Each session reports per-stage
+timings (inclusive, so _cast_hit contains raycast), memory and the number of
+scene items left alive. Memory is the process peak RSS by default, --trace-memory
+traces Python allocations per session instead at a large cost in speed:
+    python benchmarks/bench_pipeline.py --points 1000,10000 --hover-events 5000
+    python benchmarks/bench_pipeline.py --points 100000 --backend bvh
+Needs numpy and usd-core only.
+'''
+
+import argparse
+import contextlib
+import io
+import resource
+import time
+import tracemalloc
+from collections import defaultdict
+
+import numpy as np
+
+import fakes
+import fake_ui
+from scenes import make_stage
+
+
+class StageTimer:
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    # Replace obj.attr with a wrapper that records the duration of every call under name
+    def wrap(self, obj, attr, name=None):
+        fn = getattr(obj, attr)
+        samples = self.samples[name or attr]
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                samples.append(time.perf_counter() - start)
+
+        setattr(obj, attr, timed)
+
+    def reset(self):
+        for samples in self.samples.values():
+            samples.clear()
+
+    def report(self):
+        rows = []
+        for name, samples in self.samples.items():
+            if not samples:
+                continue
+            ms = np.array(samples) * 1000.0
+            rows.append(
+                f"    {name:<16} calls {len(ms):>7} | total {ms.sum():10.1f} ms | p50 {np.percentile(ms, 50):8.3f} ms"
+                f" p95 {np.percentile(ms, 95):8.3f} ms max {ms.max():8.3f} ms"
+            )
+        return "\n".join(rows)
+
+
+class PipelineHarness:
+
+    # Build a stage, install the fakes and construct the manipulator with every stage instrumented
+    def __init__(self, meshes, resolution, backend, async_workers=1):
+        self.stage = make_stage(meshes, resolution)
+        self.kit = fakes.install(self.stage, {
+            "/exts/lm.measurement.tool/raycast/backend": backend,
+            "/exts/lm.measurement.tool/raycast/asyncWorkers": async_workers,
+        }).kit
+        from lm.measurement.tool.ruler_model import RulerModel
+        from lm.measurement.tool.ruler_manipulator import RulerManipulator
+
+        # Perspective camera above the first mesh, looking down
+        self.camera = fake_ui.CameraModel(eye=(50.0, 50.0, 100.0))
+        self.scene_view = fake_ui.SceneView(self.camera)
+        self.model = RulerModel()
+        self.manipulator = RulerManipulator(model=self.model, scene_view=self.scene_view)
+
+        self.timer = StageTimer()
+        for attr in (
+            "_get_position_in_viewport", "_pick_ray", "_cast_ray", "_cast_hit",
+            "on_build", "on_model_updated", "_on_update", "_update_labels",
+        ):
+            self.timer.wrap(self.manipulator, attr)
+        self.timer.wrap(self.manipulator._mr, "raycast_closest", "raycast")
+
+        self.frame()
+        self.manipulator.set_tool("RULER")
+        self._click = next(item for item in self.manipulator.children if isinstance(item, fake_ui.Screen)).gestures[0]
+        self.rng = np.random.default_rng(0)
+
+    # One rendered frame: app update subscribers run, then an invalidated manipulator rebuilds.
+    # Frame times show how long the UI thread was blocked, raycasts on worker threads are not part of them.
+    def frame(self):
+        start = time.perf_counter()
+        self.kit.app.update()
+        self.manipulator.draw()
+        self.timer.samples["frame"].append(time.perf_counter() - start)
+
+    # Wait for queued raycasts and apply them, as the following frames would
+    def settle(self):
+        self.manipulator._queries.wait()
+        self.manipulator._analyses.wait()
+        self.frame()
+
+    # Random normalized window positions inside the viewport
+    def positions(self, count):
+        return self.rng.uniform(0.2, 0.8, (count, 2))
+
+    def click(self, x, y):
+        self.kit.input.mouse(fake_ui.MouseEventType.LEFT_BUTTON_DOWN, x, y)
+        self._click.on_ended()
+
+    def double_click(self):
+        self.manipulator.children[0].gestures[1].on_ended()
+
+    def scene_items(self):
+        return fake_ui.count_items(self.manipulator)
+
+    # Click count points, drawing a frame after every click
+    def session_clicks(self, count):
+        for x, y in self.positions(count).tolist():
+            self.click(x, y)
+            self.frame()
+        self.settle()
+
+    # Load count points in one batch, as a saved session would
+    def session_load(self, count):
+        points = self.rng.uniform(0.0, 100.0, (count, 3))
+        self.model.set_points(points)
+        self.frame()
+
+    # Pan and dolly the camera around the first mesh, one step per frame, so labels are laid out every frame
+    def session_pan(self, frames):
+        for step in range(frames):
+            angle = 2.0 * np.pi * step / max(frames, 1)
+            eye = (50.0 + 30.0 * np.cos(angle), 50.0 + 30.0 * np.sin(angle), 100.0 + 80.0 * np.sin(0.5 * angle))
+            self.camera.view = fake_ui.Matrix44([1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, -eye[0], -eye[1], -eye[2], 1])
+            self.frame()
+
+    # Many mouse moves between frames, the manipulator should cast at most once per frame
+    def session_hover(self, events, per_frame):
+        self.click(0.5, 0.5)
+        self.settle()
+        for start in range(0, events, per_frame):
+            for x, y in self.positions(min(per_frame, events - start)).tolist():
+                self.kit.input.mouse(fake_ui.MouseEventType.MOVE, x, y)
+            self.frame()
+        self.settle()
+
+    # Place a few points and clear them with a double click, repeatedly
+    def session_clears(self, repeats, points):
+        for _ in range(repeats):
+            for x, y in self.positions(points).tolist():
+                self.click(x, y)
+            self.settle()
+            self.double_click()
+            self.frame()
+
+    # Run one session with the stage timings reset around it
+    def run(self, name, fn, *args, trace_memory=False):
+        self.timer.reset()
+        calls = dict(self.kit.raycast.calls)
+        created = fake_ui.SceneStats.created
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn(*args)
+        elapsed = time.perf_counter() - start
+        if trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            memory = f"traced {current / 2**20:.1f} MiB, peak {peak / 2**20:.1f} MiB"
+        else:
+            memory = f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10:.0f} MiB"
+
+        raycasts = self.kit.raycast.calls.get("closestRaycast", 0) - calls.get("closestRaycast", 0)
+        print(
+            f"{name}: {elapsed * 1000.0:.1f} ms | {memory}"
+            f" | scene items created {fake_ui.SceneStats.created - created}, alive {self.scene_items()}"
+            f" | engine raycasts {raycasts}"
+        )
+        print(self.timer.report())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--meshes", type=int, default=4)
+    parser.add_argument("--resolution", type=int, default=128)
+    parser.add_argument(
+        "--backend", choices=("omni", "bvh"), default="omni", help="omni uses the fake mesh raycast interface"
+    )
+    parser.add_argument("--points", default="1000,10000", help="comma separated session sizes")
+    parser.add_argument(
+        "--max-clicks", type=int, default=10000, help="larger sessions are loaded in one batch instead of clicked"
+    )
+    parser.add_argument("--pan-frames", type=int, default=100, help="camera moves over each loaded session")
+    parser.add_argument("--hover-events", type=int, default=5000)
+    parser.add_argument("--hover-per-frame", type=int, default=50)
+    parser.add_argument("--clears", type=int, default=100)
+    parser.add_argument(
+        "--async-workers", type=int, default=1, help="raycast worker threads, 0 raycasts on the UI thread"
+    )
+    parser.add_argument("--trace-memory", action="store_true")
+    args = parser.parse_args()
+
+    harness = PipelineHarness(args.meshes, args.resolution, args.backend, args.async_workers)
+    run = lambda name, fn, *fn_args: harness.run(name, fn, *fn_args, trace_memory=args.trace_memory)
+    for count in [int(value) for value in args.points.split(",") if value]:
+        if count <= args.max_clicks:
+            run(f"click {count} points", harness.session_clicks, count)
+        run(f"load {count} points", harness.session_load, count)
+        run(f"pan {args.pan_frames} frames over {count} points", harness.session_pan, args.pan_frames)
+        run("clear", harness.double_click)
+        harness.frame()
+
+    run(f"hover storm {args.hover_events} moves", harness.session_hover, args.hover_events, args.hover_per_frame)
+    stats = harness.manipulator.get_hover_latency_stats()
+    print(f"    hover casts {stats['count']}, dropped {stats['dropped']}")
+    run(f"{args.clears} clears of 10 points", harness.session_clears, args.clears, 10)
+    harness.manipulator.destroy()
+
+
+if __name__ == "__main__":
+    main()
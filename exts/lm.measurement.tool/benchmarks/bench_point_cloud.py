@@ -0,0 +1,152 @@
+'''
+Cost of picking on point clouds. Indexes a scan of a wavy sheet built straight
+from NumPy, writes it to disk and maps it back, then times picks of random
+rays from a perspective camera above the sheet, with a radius of a few pixels,
+against testing every point of the cloud. --check compares the picks with that
+brute force search. --usd also times a UsdGeom.Points prim through
+PointCloudCache, including how long reading the points holds the UI thread:
+    python benchmarks/bench_point_cloud.py --points 50000000 --picks 200
+    python benchmarks/bench_point_cloud.py --points 2000000 --check --usd 5000000
+Needs numpy and usd-core only.
+'''
+
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from pxr import Usd
+
+import fakes
+from scenes import add_points, make_scan
+
+# Camera height above the sheet, vertical field of view and viewport height in pixels
+EYE_HEIGHT = 150.0
+FOV_DEGREES = 60.0
+VIEWPORT_HEIGHT = 1080
+
+
+# Rays from eyes above the sheet through random points of it, as origins and unit directions
+def make_pick_rays(points, count, seed=0):
+    rng = np.random.default_rng(seed)
+    targets = points[rng.integers(len(points), size=count)].astype(np.float64)
+    origins = targets + np.column_stack((rng.normal(0.0, 30.0, (count, 2)), np.full(count, EYE_HEIGHT)))
+    directions = targets - origins + rng.normal(0.0, 0.2, (count, 3))
+    return origins, directions / np.linalg.norm(directions, axis=1)[:, None]
+
+
+# Same rule as PointIndex.pick, over every point
+def brute_pick(points, origin, direction, radius, growth):
+    relative = points.astype(np.float64) - origin
+    t = relative @ direction
+    offset = np.sqrt(np.maximum(np.einsum("ij,ij->i", relative, relative) - t * t, 0.0))
+    cone = radius + growth * t
+    inside = (t >= 0.0) & (offset <= cone)
+    if not inside.any():
+        return None
+    nearest = float(t[inside].min())
+    score = np.where(inside & (t <= nearest + radius + growth * nearest), offset / cone, np.inf)
+    best = int(np.argmin(score))
+    return float(t[best]), best
+
+
+def percentiles(samples):
+    milliseconds = np.array(samples) * 1000.0
+    return f"p50 {np.percentile(milliseconds, 50):.2f} ms, p95 {np.percentile(milliseconds, 95):.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=50_000_000)
+    parser.add_argument("--picks", type=int, default=200)
+    parser.add_argument("--radius", type=float, default=6.0, help="pick radius in pixels")
+    parser.add_argument("--brute-picks", type=int, default=5, help="picks timed by testing every point, 0 to skip")
+    parser.add_argument("--check", action="store_true", help="compare every pick with the brute force search")
+    parser.add_argument(
+        "--usd", type=int, default=0, help="points of a UsdGeom.Points prim picked through PointCloudCache, 0 to skip"
+    )
+    args = parser.parse_args()
+
+    fakes.install(Usd.Stage.CreateInMemory())
+    from lm.measurement.tool.point_cloud import PointCloudCache, build_point_index, mapped_point_index
+
+    # A pixel at distance t along a ray from the eye is about t times this wide
+    growth = args.radius * 2.0 * np.tan(np.radians(FOV_DEGREES) * 0.5) / VIEWPORT_HEIGHT
+
+    points = make_scan(args.points)
+    start = time.perf_counter()
+    index = build_point_index(points)
+    print(f"{len(points)} points indexed in {time.perf_counter() - start:.2f} s, {len(index.levels)} levels")
+
+    directory = tempfile.mkdtemp(prefix="bench_point_cloud")
+    try:
+        start = time.perf_counter()
+        mapped_point_index(points, directory)
+        written = time.perf_counter() - start
+        start = time.perf_counter()
+        mapped = mapped_point_index(points, directory)
+        mapped_in = time.perf_counter() - start
+        print(f"indexed and written in {written:.2f} s, mapped back in {mapped_in:.2f} s (hashing the points)")
+        del points
+
+        origins, directions = make_pick_rays(mapped.points, args.picks)
+        for name, cloud in (("in memory", index), ("memory-mapped", mapped)):
+            samples = []
+            misses = 0
+            for origin, direction in zip(origins, directions):
+                start = time.perf_counter()
+                found = cloud.pick(origin, direction, 0.0, growth)
+                samples.append(time.perf_counter() - start)
+                misses += found is None
+            print(f"{name}: {len(samples)} picks, {percentiles(samples)}, {misses} missed")
+
+        if args.brute_picks:
+            samples = []
+            for origin, direction in zip(origins[:args.brute_picks], directions[:args.brute_picks]):
+                start = time.perf_counter()
+                brute_pick(index.points, origin, direction, 0.0, growth)
+                samples.append(time.perf_counter() - start)
+            print(f"every point: {len(samples)} picks, {percentiles(samples)}")
+
+        if args.check:
+            wrong = 0
+            for origin, direction in zip(origins, directions):
+                found = index.pick(origin, direction, 0.0, growth)
+                expected = brute_pick(index.points, origin, direction, 0.0, growth)
+                if (found is None) != (expected is None):
+                    wrong += 1
+                elif found is not None and not np.isclose(found[0], expected[0]):
+                    wrong += 1
+            print(f"check: {wrong} of {len(origins)} picks differ from the brute force search")
+        del index, mapped
+
+        if args.usd:
+            stage = Usd.Stage.CreateInMemory()
+            scan = make_scan(args.usd, seed=1)
+            add_points(stage, "/World/Scan", scan, translate=(10.0, 0.0, 0.0))
+            origins, directions = make_pick_rays(scan + np.float32([10.0, 0.0, 0.0]), args.picks, seed=1)
+            del scan
+            cache = PointCloudCache(stage, cache_dir=directory)
+            start = time.perf_counter()
+            cache.update()
+            blocked = time.perf_counter() - start
+            cache.wait()
+            ready = time.perf_counter() - start
+            cache.update()
+            samples = []
+            for origin, direction in zip(origins, directions):
+                start = time.perf_counter()
+                cache.pick(origin, direction, 0.0, growth)
+                samples.append(time.perf_counter() - start)
+            print(
+                f"usd: {args.usd} points, update held the caller {blocked * 1000.0:.0f} ms, ready after {ready:.2f} s,"
+                f" {len(samples)} picks {percentiles(samples)}"
+            )
+            cache.shutdown()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
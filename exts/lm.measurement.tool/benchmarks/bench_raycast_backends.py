@@ -0,0 +1,69 @@
+'''
+Raycast latency comparison between the local BVH backend and omni.kit.mesh.raycast.
+Headless, with numpy and usd-core installed, a synthetic stage is generated and only
+the BVH backend is timed:
+    python benchmarks/bench_raycast_backends.py --meshes 64 --resolution 128
+Inside Kit the active stage is used and the Omniverse engine is timed as well.
+'''
+
+import argparse
+import time
+
+import numpy as np
+
+from fakes import load_tool_package
+from scenes import make_rays, make_stage
+
+
+def time_backend(name, backend, origins, dirs):
+    start = time.perf_counter()
+    backend.raycast_closest(origins[0], dirs[0], 1e9)
+    first = time.perf_counter() - start
+
+    samples = []
+    hits = 0
+    for origin, direction in zip(origins.tolist(), dirs.tolist()):
+        start = time.perf_counter()
+        hit = backend.raycast_closest(origin, direction, 1e9)
+        samples.append(time.perf_counter() - start)
+        hits += hit["hit"]
+    samples = np.array(samples) * 1000.0
+    print(
+        f"{name:>6}: first query {first * 1000.0:9.2f} ms | per ray p50 {np.percentile(samples, 50):7.3f} ms"
+        f" p95 {np.percentile(samples, 95):7.3f} ms | hits {hits}/{len(samples)}"
+    )
+
+    start = time.perf_counter()
+    result = backend.raycast_batch(origins, dirs, 1e9)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:>6}: raycast_batch {elapsed * 1000.0:9.2f} ms for {len(result)} rays"
+        f" ({elapsed * 1e6 / max(len(result), 1):.1f} us per ray) | hits {int(result['hit'].sum())}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--meshes", type=int, default=16)
+    parser.add_argument("--resolution", type=int, default=128)
+    parser.add_argument("--rays", type=int, default=1000)
+    args = parser.parse_args()
+
+    load_tool_package()
+    from lm.measurement.tool import bvh_raycast
+    try:
+        import omni.usd
+        from lm.measurement.tool.mesh_raycast import HAS_OMNI_RAYCAST, MeshRaycast
+        stage = omni.usd.get_context().get_stage()
+    except ImportError:
+        HAS_OMNI_RAYCAST = False
+        stage = make_stage(args.meshes, args.resolution)
+
+    origins, dirs = make_rays(args.rays, args.meshes)
+    time_backend("bvh", bvh_raycast.BvhMeshRaycast(stage), origins, dirs)
+    if HAS_OMNI_RAYCAST:
+        time_backend("omni", MeshRaycast(), origins, dirs)
+
+
+if __name__ == "__main__":
+    main()
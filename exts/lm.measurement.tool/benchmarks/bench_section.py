@@ -0,0 +1,95 @@
+'''
+Cost of cross sections while the plane is dragged. A row of closed UV spheres
+of radius 10 (see bench_area_volume.py) is cut by a plane through their
+centers, which the first cut sorts every mesh's triangles for, then the plane
+is moved along its normal a number of times. Each cut is compared with cutting
+every triangle without the slabs. --check also compares the perimeter and area
+with the sphere's circle at that height:
+    python benchmarks/bench_section.py --meshes 10 --resolution 350 --steps 50
+    python benchmarks/bench_section.py --meshes 2 --resolution 100 --check
+Needs numpy only.
+'''
+
+import argparse
+import time
+
+import numpy as np
+
+from fakes import load_tool_package
+from scenes import MeshBackend, make_sphere
+
+
+# Largest relative error of a cut's perimeter and area against the circles it should be, inf unless it is one
+# closed loop per sphere
+def circle_error(result, offset, meshes):
+    radius = np.sqrt(100.0 - offset ** 2)
+    perimeter = 2.0 * np.pi * radius * meshes
+    area = np.pi * radius ** 2 * meshes
+    closed = all(result.closed) and len(result.polylines) == meshes
+    error = max(abs(result.perimeter / perimeter - 1.0), abs(result.area / area - 1.0))
+    return error if closed and np.isfinite(error) else np.inf
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--meshes", type=int, default=10)
+    parser.add_argument(
+        "--resolution", type=int, default=350, help="stacks per sphere, about 4 * resolution^2 triangles each"
+    )
+    parser.add_argument("--steps", type=int, default=50, help="plane positions the plane is dragged through")
+    parser.add_argument("--normal", default="0,0.2,1", help="plane normal, comma separated")
+    parser.add_argument("--check", action="store_true", help="compare each cut with the circle it should be")
+    args = parser.parse_args()
+
+    load_tool_package()
+    from lm.measurement.tool.section import SectionCache, SectionPlane, cut_segments, chain_segments
+
+    meshes = [
+        make_sphere(f"/World/Sphere_{i}", args.resolution, np.array((i * 25.0, 0.0, 0.0))) for i in range(args.meshes)
+    ]
+    for data in meshes:
+        data.world_points, data.triangles
+    print(f"{args.meshes} meshes, {sum(len(data.triangles) for data in meshes)} triangles")
+
+    normal = np.array([float(value) for value in args.normal.split(",")])
+    normal /= np.linalg.norm(normal)
+    cache = SectionCache(MeshBackend(meshes))
+    # The first cut goes through the vertex nearest the first sphere's center plane, with a level plane through a
+    # whole ring of vertices
+    along = meshes[0].world_points @ normal
+    center = float(along[np.argmin(np.abs(along))])
+    start = time.perf_counter()
+    result = cache.section(["/World"], SectionPlane(normal * center, normal))
+    first = (time.perf_counter() - start) * 1000.0
+    print(
+        f"first cut {first:.1f} ms | {len(result.polylines)} polylines,"
+        f" perimeter {result.perimeter:.4f} area {result.area:.4f} width {result.width:.4f}"
+    )
+
+    samples = []
+    worst = circle_error(result, center, args.meshes) if args.check else 0.0
+    for offset in np.linspace(-9.0, 9.0, args.steps).tolist():
+        plane = SectionPlane(normal * offset, normal)
+        start = time.perf_counter()
+        result = cache.section(["/World"], plane)
+        samples.append((time.perf_counter() - start) * 1000.0)
+        if args.check:
+            worst = max(worst, circle_error(result, offset, args.meshes))
+    samples = np.array(samples)
+    p50, p95 = np.percentile(samples, (50, 95))
+    print(f"dragged over {args.steps} positions: p50 {p50:.2f} ms p95 {p95:.2f} ms")
+    if args.check:
+        print(f"largest relative error against the circles {worst:.2e}")
+
+    # The same cut over every triangle of every mesh, without the sorted slabs
+    start = time.perf_counter()
+    for data in meshes:
+        distances = data.world_points @ normal
+        corners = distances[data.triangles]
+        crossing = np.flatnonzero((corners.min(axis=1) < 0.0) & (corners.max(axis=1) >= 0.0))
+        chain_segments(*cut_segments(data.world_points, data.triangles[crossing], distances, 0.0))
+    print(f"cutting every triangle: {(time.perf_counter() - start) * 1000.0:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
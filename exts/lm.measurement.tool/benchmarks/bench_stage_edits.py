@@ -0,0 +1,82 @@
+'''
+Cost of keeping the BVH backend current while the stage is edited, in the
+"events" refresh mode (only meshes named by USD change notices are read again)
+and the "fast" mode (the whole scene is rebuilt on any change, like the stage
+wide background refresh of omni.kit.mesh.raycast). Each round edits a few
+meshes' points or transforms, then casts a batch of rays:
+    python benchmarks/bench_stage_edits.py --meshes 256 --resolution 32 --rounds 50
+Needs numpy and usd-core only.
+'''
+
+import argparse
+import time
+
+import numpy as np
+from pxr import Gf, UsdGeom
+
+from fakes import load_tool_package
+from scenes import make_rays, make_stage
+
+
+# Lift the points of one mesh and move another, as an interactive edit would
+def edit_stage(stage, rng, meshes, edits):
+    for index in rng.choice(meshes, size=min(edits, meshes), replace=False).tolist():
+        prim = stage.GetPrimAtPath(f"/World/Mesh_{index}")
+        if index % 2:
+            mesh = UsdGeom.Mesh(prim)
+            points = np.array(mesh.GetPointsAttr().Get())
+            points[:, 2] += rng.uniform(-1.0, 1.0)
+            mesh.GetPointsAttr().Set(points.astype(np.float32))
+        else:
+            xformable = UsdGeom.Xformable(prim)
+            ops = xformable.GetOrderedXformOps()
+            op = ops[0] if ops else xformable.AddTranslateOp()
+            op.Set(Gf.Vec3d(0.0, 0.0, rng.uniform(-1.0, 1.0)))
+
+
+def run(mode, args):
+    from lm.measurement.tool.bvh_raycast import BvhMeshRaycast
+
+    stage = make_stage(args.meshes, args.resolution)
+    backend = BvhMeshRaycast(stage, refresh_mode=mode)
+    origins, dirs = make_rays(args.rays, args.meshes)
+    backend.raycast_batch(origins, dirs, 1e9)
+    start = time.perf_counter()
+    backend.raycast_batch(origins, dirs, 1e9)
+    query = (time.perf_counter() - start) * 1000.0
+
+    rng = np.random.default_rng(0)
+    samples = []
+    for _ in range(args.rounds):
+        edit_stage(stage, rng, args.meshes, args.edits)
+        start = time.perf_counter()
+        backend.raycast_batch(origins, dirs, 1e9)
+        samples.append(time.perf_counter() - start)
+
+    stats = backend.get_rebuild_stats()
+    ms = np.array(samples) * 1000.0
+    print(
+        f"{mode:>6}: query alone {query:8.2f} ms"
+        f" | edit + query p50 {np.percentile(ms, 50):8.2f} ms p95 {np.percentile(ms, 95):8.2f} ms"
+        f" | full rebuilds {stats['full_rebuilds']}, partial {stats['partial_rebuilds']}"
+        f", meshes rebuilt {stats['meshes_rebuilt']}, rebuild total {stats['rebuild_ms']:.1f} ms"
+        f" | notices {stats['notices']}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--meshes", type=int, default=256)
+    parser.add_argument("--resolution", type=int, default=32)
+    parser.add_argument("--rays", type=int, default=256)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--edits", type=int, default=2, help="meshes edited per round")
+    args = parser.parse_args()
+
+    load_tool_package()
+    for mode in ("events", "fast"):
+        run(mode, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+'''
+Cost of measurement tracks over the animation range. Points are anchored to
+meshes that are each translated and rotated over time under an animated
+/World, and their segment distances are evaluated at every time code, then
+again from the cache. --python also times the per frame, per point loop the
+batched pass replaces (ComputeLocalToWorldTransform for every point and time):
+    python benchmarks/bench_tracks.py --frames 10000 --points 10
+    python benchmarks/bench_tracks.py --frames 1000 --points 10 --python
+Needs numpy and usd-core only.
+'''
+
+import argparse
+import time
+
+import numpy as np
+from pxr import Gf, Usd, UsdGeom
+
+from fakes import load_tool_package
+from scenes import make_stage
+
+
+def animate(stage, meshes, frames):
+    UsdGeom.Xform.Define(stage, "/World")
+    stage.SetStartTimeCode(0)
+    stage.SetEndTimeCode(frames - 1)
+    samples = np.arange(0, frames, 10, dtype=np.float64)
+    spin = UsdGeom.Xformable(stage.GetPrimAtPath("/World")).AddRotateZOp()
+    for t in samples.tolist():
+        spin.Set(t * 0.01, t)
+    for i in range(meshes):
+        xformable = UsdGeom.Xformable(stage.GetPrimAtPath(f"/World/Mesh_{i}"))
+        translate = xformable.AddTranslateOp()
+        rotate = xformable.AddRotateXOp()
+        for t in samples.tolist():
+            translate.Set(Gf.Vec3d(0.0, 0.0, 40.0 * np.sin(t * 0.002 + i)), t)
+            rotate.Set(np.degrees(np.sin(t * 0.001 * (i + 1))) * 0.2, t)
+
+
+# Per time code and per point, through each prim's ComputeLocalToWorldTransform
+def python_track(stage, points, times):
+    distances = []
+    for t in times.tolist():
+        world = []
+        for path, local in points:
+            matrix = UsdGeom.Xformable(stage.GetPrimAtPath(path)).ComputeLocalToWorldTransform(Usd.TimeCode(t))
+            world.append(matrix.Transform(Gf.Vec3d(*local)))
+        distances.append([(world[k + 1] - world[k]).GetLength() for k in range(len(world) - 1)])
+    return np.array(distances)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--meshes", type=int, default=4)
+    parser.add_argument("--frames", type=int, default=10000)
+    parser.add_argument(
+        "--points", type=int, default=10, help="points of the measured group, anchored round robin to the meshes"
+    )
+    parser.add_argument("--python", action="store_true", help="also time a per frame, per point loop")
+    args = parser.parse_args()
+
+    load_tool_package()
+    from lm.measurement.tool.tracks import TrackCache
+
+    stage = make_stage(args.meshes, 2)
+    animate(stage, args.meshes, args.frames)
+    rng = np.random.default_rng(0)
+    points = [(f"/World/Mesh_{k % args.meshes}", rng.random(3) * 100.0) for k in range(args.points)]
+    cache = TrackCache(stage)
+
+    start = time.perf_counter()
+    track = cache.get(points, 0, args.frames - 1)
+    first = (time.perf_counter() - start) * 1000.0
+    start = time.perf_counter()
+    cache.get(points, 0, args.frames - 1)
+    again = (time.perf_counter() - start) * 1000.0
+    print(
+        f"{args.points} points on {args.meshes} meshes over {len(track.times)} time codes:"
+        f" first {first:.1f} ms, cached {again:.3f} ms"
+        f" | segment 0 min {track.minimum[0]:.3f} at {track.closest_time[0]:g}, max {track.maximum[0]:.3f}"
+    )
+
+    if args.python:
+        start = time.perf_counter()
+        distances = python_track(stage, points, track.times)
+        elapsed = (time.perf_counter() - start) * 1000.0
+        print(f"python loop: {elapsed:.1f} ms | largest difference {np.abs(distances - track.distances).max():.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+'''
+Local stand-ins for omni.ui.scene, carb.input, omni.kit.app and the legacy
+viewport, enough to construct RulerManipulator and RulerModel headless.
+Scene items form a retained tree like the real omni.ui.scene, and every
+created item is counted so benchmarks can report scene graph churn.
+'''
+
+from enum import IntEnum
+
+
+# Scene graph
+
+class SceneStats:
+    created = 0
+
+
+_containers = []
+
+
+class _SceneItem:
+
+    def __init__(self, *args, **kwargs):
+        SceneStats.created += 1
+        self.args = args
+        self.visible = kwargs.pop("visible", True)
+        self.__dict__.update(kwargs)
+        if _containers:
+            _containers[-1].children.append(self)
+
+
+class _SceneContainer(_SceneItem):
+
+    def __init__(self, *args, **kwargs):
+        self.children = []
+        super().__init__(*args, **kwargs)
+
+    def __enter__(self):
+        _containers.append(self)
+        return self
+
+    def __exit__(self, *args):
+        _containers.pop()
+
+    def clear(self):
+        self.children = []
+
+
+# Number of live items in a retained tree, the root included
+def count_items(item):
+    return 1 + sum(count_items(child) for child in getattr(item, "children", []))
+
+
+class Space(IntEnum):
+    CURRENT = 0
+    WORLD = 1
+    OBJECT = 2
+    NDC = 3
+    SCREEN = 4
+
+
+class Matrix44(list):
+
+    def __init__(self, values=None):
+        super().__init__(values if values is not None else [1.0 if i % 5 == 0 else 0.0 for i in range(16)])
+
+    @staticmethod
+    def get_translation_matrix(x, y, z):
+        return Matrix44([1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, x, y, z, 1])
+
+    def get_inverse(self):
+        import numpy as np
+
+        return Matrix44(np.linalg.inv(np.array(self, dtype=np.float64).reshape(4, 4)).ravel().tolist())
+
+
+class Transform(_SceneContainer):
+
+    class LookAt(IntEnum):
+        NONE = 0
+        CAMERA = 1
+
+    def __init__(self, transform=None, **kwargs):
+        self.transform = transform if transform is not None else Matrix44()
+        super().__init__(**kwargs)
+
+
+class Screen(_SceneItem):
+    pass
+
+
+class Line(_SceneItem):
+    pass
+
+
+class Curve(_SceneItem):
+
+    class CurveType(IntEnum):
+        CUBIC = 0
+        LINEAR = 1
+
+
+class Label(_SceneItem):
+    pass
+
+
+class Points(_SceneItem):
+    pass
+
+
+class PolygonMesh(_SceneItem):
+    pass
+
+
+class GestureManager:
+
+    def __init__(self):
+        pass
+
+
+class ClickGesture:
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+
+class DoubleClickGesture(ClickGesture):
+    pass
+
+
+class AbstractManipulatorItem:
+
+    def __init__(self):
+        pass
+
+
+class AbstractManipulatorModel:
+
+    def __init__(self):
+        self._item_changed_fns = []
+
+    def add_item_changed_fn(self, fn):
+        self._item_changed_fns.append(fn)
+        return fn
+
+    def _item_changed(self, item):
+        for fn in list(self._item_changed_fns):
+            fn(self, item)
+
+
+# Rebuilds on draw() after invalidate(), and forwards model changes to on_model_updated like the real class
+class Manipulator(_SceneContainer):
+
+    def __init__(self, model=None, **kwargs):
+        self._model = None
+        self._dirty = True
+        super().__init__(**kwargs)
+        self.model = model
+
+    @property
+    def model(self):
+        return self._model
+
+    @model.setter
+    def model(self, model):
+        self._model = model
+        if model is not None:
+            model.add_item_changed_fn(lambda _, item: self._forward(model, item))
+
+    def _forward(self, model, item):
+        if model is self._model:
+            self.on_model_updated(item)
+
+    def on_build(self):
+        pass
+
+    def on_model_updated(self, item):
+        self.invalidate()
+
+    def invalidate(self):
+        self._dirty = True
+
+    # One frame, rebuilds the manipulator if it was invalidated
+    def draw(self):
+        if not self._dirty:
+            return False
+        self._dirty = False
+        self.clear()
+        with self:
+            self.on_build()
+        return True
+
+
+class CameraModel(AbstractManipulatorModel):
+
+    # Camera at eye looking down -Z, with a perspective or orthographic projection
+    def __init__(self, eye=(0.0, 0.0, 100.0), fov=60.0, aspect=1.0, near=1.0, far=1e6, orthographic_height=None):
+        super().__init__()
+        import numpy as np
+
+        self.view = Matrix44([1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, -eye[0], -eye[1], -eye[2], 1])
+        if orthographic_height is None:
+            f = 1.0 / np.tan(np.radians(fov) * 0.5)
+            self.projection = Matrix44([
+                f / aspect, 0, 0, 0, 0, f, 0, 0,
+                0, 0, (far + near) / (near - far), -1, 0, 0, 2 * far * near / (near - far), 0,
+            ])
+        else:
+            h = orthographic_height * 0.5
+            self.projection = Matrix44([
+                1.0 / (h * aspect), 0, 0, 0, 0, 1.0 / h, 0, 0,
+                0, 0, -2.0 / (far - near), 0, 0, 0, -(far + near) / (far - near), 1,
+            ])
+
+
+class SceneView:
+
+    def __init__(self, model=None):
+        self.model = model or CameraModel()
+        self.scene = _SceneContainer()
+
+
+class Alignment(IntEnum):
+    LEFT_TOP = 0
+    CENTER = 1
+    CENTER_BOTTOM = 2
+
+
+# carb.input
+
+class DeviceType(IntEnum):
+    KEYBOARD = 0
+    MOUSE = 1
+    GAMEPAD = 2
+
+
+class MouseEventType(IntEnum):
+    LEFT_BUTTON_DOWN = 0
+    LEFT_BUTTON_UP = 1
+    MOVE = 6
+
+
+class KeyboardEventType(IntEnum):
+    KEY_PRESS = 0
+    KEY_REPEAT = 1
+    KEY_RELEASE = 2
+
+
+class KeyboardInput(IntEnum):
+    ENTER = 0
+    ESCAPE = 1
+    DEL = 2
+    BACKSPACE = 3
+    C = 4
+    D = 5
+    B = 6
+    V = 7
+    T = 8
+    X = 9
+    F = 10
+
+
+class _Coords:
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+class InputEvent:
+
+    def __init__(self, device_type, event):
+        self.deviceType = device_type
+        self.event = event
+
+
+class MouseEvent:
+
+    def __init__(self, event_type, x, y):
+        self.type = event_type
+        self.normalized_coords = _Coords(x, y)
+
+
+class KeyboardEvent:
+
+    def __init__(self, event_type, key):
+        self.type = event_type
+        self.input = key
+
+
+class FakeInput:
+
+    def __init__(self):
+        self._subscribers = {}
+        self._next_id = 1
+
+    def subscribe_to_input_events(self, fn, order=0):
+        subscription = self._next_id
+        self._next_id += 1
+        self._subscribers[subscription] = (order, fn)
+        return subscription
+
+    def unsubscribe_to_input_events(self, subscription):
+        self._subscribers.pop(subscription, None)
+
+    # Deliver an event to the subscribers in order, stopping when one consumes it
+    def dispatch(self, event):
+        for _, fn in sorted(self._subscribers.values(), key=lambda entry: entry[0]):
+            if fn(event) is False:
+                return False
+        return True
+
+    def mouse(self, event_type, x, y):
+        return self.dispatch(InputEvent(DeviceType.MOUSE, MouseEvent(event_type, x, y)))
+
+    def key(self, key, event_type=KeyboardEventType.KEY_PRESS):
+        return self.dispatch(InputEvent(DeviceType.KEYBOARD, KeyboardEvent(event_type, key)))
+
+
+# Viewport window from omni.kit.viewport.utility, an omni.ui window that tracks whether it has keyboard focus
+
+class FakeActiveViewportWindow:
+
+    def __init__(self):
+        self.focused = True
+
+
+# Legacy viewport window
+
+class FakeViewportWindow:
+
+    def __init__(self, width=1280, height=720):
+        self.width = width
+        self.height = height
+        self.position_x = 0
+        self.position_y = 0
+        self.dock_tab_bar_visible = False
+        self.picking_enabled = True
+
+    def set_enabled_picking(self, enabled):
+        self.picking_enabled = enabled
+
+    def get_viewport_rect(self):
+        return (0, 0, self.width - 8, self.height - 8)
+
+
+class FakeViewportInterface:
+
+    def __init__(self, window):
+        self._window = window
+
+    def get_viewport_window(self, *args):
+        return self._window
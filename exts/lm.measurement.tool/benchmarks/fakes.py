@@ -0,0 +1,330 @@
+'''
+Local stand-ins for the Kit modules the extension imports, so its code can be
+timed outside a running Kit app. install() registers them in sys.modules and
+load_tool_package() imports lm.measurement.tool without running the package
+__init__ (which needs the extension manager and toolbar). The UI side
+(omni.ui.scene, carb.input, the viewport) lives in fake_ui.
+'''
+
+import os
+import sys
+import types
+from enum import IntEnum
+
+import fake_ui
+
+EXT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Register lm.measurement.tool as a bare package so its modules can be imported one by one
+def load_tool_package():
+    if "lm.measurement.tool" not in sys.modules:
+        sys.path.insert(0, EXT_ROOT)
+        package = types.ModuleType("lm.measurement.tool")
+        package.__path__ = [os.path.join(EXT_ROOT, "lm", "measurement", "tool")]
+        sys.modules["lm.measurement.tool"] = package
+    return sys.modules["lm.measurement.tool"]
+
+
+class BvhRefreshRate(IntEnum):
+    SLOW = 0
+    FAST = 1
+
+
+class RaycastEventType(IntEnum):
+    BVH_REBUILT = 0
+
+
+class _Record:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class FakeEventStream:
+
+    def __init__(self):
+        self._subscribers = []
+
+    def create_subscription_to_pop_by_type(self, event_type, fn):
+        entry = (event_type, fn)
+        self._subscribers.append(entry)
+        return entry
+
+    def create_subscription_to_pop(self, fn, **kwargs):
+        entry = (None, fn)
+        self._subscribers.append(entry)
+        return entry
+
+    def push(self, event_type=None, payload=None):
+        event = _Record(type=event_type, payload=payload or {})
+        for subscribed_type, fn in list(self._subscribers):
+            if subscribed_type is None or subscribed_type == event_type:
+                fn(event)
+
+
+# The omni.kit.mesh.raycast interface, answered by the local BVH backend.
+# Every call is counted so benchmarks can report Python -> engine round trips.
+class FakeMeshRaycastInterface:
+
+    def __init__(self, stage):
+        from lm.measurement.tool.bvh_raycast import BvhMeshRaycast
+
+        self._backend = BvhMeshRaycast(stage)
+        self._events = FakeEventStream()
+        self._refreshing = False
+        self.calls = {}
+
+    def _count(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def get_mesh_raycast_event_stream(self):
+        return self._events
+
+    def set_bvh_refresh_rate(self, rate, enabled):
+        self._count("set_bvh_refresh_rate")
+        self._refreshing = enabled
+
+    # The engine's background refresh, run once per app update: while it is on, stage edits rebuild the BVH
+    def refresh(self, event=None):
+        if not self._refreshing:
+            return
+        scene = self._backend._scene
+        self._backend.update()
+        if self._backend._scene is not scene:
+            self.rebuild()
+
+    def set_allowed_mesh_paths(self, paths):
+        self._count("set_allowed_mesh_paths")
+        if paths:
+            self._backend.createSelectionScene(paths)
+        else:
+            self._backend.createScene(None, None)
+
+        # The engine builds its BVH as soon as it is handed the paths, not in the first raycast
+        self._backend.update()
+
+    def get_mesh_paths(self):
+        self._count("get_mesh_paths")
+        return list(self._backend.get_mesh_paths())
+
+    def get_mesh_path_from_index(self, mesh_index):
+        self._count("get_mesh_path_from_index")
+        return self._backend.get_mesh_path_from_index(mesh_index)
+
+    def get_mesh_index_from_path(self, mesh_path):
+        self._count("get_mesh_index_from_path")
+        return self._backend.get_mesh_paths().index(str(mesh_path))
+
+    def get_vertex_local_position(self, mesh_path, index):
+        self._count("get_vertex_local_position")
+        return tuple(self._backend.get_vertex_positions(mesh_path)[index].tolist())
+
+    def closestRaycast(self, origin, direction, max_dist):
+        self._count("closestRaycast")
+        hit = self._backend.raycast_closest(origin, direction, max_dist)
+        if not hit["hit"]:
+            return _Record(meshIndex=-1, position=(0.0, 0.0, 0.0), normal=(0.0, 0.0, 0.0))
+        paths = self._backend.get_mesh_paths()
+        return _Record(meshIndex=paths.index(hit["collision"]), position=hit["position"], normal=hit["normal"])
+
+    def spherecast(self, origin, direction, radius, max_dist):
+        self._count("spherecast")
+        report = self._backend.spherecast(origin, radius, direction, max_dist)
+        paths = self._backend.get_mesh_paths()
+        return [paths.index(path) for path in report.get("collisions", [])]
+
+    def overlap_vertices(self, origin, radius):
+        self._count("overlap_vertices")
+        report = self._backend.overlap_vertices(origin, radius)
+        if not report["overlap"]:
+            return []
+        paths = self._backend.get_mesh_paths()
+        return [
+            _Record(
+                meshIndex=paths.index(path),
+                vertexIndices=report["collisions"][path].tolist(),
+                faceIndices=report["collisions_faces"][path].tolist(),
+            )
+            for path in report["collisions"]
+        ]
+
+    def getFloodPoints(self, mesh_path, density, local):
+        self._count("getFloodPoints")
+        positions, normals = self._backend.get_flood_data([mesh_path], density)
+        return {"positions": positions.tolist(), "normals": normals.tolist()}
+
+    # Simulate the engine finishing a BVH rebuild
+    def rebuild(self):
+        self._events.push(int(RaycastEventType.BVH_REBUILT))
+
+
+class FakeApp:
+
+    def __init__(self):
+        self._update_stream = FakeEventStream()
+
+    def get_update_event_stream(self):
+        return self._update_stream
+
+    # Run one app update, servicing every update subscriber
+    def update(self):
+        self._update_stream.push()
+
+
+class FakeSelection:
+
+    def __init__(self):
+        self.paths = []
+
+    def get_selected_prim_paths(self):
+        return list(self.paths)
+
+    def set_selected_prim_paths(self, paths, expand_in_stage=False):
+        self.paths = [str(path) for path in paths]
+
+
+class FakeUsdContext:
+
+    def __init__(self, stage):
+        self._stage = stage
+        self._selection = FakeSelection()
+
+    def get_stage(self):
+        return self._stage
+
+    def get_selection(self):
+        return self._selection
+
+
+class FakeSettings:
+
+    def __init__(self, values=None):
+        self._values = dict(values or {})
+        self._subscribers = {}
+
+    def get(self, path):
+        return self._values.get(path)
+
+    def set(self, path, value):
+        self._values[path] = value
+        for fn in list(self._subscribers.get(path, [])):
+            fn(None, None)
+
+    def set_default(self, path, value):
+        self._values.setdefault(path, value)
+
+    def subscribe_to_node_change_events(self, path, fn):
+        self._subscribers.setdefault(path, []).append(fn)
+        return (path, fn)
+
+    def unsubscribe_to_change_events(self, subscription):
+        path, fn = subscription
+        if fn in self._subscribers.get(path, []):
+            self._subscribers[path].remove(fn)
+
+
+# Fake modules are updated in place on repeated installs, so modules that imported them see the new fakes
+def _module(name, **attrs):
+    module = sys.modules.get(name)
+    if module is None or not getattr(module, "_is_fake", False):
+        module = types.ModuleType(name)
+        module.__path__ = []
+        module._is_fake = True
+    module.__dict__.update(attrs)
+    return module
+
+
+# Everything install() registered, for harnesses that drive the UI side
+class FakeKit:
+
+    def __init__(self, interface, settings, app, input, viewport_window, active_viewport_window):
+        self.raycast = interface
+        self.settings = settings
+        self.app = app
+        self.input = input
+        self.viewport_window = viewport_window
+        self.active_viewport_window = active_viewport_window
+
+
+# Register the fake Kit modules for a USD stage and return the fake raycast interface.
+# The other fakes are reachable through the kit attribute of the returned interface.
+def install(stage, settings=None):
+    load_tool_package()
+    context = FakeUsdContext(stage)
+    carb_settings = FakeSettings(settings)
+    app = FakeApp()
+    input = fake_ui.FakeInput()
+    viewport_window = fake_ui.FakeViewportWindow()
+    active_viewport_window = fake_ui.FakeActiveViewportWindow()
+    interface = None
+
+    log = lambda *args, **kwargs: None
+    carb = _module("carb", log_info=log, log_warn=log, log_error=log, log_verbose=log)
+    carb.settings = _module("carb.settings", get_settings=lambda: carb_settings)
+    carb.events = _module("carb.events", IEvent=object)
+    carb.input = _module(
+        "carb.input",
+        acquire_input_interface=lambda: input,
+        DeviceType=fake_ui.DeviceType,
+        MouseEventType=fake_ui.MouseEventType,
+        KeyboardEventType=fake_ui.KeyboardEventType,
+        KeyboardInput=fake_ui.KeyboardInput,
+    )
+
+    scene_names = [
+        "Space", "Matrix44", "Transform", "Screen", "Line", "Curve", "Label", "Points", "PolygonMesh",
+        "GestureManager", "ClickGesture", "DoubleClickGesture", "AbstractManipulatorItem",
+        "AbstractManipulatorModel", "Manipulator", "CameraModel", "SceneView",
+    ]
+    ui = _module("omni.ui", Alignment=fake_ui.Alignment)
+    ui.scene = _module("omni.ui.scene", **{name: getattr(fake_ui, name) for name in scene_names})
+    ui.color = _module("omni.ui.color")
+
+    omni = sys.modules.get("omni") or _module("omni")
+    omni.ui = ui
+    omni.usd = _module("omni.usd", get_context=lambda *args: context)
+    omni.appwindow = _module("omni.appwindow")
+    kit = _module("omni.kit")
+    kit.app = _module("omni.kit.app", get_app=lambda: app)
+    kit.viewport_legacy = _module(
+        "omni.kit.viewport_legacy", get_viewport_interface=lambda: fake_ui.FakeViewportInterface(viewport_window)
+    )
+    kit.viewport = _module("omni.kit.viewport")
+    kit.viewport.utility = _module(
+        "omni.kit.viewport.utility", get_active_viewport_window=lambda *args: active_viewport_window
+    )
+    mesh = _module("omni.kit.mesh")
+    mesh.raycast = _module(
+        "omni.kit.mesh.raycast",
+        acquire_mesh_raycast_interface=lambda: interface,
+        BvhRefreshRate=BvhRefreshRate,
+        RaycastEventType=RaycastEventType,
+    )
+    kit.mesh = mesh
+    omni.kit = kit
+
+    sys.modules.update({
+        "carb": carb,
+        "carb.settings": carb.settings,
+        "carb.events": carb.events,
+        "carb.input": carb.input,
+        "omni": omni,
+        "omni.ui": ui,
+        "omni.ui.scene": ui.scene,
+        "omni.ui.color": ui.color,
+        "omni.usd": omni.usd,
+        "omni.appwindow": omni.appwindow,
+        "omni.kit": kit,
+        "omni.kit.app": kit.app,
+        "omni.kit.viewport_legacy": kit.viewport_legacy,
+        "omni.kit.viewport": kit.viewport,
+        "omni.kit.viewport.utility": kit.viewport.utility,
+        "omni.kit.mesh": mesh,
+        "omni.kit.mesh.raycast": mesh.raycast,
+    })
+
+    # Created last, so the backend it wraps imports the fake modules above
+    interface = FakeMeshRaycastInterface(stage)
+    app.get_update_event_stream().create_subscription_to_pop(interface.refresh)
+    interface.kit = FakeKit(interface, carb_settings, app, input, viewport_window, active_viewport_window)
+    return interface
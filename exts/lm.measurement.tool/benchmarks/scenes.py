@@ -0,0 +1,94 @@
+'''
+Synthetic USD stages, meshes and ray sets shared by the benchmarks.
+'''
+
+import numpy as np
+from pxr import Usd, UsdGeom
+
+
+# Stage with a row of wavy grid meshes, each resolution x resolution quads
+def make_stage(meshes, resolution):
+    stage = Usd.Stage.CreateInMemory()
+    u, v = np.meshgrid(np.linspace(0.0, 100.0, resolution + 1), np.linspace(0.0, 100.0, resolution + 1))
+    cells = np.arange(resolution * resolution)
+    row = cells // resolution
+    corner = row * (resolution + 1) + cells % resolution
+    indices = np.stack((corner, corner + 1, corner + resolution + 2, corner + resolution + 1), axis=1).ravel()
+    for i in range(meshes):
+        points = np.stack((u.ravel() + i * 120.0, v.ravel(), 5.0 * np.sin(u.ravel() * 0.1 + i)), axis=1)
+        mesh = UsdGeom.Mesh.Define(stage, f"/World/Mesh_{i}")
+        mesh.CreatePointsAttr(points.astype(np.float32))
+        mesh.CreateFaceVertexCountsAttr(np.full(resolution * resolution, 4, dtype=np.int32))
+        mesh.CreateFaceVertexIndicesAttr(indices.astype(np.int32))
+    return stage
+
+
+# Rays fired straight down at random positions over the meshes
+def make_rays(count, meshes, seed=0):
+    rng = np.random.default_rng(seed)
+    origins = np.stack((rng.random(count) * meshes * 120.0, rng.random(count) * 100.0, np.full(count, 50.0)), axis=1)
+    dirs = np.tile((0.0, 0.0, -1.0), (count, 1))
+    return origins, dirs
+
+
+# Closed UV sphere with its poles as single vertices
+def make_sphere(path, resolution, offset):
+    from lm.measurement.tool.mesh_data import MeshData
+
+    stacks, slices = resolution, 2 * resolution
+    theta = np.linspace(0.0, np.pi, stacks + 1)[1:-1]
+    phi = np.linspace(0.0, 2.0 * np.pi, slices, endpoint=False)
+    t, p = (grid.ravel() for grid in np.meshgrid(theta, phi, indexing="ij"))
+    ring = np.stack((np.sin(t) * np.cos(p), np.sin(t) * np.sin(p), np.cos(t)), axis=1)
+    points = np.vstack(((0.0, 0.0, 1.0), ring, (0.0, 0.0, -1.0))) * 10.0 + offset
+    bottom = len(points) - 1
+
+    j = np.arange(slices)
+    following = (j + 1) % slices
+    top = np.stack((np.zeros(slices, dtype=np.int64), 1 + following, 1 + j), axis=1).ravel()
+    rows = np.arange(stacks - 2)[:, None] * slices
+    quads = np.stack(
+        (1 + rows + j, 1 + rows + following, 1 + rows + slices + following, 1 + rows + slices + j), axis=2
+    ).reshape(-1)
+    last = 1 + (stacks - 2) * slices
+    cap = np.stack((last + j, last + following, np.full(slices, bottom)), axis=1).ravel()
+    counts = np.concatenate((np.full(slices, 3), np.full((stacks - 2) * slices, 4), np.full(slices, 3)))
+    return MeshData(path, points, counts, np.concatenate((top, quads, cap)))
+
+
+class MeshBackend:
+
+    # Just enough of a raycast backend for the caches that read its MeshData, such as AreaVolumeCache
+    def __init__(self, meshes):
+        self.meshes = {data.path: data for data in meshes}
+        self.callbacks = []
+
+    def get_mesh_paths(self):
+        return list(self.meshes)
+
+    def get_mesh_data(self, path):
+        return self.meshes.get(path)
+
+    def add_rebuild_callback(self, fn):
+        self.callbacks.append(fn)
+
+
+# count points scanned off a wavy 100 x 100 sheet, with noise across it, as N x 3 float32 generated in chunks
+def make_scan(count, seed=0, noise=0.05, chunk=1 << 22):
+    rng = np.random.default_rng(seed)
+    points = np.empty((count, 3), dtype=np.float32)
+    for lo in range(0, count, chunk):
+        n = min(chunk, count - lo)
+        uv = rng.random((n, 2), dtype=np.float32) * 100.0
+        points[lo:lo + n, :2] = uv
+        points[lo:lo + n, 2] = 5.0 * np.sin(uv[:, 0] * 0.1) + rng.normal(0.0, noise, n).astype(np.float32)
+    return points
+
+
+# UsdGeom.Points prim at path holding points
+def add_points(stage, path, points, translate=None):
+    cloud = UsdGeom.Points.Define(stage, path)
+    cloud.CreatePointsAttr(np.asarray(points, dtype=np.float32))
+    if translate is not None:
+        cloud.AddTranslateOp().Set(tuple(float(value) for value in translate))
+    return cloud
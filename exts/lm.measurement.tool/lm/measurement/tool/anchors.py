@@ -0,0 +1,209 @@
+'''
+Keeps measurement points attached to the prims they were picked on. An anchored
+point is stored as the path of its prim and its position in the prim's local
+space, and its world position is recomputed through one shared
+UsdGeom.XformCache. Transform and resync change notices are resolved to the
+anchored prims at or under the changed paths through a sorted index of prim
+paths, so moving one part only recomputes the points anchored to it and to the
+prims below it, however many other measurements there are.
+'''
+
+import bisect
+
+import numpy as np
+from pxr import Usd, UsdGeom
+
+from .stage_listener import StageListener
+
+
+class AnchorMove:
+
+    # Constructor, positions are the new world positions of the group's points at indices. segment_transforms maps
+    # the index of a segment whose two points moved with the same prim to the 4 x 4 matrix (row vectors) that moved it.
+    def __init__(self, group_id, indices, positions, segment_transforms):
+        self.group_id = group_id
+        self.indices = indices
+        self.positions = positions
+        self.segment_transforms = segment_transforms
+
+
+class _PrimAnchors:
+
+    # Local positions of the points anchored to one prim by (group id, point index), with the local to world matrix
+    # their world positions were last computed with
+    def __init__(self, matrix):
+        self.local = {}
+        self.matrix = matrix
+        self._inverse = None
+
+    @property
+    def inverse(self):
+        if self._inverse is None:
+            self._inverse = np.linalg.pinv(self.matrix)
+        return self._inverse
+
+    def set_matrix(self, matrix):
+        self.matrix = matrix
+        self._inverse = None
+
+
+class PointAnchors:
+
+    # Constructor, time is the time code transforms are read at
+    def __init__(self, stage=None, time=Usd.TimeCode.Default()):
+        self._stage = None
+        self._listener = StageListener(geometry_attributes=frozenset())
+        self._xform_cache = UsdGeom.XformCache(time)
+
+        # Anchors per prim path, the prim path of each anchored point per group and points waiting to be anchored.
+        # Prim paths are kept sorted for subtree lookups, sorted again only after prims were added or removed.
+        self._prims = {}
+        self._groups = {}
+        self._pending = {}
+        self._sorted = None
+        self.set_stage(stage)
+
+    def __len__(self):
+        return sum(len(points) for points in self._groups.values()) + len(self._pending)
+
+    def get_stage(self):
+        return self._stage
+
+    # Switching stages drops the anchors on the previous one, points added before any stage was set are kept
+    def set_stage(self, stage):
+        if stage == self._stage:
+            return
+        if self._stage is not None:
+            self.clear()
+        self._stage = stage
+        self._listener.set_stage(stage)
+        self._xform_cache.Clear()
+
+    def clear(self):
+        self._prims.clear()
+        self._groups.clear()
+        self._pending = {}
+        self._sorted = None
+
+    # Anchor a group's point to the prim at prim_path, world_point is where the point is now. A point already
+    # anchored to that prim keeps its anchor. The local position is computed on the next update, once pending
+    # stage edits are applied.
+    def add(self, group_id, index, prim_path, world_point):
+        index = int(index)
+        prim_path = str(prim_path)
+        if self.get_prim(group_id, index) != prim_path:
+            self._pending[(group_id, index)] = (prim_path, np.asarray(world_point, dtype=np.float64).reshape(3))
+
+    # Drop the anchors of a group's points from index first on, all of them by default
+    def remove(self, group_id, first=0):
+        if self._pending:
+            self._pending = {key: value for key, value in self._pending.items() if key[0] != group_id or key[1] < first}
+        points = self._groups.get(group_id)
+        if points:
+            for index in [index for index in points if index >= first]:
+                self._remove_point(group_id, index)
+
+    def _remove_point(self, group_id, index):
+        points = self._groups.get(group_id)
+        prim_path = points.pop(index, None) if points else None
+        if prim_path is None:
+            return
+        if not points:
+            del self._groups[group_id]
+        anchors = self._prims[prim_path]
+        del anchors.local[(group_id, index)]
+        if not anchors.local:
+            del self._prims[prim_path]
+            self._sorted = None
+
+    # Prim a group's point is anchored to, None when it is not anchored (yet)
+    def get_prim(self, group_id, index):
+        return self._groups.get(group_id, {}).get(index)
+
+    # Prim path and local position a group's point is anchored to, None when it is not anchored (yet)
+    def get_anchor(self, group_id, index):
+        prim_path = self.get_prim(group_id, index)
+        if prim_path is None:
+            return None
+        return prim_path, self._prims[prim_path].local[(group_id, index)]
+
+    # Apply the stage edits collected from change notices and anchor the points added since the last call, called on
+    # the main thread. Returns an AnchorMove for every group with points whose prim moved.
+    def update(self):
+        moved = {}
+        deltas = {}
+        if self._listener.has_changes():
+            changes = self._listener.take()
+            self._xform_cache.Clear()
+            for prim_path in self._prims_under(changes.transforms | changes.resynced):
+                self._move(prim_path, moved, deltas)
+        if self._pending:
+            self._anchor_pending()
+        return [self._group_move(group_id, positions, deltas) for group_id, positions in moved.items()]
+
+    # Anchored prims at or under any of the given paths
+    def _prims_under(self, roots):
+        if not self._prims or not roots:
+            return []
+        if "/" in roots:
+            return list(self._prims)
+        if self._sorted is None:
+            self._sorted = sorted(self._prims)
+        found = set()
+        for root in roots:
+            if root in self._prims:
+                found.add(root)
+
+            # Prim names never contain characters between "/" and "0", so a subtree is one run of the sorted paths
+            lo = bisect.bisect_left(self._sorted, root + "/")
+            hi = bisect.bisect_left(self._sorted, root + "0", lo)
+            found.update(self._sorted[lo:hi])
+        return found
+
+    def _world_matrix(self, prim_path):
+        prim = self._stage.GetPrimAtPath(prim_path) if self._stage is not None else None
+        if not prim:
+            return None
+        return np.array(self._xform_cache.GetLocalToWorldTransform(prim), dtype=np.float64)
+
+    # Recompute the world positions of one prim's points when its transform changed. A prim that no longer exists
+    # leaves its points where they are, they follow it again if it comes back.
+    def _move(self, prim_path, moved, deltas):
+        anchors = self._prims[prim_path]
+        matrix = self._world_matrix(prim_path)
+        if matrix is None or np.array_equal(matrix, anchors.matrix):
+            return
+        deltas[prim_path] = anchors.inverse @ matrix
+        anchors.set_matrix(matrix)
+        keys = list(anchors.local)
+        world = np.array(list(anchors.local.values())) @ matrix[:3, :3] + matrix[3, :3]
+        for (group_id, index), position in zip(keys, world):
+            moved.setdefault(group_id, {})[index] = position
+
+    def _anchor_pending(self):
+        pending = self._pending
+        self._pending = {}
+        for (group_id, index), (prim_path, point) in pending.items():
+            self._remove_point(group_id, index)
+            anchors = self._prims.get(prim_path)
+            if anchors is None:
+                matrix = self._world_matrix(prim_path)
+                if matrix is None:
+                    continue
+                anchors = self._prims[prim_path] = _PrimAnchors(matrix)
+                self._sorted = None
+            inverse = anchors.inverse
+            anchors.local[(group_id, index)] = point @ inverse[:3, :3] + inverse[3, :3]
+            self._groups.setdefault(group_id, {})[index] = prim_path
+
+    # Segments whose two points moved with the same prim keep their shape, moved by that prim's change of transform
+    def _group_move(self, group_id, positions, deltas):
+        points = self._groups[group_id]
+        indices = sorted(positions)
+        segment_transforms = {}
+        for index in indices:
+            prim_path = points[index]
+            if index + 1 in positions and points.get(index + 1) == prim_path:
+                segment_transforms[index] = deltas[prim_path]
+        world = np.array([positions[index] for index in indices])
+        return AnchorMove(group_id, np.array(indices, dtype=np.int64), world, segment_transforms)
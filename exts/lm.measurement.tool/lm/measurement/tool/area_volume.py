@@ -0,0 +1,172 @@
+'''
+Surface area and enclosed volume of meshes. Both are sums over the triangles of
+the mesh data the raycast backend already reads (world space points and the fan
+triangulation of faceVertexIndices), taken in vectorized chunks: the area from
+the lengths of the triangle cross products, the volume as the signed volume of
+the tetrahedra the triangles form with the mesh's center (divergence theorem).
+The volume only means something for closed meshes. A mesh counts as closed when
+every edge is shared by exactly two triangles that run along it in opposite
+directions, so an open tube or a surface with a hole or a flipped face is not.
+Results are cached per mesh until it is edited. The meshes of a multi-selection
+are summed on a thread pool, NumPy releases the GIL in the chunk sums.
+'''
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .stage_listener import paths_under
+
+# Triangles summed at once, bounds the working memory to about 200 bytes per triangle of the chunk
+CHUNK_TRIANGLES = 1 << 16
+
+
+class MeshAreaVolume:
+
+    # Constructor, signed_volume is positive when the triangles wind counterclockwise seen from outside
+    # and bounds are the mesh's world space (min, max)
+    def __init__(self, mesh_path, area, signed_volume, closed, triangle_count, bounds):
+        self.mesh_path = mesh_path
+        self.area = area
+        self.signed_volume = signed_volume
+        self.closed = closed
+        self.triangle_count = triangle_count
+        self.bounds = bounds
+
+    @property
+    def volume(self):
+        return abs(self.signed_volume)
+
+
+class AreaVolumeResult:
+
+    # Constructor, meshes are the MeshAreaVolume of every mesh at or under path
+    def __init__(self, path, meshes):
+        self.path = path
+        self.meshes = meshes
+
+    @property
+    def area(self):
+        return sum(mesh.area for mesh in self.meshes)
+
+    # Volume enclosed by the closed meshes, open ones enclose nothing
+    @property
+    def volume(self):
+        return sum(mesh.volume for mesh in self.meshes if mesh.closed)
+
+    @property
+    def closed(self):
+        return all(mesh.closed for mesh in self.meshes)
+
+    @property
+    def triangle_count(self):
+        return sum(mesh.triangle_count for mesh in self.meshes)
+
+    # Center of the meshes' combined world bounds, where the readout is drawn
+    @property
+    def center(self):
+        if not self.meshes:
+            return np.zeros(3)
+        lo = np.min([mesh.bounds[0] for mesh in self.meshes], axis=0)
+        hi = np.max([mesh.bounds[1] for mesh in self.meshes], axis=0)
+        return (lo + hi) * 0.5
+
+
+# Area, signed volume and summed area vector of a triangle mesh, points are N x 3 and triangles T x 3 vertex indices.
+# Coordinates are gathered per axis from contiguous columns. With a the first corner relative to the center and
+# n the cross product of the triangle's edges from it, a . n is six times the volume of its tetrahedron.
+def area_volume(points, triangles):
+    center = (points.min(axis=0) + points.max(axis=0)) * 0.5 if len(points) else np.zeros(3)
+    columns = [np.ascontiguousarray(points[:, axis] - center[axis]) for axis in range(3)]
+    area = 0.0
+    volume = 0.0
+    vector = np.zeros(3)
+    for lo in range(0, len(triangles), CHUNK_TRIANGLES):
+        chunk = triangles[lo:lo + CHUNK_TRIANGLES]
+        i0, i1, i2 = chunk[:, 0], chunk[:, 1], chunk[:, 2]
+        a = [column[i0] for column in columns]
+        u = [column[i1] - corner for column, corner in zip(columns, a)]
+        v = [column[i2] - corner for column, corner in zip(columns, a)]
+        n = (u[1] * v[2] - u[2] * v[1], u[2] * v[0] - u[0] * v[2], u[0] * v[1] - u[1] * v[0])
+        area += float(np.sqrt(n[0] * n[0] + n[1] * n[1] + n[2] * n[2]).sum())
+        volume += float(a[0] @ n[0] + a[1] @ n[1] + a[2] @ n[2])
+        vector += [component.sum() for component in n]
+    return area * 0.5, volume / 6.0, vector * 0.5
+
+
+# Whether triangles (T x 3 vertex indices) form closed, consistently wound surfaces: every edge is used exactly
+# twice, once in each direction. The edges running from a lower to a higher vertex index must then be the reverses
+# of the others, one for one. Edges of degenerate triangles that start and end at one vertex are skipped.
+def is_closed(triangles, vertex_count):
+    if not len(triangles):
+        return False
+    start = triangles.ravel()
+    end = np.roll(triangles, -1, axis=1).ravel()
+    forward = start < end
+    backward = start > end
+    keys = start[forward] * int(vertex_count) + end[forward]
+    keys.sort()
+    reverses = end[backward] * int(vertex_count) + start[backward]
+    reverses.sort()
+    return len(keys) == len(reverses) and bool((keys == reverses).all()) and bool((keys[1:] != keys[:-1]).all())
+
+
+class AreaVolumeCache:
+
+    # Constructor, mesh_raycast is the raycast backend that supplies mesh data and rebuild notifications,
+    # workers is the size of the thread pool meshes are summed on
+    def __init__(self, mesh_raycast, workers=1):
+        self._mr = mesh_raycast
+        self._meshes = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(int(workers), 1), thread_name_prefix="lm.measurement.tool.area")
+
+        # Counts invalidations, so callers can tell whether results they hold may be stale
+        self.generation = 0
+        self._mr.add_rebuild_callback(self.invalidate)
+
+    # Area and volume of every mesh at or under each prim path, one AreaVolumeResult per path.
+    # Cached meshes are reused, the others are summed on the pool from the mesh data read before the query.
+    def measure(self, paths):
+        mesh_paths = self._mr.get_mesh_paths()
+        per_path = [paths_under(mesh_paths, [str(path)]) for path in paths]
+        with self._lock:
+            generation = self.generation
+            missing = sorted(set(mesh for meshes in per_path for mesh in meshes if mesh not in self._meshes))
+
+        futures = {}
+        for mesh_path in missing:
+            data = self._mr.get_mesh_data(mesh_path)
+            if data is not None and len(data.points):
+                futures[mesh_path] = self._pool.submit(self._measure_mesh, mesh_path, data)
+        measured = {mesh_path: future.result() for mesh_path, future in futures.items()}
+
+        with self._lock:
+            if generation == self.generation:
+                self._meshes.update(measured)
+            known = dict(self._meshes)
+        known.update(measured)
+        return [
+            AreaVolumeResult(str(path), [known[mesh] for mesh in meshes if mesh in known])
+            for path, meshes in zip(paths, per_path)
+        ]
+
+    @staticmethod
+    def _measure_mesh(mesh_path, data):
+        area, volume, _ = area_volume(data.world_points, data.triangles)
+        closed = is_closed(data.triangles, len(data.points))
+        return MeshAreaVolume(mesh_path, area, volume, closed, len(data.triangles), data.bounds)
+
+    # Drop the results of the given mesh paths, or every result when paths is None
+    def invalidate(self, paths=None):
+        with self._lock:
+            self.generation += 1
+            if paths is None:
+                self._meshes.clear()
+                return
+            for path in paths:
+                self._meshes.pop(str(path), None)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,399 @@
+'''
+Overall dimensions of prims: the world axis aligned box of their geometry and a
+close to minimal oriented box. Each prim stands for every visible point based
+prim (meshes, points, curves) at or under it, other gprims add the corners of
+their UsdGeom.BBoxCache bound. The world space points of each gprim and the
+boxes of each measured prim are cached per prim path, and a USD change notice
+only drops the entries of the edited prim, its ancestors and its descendants,
+so selecting an unchanged prim again is a dictionary lookup. The points are
+read on the main thread, the boxes are then fitted on any thread.
+The oriented box is the smallest of the axis aligned box, the box along the
+principal axes of the points and the boxes rotating calipers find around each
+principal and world axis, on the 2D convex hull of the points projected across
+that axis. Extents are always measured over every point, so the box is tight.
+'''
+
+import threading
+
+import numpy as np
+from pxr import Usd, UsdGeom
+
+from .mesh_data import transform_points
+from .stage_listener import StageListener, GEOMETRY_ATTRIBUTES
+
+# Attributes besides the transform whose edits change a prim's bounds
+BOUNDS_ATTRIBUTES = GEOMETRY_ATTRIBUTES | frozenset(
+    ("extent", "visibility", "purpose", "size", "radius", "height", "axis", "widths", "positions", "protoIndices")
+)
+
+# Purposes whose geometry counts toward bounds, the ones the viewport draws
+BOUNDS_PURPOSES = [UsdGeom.Tokens.default_, UsdGeom.Tokens.render]
+
+# Projected points are binned into this many columns along each axis of the projection plane, only the lowest and
+# highest point of each column can be a hull vertex the calipers need
+HULL_BINS = 256
+
+# Points are binned into this many columns along each axis of a grid across each world axis, only the lowest and
+# highest point of each column take part in the search for the box axes
+BOUNDARY_BINS = 96
+
+# Points projected onto the candidate box axes at once
+EXTENT_CHUNK = 1 << 16
+
+# Most rounds of rotating calipers around the axes of the best box found so far
+REFINE_ROUNDS = 4
+
+# Sizes below this fraction of the box diagonal count as this much when comparing volumes, so flat and linear
+# shapes are compared by area or length
+FLAT_TOLERANCE = 1e-6
+
+# The 12 edges of a box as pairs of corner indices, bit i of a corner index picks the positive side along axis i
+BOX_EDGES = np.array([(c, c | 1 << i) for c in range(8) for i in range(3) if not c & 1 << i])
+
+
+# Corners (8 x 3) of a box centered at center with its unit axes as the rows of axes and full size along each
+def box_corners(center, axes, size):
+    signs = (np.arange(8)[:, None] >> np.arange(3) & 1) * 2.0 - 1.0
+    return center + (signs * (np.asarray(size) * 0.5)) @ axes
+
+
+# Counterclockwise convex hull of N x 2 points by the monotone chain, duplicates and collinear points are dropped
+def convex_hull_2d(points):
+    points = np.unique(points, axis=0)
+    if len(points) < 3:
+        return points
+    rows = points.tolist()
+
+    def chain(ordered):
+        hull = []
+        for x, y in ordered:
+            while len(hull) >= 2:
+                (ax, ay), (bx, by) = hull[-2], hull[-1]
+                if (bx - ax) * (y - ay) - (by - ay) * (x - ax) > 0.0:
+                    break
+                hull.pop()
+            hull.append((x, y))
+        return hull[:-1]
+
+    return np.array(chain(rows) + chain(reversed(rows)))
+
+
+# Indices of one lowest and one highest point along axis per column of a bins^d grid over the other coordinates,
+# columns index the points' columns (any integer in [0, bins^d))
+def _column_extremes(values, columns, count):
+    keep = []
+    lowest = np.full(count, np.inf)
+    highest = np.full(count, -np.inf)
+    np.minimum.at(lowest, columns, values)
+    np.maximum.at(highest, columns, values)
+    for extreme in (lowest, highest):
+        index = np.flatnonzero(values == extreme[columns])
+        _, first = np.unique(columns[index], return_index=True)
+        keep.append(index[first])
+    return keep
+
+
+# Column of each coordinate in bins equal columns over its range
+def _bin(values, bins):
+    span = np.ptp(values)
+    if span <= 0.0:
+        return np.zeros(len(values), dtype=np.int64)
+    return np.minimum(((values - values.min()) * (bins / span)).astype(np.int64), bins - 1)
+
+
+# Points of an N x 2 array that are the lowest or highest in their column, binned along both axes
+def _hull_candidates(points):
+    keep = []
+    for axis in (0, 1):
+        keep += _column_extremes(points[:, 1 - axis], _bin(points[:, axis], HULL_BINS), HULL_BINS)
+    return points[np.concatenate(keep)]
+
+
+# Points of an N x 3 array that are the lowest or highest in their column of a grid across each axis. Every
+# projection's hull is searched on these, extents are still measured over every point.
+def _boundary_points(points):
+    keep = []
+    bins = [_bin(points[:, axis], BOUNDARY_BINS) for axis in range(3)]
+    for axis in range(3):
+        columns = bins[(axis + 1) % 3] * BOUNDARY_BINS + bins[(axis + 2) % 3]
+        keep += _column_extremes(points[:, axis], columns, BOUNDARY_BINS * BOUNDARY_BINS)
+    return points[np.unique(np.concatenate(keep))]
+
+
+# Rotation angle of the smallest area rectangle around N x 2 points, by rotating calipers over their convex hull.
+# The rectangle's sides run along (cos, sin) and (-sin, cos), None when the points do not span an area.
+def min_area_angle(points):
+    hull = convex_hull_2d(_hull_candidates(points))
+    if len(hull) < 3:
+        return None
+    edges = np.roll(hull, -1, axis=0) - hull
+    angles = np.unique(np.mod(np.arctan2(edges[:, 1], edges[:, 0]), np.pi * 0.5))
+    cos, sin = np.cos(angles), np.sin(angles)
+    u = hull[:, 0, None] * cos + hull[:, 1, None] * sin
+    v = hull[:, 1, None] * cos - hull[:, 0, None] * sin
+    areas = np.ptp(u, axis=0) * np.ptp(v, axis=0)
+    return float(angles[np.argmin(areas)])
+
+
+# Lowest and highest coordinates of N x 3 points along each row of a K x 3 array of axes, in chunks of points
+def _extents(points, axes):
+    low = np.full(len(axes), np.inf)
+    high = np.full(len(axes), -np.inf)
+    for lo in range(0, len(points), EXTENT_CHUNK):
+        projected = axes @ points[lo:lo + EXTENT_CHUNK].T
+        np.minimum(low, projected.min(axis=1), out=low)
+        np.maximum(high, projected.max(axis=1), out=high)
+    return low, high
+
+
+# Boxes found by rotating calipers around each axis of a frame (rows), keeping that axis
+def _caliper_frames(centered, frame):
+    frames = []
+    for k in range(3):
+        u, v = frame[(k + 1) % 3], frame[(k + 2) % 3]
+        angle = min_area_angle(centered @ np.stack((u, v), axis=1))
+        if angle is not None:
+            cos, sin = np.cos(angle), np.sin(angle)
+            frames.append(np.stack((frame[k], cos * u + sin * v, cos * v - sin * u)))
+    return frames
+
+
+# Smallest of the candidate frames' boxes around centered points, returns (volume, axes, low, high).
+# Every candidate's extents are measured in one pass over the points, the first of equally small boxes wins.
+def _smallest_box(centered, candidates, floor):
+    lows, highs = (extent.reshape(-1, 3) for extent in _extents(centered, np.concatenate(candidates)))
+    volumes = np.prod(np.maximum(highs - lows, floor), axis=1)
+    best = int(np.flatnonzero(volumes <= volumes.min() * (1.0 + 1e-9))[0])
+    return float(volumes[best]), candidates[best], lows[best], highs[best]
+
+
+# Close to minimal oriented box around N x 3 points, returns (center, axes as rows, size along each axis).
+# The axes are searched on the points at the boundary of a coarse grid, then measured over every point.
+# The best box of the first candidates is refined by rotating calipers around its own axes until that stops
+# shrinking it, which straightens boxes whose principal axes are tilted by uneven geometry.
+def oriented_box(points):
+    lo, hi = _extents(points, np.identity(3))
+    middle = (lo + hi) * 0.5
+    centered = points - middle
+    floor = FLAT_TOLERANCE * max(float(np.linalg.norm(hi - lo)), 1e-30)
+    candidates = [np.identity(3)]
+    if len(points) >= 3:
+        _, vectors = np.linalg.eigh(centered.T @ centered)
+        principal = vectors.T[::-1]
+        boundary = _boundary_points(centered)
+        candidates += [principal] + _caliper_frames(boundary, principal) + _caliper_frames(boundary, np.identity(3))
+        best = _smallest_box(boundary, candidates, floor)
+        for _ in range(REFINE_ROUNDS):
+            refined = _caliper_frames(boundary, best[1])
+            if not refined:
+                break
+            candidate = _smallest_box(boundary, refined, floor)
+            if candidate[0] >= best[0] * (1.0 - 1e-6):
+                break
+            best = candidate
+        candidates = [best[1]]
+    low, high = _extents(centered, candidates[0])
+    axes = candidates[0]
+    return middle + ((low + high) * 0.5) @ axes, axes, high - low
+
+
+# Order of a box's axes as (width, height, depth): height is the axis closest to the stage's up axis,
+# width the closest of the other two to world X
+def dimension_order(axes, up_axis=UsdGeom.Tokens.y):
+    up = np.array((0.0, 0.0, 1.0)) if up_axis == UsdGeom.Tokens.z else np.array((0.0, 1.0, 0.0))
+    height = int(np.argmax(np.abs(axes @ up)))
+    others = [k for k in range(3) if k != height]
+    width = max(others, key=lambda k: abs(axes[k][0]))
+    depth = others[0] if width == others[1] else others[1]
+    return width, height, depth
+
+
+class PrimBounds:
+
+    # Constructor, aligned_min and aligned_max span the world axis aligned box and the oriented box is centered
+    # at center with its unit axes as the rows of axes and its full size along each
+    def __init__(self, path, aligned_min, aligned_max, center, axes, size, point_count):
+        self.path = path
+        self.aligned_min = aligned_min
+        self.aligned_max = aligned_max
+        self.center = center
+        self.axes = axes
+        self.size = size
+        self.point_count = point_count
+
+    @property
+    def aligned_size(self):
+        return self.aligned_max - self.aligned_min
+
+    # Center, axes and size of the oriented box, or of the axis aligned one
+    def box(self, oriented=True):
+        if oriented:
+            return self.center, self.axes, self.size
+        return (self.aligned_min + self.aligned_max) * 0.5, np.identity(3), self.aligned_size
+
+    def corners(self, oriented=True):
+        return box_corners(*self.box(oriented))
+
+    # Width, height and depth of a box with the axes they run along, see dimension_order
+    def dimensions(self, oriented=True, up_axis=UsdGeom.Tokens.y):
+        _, axes, size = self.box(oriented)
+        order = dimension_order(axes, up_axis)
+        return [(float(size[k]), axes[k]) for k in order], order
+
+
+# World points of a prim's gprims, read on the main thread, see BoundsCache.snapshot
+class BoundsSnapshot:
+
+    def __init__(self, path, points, generation):
+        self.path = path
+        self.points = points
+        self.generation = generation
+
+
+class BoundsCache:
+
+    # Constructor, time is the time code bounds are computed at
+    def __init__(self, stage=None, time=Usd.TimeCode.Default()):
+        self._time = time
+        self._stage = None
+        self._listener = StageListener(geometry_attributes=BOUNDS_ATTRIBUTES)
+        self._bbox_cache = UsdGeom.BBoxCache(time, BOUNDS_PURPOSES)
+        self._xform_cache = UsdGeom.XformCache(time)
+
+        # Boxes per measured prim and world points per gprim. Points are read and both are dropped on the UI thread
+        # while queries may be fitting boxes on a worker, boxes fitted across an invalidation are not stored.
+        self._bounds = {}
+        self._points = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.set_stage(stage)
+
+    def get_stage(self):
+        return self._stage
+
+    # Switching stages drops everything measured on the previous one
+    def set_stage(self, stage):
+        if stage == self._stage:
+            return
+        self._stage = stage
+        self._listener.set_stage(stage)
+        self.invalidate()
+
+    # Apply stage edits collected from change notices, called on the main thread.
+    # Returns the paths of the measured prims whose boxes were dropped.
+    def update(self):
+        if not self._listener.has_changes():
+            return set()
+        changes = self._listener.take()
+        return self.invalidate(changes.resynced | changes.geometry | changes.transforms)
+
+    # Drop the cached data of the given prim paths with their ancestors and descendants, or everything when paths
+    # is None, called on the main thread. Returns the paths of the measured prims whose boxes were dropped.
+    def invalidate(self, paths=None):
+        self._bbox_cache.Clear()
+        self._xform_cache.Clear()
+        with self._lock:
+            self._generation += 1
+            if paths is None:
+                dropped = set(self._bounds)
+                self._bounds.clear()
+                self._points.clear()
+                return dropped
+            prefixes = tuple(path.rstrip("/") + "/" for path in paths)
+            dropped = set(key for key in self._bounds if _related(key, paths, prefixes))
+            for key in dropped:
+                del self._bounds[key]
+            for key in [key for key in self._points if _related(key, paths, prefixes)]:
+                del self._points[key]
+            return dropped
+
+    # Cached bounds of a prim path, None when they have not been measured since the prim last changed
+    def peek(self, path):
+        with self._lock:
+            return self._bounds.get(str(path))
+
+    # Bounds of the geometry at or under a prim path, measured on first request on the calling thread, which has to
+    # be the main thread. Returns a PrimBounds or None when the prim does not exist or has no visible geometry.
+    def get(self, path):
+        bounds = self.peek(path)
+        if bounds is None:
+            bounds = self.compute(self.snapshot(path))
+        return bounds
+
+    # Read the world points of every visible gprim at or under a prim path, called on the main thread.
+    # compute() fits the boxes to the snapshot on any thread.
+    def snapshot(self, path):
+        path = str(path)
+        with self._lock:
+            generation = self._generation
+        prim = self._stage.GetPrimAtPath(path) if self._stage is not None else None
+        if not prim or not prim.IsValid():
+            return BoundsSnapshot(path, None, generation)
+        arrays = [self._gprim_points(gprim) for gprim in self._gprims(prim)]
+        arrays = [points for points in arrays if len(points)]
+        points = None
+        if arrays:
+            points = np.concatenate(arrays) if len(arrays) > 1 else arrays[0]
+            points.setflags(write=False)
+        return BoundsSnapshot(path, points, generation)
+
+    # Bounds of a snapshot, cached unless the prim changed since it was read
+    def compute(self, snapshot):
+        bounds = None
+        if snapshot.points is not None:
+            points = snapshot.points
+            center, axes, size = oriented_box(points)
+            bounds = PrimBounds(snapshot.path, *_extents(points, np.identity(3)), center, axes, size, len(points))
+        with self._lock:
+            if snapshot.generation == self._generation:
+                self._bounds[snapshot.path] = bounds
+        return bounds
+
+    # Visible gprims at or under a prim, including those inside instances
+    def _gprims(self, prim):
+        gprims = []
+        iterator = iter(Usd.PrimRange(prim, Usd.TraverseInstanceProxies()))
+        for child in iterator:
+            imageable = UsdGeom.Imageable(child)
+            if imageable and (
+                imageable.ComputeVisibility(self._time) == UsdGeom.Tokens.invisible
+                or imageable.ComputePurpose() not in BOUNDS_PURPOSES
+            ):
+                iterator.PruneChildren()
+            elif child.IsA(UsdGeom.Boundable):
+                gprims.append(child)
+                iterator.PruneChildren()
+        return gprims
+
+    # World space points of a point based prim, or the corners of any other gprim's bound, cached per path
+    def _gprim_points(self, prim):
+        path = prim.GetPath().pathString
+        with self._lock:
+            points = self._points.get(path)
+            generation = self._generation
+        if points is not None:
+            return points
+        if prim.IsA(UsdGeom.PointBased):
+            local = UsdGeom.PointBased(prim).GetPointsAttr().Get(self._time)
+            matrix = np.array(self._xform_cache.GetLocalToWorldTransform(prim), dtype=np.float64)
+            points = np.zeros((0, 3))
+            if local:
+                points = transform_points(np.asarray(local, dtype=np.float64).reshape(-1, 3), matrix)
+        else:
+            bound = self._bbox_cache.ComputeWorldBound(prim)
+            box = bound.GetRange()
+            if box.IsEmpty():
+                points = np.zeros((0, 3))
+            else:
+                lo, hi = np.array(box.GetMin()), np.array(box.GetMax())
+                local = box_corners((lo + hi) * 0.5, np.identity(3), hi - lo)
+                points = transform_points(local, np.array(bound.GetMatrix(), dtype=np.float64))
+        with self._lock:
+            if generation == self._generation:
+                self._points[path] = points
+        return points
+
+
+# Whether key is one of paths or an ancestor or descendant of one, prefixes are the paths with a trailing slash
+def _related(key, paths, prefixes):
+    return key in paths or key.startswith(prefixes) or any(path.startswith(key.rstrip("/") + "/") for path in paths)
@@ -0,0 +1,855 @@
+'''
+Bounding volume hierarchy over triangle arrays, built with a binned SAH.
+All queries walk the tree one level at a time so that box and triangle tests
+run as vectorized NumPy operations instead of per-node Python calls.
+'''
+
+import numpy as np
+
+# Numerical tolerance for the ray/triangle and geometry helpers
+EPSILON = 1e-12
+
+# Node pairs expanded at once by the closest pair search, the ones with the smallest lower bound go first
+CLOSEST_PAIR_BATCH = 4096
+
+# Leaf pairs whose triangles are gathered at once by the closest pair search, before the rest are pruned again
+CLOSEST_PAIR_LEAVES = 256
+
+# Triangle pairs the closest pair search collects before testing them exactly
+CLOSEST_PAIR_TRIANGLES = 1 << 12
+
+# (point, leaf) pairs tested at once by the closest point search, in order of their distance
+CLOSEST_POINT_LEAVES = 1 << 14
+
+# Nodes per level each point descends along to find the first upper bound of the closest point search
+CLOSEST_POINT_SEEDS = 3
+
+
+# Row-wise dot product of two N x 3 arrays
+def _dot(a, b):
+    return np.einsum("ij,ij->i", a, b)
+
+
+# Expand (start, count) ranges into one flat array of indices plus the range each index came from
+def expand_ranges(starts, counts):
+    total = int(counts.sum())
+    owner = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return starts[owner] + offsets, owner
+
+
+# Slab test of rays against boxes, returns the entry and exit distance along each ray
+def ray_box_intervals(box_min, box_max, origins, inv_dirs):
+    with np.errstate(invalid="ignore"):
+        t0 = (box_min - origins) * inv_dirs
+        t1 = (box_max - origins) * inv_dirs
+    t0 = np.nan_to_num(t0, nan=-np.inf)
+    t1 = np.nan_to_num(t1, nan=np.inf)
+    tnear = np.minimum(t0, t1).max(axis=1)
+    tfar = np.maximum(t0, t1).min(axis=1)
+    return tnear, tfar
+
+
+# Reciprocal ray directions with zero components mapped to infinity
+def safe_inverse(dirs):
+    with np.errstate(divide="ignore"):
+        return 1.0 / np.where(dirs == 0.0, 0.0, dirs)
+
+
+# Squared distance from points to boxes, zero when the point is inside
+def point_box_distance_sq(points, box_min, box_max):
+    delta = np.maximum(np.maximum(box_min - points, points - box_max), 0.0)
+    return (delta * delta).sum(axis=-1)
+
+
+# Squared distance between pairs of boxes, zero when they overlap
+def box_box_distance_sq(min_a, max_a, min_b, max_b):
+    delta = np.maximum(np.maximum(min_a - max_b, min_b - max_a), 0.0)
+    return (delta * delta).sum(axis=-1)
+
+
+# Mask of the world space boxes (N x 3 min and max) that may be visible through a row-vector view projection
+# matrix. A box is culled only when all 8 of its corners lie outside the same clip plane.
+def boxes_in_frustum(view_projection, box_min, box_max):
+    box_min = np.asarray(box_min, dtype=np.float64).reshape(-1, 3)
+    box_max = np.asarray(box_max, dtype=np.float64).reshape(-1, 3)
+    select = np.array([[(i >> axis) & 1 for axis in range(3)] for i in range(8)], dtype=bool)
+    corners = np.ones((len(box_min), 8, 4))
+    corners[:, :, :3] = np.where(select, box_max[:, None, :], box_min[:, None, :])
+    with np.errstate(invalid="ignore"):
+        clip = corners @ np.asarray(view_projection, dtype=np.float64).reshape(4, 4)
+        xyz = clip[:, :, :3]
+        w = clip[:, :, 3:]
+        outside = ((xyz < -w).all(axis=1) | (xyz > w).all(axis=1)).any(axis=1)
+    return ~outside
+
+# Moller-Trumbore intersection of rays with triangles given as (v0, e1, e2), double sided
+def ray_triangle_intersect(origins, dirs, v0, e1, e2):
+    p = np.cross(dirs, e2)
+    det = _dot(e1, p)
+    valid = np.abs(det) > EPSILON
+    inv_det = 1.0 / np.where(valid, det, 1.0)
+    s = origins - v0
+    u = _dot(s, p) * inv_det
+    q = np.cross(s, e1)
+    v = _dot(dirs, q) * inv_det
+    t = _dot(e2, q) * inv_det
+    hit = valid & (u >= 0.0) & (v >= 0.0) & (u + v <= 1.0) & (t >= 0.0)
+    return t, hit
+
+
+# Closest point on each triangle (a, b, c) to the matching point p, vectorized form of Ericson's region test
+def closest_points_on_triangles(p, a, b, c):
+    ab = b - a
+    ac = c - a
+    ap = p - a
+    bp = p - b
+    cp = p - c
+    d1 = _dot(ab, ap)
+    d2 = _dot(ac, ap)
+    d3 = _dot(ab, bp)
+    d4 = _dot(ac, bp)
+    d5 = _dot(ab, cp)
+    d6 = _dot(ac, cp)
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denom = 1.0 / (va + vb + vc)
+        result = a + ab * (vb * denom)[:, None] + ac * (vc * denom)[:, None]
+
+        # Apply the Voronoi regions from lowest to highest priority so the first match wins
+        region = (va <= 0.0) & (d4 - d3 >= 0.0) & (d5 - d6 >= 0.0)
+        w = (d4 - d3) / ((d4 - d3) + (d5 - d6))
+        result[region] = (b + (c - b) * w[:, None])[region]
+        region = (vb <= 0.0) & (d2 >= 0.0) & (d6 <= 0.0)
+        w = d2 / (d2 - d6)
+        result[region] = (a + ac * w[:, None])[region]
+        region = (d6 >= 0.0) & (d5 <= d6)
+        result[region] = c[region]
+        region = (vc <= 0.0) & (d1 >= 0.0) & (d3 <= 0.0)
+        v = d1 / (d1 - d3)
+        result[region] = (a + ab * v[:, None])[region]
+        region = (d3 >= 0.0) & (d4 <= d3)
+        result[region] = b[region]
+        region = (d1 <= 0.0) & (d2 <= 0.0)
+        result[region] = a[region]
+
+    # Degenerate triangles fall back to their first vertex
+    bad = ~np.isfinite(result).all(axis=1)
+    result[bad] = a[bad]
+    return result
+
+
+# Closest points between pairs of segments (p1, q1) and (p2, q2), vectorized form of Ericson's method
+def closest_points_between_segments(p1, q1, p2, q2):
+    d1 = q1 - p1
+    d2 = q2 - p2
+    r = p1 - p2
+    a = _dot(d1, d1)
+    e = _dot(d2, d2)
+    f = _dot(d2, r)
+    c = _dot(d1, r)
+    b = _dot(d1, d2)
+    denom = a * e - b * b
+
+    safe_a = np.where(a > EPSILON, a, 1.0)
+    safe_e = np.where(e > EPSILON, e, 1.0)
+    safe_denom = np.where(denom > EPSILON, denom, 1.0)
+
+    s = np.where(denom > EPSILON, np.clip((b * f - c * e) / safe_denom, 0.0, 1.0), 0.0)
+    t = (b * s + f) / safe_e
+    s = np.where(t < 0.0, np.clip(-c / safe_a, 0.0, 1.0), np.where(t > 1.0, np.clip((b - c) / safe_a, 0.0, 1.0), s))
+    t = np.clip(t, 0.0, 1.0)
+
+    # Degenerate segments collapse to points
+    first_point = a <= EPSILON
+    second_point = e <= EPSILON
+    s = np.where(first_point, 0.0, s)
+    t = np.where(first_point, np.clip(f / safe_e, 0.0, 1.0), t)
+    t = np.where(second_point, 0.0, t)
+    s = np.where(second_point & ~first_point, np.clip(-c / safe_a, 0.0, 1.0), s)
+
+    return p1 + d1 * s[:, None], p2 + d2 * t[:, None]
+
+
+# Squared distance between segments (start, end) and triangles (a, b, c)
+def segment_triangle_distance_sq(start, end, a, b, c):
+    # Segments that pierce the triangle are at distance zero
+    direction = end - start
+    t, hit = ray_triangle_intersect(start, direction, a, b - a, c - a)
+    crossing = hit & (t <= 1.0)
+
+    # Otherwise the closest pair involves a segment endpoint or a triangle edge
+    best = np.full(len(start), np.inf)
+    for point in (start, end):
+        delta = closest_points_on_triangles(point, a, b, c) - point
+        best = np.minimum(best, _dot(delta, delta))
+    for edge_start, edge_end in ((a, b), (b, c), (c, a)):
+        on_segment, on_edge = closest_points_between_segments(start, end, edge_start, edge_end)
+        delta = on_segment - on_edge
+        best = np.minimum(best, _dot(delta, delta))
+    return np.where(crossing, 0.0, best)
+
+
+# Closest points between pairs of triangles (a0, a1, a2) and (b0, b1, b2). Returns the squared distance and the
+# point on each triangle. The closest pair is a vertex against the other triangle or an edge against an edge,
+# unless the triangles intersect, then an edge of one pierces the other and both points are where it does.
+def closest_points_between_triangles(a0, a1, a2, b0, b1, b2):
+    best = np.full(len(a0), np.inf)
+    point_a = a0.copy()
+    point_b = b0.copy()
+
+    def keep(on_a, on_b):
+        delta = on_a - on_b
+        distance_sq = _dot(delta, delta)
+        closer = distance_sq < best
+        best[closer] = distance_sq[closer]
+        point_a[closer] = on_a[closer]
+        point_b[closer] = on_b[closer]
+
+    for vertex in (a0, a1, a2):
+        keep(vertex, closest_points_on_triangles(vertex, b0, b1, b2))
+    for vertex in (b0, b1, b2):
+        keep(closest_points_on_triangles(vertex, a0, a1, a2), vertex)
+    edges_a = ((a0, a1), (a1, a2), (a2, a0))
+    edges_b = ((b0, b1), (b1, b2), (b2, b0))
+    for start, end in edges_a:
+        for other_start, other_end in edges_b:
+            keep(*closest_points_between_segments(start, end, other_start, other_end))
+
+    for edges, (c0, c1, c2) in ((edges_a, (b0, b1, b2)), (edges_b, (a0, a1, a2))):
+        for start, end in edges:
+            direction = end - start
+            t, hit = ray_triangle_intersect(start, direction, c0, c1 - c0, c2 - c0)
+            hit &= t <= 1.0
+            if hit.any():
+                pierce = start[hit] + direction[hit] * t[hit, None]
+                best[hit] = 0.0
+                point_a[hit] = pierce
+                point_b[hit] = pierce
+    return best, point_a, point_b
+
+
+# Interleave the low 10 bits of each coordinate into a 30 bit Morton code. Built one column at a time in uint32,
+# which is several times faster than spreading the bits of an N x 3 uint64 array.
+def morton_codes(points, lo, hi):
+    scale = np.where(hi - lo > 0.0, 1023.0 / np.maximum(hi - lo, EPSILON), 0.0)
+    codes = np.zeros(len(points), dtype=np.uint32)
+    for axis in range(3):
+        cells = np.clip((points[:, axis] - lo[axis]) * scale[axis], 0, 1023).astype(np.uint32)
+        cells = (cells | (cells << np.uint32(16))) & np.uint32(0x030000FF)
+        cells = (cells | (cells << np.uint32(8))) & np.uint32(0x0300F00F)
+        cells = (cells | (cells << np.uint32(4))) & np.uint32(0x030C30C3)
+        cells = (cells | (cells << np.uint32(2))) & np.uint32(0x09249249)
+        codes |= cells << np.uint32(2 - axis)
+    return codes
+
+
+# Build the flattened node arrays for a set of primitive bounds.
+# Large nodes are split one at a time with the binned SAH, everything below sah_threshold
+# primitives is split level by level at the Morton median so no Python loop runs per node.
+def _build_nodes(prim_min, prim_max, leaf_size, bins, sah_threshold):
+    n = len(prim_min)
+    centroids = (prim_min + prim_max) * 0.5
+    order = np.arange(n)
+    if not n:
+        empty = np.empty(0, dtype=np.int64)
+        return np.empty((0, 3)), np.empty((0, 3)), empty, empty, empty, empty, order
+
+    start = [0]
+    count = [n]
+    left = [-1]
+    right = [-1]
+    pending = []
+
+    # Top of the tree, a handful of nodes each covering many primitives
+    stack = [0]
+    while stack:
+        node = stack.pop()
+        lo = start[node]
+        hi = lo + count[node]
+        if hi - lo <= leaf_size:
+            continue
+        if hi - lo <= sah_threshold:
+            pending.append(node)
+            continue
+
+        idx = order[lo:hi]
+        c = centroids[idx]
+        c_min = c.min(axis=0)
+        extent = c.max(axis=0) - c_min
+        split = _sah_split(idx, c, c_min, extent, prim_min, prim_max, bins)
+        if split is None:
+            pending.append(node)
+            continue
+        order[lo:hi] = np.concatenate((idx[split], idx[~split]))
+        mid = lo + int(split.sum())
+
+        for child_lo, child_hi in ((lo, mid), (mid, hi)):
+            start.append(child_lo)
+            count.append(child_hi - child_lo)
+            left.append(-1)
+            right.append(-1)
+        left[node] = len(left) - 2
+        right[node] = len(left) - 1
+        stack.append(right[node])
+        stack.append(left[node])
+
+    start = np.array(start, dtype=np.int64)
+    count = np.array(count, dtype=np.int64)
+    left = np.array(left, dtype=np.int64)
+    right = np.array(right, dtype=np.int64)
+
+    # Sort the primitives of every pending node by Morton code, then halve ranges level by level
+    level = np.array(pending, dtype=np.int64)
+    if len(level):
+        codes = morton_codes(centroids, centroids.min(axis=0), centroids.max(axis=0))
+        positions, owner = expand_ranges(start[level], count[level])
+        members = order[positions]
+        order[positions] = members[np.lexsort((codes[members], owner))]
+
+    while len(level):
+        half = count[level] // 2
+        first = len(start)
+        children = np.arange(first, first + 2 * len(level), dtype=np.int64).reshape(-1, 2)
+        left[level] = children[:, 0]
+        right[level] = children[:, 1]
+        child_start = np.stack((start[level], start[level] + half), axis=1).ravel()
+        child_count = np.stack((half, count[level] - half), axis=1).ravel()
+        start = np.concatenate((start, child_start))
+        count = np.concatenate((count, child_count))
+        left = np.concatenate((left, np.full(len(child_start), -1, dtype=np.int64)))
+        right = np.concatenate((right, np.full(len(child_start), -1, dtype=np.int64)))
+        level = children.ravel()[child_count > leaf_size]
+
+    # Leaf bounds from their disjoint primitive ranges, then parents from their children bottom up
+    node_min = np.empty((len(start), 3))
+    node_max = np.empty((len(start), 3))
+    leaves = np.flatnonzero(left < 0)
+    sorted_min = np.concatenate((prim_min[order], prim_min[:1]))
+    sorted_max = np.concatenate((prim_max[order], prim_max[:1]))
+    bounds = np.stack((start[leaves], start[leaves] + count[leaves]), axis=1).ravel()
+    node_min[leaves] = np.minimum.reduceat(sorted_min, bounds, axis=0)[::2]
+    node_max[leaves] = np.maximum.reduceat(sorted_max, bounds, axis=0)[::2]
+
+    done = left < 0
+    while not done.all():
+        ready = np.flatnonzero(~done & done[np.maximum(left, 0)] & done[np.maximum(right, 0)])
+        node_min[ready] = np.minimum(node_min[left[ready]], node_min[right[ready]])
+        node_max[ready] = np.maximum(node_max[left[ready]], node_max[right[ready]])
+        done[ready] = True
+
+    return node_min, node_max, left, right, start, count, order
+
+
+# Binned surface area heuristic along the widest centroid axis.
+# Returns a mask of the primitives that go to the left child, or None when no split beats a leaf.
+def _sah_split(idx, centroids, c_min, extent, prim_min, prim_max, bins):
+    def half_area(lo, hi):
+        d = np.maximum(hi - lo, 0.0)
+        return d[..., 0] * d[..., 1] + d[..., 1] * d[..., 2] + d[..., 2] * d[..., 0]
+
+    axis = int(np.argmax(extent))
+    if extent[axis] <= 0.0:
+        return None
+    lo = prim_min[idx]
+    hi = prim_max[idx]
+    binned = ((centroids[:, axis] - c_min[axis]) * (bins / extent[axis])).astype(np.int16)
+    np.clip(binned, 0, bins - 1, out=binned)
+
+    # Per bin bounds with a radix sort and reduceat rather than a Python loop
+    sort = np.argsort(binned, kind="stable")
+    counts = np.bincount(binned, minlength=bins)
+    used = np.flatnonzero(counts)
+    offsets = (np.cumsum(counts) - counts)[used]
+    bin_min = np.full((bins, 3), np.inf)
+    bin_max = np.full((bins, 3), -np.inf)
+    bin_min[used] = np.minimum.reduceat(lo[sort], offsets, axis=0)
+    bin_max[used] = np.maximum.reduceat(hi[sort], offsets, axis=0)
+
+    # Cost of splitting after each bin, from prefix and suffix bounds
+    left_area = half_area(np.minimum.accumulate(bin_min, axis=0), np.maximum.accumulate(bin_max, axis=0))[:-1]
+    right_area = half_area(
+        np.minimum.accumulate(bin_min[::-1], axis=0)[::-1], np.maximum.accumulate(bin_max[::-1], axis=0)[::-1]
+    )[1:]
+    left_count = np.cumsum(counts)[:-1]
+    right_count = len(idx) - left_count
+    with np.errstate(invalid="ignore"):
+        cost = left_area * left_count + right_area * right_count
+    cost[(left_count == 0) | (right_count == 0)] = np.inf
+
+    split_bin = int(np.argmin(cost))
+    if cost[split_bin] >= len(idx) * half_area(lo.min(axis=0), hi.max(axis=0)):
+        return None
+    return binned <= split_bin
+
+
+class TriangleBvh:
+
+    # Constructor, vertices is V x 3 and triangles is T x 3 vertex indices
+    def __init__(self, vertices, triangles, leaf_size=16, bins=16, sah_threshold=4096):
+        self.vertices = np.ascontiguousarray(vertices, dtype=np.float64).reshape(-1, 3)
+        triangles = np.ascontiguousarray(triangles, dtype=np.int64).reshape(-1, 3)
+
+        corners = self.vertices[triangles]
+        (self._min, self._max, self._left, self._right, self._start, self._count, order) = _build_nodes(
+            corners.min(axis=1), corners.max(axis=1), leaf_size, bins, sah_threshold
+        )
+
+        # Triangles are stored in leaf order so that each leaf covers one contiguous range
+        self._order = order
+        self._slot_of = np.empty_like(order)
+        self._slot_of[order] = np.arange(len(order))
+        self._triangles = triangles[order]
+        corners = corners[order]
+        self._v0 = np.ascontiguousarray(corners[:, 0])
+        self._e1 = np.ascontiguousarray(corners[:, 1] - corners[:, 0])
+        self._e2 = np.ascontiguousarray(corners[:, 2] - corners[:, 0])
+        self._tri_min = None
+        self._tri_max = None
+        self._tri_normals = None
+        self._slab_normal = None
+        self._slab_lo = None
+        self._slab_hi = None
+
+    def __len__(self):
+        return len(self._order)
+
+    # World bounds of the whole tree
+    @property
+    def bounds(self):
+        if not len(self._min):
+            return np.zeros(3), np.zeros(3)
+        return self._min[0], self._max[0]
+
+    @property
+    def node_count(self):
+        return len(self._left)
+
+    # Vertex indices of the given triangles (original triangle numbering)
+    def triangle_vertices(self, triangles):
+        return self._triangles[self._slot_of[triangles]]
+
+    # Unit face normals of the given triangles (original triangle numbering)
+    def face_normals(self, triangles):
+        slots = self._slot_of[triangles]
+        normals = np.cross(self._e1[slots], self._e2[slots])
+        lengths = np.linalg.norm(normals, axis=-1, keepdims=True)
+        return normals / np.where(lengths > 0.0, lengths, 1.0)
+
+    # Per triangle bounds and unit normals in leaf order, computed on first use by the closest pair search
+    def _triangle_bounds(self):
+        if self._tri_min is None:
+            v1 = self._v0 + self._e1
+            v2 = self._v0 + self._e2
+            self._tri_min = np.minimum(np.minimum(self._v0, v1), v2)
+            self._tri_max = np.maximum(np.maximum(self._v0, v1), v2)
+            normals = np.cross(self._e1, self._e2)
+            lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+            self._tri_normals = normals / np.where(lengths > 0.0, lengths, 1.0)
+        return self._tri_min, self._tri_max
+
+    # Walk the tree for a single query, box_test maps (min, max) arrays to a keep mask.
+    # Returns the leaf-order slots of all triangles in the surviving leaves.
+    def _candidate_slots(self, box_test):
+        if not len(self._left):
+            return np.empty(0, dtype=np.int64)
+        nodes = np.zeros(1, dtype=np.int64)
+        leaves = []
+        while len(nodes):
+            nodes = nodes[box_test(self._min[nodes], self._max[nodes])]
+            is_leaf = self._left[nodes] < 0
+            leaves.append(nodes[is_leaf])
+            inner = nodes[~is_leaf]
+            nodes = np.concatenate((self._left[inner], self._right[inner]))
+        leaves = np.concatenate(leaves)
+        slots, _ = expand_ranges(self._start[leaves], self._count[leaves])
+        return slots
+
+    # Closest hit for a batch of rays. Returns distance, triangle index (-1 on a miss) and the barycentric u, v.
+    def intersect(self, origins, dirs, max_dist=np.inf):
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+        dirs = np.asarray(dirs, dtype=np.float64).reshape(-1, 3)
+        inv_dirs = safe_inverse(dirs)
+        n = len(origins)
+        best_t = np.broadcast_to(np.asarray(max_dist, dtype=np.float64), (n,)).copy()
+        best_slot = np.full(n, -1, dtype=np.int64)
+        if not len(self._left) or not n:
+            return best_t, best_slot, np.zeros(n), np.zeros(n)
+
+        # The frontier is a list of (ray, node) pairs that still need testing
+        rays = np.arange(n)
+        nodes = np.zeros(n, dtype=np.int64)
+        while len(rays):
+            tnear, tfar = ray_box_intervals(self._min[nodes], self._max[nodes], origins[rays], inv_dirs[rays])
+            keep = (tnear <= tfar) & (tfar >= 0.0) & (tnear <= best_t[rays])
+            rays = rays[keep]
+            nodes = nodes[keep]
+
+            is_leaf = self._left[nodes] < 0
+            leaf_rays = rays[is_leaf]
+            if len(leaf_rays):
+                leaf_nodes = nodes[is_leaf]
+                slots, owner = expand_ranges(self._start[leaf_nodes], self._count[leaf_nodes])
+                pair_rays = leaf_rays[owner]
+                t, hit = ray_triangle_intersect(
+                    origins[pair_rays], dirs[pair_rays], self._v0[slots], self._e1[slots], self._e2[slots]
+                )
+                hit &= t < best_t[pair_rays]
+                if hit.any():
+                    pair_rays = pair_rays[hit]
+                    slots = slots[hit]
+                    t = t[hit]
+                    # Keep the nearest hit per ray
+                    sort = np.lexsort((t, pair_rays))
+                    pair_rays = pair_rays[sort]
+                    first = np.ones(len(sort), dtype=bool)
+                    first[1:] = pair_rays[1:] != pair_rays[:-1]
+                    best_t[pair_rays[first]] = t[sort][first]
+                    best_slot[pair_rays[first]] = slots[sort][first]
+
+            inner = ~is_leaf
+            inner_nodes = nodes[inner]
+            rays = np.concatenate((rays[inner], rays[inner]))
+            nodes = np.concatenate((self._left[inner_nodes], self._right[inner_nodes]))
+
+        # Barycentric coordinates of the final hits
+        u = np.zeros(n)
+        v = np.zeros(n)
+        hit = best_slot >= 0
+        if hit.any():
+            slots = best_slot[hit]
+            s = origins[hit] - self._v0[slots]
+            p = np.cross(dirs[hit], self._e2[slots])
+            inv_det = 1.0 / _dot(self._e1[slots], p)
+            u[hit] = _dot(s, p) * inv_det
+            v[hit] = _dot(dirs[hit], np.cross(s, self._e1[slots])) * inv_det
+
+        triangles = np.where(hit, self._order[np.maximum(best_slot, 0)], -1)
+        return best_t, triangles, u, v
+
+    # Closest point on the surface for a batch of points, only surfaces closer than max_dist (a scalar or one value
+    # per point) are searched. Returns distance (max_dist where nothing is closer), the closest points and their
+    # triangle indices (-1 where nothing is closer).
+    def closest_points(self, points, max_dist=np.inf):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        n = len(points)
+        best_sq = np.broadcast_to(np.asarray(max_dist, dtype=np.float64), (n,)) ** 2
+        best_sq = best_sq.copy()
+        best_slot = np.full(n, -1, dtype=np.int64)
+        closest = points.copy()
+        if not len(self._left) or not n:
+            return np.sqrt(best_sq), closest, best_slot
+
+        # Descend every point along the few nearest nodes of each level first, by box distance and then by distance
+        # to the box center since points often lie inside several boxes. The triangles of the leaves reached give a
+        # close upper bound that prunes the full search.
+        queries = np.arange(n)
+        seed = np.zeros((n, 1), dtype=np.int64)
+        while (self._left[seed] >= 0).any():
+            inner = self._left[seed] >= 0
+            children = np.concatenate(
+                (np.where(inner, self._left[seed], seed), np.where(inner, self._right[seed], -1)), axis=1
+            )
+            valid = children >= 0
+            nodes = np.maximum(children, 0)
+            at = points[:, None, :]
+            to_box = np.where(valid, point_box_distance_sq(at, self._min[nodes], self._max[nodes]), np.inf)
+            delta = at - (self._min[nodes] + self._max[nodes]) * 0.5
+            to_center = (delta * delta).sum(axis=-1)
+            width = min(children.shape[1], CLOSEST_POINT_SEEDS)
+            rows = np.repeat(np.arange(n), children.shape[1])
+            order = np.lexsort((to_center.ravel(), to_box.ravel(), rows)).reshape(n, -1)[:, :width] % children.shape[1]
+            seed = np.take_along_axis(children, order, axis=1)
+            seed = np.where(np.take_along_axis(valid, order, axis=1), seed, seed[:, :1])
+        seed_queries = np.repeat(queries, seed.shape[1])
+        self._closest_in_leaves(points, seed_queries, seed.ravel(), best_sq, best_slot, closest)
+
+        # The frontier is a list of (point, node) pairs whose boxes are closer than the point's best triangle.
+        # Leaves reached are tested afterwards in order of their distance, so the nearest ones tighten the bound
+        # before the others are pruned again.
+        nodes = np.zeros(n, dtype=np.int64)
+        leaf_queries, leaf_nodes, leaf_lower = [], [], []
+        while len(queries):
+            lower = point_box_distance_sq(points[queries], self._min[nodes], self._max[nodes])
+            keep = lower < best_sq[queries]
+            queries, nodes, lower = queries[keep], nodes[keep], lower[keep]
+
+            is_leaf = self._left[nodes] < 0
+            visit = is_leaf & (nodes[:, None] != seed[queries]).all(axis=1)
+            leaf_queries.append(queries[visit])
+            leaf_nodes.append(nodes[visit])
+            leaf_lower.append(lower[visit])
+
+            inner = ~is_leaf
+            inner_nodes = nodes[inner]
+            queries = np.concatenate((queries[inner], queries[inner]))
+            nodes = np.concatenate((self._left[inner_nodes], self._right[inner_nodes]))
+
+        leaf_lower = np.concatenate(leaf_lower)
+        order = np.argsort(leaf_lower, kind="stable")
+        leaf_queries = np.concatenate(leaf_queries)[order]
+        leaf_nodes = np.concatenate(leaf_nodes)[order]
+        leaf_lower = leaf_lower[order]
+        for lo in range(0, len(order), CLOSEST_POINT_LEAVES):
+            chunk = slice(lo, lo + CLOSEST_POINT_LEAVES)
+            keep = leaf_lower[chunk] < best_sq[leaf_queries[chunk]]
+            if keep.any():
+                self._closest_in_leaves(
+                    points, leaf_queries[chunk][keep], leaf_nodes[chunk][keep], best_sq, best_slot, closest
+                )
+
+        triangles = np.where(best_slot >= 0, self._order[np.maximum(best_slot, 0)], -1)
+        return np.sqrt(best_sq), closest, triangles
+
+    # Test the triangles of one leaf per query point, keeping the closest per point in best_sq, best_slot and closest
+    def _closest_in_leaves(self, points, queries, leaves, best_sq, best_slot, closest):
+        slots, owner = expand_ranges(self._start[leaves], self._count[leaves])
+        pair_points = queries[owner]
+        tri_min, tri_max = self._triangle_bounds()
+        near = point_box_distance_sq(points[pair_points], tri_min[slots], tri_max[slots]) < best_sq[pair_points]
+        slots, pair_points = slots[near], pair_points[near]
+        v0 = self._v0[slots]
+        on_triangle = closest_points_on_triangles(points[pair_points], v0, v0 + self._e1[slots], v0 + self._e2[slots])
+        delta = on_triangle - points[pair_points]
+        distance_sq = _dot(delta, delta)
+        near = distance_sq < best_sq[pair_points]
+        if not near.any():
+            return
+        pair_points, slots = pair_points[near], slots[near]
+        distance_sq, on_triangle = distance_sq[near], on_triangle[near]
+
+        # Keep the nearest triangle per point
+        sort = np.lexsort((distance_sq, pair_points))
+        pair_points = pair_points[sort]
+        first = np.ones(len(sort), dtype=bool)
+        first[1:] = pair_points[1:] != pair_points[:-1]
+        sort = sort[first]
+        pair_points = pair_points[first]
+        best_sq[pair_points] = distance_sq[sort]
+        best_slot[pair_points] = slots[sort]
+        closest[pair_points] = on_triangle[sort]
+
+    # Triangles whose leaf boxes overlap a sphere, cheap superset used for vertex queries
+    def triangles_near_point(self, center, radius):
+        center = np.asarray(center, dtype=np.float64)
+        slots = self._candidate_slots(lambda lo, hi: point_box_distance_sq(center, lo, hi) <= radius * radius)
+        return self._order[slots]
+
+    # Triangles that actually intersect a sphere
+    def triangles_in_sphere(self, center, radius):
+        center = np.asarray(center, dtype=np.float64)
+        slots = self._candidate_slots(lambda lo, hi: point_box_distance_sq(center, lo, hi) <= radius * radius)
+        v0 = self._v0[slots]
+        closest = closest_points_on_triangles(
+            np.broadcast_to(center, v0.shape), v0, v0 + self._e1[slots], v0 + self._e2[slots]
+        )
+        delta = closest - center
+        return self._order[slots[_dot(delta, delta) <= radius * radius]]
+
+    # Triangles within radius of the segment from start to end, used for sphere sweeps
+    def triangles_near_segment(self, start, end, radius):
+        start = np.asarray(start, dtype=np.float64)
+        end = np.asarray(end, dtype=np.float64)
+        direction = end - start
+        inv_dir = safe_inverse(direction[None])
+
+        def box_test(lo, hi):
+            tnear, tfar = ray_box_intervals(lo - radius, hi + radius, start[None], inv_dir)
+            return (tnear <= tfar) & (tfar >= 0.0) & (tnear <= 1.0)
+
+        slots = self._candidate_slots(box_test)
+        if not len(slots):
+            return slots
+        v0 = self._v0[slots]
+        shape = v0.shape
+        distance_sq = segment_triangle_distance_sq(
+            np.broadcast_to(start, shape), np.broadcast_to(end, shape), v0, v0 + self._e1[slots], v0 + self._e2[slots]
+        )
+        return self._order[slots[distance_sq <= radius * radius]]
+
+    # Closest pair of points between this tree's triangles and another tree's, by branch and bound over pairs of
+    # nodes: a pair is only opened while its boxes are closer than the best triangle pair found so far.
+    # Returns (distance, point on this mesh, point on the other, triangle of this mesh, triangle of the other),
+    # with an infinite distance and triangles of -1 when no pair is closer than max_dist.
+    def closest_pair(self, other, max_dist=np.inf):
+        best = np.array([np.inf if not np.isfinite(max_dist) else float(max_dist) ** 2])
+        found = [np.zeros(3), np.zeros(3), -1, -1]
+        if not len(self._left) or not len(other._left):
+            return np.inf, found[0], found[1], -1, -1
+
+        nodes_a = np.zeros(1, dtype=np.int64)
+        nodes_b = np.zeros(1, dtype=np.int64)
+        lower = box_box_distance_sq(self._min[:1], self._max[:1], other._min[:1], other._max[:1])
+        while len(nodes_a):
+            keep = lower < best[0]
+            nodes_a, nodes_b, lower = nodes_a[keep], nodes_b[keep], lower[keep]
+            if not len(nodes_a):
+                break
+
+            # Expand the closest pairs first, so a tight bound is found early and prunes the rest
+            if len(nodes_a) > CLOSEST_PAIR_BATCH:
+                first = np.argpartition(lower, CLOSEST_PAIR_BATCH)[:CLOSEST_PAIR_BATCH]
+                rest = np.ones(len(nodes_a), dtype=bool)
+                rest[first] = False
+                batch_a, batch_b, batch_lower = nodes_a[first], nodes_b[first], lower[first]
+                nodes_a, nodes_b, lower = nodes_a[rest], nodes_b[rest], lower[rest]
+            else:
+                batch_a, batch_b, batch_lower = nodes_a, nodes_b, lower
+                nodes_a = nodes_b = np.empty(0, dtype=np.int64)
+                lower = np.empty(0)
+
+            leaf_a = self._left[batch_a] < 0
+            leaf_b = other._left[batch_b] < 0
+            leaves = leaf_a & leaf_b
+            if leaves.any():
+                self._closest_leaf_pairs(other, batch_a[leaves], batch_b[leaves], batch_lower[leaves], best, found)
+
+            # Open the larger box of every other pair, or the one that is not a leaf
+            size_a = self._max[batch_a] - self._min[batch_a]
+            size_b = other._max[batch_b] - other._min[batch_b]
+            open_a = ~leaf_a & (leaf_b | (_dot(size_a, size_a) >= _dot(size_b, size_b)))
+            open_b = ~leaves & ~open_a
+            split_a = batch_a[open_a]
+            split_b = batch_b[open_b]
+            child_a = np.concatenate((self._left[split_a], self._right[split_a], batch_a[open_b], batch_a[open_b]))
+            child_b = np.concatenate((batch_b[open_a], batch_b[open_a], other._left[split_b], other._right[split_b]))
+            child_lower = self._pair_lower_bound(other, child_a, child_b)
+            nodes_a = np.concatenate((nodes_a, child_a))
+            nodes_b = np.concatenate((nodes_b, child_b))
+            lower = np.concatenate((lower, child_lower))
+
+        if found[2] < 0:
+            return np.inf, found[0], found[1], -1, -1
+        return float(np.sqrt(best[0])), found[0], found[1], int(self._order[found[2]]), int(other._order[found[3]])
+
+    # Test the triangles of leaf pairs in order of their lower bound, updating best (a one element array of the
+    # squared distance) and found (point on each mesh and the leaf order slot of each triangle) in place.
+    # Triangle pairs whose bounds are close enough are collected over several chunks of leaf pairs and tested at once.
+    def _closest_leaf_pairs(self, other, leaves_a, leaves_b, lower, best, found):
+        order = np.argsort(lower)
+        leaves_a, leaves_b, lower = leaves_a[order], leaves_b[order], lower[order]
+        min_a, max_a = self._triangle_bounds()
+        min_b, max_b = other._triangle_bounds()
+        pending = []
+        pending_count = 0
+        lo = 0
+        while lo < len(leaves_a):
+            # Until a first distance is known nothing can be pruned, so the closest leaf pair is tested on its own
+            size = CLOSEST_PAIR_LEAVES if np.isfinite(best[0]) else 1
+            chunk = slice(lo, lo + size)
+            lo += size
+            keep = lower[chunk] < best[0]
+            if not keep.any():
+                break
+            chunk_a, chunk_b = leaves_a[chunk][keep], leaves_b[chunk][keep]
+
+            # Triangles of each leaf that can be close enough to the other leaf, then every pair of those
+            slots_a, owner_a = expand_ranges(self._start[chunk_a], self._count[chunk_a])
+            near = self._triangle_node_bound(other, slots_a, chunk_b[owner_a]) < best[0]
+            slots_a, owner_a = slots_a[near], owner_a[near]
+            slots_b, owner_b = expand_ranges(other._start[chunk_b], other._count[chunk_b])
+            near = other._triangle_node_bound(self, slots_b, chunk_a[owner_b]) < best[0]
+            slots_b, owner_b = slots_b[near], owner_b[near]
+            count_b = np.bincount(owner_b, minlength=len(chunk_a))
+            index_b, pair = expand_ranges((np.cumsum(count_b) - count_b)[owner_a], count_b[owner_a])
+            slots_a, slots_b = slots_a[pair], slots_b[index_b]
+            near = box_box_distance_sq(min_a[slots_a], max_a[slots_a], min_b[slots_b], max_b[slots_b]) < best[0]
+            slots_a, slots_b = slots_a[near], slots_b[near]
+            gap = np.maximum(self._plane_gap(other, slots_a, slots_b), other._plane_gap(self, slots_b, slots_a))
+            near = gap ** 2 < best[0]
+            pending.append((slots_a[near], slots_b[near]))
+            pending_count += int(near.sum())
+            if pending_count >= CLOSEST_PAIR_TRIANGLES or not np.isfinite(best[0]):
+                self._closest_triangle_pairs(other, pending, best, found)
+                pending = []
+                pending_count = 0
+        if pending_count:
+            self._closest_triangle_pairs(other, pending, best, found)
+
+    # Per node slab for the closest pair search, computed on first use: for leaves the area weighted mean normal of
+    # their triangles and the range their corners span along it, internal nodes get a zero normal and range
+    def _node_slabs(self):
+        if self._slab_normal is None:
+            count = len(self._left)
+            self._slab_normal = np.zeros((count, 3))
+            self._slab_lo = np.zeros(count)
+            self._slab_hi = np.zeros(count)
+            leaves = np.flatnonzero(self._left < 0)
+            leaves = leaves[self._count[leaves] > 0]
+            if len(leaves):
+                slots, owner = expand_ranges(self._start[leaves], self._count[leaves])
+                offsets = np.cumsum(self._count[leaves]) - self._count[leaves]
+                normals = np.add.reduceat(np.cross(self._e1[slots], self._e2[slots]), offsets, axis=0)
+                lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+                normals = normals / np.where(lengths > 0.0, lengths, 1.0)
+                leaf_normals = normals[owner]
+                side0 = _dot(leaf_normals, self._v0[slots])
+                side1 = side0 + _dot(leaf_normals, self._e1[slots])
+                side2 = side0 + _dot(leaf_normals, self._e2[slots])
+                self._slab_normal[leaves] = normals
+                self._slab_lo[leaves] = np.minimum.reduceat(np.minimum(np.minimum(side0, side1), side2), offsets)
+                self._slab_hi[leaves] = np.maximum.reduceat(np.maximum(np.maximum(side0, side1), side2), offsets)
+        return self._slab_normal, self._slab_lo, self._slab_hi
+
+    # Lower bound on the distance between node pairs: the gap between this node's slab and the other node's box
+    # projected onto the slab normal. Zero for internal nodes, tight for pairs of flat leaves.
+    def _slab_gap(self, other, nodes, other_nodes):
+        normal, lo, hi = self._node_slabs()
+        normal = normal[nodes]
+        center = _dot(normal, (other._min[other_nodes] + other._max[other_nodes]) * 0.5)
+        radius = _dot(np.abs(normal), (other._max[other_nodes] - other._min[other_nodes]) * 0.5)
+        return np.maximum(np.maximum(center - radius - hi[nodes], lo[nodes] - center - radius), 0.0)
+
+    # Squared lower bound on the distance between node pairs, from their boxes and the slabs of leaves
+    def _pair_lower_bound(self, other, nodes, other_nodes):
+        box = box_box_distance_sq(self._min[nodes], self._max[nodes], other._min[other_nodes], other._max[other_nodes])
+        slab = np.maximum(self._slab_gap(other, nodes, other_nodes), other._slab_gap(self, other_nodes, nodes))
+        return np.maximum(box, slab * slab)
+
+    # Squared lower bound on the distance between triangles (leaf order slots) and the other tree's leaves, from the
+    # triangle's box against the leaf's, the triangle's plane against the leaf's box and the leaf's slab against the
+    # triangle's corners
+    def _triangle_node_bound(self, other, slots, other_nodes):
+        box_min, box_max = other._min[other_nodes], other._max[other_nodes]
+        box = box_box_distance_sq(self._tri_min[slots], self._tri_max[slots], box_min, box_max)
+        normals = self._tri_normals[slots]
+        center = _dot(normals, (box_min + box_max) * 0.5) - _dot(normals, self._v0[slots])
+        radius = _dot(np.abs(normals), (box_max - box_min) * 0.5)
+        plane = np.maximum(np.abs(center) - radius, 0.0)
+        normal, lo, hi = other._node_slabs()
+        normal = normal[other_nodes]
+        side0 = _dot(normal, self._v0[slots])
+        side1 = side0 + _dot(normal, self._e1[slots])
+        side2 = side0 + _dot(normal, self._e2[slots])
+        above = np.minimum(np.minimum(side0, side1), side2) - hi[other_nodes]
+        below = lo[other_nodes] - np.maximum(np.maximum(side0, side1), side2)
+        slab = np.maximum(np.maximum(np.maximum(above, below), plane), 0.0)
+        return np.maximum(box, slab * slab)
+
+    # Lower bound on the distance between triangle pairs: how far the other triangle lies to one side of this one's
+    # plane, zero when it straddles the plane. Tight for nearly parallel surfaces, where box bounds are weakest.
+    def _plane_gap(self, other, slots, other_slots):
+        normals = self._tri_normals[slots]
+        offset = _dot(normals, self._v0[slots])
+        v0 = other._v0[other_slots]
+        side0 = _dot(normals, v0) - offset
+        side1 = side0 + _dot(normals, other._e1[other_slots])
+        side2 = side0 + _dot(normals, other._e2[other_slots])
+        above = np.minimum(np.minimum(side0, side1), side2)
+        below = -np.maximum(np.maximum(side0, side1), side2)
+        return np.maximum(np.maximum(above, below), 0.0)
+
+    def _closest_triangle_pairs(self, other, pending, best, found):
+        slots_a = np.concatenate([slots for slots, _ in pending])
+        slots_b = np.concatenate([slots for _, slots in pending])
+        v0, v1 = self._v0[slots_a], other._v0[slots_b]
+        distance_sq, on_a, on_b = closest_points_between_triangles(
+            v0, v0 + self._e1[slots_a], v0 + self._e2[slots_a], v1, v1 + other._e1[slots_b], v1 + other._e2[slots_b]
+        )
+        closest = int(np.argmin(distance_sq))
+        if distance_sq[closest] < best[0]:
+            best[0] = distance_sq[closest]
+            found[:] = [on_a[closest], on_b[closest], int(slots_a[closest]), int(slots_b[closest])]
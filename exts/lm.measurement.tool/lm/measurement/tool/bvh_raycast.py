@@ -0,0 +1,470 @@
+'''
+Raycast backend built on a local SAH BVH per mesh.
+Provides the same interface as MeshRaycast, but reads mesh data straight from
+USD and does not depend on omni.kit.mesh.raycast or its background BVH refresh.
+Used headless, in CI, and wherever the Omniverse engine is unavailable.
+Stage edits are followed through USD change notices, so only the meshes an
+edit touched are read again and get a new BVH.
+'''
+
+import threading
+import time
+
+import numpy as np
+
+from .bvh import ray_box_intervals, safe_inverse, point_box_distance_sq, boxes_in_frustum
+from .flood import BLOCK_POINTS, stream_flood, collect_flood
+from .mesh_data import MeshDataCache, on_main_thread
+from .raycast_result import RaycastBatchResult, empty_ray_hits
+from .stage_listener import StageListener, RebuildStats, resolve_changes, relist_mesh_paths, REFRESH_FAST
+
+try:
+    import omni.usd as _omni_usd
+except ImportError:
+    _omni_usd = None
+
+# Upper bound on (ray, mesh) pairs tested against mesh bounds at once
+MAX_BOX_PAIRS = 1 << 22
+
+
+class _Scene:
+
+    # Constructor, paths and meshes are parallel lists of the collected meshes
+    def __init__(self, paths, meshes, bounds_min=None, bounds_max=None):
+        self.paths = paths
+        self.meshes = meshes
+        self.index = {path: i for i, path in enumerate(paths)}
+        if bounds_min is None:
+            bounds = [data.bounds for data in meshes]
+            bounds_min = np.array([lo for lo, _ in bounds], dtype=np.float64).reshape(-1, 3)
+            bounds_max = np.array([hi for _, hi in bounds], dtype=np.float64).reshape(-1, 3)
+        self.bounds_min = bounds_min
+        self.bounds_max = bounds_max
+
+        # Indices of the meshes queries consider, all of them unless the scene is restricted to the view frustum
+        self.active = np.arange(len(meshes))
+
+    # The same meshes with only the given indices active
+    def restricted(self, active):
+        scene = _Scene.__new__(_Scene)
+        scene.__dict__.update(self.__dict__)
+        scene.active = active
+        return scene
+
+
+class BvhMeshRaycast:
+
+    # Flood sampling threads when the workers setting is 0, one per CPU. Samples come from mesh arrays read on the
+    # main thread before the query.
+    FLOOD_WORKERS = 0
+
+    # Constructor, an explicit stage is used headless, otherwise the active USD context's stage is used.
+    # refresh_mode "events" rebuilds only the meshes named by stage change notices, "fast" the whole scene.
+    def __init__(self, stage=None, refresh_mode="events"):
+        self._fixed_stage = stage is not None
+        self._cache = MeshDataCache(stage)
+        self._rootPath = None
+        self._filter_fn = None
+        self._limit_to_selection = False
+        self._selection = []
+        self._scene_ready = False
+        self._rebuild_callbacks = []
+
+        # Every mesh path of the scene, including meshes that have no usable geometry yet
+        self._listed = []
+
+        # Collected meshes, replaced as a whole so that queries running on other threads see a consistent scene
+        self._scene = _Scene([], [])
+
+        # Stage edits are collected from change notices and applied before the next query
+        self._refresh_mode = refresh_mode
+        self._listener = StageListener(stage)
+        self._stats = RebuildStats(refresh_mode)
+
+        # Row-vector view projection matrix queries are restricted to, None for the whole scene
+        self._view_projection = None
+        self._frustum_dirty = False
+
+        # The scene is collected on the main thread, queries on worker threads use the last one collected there
+        self._scene_lock = threading.RLock()
+
+    def createScene(self, rootPrim, filter_fn):
+        self._limit_to_selection = False
+        self._rootPath = rootPrim
+        self._filter_fn = filter_fn
+        self._scene_ready = False
+
+    def createSelectionScene(self, meshes):
+        self._limit_to_selection = True
+        self._selection = [str(mesh) for mesh in meshes]
+        self._scene_ready = False
+
+    def clearScene(self):
+        self._limit_to_selection = False
+        self._rootPath = None
+        self._filter_fn = None
+        self._selection = []
+        self._listed = []
+        self._scene = _Scene([], [])
+        self._scene_ready = False
+        if not self._fixed_stage:
+            self._listener.revoke()
+        self._clear_caches()
+
+    # Restrict queries to the meshes whose bounds intersect a view frustum, None queries every mesh
+    def set_view_frustum(self, view_projection):
+        self._view_projection = None if view_projection is None else np.array(view_projection, dtype=np.float64)
+        self._frustum_dirty = True
+
+    # Collect the scene and apply the stage edits made since the last update, called once per app update so that
+    # USD is only read on the main thread
+    def update(self):
+        if (
+            not self._scene_ready or self._listener.has_changes() or self._frustum_dirty
+            or self._current_stage() != self._cache.get_stage()
+        ):
+            self._ensure_scene()
+
+    # Rebuild counts and times, for comparing the refresh modes
+    def get_rebuild_stats(self):
+        stats = self._stats.as_dict(self._listener)
+        stats["meshes"] = len(self._scene.paths)
+        stats["active_meshes"] = len(self._scene.active)
+        return stats
+
+    # Follow the active stage and collect the meshes for the current scene on first use, then keep them current.
+    # Called from a worker thread it returns the scene as last collected, without reading the stage.
+    def _ensure_scene(self):
+        if not on_main_thread():
+            return self._scene
+        with self._scene_lock:
+            self._collect_scene()
+            return self._scene
+
+    def _current_stage(self):
+        if not self._fixed_stage and _omni_usd is not None:
+            return _omni_usd.get_context().get_stage()
+        return self._cache.get_stage()
+
+    def _collect_scene(self):
+        if not self._fixed_stage and _omni_usd is not None:
+            stage = self._current_stage()
+            if stage != self._cache.get_stage():
+                self._cache.set_stage(stage)
+                self._scene_ready = False
+                self._clear_caches()
+        self._listener.set_stage(self._cache.get_stage())
+
+        if self._scene_ready and self._listener.has_changes():
+            if self._refresh_mode == REFRESH_FAST:
+                self._rebuild_scene()
+            else:
+                self._update_scene(self._listener.take())
+        if not self._scene_ready:
+            start = time.perf_counter()
+            self._collect_all()
+            self._stats.add(True, len(self._scene.paths), start)
+        if self._frustum_dirty:
+            self._apply_frustum()
+
+    # Read every mesh of the scene, BVHs are built when a query first reaches them
+    def _collect_all(self):
+        self._listener.take()
+        if self._limit_to_selection:
+            self._listed = list(self._selection)
+        else:
+            self._listed = self._cache.find_mesh_paths(self._rootPath, self._filter_fn)
+        self._set_scene(self._listed)
+        self._scene_ready = True
+
+    # Drop and read every mesh again after any change, rebuilding the BVHs that had been built.
+    # Matches a stage wide background refresh, kept for comparison with the event driven mode.
+    def _rebuild_scene(self):
+        start = time.perf_counter()
+        built = [path for path, data in zip(self._scene.paths, self._scene.meshes) if data.has_bvh]
+        self._clear_caches()
+        self._scene_ready = False
+        self._collect_all()
+        self._build_bvhs(built)
+        self._stats.add(True, len(self._scene.paths), start)
+
+    # Read again only the meshes a batch of changes touched, and the subtrees that were resynced
+    def _update_scene(self, changes):
+        start = time.perf_counter()
+        scene = self._scene
+        dirty, resynced = resolve_changes(changes, self._listed)
+        if resynced and not self._limit_to_selection:
+            # Meshes may have been added or removed under the resynced prims
+            listed = set(self._listed)
+            self._listed = relist_mesh_paths(self._cache, self._listed, resynced, self._rootPath, self._filter_fn)
+            dirty.update(path for path in self._listed if path not in listed)
+        if not dirty and not resynced:
+            return
+
+        built = [path for path in dirty if path in scene.index and scene.meshes[scene.index[path]].has_bvh]
+        self._clear_caches(dirty)
+        self._set_scene(self._listed, scene, dirty)
+        self._build_bvhs(built)
+        self._stats.add(False, len(dirty), start)
+
+    # Replace the scene with the meshes at paths. Bounds of meshes that are not dirty are copied from previous.
+    def _set_scene(self, paths, previous=None, dirty=()):
+        meshes = [(path, self._cache.get(path)) for path in paths]
+        meshes = [(path, data) for path, data in meshes if data is not None]
+        paths = [path for path, _ in meshes]
+        meshes = [data for _, data in meshes]
+
+        if previous is not None and paths == previous.paths:
+            bounds_min = previous.bounds_min.copy()
+            bounds_max = previous.bounds_max.copy()
+            for path in dirty:
+                i = previous.index.get(path)
+                if i is not None:
+                    bounds_min[i], bounds_max[i] = meshes[i].bounds
+            scene = _Scene(paths, meshes, bounds_min, bounds_max)
+        else:
+            scene = _Scene(paths, meshes)
+        if self._view_projection is not None:
+            scene.active = np.flatnonzero(boxes_in_frustum(self._view_projection, scene.bounds_min, scene.bounds_max))
+        self._scene = scene
+
+    def _apply_frustum(self):
+        self._frustum_dirty = False
+        scene = self._scene
+        if self._view_projection is None:
+            active = np.arange(len(scene.meshes))
+        else:
+            active = np.flatnonzero(boxes_in_frustum(self._view_projection, scene.bounds_min, scene.bounds_max))
+        self._scene = scene.restricted(active)
+
+    def _build_bvhs(self, paths):
+        scene = self._scene
+        for path in paths:
+            i = scene.index.get(path)
+            if i is not None:
+                scene.meshes[i].bvh
+
+    # Closest hit for a batch of rays over every active mesh in a scene.
+    # Returns the hit distance, mesh index and triangle index per ray, with -1 indices on a miss.
+    def _intersect(self, scene, origins, dirs, max_dist):
+        n = len(origins)
+        best_t = np.broadcast_to(np.asarray(max_dist, dtype=np.float64), (n,)).copy()
+        best_mesh = np.full(n, -1, dtype=np.int64)
+        best_tri = np.full(n, -1, dtype=np.int64)
+        mesh_count = len(scene.active)
+        if not n or not mesh_count:
+            return best_t, best_mesh, best_tri
+
+        # Test rays against every mesh's bounds in chunks, then visit candidate meshes nearest first
+        inv_dirs = safe_inverse(dirs)
+        chunk = max(MAX_BOX_PAIRS // mesh_count, 1)
+        pair_rays = []
+        pair_meshes = []
+        pair_near = []
+        for lo in range(0, n, chunk):
+            rays = np.repeat(np.arange(lo, min(lo + chunk, n)), mesh_count)
+            meshes = np.tile(scene.active, len(rays) // mesh_count)
+            tnear, tfar = ray_box_intervals(
+                scene.bounds_min[meshes], scene.bounds_max[meshes], origins[rays], inv_dirs[rays]
+            )
+            keep = (tnear <= tfar) & (tfar >= 0.0) & (tnear <= best_t[rays])
+            pair_rays.append(rays[keep])
+            pair_meshes.append(meshes[keep])
+            pair_near.append(tnear[keep])
+        pair_rays = np.concatenate(pair_rays)
+        pair_meshes = np.concatenate(pair_meshes)
+        pair_near = np.concatenate(pair_near)
+
+        if n == 1:
+            visit = np.argsort(pair_near)
+        else:
+            visit = np.argsort(pair_meshes, kind="stable")
+        pair_rays = pair_rays[visit]
+        pair_meshes = pair_meshes[visit]
+        pair_near = pair_near[visit]
+
+        # Group the pairs into runs of the same mesh and trace each run against that mesh's BVH
+        breaks = np.flatnonzero(pair_meshes[1:] != pair_meshes[:-1]) + 1
+        for run in np.split(np.arange(len(pair_meshes)), breaks):
+            if not len(run):
+                continue
+            rays = pair_rays[run]
+            rays = rays[pair_near[run] <= best_t[rays]]
+            if not len(rays):
+                continue
+            mesh_index = int(pair_meshes[run[0]])
+            t, tri, _, _ = scene.meshes[mesh_index].bvh.intersect(origins[rays], dirs[rays], best_t[rays])
+            hit = tri >= 0
+            best_t[rays[hit]] = t[hit]
+            best_mesh[rays[hit]] = mesh_index
+            best_tri[rays[hit]] = tri[hit]
+        return best_t, best_mesh, best_tri
+
+    def raycast_closest(self, origin, dir, maxDist):
+        origin = np.asarray(origin, dtype=np.float64).reshape(1, 3)
+        direction = np.asarray(dir, dtype=np.float64).reshape(1, 3)
+        direction = direction / max(np.linalg.norm(direction), 1e-300)
+        scene = self._ensure_scene()
+        t, mesh_index, tri = self._intersect(scene, origin, direction, maxDist)
+        hitReport = {}
+        if mesh_index[0] >= 0:
+            mesh = scene.meshes[mesh_index[0]]
+            hitReport["hit"] = True
+            hitReport["position"] = tuple((origin[0] + direction[0] * t[0]).tolist())
+            hitReport["normal"] = tuple(mesh.bvh.face_normals(tri)[0].tolist())
+            hitReport["distance"] = float(t[0])
+            hitReport["collision"] = scene.paths[mesh_index[0]]
+        else:
+            hitReport["hit"] = False
+        return hitReport
+
+    # Cast many rays in one call, origins and dirs are N x 3 arrays.
+    # Returns a RaycastBatchResult, mesh paths are only looked up for the hits that ask for them.
+    def raycast_batch(self, origins, dirs, max_dist):
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+        dirs = np.asarray(dirs, dtype=np.float64).reshape(-1, 3)
+        lengths = np.linalg.norm(dirs, axis=1, keepdims=True)
+        dirs = dirs / np.where(lengths > 0.0, lengths, 1.0)
+        scene = self._ensure_scene()
+        t, mesh_index, tri = self._intersect(scene, origins, dirs, max_dist)
+
+        records = empty_ray_hits(len(origins))
+        hit = mesh_index >= 0
+        records["hit"] = hit
+        records["distance"][hit] = t[hit]
+        records["mesh_index"] = mesh_index
+        records["position"][hit] = origins[hit] + dirs[hit] * t[hit, None]
+        for index in np.unique(mesh_index[hit]):
+            rays = np.flatnonzero(mesh_index == index)
+            records["normal"][rays] = scene.meshes[index].bvh.face_normals(tri[rays])
+        return RaycastBatchResult(records, scene.paths.__getitem__)
+
+    def spherecast(self, origin, radius, dir, maxDist):
+        scene = self._ensure_scene()
+        origin = np.asarray(origin, dtype=np.float64)
+        direction = np.asarray(dir, dtype=np.float64)
+        end = origin + direction / max(np.linalg.norm(direction), 1e-300) * maxDist
+
+        # Sweep the sphere as a capsule, meshes are checked nearest first
+        active = scene.active
+        tnear, tfar = ray_box_intervals(
+            scene.bounds_min[active] - radius,
+            scene.bounds_max[active] + radius,
+            origin[None],
+            safe_inverse((end - origin)[None]),
+        )
+        candidates = np.flatnonzero((tnear <= tfar) & (tfar >= 0.0) & (tnear <= 1.0))
+        candidates = active[candidates[np.argsort(tnear[candidates])]]
+        collisions = [
+            scene.paths[i] for i in candidates if len(scene.meshes[i].bvh.triangles_near_segment(origin, end, radius))
+        ]
+
+        overlap_report = {}
+        if len(collisions):
+            overlap_report["overlap"] = True
+            overlap_report["collisions"] = collisions
+        else:
+            overlap_report["overlap"] = False
+        return overlap_report
+
+    def overlap_vertices(self, origin, radius):
+        scene = self._ensure_scene()
+        origin = np.asarray(origin, dtype=np.float64)
+        active = scene.active
+        distance_sq = point_box_distance_sq(origin, scene.bounds_min[active], scene.bounds_max[active])
+        candidates = active[distance_sq <= radius * radius]
+
+        overlap_report = {"overlap": False}
+        for i in candidates:
+            mesh = scene.meshes[i]
+            triangles = mesh.bvh.triangles_near_point(origin, radius)
+            vertices = np.unique(mesh.triangles[triangles])
+            delta = mesh.world_points[vertices] - origin
+            vertices = vertices[np.einsum("ij,ij->i", delta, delta) <= radius * radius]
+            if not len(vertices):
+                continue
+
+            touching = np.isin(mesh.triangles[triangles], vertices).any(axis=1)
+            mesh_path = scene.paths[i]
+            if not overlap_report["overlap"]:
+                overlap_report = {
+                    "overlap": True, "collisions": {}, "collisions_faces": {}, "collision_vert_positions": {}
+                }
+            overlap_report["collisions"][mesh_path] = vertices
+            overlap_report["collisions_faces"][mesh_path] = np.unique(mesh.triangle_faces[triangles[touching]])
+            overlap_report["collision_vert_positions"][mesh_path] = mesh.points[vertices]
+        return overlap_report
+
+    # Random surface samples, density is the number of points per unit of world space area. A stream of FloodBlocks
+    # with meshes sampled on up to workers threads, see stream_flood.
+    def iter_flood_data(self, mesh_paths, density, max_points=None, memory_budget=None, workers=1):
+        return stream_flood(
+            lambda mesh_path, index: self._flood_samples(mesh_path, index, density),
+            mesh_paths, max_points, memory_budget, workers,
+        )
+
+    # Positions and normals of every sample as two N x 3 arrays
+    def get_flood_data(self, mesh_paths, density, max_points=None):
+        return collect_flood(self.iter_flood_data(mesh_paths, density, max_points))
+
+    # Samples of one mesh in blocks, each mesh draws from its own generator seeded by its place in the request
+    def _flood_samples(self, mesh_path, index, density):
+        mesh = self.get_mesh_data(mesh_path)
+        if mesh is None:
+            return
+        points, triangles = mesh.world_points, mesh.triangles
+        a = points[triangles[:, 0]]
+        cross = np.cross(points[triangles[:, 1]] - a, points[triangles[:, 2]] - a)
+        areas = np.linalg.norm(cross, axis=1) * 0.5
+        cumulative = np.cumsum(areas)
+        total = float(cumulative[-1]) if len(cumulative) else 0.0
+        count = int(round(total * density))
+        rng = np.random.default_rng((0, index))
+        for lo in range(0, count, BLOCK_POINTS):
+            size = min(BLOCK_POINTS, count - lo)
+
+            # Area weighted triangle choice, then a uniform point inside each chosen triangle
+            tris = np.minimum(np.searchsorted(cumulative, rng.random(size) * total, side="right"), len(areas) - 1)
+            r1 = np.sqrt(rng.random(size))[:, None]
+            r2 = rng.random(size)[:, None]
+            c = points[triangles[tris]]
+            positions = c[:, 0] * (1.0 - r1) + c[:, 1] * (r1 * (1.0 - r2)) + c[:, 2] * (r1 * r2)
+            yield positions, cross[tris] / np.maximum(areas[tris, None] * 2.0, 1e-300)
+
+    def get_mesh_paths(self):
+        return self._ensure_scene().paths
+
+    def get_mesh_path_from_index(self, mesh_index):
+        return self._scene.paths[mesh_index]
+
+    # Points, topology and BVH of a mesh, cached until the mesh is edited, the scene is cleared or the stage changes.
+    # Meshes of the scene are taken from it, so a query sees the same data it raycast against. Query workers only see
+    # the other meshes once they were read on the main thread, see prefetch_mesh_data.
+    def get_mesh_data(self, mesh_path):
+        scene = self._ensure_scene()
+        i = scene.index.get(str(mesh_path))
+        return scene.meshes[i] if i is not None else self._cache.get(mesh_path)
+
+    # Read the meshes a query will need, called on the main thread before the query is submitted
+    def prefetch_mesh_data(self, mesh_paths):
+        for mesh_path in mesh_paths:
+            self.get_mesh_data(mesh_path)
+
+    # Local space positions of every vertex of a mesh as one contiguous N x 3 array, None if unavailable
+    def get_vertex_positions(self, mesh_path):
+        data = self.get_mesh_data(mesh_path)
+        return data.points if data is not None else None
+
+    # Callbacks run whenever cached mesh data is dropped, so derived caches can follow
+    def add_rebuild_callback(self, fn):
+        self._rebuild_callbacks.append(fn)
+
+    def remove_rebuild_callback(self, fn):
+        if fn in self._rebuild_callbacks:
+            self._rebuild_callbacks.remove(fn)
+
+    # Callbacks are passed the mesh paths whose data was dropped, or None when everything was
+    def _clear_caches(self, paths=None):
+        self._cache.invalidate(paths)
+        for fn in list(self._rebuild_callbacks):
+            fn(paths)
@@ -0,0 +1,76 @@
+'''
+Clearance between two prims: the exact closest pair of points on their meshes.
+Each prim stands for every mesh at or under it. Mesh pairs are searched in
+order of the distance between their bounds, each with a branch and bound over
+the two meshes' BVHs (TriangleBvh.closest_pair) that is seeded with the best
+distance found so far, so pairs that cannot beat it are skipped outright.
+Uses the triangle data and BVHs the raycast backend already keeps.
+'''
+
+import numpy as np
+
+from .bvh import box_box_distance_sq
+from .stage_listener import paths_under
+
+
+class ClearanceResult:
+
+    # Constructor, points are world space positions on the mesh at the matching path
+    def __init__(self, distance, point_a, point_b, mesh_a, mesh_b, triangle_a, triangle_b):
+        self.distance = distance
+        self.point_a = point_a
+        self.point_b = point_b
+        self.mesh_a = mesh_a
+        self.mesh_b = mesh_b
+        self.triangle_a = triangle_a
+        self.triangle_b = triangle_b
+
+    # Whether the two prims touch or intersect
+    @property
+    def touching(self):
+        return self.distance == 0.0
+
+
+class ClearanceQuery:
+
+    # Constructor, mesh_raycast is the raycast backend that supplies mesh data
+    def __init__(self, mesh_raycast):
+        self._mr = mesh_raycast
+
+    # Meshes the raycast backend knows at or under a prim path, with their data
+    def _meshes(self, path):
+        meshes = []
+        for mesh_path in paths_under(self._mr.get_mesh_paths(), [str(path)]):
+            data = self._mr.get_mesh_data(mesh_path)
+            if data is not None and len(data.triangles):
+                meshes.append((mesh_path, data))
+        return meshes
+
+    # Closest pair of points between the meshes under two prims, returns a ClearanceResult or None when either prim
+    # has no meshes. Meshes under both prims (one prim inside the other) are only measured against the others.
+    def closest(self, path_a, path_b):
+        meshes_a = self._meshes(path_a)
+        meshes_b = self._meshes(path_b)
+        if not meshes_a or not meshes_b:
+            return None
+
+        pairs = []
+        for mesh_a, data_a in meshes_a:
+            for mesh_b, data_b in meshes_b:
+                if mesh_a != mesh_b:
+                    bounds = [np.asarray(bound)[None] for bound in data_a.bounds + data_b.bounds]
+                    lower = box_box_distance_sq(*bounds)[0]
+                    pairs.append((lower, mesh_a, data_a, mesh_b, data_b))
+        pairs.sort(key=lambda pair: pair[0])
+
+        best = None
+        for lower, mesh_a, data_a, mesh_b, data_b in pairs:
+            limit = best.distance if best is not None else np.inf
+            if lower >= limit * limit:
+                break
+            distance, point_a, point_b, triangle_a, triangle_b = data_a.bvh.closest_pair(data_b.bvh, limit)
+            if triangle_a >= 0 and distance < limit:
+                best = ClearanceResult(distance, point_a, point_b, mesh_a, mesh_b, triangle_a, triangle_b)
+                if distance == 0.0:
+                    break
+        return best
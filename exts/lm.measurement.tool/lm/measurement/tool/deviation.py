@@ -0,0 +1,290 @@
+'''
+Deviation maps for comparing a scan against its CAD model: the signed distance
+from every vertex of one mesh to the nearest surface of others, with summary
+statistics and a color overlay.
+Nearest surfaces are found in two steps. A uniform grid over each reference
+mesh's triangles gives every vertex the triangles of its own cell, which settles
+the vertices closer to one of those than to the cell's walls. Triangles much
+larger than the median, such as the planar faces of a CAD model next to its
+fillets, sit in coarser grids of their own instead of filling the fine one. Only the rest are
+searched in the mesh's BVH, bounded by the distance found so far. Vertices are
+processed in chunks sized to a memory budget, on worker threads for large
+meshes, and reference surfaces are cached per prim until the mesh is edited.
+Threads share the reference surfaces and get in parallel where NumPy releases
+the GIL.
+'''
+
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from pxr import Sdf, Usd, UsdGeom, Vt
+
+from .bvh import closest_points_on_triangles, point_box_distance_sq
+from .spatial_index import UniformGrid
+from .stage_listener import paths_under
+
+# Grid cell size of a reference surface, in median triangle sizes
+CELL_TRIANGLE_SIZES = 1.0
+
+# Working memory a chunk needs per vertex, measured on dense meshes, sets the chunk size for a memory budget
+BYTES_PER_VERTEX = 8192
+
+# Smallest chunk of vertices processed at once, whatever the memory budget
+MIN_CHUNK = 4096
+
+# Meshes with fewer vertices than this are measured on the calling thread, splitting them would cost more than it saves
+MIN_POOL_VERTICES = 1 << 18
+
+# Overlay colors for vertices below the surface, on it and above it
+COLOR_BELOW = np.array((0.1, 0.3, 1.0))
+COLOR_ON = np.array((0.1, 0.9, 0.2))
+COLOR_ABOVE = np.array((1.0, 0.15, 0.1))
+
+
+class ReferenceSurface:
+
+    # Constructor, points are world space vertex positions, triangles T x 3 vertex indices and bvh their TriangleBvh
+    def __init__(self, points, triangles, bvh):
+        self.points = points
+        self.triangles = triangles
+        self.bvh = bvh
+        corners = points[triangles]
+        self.box_min = corners.min(axis=1)
+        self.box_max = corners.max(axis=1)
+        size = float(np.median((self.box_max - self.box_min).max(axis=1))) if len(triangles) else 1.0
+        self.grid = UniformGrid(self.box_min, self.box_max, max(size, 1e-9) * CELL_TRIANGLE_SIZES)
+
+    # Closest points on the surface for a batch of points, only where it is closer than max_dist (a scalar or one
+    # value per point). Returns distance, closest points and triangle indices (-1 where nothing is closer).
+    def closest(self, points, max_dist=np.inf):
+        n = len(points)
+        best_sq = np.broadcast_to(np.asarray(max_dist, dtype=np.float64), (n,)) ** 2
+        best_sq = best_sq.copy()
+        closest = points.copy()
+        triangles = np.full(n, -1, dtype=np.int64)
+
+        # Triangles in each point's own cell give a first distance, then every triangle in the cells within that
+        # distance gives the exact one. Triangles in no such cell lie outside the box around the point, further away.
+        items, owner, _ = self.grid.query_boxes(points, points, 1)
+        self._closest_of(points, items, owner, best_sq, closest, triangles)
+        near = np.flatnonzero(triangles >= 0)
+        radius = np.sqrt(best_sq[near])[:, None]
+        items, owner, queried = self.grid.query_boxes(points[near] - radius, points[near] + radius)
+        self._closest_of(points, items, near[owner], best_sq, closest, triangles)
+
+        # Points with an empty cell or too many cells within reach are searched in the BVH instead
+        settled = np.zeros(n, dtype=bool)
+        settled[near[queried]] = True
+        rest = np.flatnonzero(~settled)
+        if len(rest):
+            distance, on_triangle, found = self.bvh.closest_points(points[rest], np.sqrt(best_sq[rest]))
+            hit = found >= 0
+            rest = rest[hit]
+            best_sq[rest] = distance[hit] ** 2
+            closest[rest] = on_triangle[hit]
+            triangles[rest] = found[hit]
+        return np.sqrt(best_sq), closest, triangles
+
+    # Test (triangle, point) pairs whose bounds are closer than best_sq, keeping the closest triangle per point
+    def _closest_of(self, points, items, owner, best_sq, closest, triangles):
+        near = point_box_distance_sq(points[owner], self.box_min[items], self.box_max[items]) < best_sq[owner]
+        items, owner = items[near], owner[near]
+        if not len(items):
+            return
+        corners = self.points[self.triangles[items]]
+        on_triangle = closest_points_on_triangles(points[owner], corners[:, 0], corners[:, 1], corners[:, 2])
+        delta = on_triangle - points[owner]
+        distance_sq = np.einsum("ij,ij->i", delta, delta)
+        np.minimum.at(best_sq, owner, distance_sq)
+        won = np.flatnonzero(distance_sq == best_sq[owner])
+        closest[owner[won]] = on_triangle[won]
+        triangles[owner[won]] = items[won]
+
+    # Unit normals of the given triangles
+    def normals(self, triangles):
+        corners = self.points[self.triangles[triangles]]
+        normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        return normals / np.where(lengths > 0.0, lengths, 1.0)
+
+
+# Signed distance from points to the nearest of several reference surfaces, positive on the side their normals
+# face. NaN where there are no surfaces.
+def signed_distances(surfaces, points):
+    points = np.ascontiguousarray(points, dtype=np.float64).reshape(-1, 3)
+    best = np.full(len(points), np.inf)
+    closest = points.copy()
+    nearest = np.full(len(points), -1, dtype=np.int64)
+    triangles = np.full(len(points), -1, dtype=np.int64)
+    for index, surface in enumerate(surfaces):
+        distance, on_surface, found = surface.closest(points, best)
+        hit = found >= 0
+        best[hit] = distance[hit]
+        closest[hit] = on_surface[hit]
+        nearest[hit] = index
+        triangles[hit] = found[hit]
+
+    signed = np.full(len(points), np.nan)
+    for index, surface in enumerate(surfaces):
+        at = np.flatnonzero(nearest == index)
+        if len(at):
+            side = np.einsum("ij,ij->i", points[at] - closest[at], surface.normals(triangles[at]))
+            signed[at] = np.where(side < 0.0, -best[at], best[at])
+    return signed
+
+
+def _store(distances, start, future):
+    result = future.result()
+    distances[start:start + len(result)] = result
+
+
+# Signed distance from every point to the nearest surface, in chunks whose working memory fits memory_budget
+# bytes overall. workers > 1 spreads the chunks over that many threads, with at most two chunks per thread in
+# flight. Returns the distances and the number of threads used.
+def compute_deviation(surfaces, points, memory_budget, workers=1):
+    points = np.ascontiguousarray(points, dtype=np.float64).reshape(-1, 3)
+    distances = np.empty(len(points))
+    workers = max(int(workers), 1)
+    if len(points) < MIN_POOL_VERTICES:
+        workers = 1
+    chunk = max(int(memory_budget) // (BYTES_PER_VERTEX * workers), MIN_CHUNK)
+
+    if workers == 1:
+        for lo in range(0, len(points), chunk):
+            distances[lo:lo + chunk] = signed_distances(surfaces, points[lo:lo + chunk])
+        return distances, 1
+
+    with ThreadPoolExecutor(workers, thread_name_prefix="lm.measurement.tool.deviation") as pool:
+        pending = deque()
+        for lo in range(0, len(points), chunk):
+            pending.append((lo, pool.submit(signed_distances, surfaces, points[lo:lo + chunk])))
+            if len(pending) >= 2 * workers:
+                _store(distances, *pending.popleft())
+        while pending:
+            _store(distances, *pending.popleft())
+    return distances, workers
+
+
+class DeviationResult:
+
+    # Constructor, distances are signed per vertex of the mesh at mesh_path, NaN where nothing was measured
+    def __init__(self, mesh_path, reference_paths, distances, workers=1):
+        self.mesh_path = mesh_path
+        self.reference_paths = reference_paths
+        self.distances = distances
+        self.workers = workers
+
+    # Summary of the signed distances, plus the given percentiles of them as "p<percentile>"
+    def statistics(self, percentiles=(5, 50, 95)):
+        values = self.distances[np.isfinite(self.distances)]
+        if not len(values):
+            return {"count": 0}
+        magnitude = np.abs(values)
+        stats = {
+            "count": len(values),
+            "min": float(values.min()),
+            "max": float(values.max()),
+            "mean": float(values.mean()),
+            "mean_abs": float(magnitude.mean()),
+            "max_abs": float(magnitude.max()),
+            "rms": float(np.sqrt(np.mean(values * values))),
+        }
+        for percentile, value in zip(percentiles, np.percentile(values, percentiles)):
+            stats[f"p{percentile:g}"] = float(value)
+        return stats
+
+
+# Overlay colors for signed distances: blue below the surface, green on it and red above, saturating at +-limit
+def deviation_colors(distances, limit):
+    t = np.clip(np.nan_to_num(distances) / max(float(limit), 1e-12), -1.0, 1.0)[:, None]
+    return np.where(t < 0.0, COLOR_ON + (COLOR_BELOW - COLOR_ON) * -t, COLOR_ON + (COLOR_ABOVE - COLOR_ON) * t)
+
+
+# Color range that covers all but the outer few percent of every result's distances
+def auto_color_limit(results):
+    values = [np.abs(result.distances[np.isfinite(result.distances)]) for result in results]
+    values = np.concatenate(values) if values else np.empty(0)
+    return float(np.percentile(values, 95)) if len(values) else 1.0
+
+
+# Show results as per vertex display colors, authored in the session layer so the stage itself is left untouched
+def apply_overlay(stage, results, limit):
+    with Usd.EditContext(stage, stage.GetSessionLayer()):
+        for result in results:
+            prim = stage.GetPrimAtPath(result.mesh_path)
+            if not prim:
+                continue
+            colors = deviation_colors(result.distances, limit).astype(np.float32)
+            primvar = UsdGeom.PrimvarsAPI(prim).CreatePrimvar(
+                "displayColor", Sdf.ValueTypeNames.Color3fArray, UsdGeom.Tokens.vertex
+            )
+            primvar.Set(Vt.Vec3fArray.FromNumpy(colors))
+
+
+# Remove the overlay from the given mesh paths
+def clear_overlay(stage, mesh_paths):
+    with Usd.EditContext(stage, stage.GetSessionLayer()):
+        for path in mesh_paths:
+            prim = stage.GetPrimAtPath(path)
+            if prim:
+                prim.RemoveProperty("primvars:displayColor")
+
+
+class DeviationAnalysis:
+
+    # Constructor, mesh_raycast is the raycast backend that supplies mesh data and rebuild notifications
+    def __init__(self, mesh_raycast):
+        self._mr = mesh_raycast
+
+        # Built on a worker and dropped on the UI thread, a surface built across an invalidation is not stored
+        self._surfaces = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._mr.add_rebuild_callback(self.invalidate)
+
+    # Reference surface of a mesh path, built on first use
+    def surface(self, mesh_path):
+        mesh_path = str(mesh_path)
+        with self._lock:
+            if mesh_path in self._surfaces:
+                return self._surfaces[mesh_path]
+            generation = self._generation
+        data = self._mr.get_mesh_data(mesh_path)
+        surface = None
+        if data is not None and len(data.triangles):
+            surface = ReferenceSurface(data.world_points, data.triangles, data.bvh)
+        with self._lock:
+            if generation == self._generation:
+                self._surfaces[mesh_path] = surface
+        return surface
+
+    # Deviation of every mesh under path from the nearest surface of the meshes under reference_path (other than
+    # the measured ones). Returns one DeviationResult per measured mesh, empty when either side has no meshes.
+    def measure(self, path, reference_path, memory_budget, workers=1):
+        mesh_paths = self._mr.get_mesh_paths()
+        measured = paths_under(mesh_paths, [str(path)])
+        references = [mesh for mesh in paths_under(mesh_paths, [str(reference_path)]) if mesh not in set(measured)]
+        surfaces = [surface for surface in (self.surface(mesh) for mesh in references) if surface is not None]
+        if not surfaces:
+            return []
+
+        results = []
+        for mesh_path in measured:
+            data = self._mr.get_mesh_data(mesh_path)
+            if data is None or not len(data.points):
+                continue
+            distances, used = compute_deviation(surfaces, data.world_points, memory_budget, workers)
+            results.append(DeviationResult(mesh_path, references, distances, used))
+        return results
+
+    # Drop the surfaces of the given mesh paths, or every surface when paths is None
+    def invalidate(self, paths=None):
+        with self._lock:
+            self._generation += 1
+            if paths is None:
+                self._surfaces.clear()
+                return
+            for path in paths:
+                self._surfaces.pop(str(path), None)
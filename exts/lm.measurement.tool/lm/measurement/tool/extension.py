@@ -10,6 +10,7 @@ import omni.kit.window.toolbar as tb
 from omni.kit.viewport.utility import get_active_viewport_window
 
 from .viewport_scene import ViewportScene, MeasurementToolGroup
+from .profiling import get_profiler
 
 class MeasurementTool(omni.ext.IExt):
 
@@ -43,6 +44,10 @@ class MeasurementTool(omni.ext.IExt):
 
     # Clean up
     def on_shutdown(self):
+        # Save any measurements still on screen before the scene goes away
+        if self._viewport_scene:
+            self._manipuator.autosave()
+
         self._toolbar.remove_widget(self._widget)
         self._widget.clean()
         self._widget = None
@@ -52,4 +57,7 @@ class MeasurementTool(omni.ext.IExt):
             self._viewport_scene.destroy()
             self._viewport_scene = None
 
+        # Stop following the profiling setting and write out the final snapshot
+        get_profiler().shutdown()
+
         print("[lm.measurement.tool] Measurement Tool shutdown")
\ No newline at end of file
@@ -0,0 +1,213 @@
+'''
+Flood sampling streamed in blocks. Meshes are sampled on worker threads, each
+mesh's points are handed over in blocks of NumPy arrays through a bounded queue
+as soon as they are sampled, and the caller consumes the blocks while later
+meshes are still being sampled. The queue holds as many blocks as fit the
+memory budget, so workers wait while the consumer is behind instead of piling
+up points. Sampling stops once a cap on the total number of points is reached.
+A running summary and a file writer consume the blocks as they arrive, so a
+flood of a large selection is never held in memory as a whole.
+'''
+
+import os
+import queue
+import threading
+
+import numpy as np
+
+# Points per block handed to the consumer
+BLOCK_POINTS = 1 << 16
+
+# Bytes a sampled point takes, its position and normal as float64
+BYTES_PER_POINT = 48
+
+# Blocks queued per worker when there is no memory budget
+BLOCKS_PER_WORKER = 4
+
+# Seconds a worker waits on a full queue before checking whether the consumer stopped
+_PUT_TIMEOUT = 0.05
+
+_DONE = object()
+
+
+class FloodBlock:
+
+    # Constructor, positions and normals are N x 3 world space arrays of samples of the mesh at mesh_path
+    def __init__(self, mesh_path, positions, normals):
+        self.mesh_path = mesh_path
+        self.positions = positions
+        self.normals = normals
+
+    def __len__(self):
+        return len(self.positions)
+
+    def head(self, count):
+        return FloodBlock(self.mesh_path, self.positions[:count], self.normals[:count])
+
+
+# Blocks of flood samples of mesh_paths, in the order they are sampled. sample(mesh_path, index) returns an iterable
+# of (positions, normals) arrays for one mesh and is run on up to workers threads at once. max_points caps the points
+# yielded, the first ones sampled are kept. memory_budget caps the bytes of blocks sampled but not yet consumed, at
+# least one block is always let through. Meshes with one worker arrive in order, with more in the order they finish.
+def stream_flood(sample, mesh_paths, max_points=None, memory_budget=None, workers=1, block_points=BLOCK_POINTS):
+    mesh_paths = [str(path) for path in mesh_paths]
+    workers = max(1, min(int(workers), len(mesh_paths)))
+    if not mesh_paths or (max_points is not None and max_points <= 0):
+        return
+    if memory_budget:
+        block_points = max(1, min(block_points, int(memory_budget) // BYTES_PER_POINT))
+        slots = max(1, int(memory_budget) // (block_points * BYTES_PER_POINT))
+    else:
+        slots = BLOCKS_PER_WORKER * workers
+    blocks = queue.Queue(maxsize=slots)
+    stop = threading.Event()
+    next_mesh = iter(range(len(mesh_paths)))
+    lock = threading.Lock()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                blocks.put(item, timeout=_PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            while not stop.is_set():
+                with lock:
+                    index = next(next_mesh, None)
+                if index is None:
+                    break
+                mesh_path = mesh_paths[index]
+                for positions, normals in sample(mesh_path, index):
+                    for lo in range(0, len(positions), block_points):
+                        hi = lo + block_points
+                        if not put(FloodBlock(mesh_path, positions[lo:hi], normals[lo:hi])):
+                            return
+        except Exception as e:
+            put(e)
+        finally:
+            put(_DONE)
+
+    for _ in range(workers):
+        threading.Thread(target=produce, name="lm.measurement.tool.flood", daemon=True).start()
+
+    # Workers still sampling when the consumer stops finish their current mesh in the background
+    remaining = np.inf if max_points is None else int(max_points)
+    finished = 0
+    try:
+        while finished < workers:
+            block = blocks.get()
+            if block is _DONE:
+                finished += 1
+                continue
+            if isinstance(block, Exception):
+                raise block
+            if len(block) > remaining:
+                block = block.head(int(remaining))
+            remaining -= len(block)
+            yield block
+            if remaining <= 0:
+                break
+    finally:
+        stop.set()
+
+
+# Positions and normals of every block as two N x 3 arrays
+def collect_flood(blocks):
+    positions = []
+    normals = []
+    for block in blocks:
+        positions.append(block.positions)
+        normals.append(block.normals)
+    if not positions:
+        return np.empty((0, 3)), np.empty((0, 3))
+    return np.concatenate(positions), np.concatenate(normals)
+
+
+class FloodSummary:
+
+    # Point count per mesh, bounds and centroid of flood samples, accumulated block by block
+    def __init__(self):
+        self.count = 0
+        self.mesh_counts = {}
+        self.bounds_min = np.full(3, np.inf)
+        self.bounds_max = np.full(3, -np.inf)
+        self._sum = np.zeros(3)
+
+    def add(self, block):
+        if not len(block):
+            return
+        self.count += len(block)
+        self.mesh_counts[block.mesh_path] = self.mesh_counts.get(block.mesh_path, 0) + len(block)
+
+        # Reductions along the rows of the transposed copy are several times faster than down the N x 3 columns
+        columns = np.ascontiguousarray(block.positions.T)
+        np.minimum(self.bounds_min, columns.min(axis=1), out=self.bounds_min)
+        np.maximum(self.bounds_max, columns.max(axis=1), out=self.bounds_max)
+        self._sum += columns.sum(axis=1)
+
+    @property
+    def centroid(self):
+        return self._sum / self.count if self.count else np.zeros(3)
+
+
+class FloodWriter:
+
+    # Writes flood samples to path as they arrive, as .csv (x, y, z, nx, ny, nz per line) or binary little endian
+    # .ply with float32 positions and normals. The .ply vertex count is filled in on close.
+    def __init__(self, path):
+        self.path = str(path)
+        self.count = 0
+        self._ply = os.path.splitext(self.path)[1].lower() == ".ply"
+        self._file = open(self.path, "wb")
+        if self._ply:
+            self._file.write(b"ply\nformat binary_little_endian 1.0\nelement vertex ")
+            self._count_offset = self._file.tell()
+            self._file.write(b" " * 20 + b"\n")
+            for name in ("x", "y", "z", "nx", "ny", "nz"):
+                self._file.write(f"property float {name}\n".encode())
+            self._file.write(b"end_header\n")
+        else:
+            self._file.write(b"x,y,z,nx,ny,nz\n")
+
+    def write(self, block):
+        if not len(block):
+            return
+        rows = np.hstack((block.positions, block.normals))
+        if self._ply:
+            self._file.write(rows.astype("<f4").tobytes())
+        else:
+            np.savetxt(self._file, rows, delimiter=",", fmt="%.9g")
+        self.count += len(block)
+
+    def close(self):
+        if self._file.closed:
+            return
+        if self._ply:
+            self._file.seek(self._count_offset)
+            self._file.write(str(self.count).ljust(20).encode())
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# Consume flood blocks into a FloodSummary, also writing them to path when it is given. Returns the summary.
+def consume_flood(blocks, path=None):
+    summary = FloodSummary()
+    writer = FloodWriter(path) if path else None
+    try:
+        for block in blocks:
+            summary.add(block)
+            if writer is not None:
+                writer.write(block)
+    finally:
+        if writer is not None:
+            writer.close()
+    return summary
@@ -0,0 +1,281 @@
+'''
+Shortest paths along mesh surfaces, for measuring cable runs and seam lengths.
+Each mesh gets a MeshGraph: its triangle edges as a compressed sparse row (CSR)
+adjacency with Euclidean edge lengths, plus a vertex to triangle index used to
+locate picked points. Graphs are built lazily from the topology the raycast
+backend already reads and cached per prim until the mesh is edited.
+Paths are found with bidirectional A*, run as delta stepping over whole NumPy
+frontiers instead of one heap pop per vertex. They follow mesh edges and chords
+across flat pairs of triangles, so they can run a few percent longer than the
+true geodesic, most on regular grids in directions between the edge directions.
+'''
+
+import threading
+
+import numpy as np
+
+from .bvh import expand_ranges, closest_points_on_triangles
+
+# Adjacent triangles whose normals are closer than this (cosine of the dihedral angle) are also joined
+# between their opposite corners, so paths can cut across flat regions instead of zigzagging along edges
+FLAT_DIHEDRAL_COS = 0.95
+
+# Number of nearest vertices whose triangles are searched for the triangle a picked point lies on
+LOCATE_VERTICES = 16
+
+# Points further than this from every triangle found around the nearest vertices (relative to the
+# mesh's size) trigger a search over every triangle
+LOCATE_TOLERANCE = 1e-4
+
+# Triangles tested at once by the exhaustive locate
+LOCATE_CHUNK = 1 << 18
+
+# Width of the A* buckets in median edge lengths
+BUCKET_EDGES = 0.5
+
+
+# Group (source, target) pairs by source vertex, returns CSR row offsets and the targets in row order
+def _csr(sources, targets, count):
+    order = np.argsort(sources, kind="stable")
+    indptr = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=count), out=indptr[1:])
+    return indptr, targets[order]
+
+
+# Euclidean distance from every row of points to one point
+def _distances(points, point):
+    delta = points - point
+    return np.sqrt(np.einsum("ij,ij->i", delta, delta))
+
+
+# Total length of an N x 3 polyline
+def polyline_length(points):
+    return float(np.linalg.norm(np.diff(points, axis=0), axis=1).sum())
+
+
+# Point halfway along an N x 3 polyline, where a label for the whole path is placed
+def polyline_midpoint(points):
+    lengths = np.linalg.norm(np.diff(points, axis=0), axis=1)
+    if not lengths.sum():
+        return points[0]
+    cumulative = np.cumsum(lengths)
+    half = cumulative[-1] * 0.5
+    index = int(np.searchsorted(cumulative, half))
+    t = (half - (cumulative[index] - lengths[index])) / lengths[index]
+    return points[index] + (points[index + 1] - points[index]) * t
+
+
+class MeshGraph:
+
+    # Constructor, points are world space vertex positions and triangles are T x 3 vertex indices
+    def __init__(self, points, triangles):
+        self.points = np.ascontiguousarray(points, dtype=np.float64).reshape(-1, 3)
+        self.triangles = np.ascontiguousarray(triangles, dtype=np.int64).reshape(-1, 3)
+        count = len(self.points)
+
+        # Triangle edges keyed by one packed integer each, with the corner opposite the edge
+        a = self.triangles.ravel()
+        b = self.triangles[:, [1, 2, 0]].ravel()
+        opposite = self.triangles[:, [2, 0, 1]].ravel()
+        keys = np.minimum(a, b) * count + np.maximum(a, b)
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        unique = np.append(True, keys[1:] != keys[:-1]) if len(keys) else np.zeros(0, dtype=bool)
+
+        # An edge shared by two nearly coplanar triangles also joins their opposite corners
+        shared = np.flatnonzero(~unique)
+        near = opposite[order[shared - 1]]
+        far = opposite[order[shared]]
+        normals = self._unit_normals()
+        flat = np.einsum("ij,ij->i", normals[order[shared - 1] // 3], normals[order[shared] // 3]) > FLAT_DIHEDRAL_COS
+        flat &= near != far
+        keys = np.concatenate((keys[unique], np.minimum(near, far)[flat] * count + np.maximum(near, far)[flat]))
+        keys = np.sort(keys)
+        keys = keys[np.append(True, keys[1:] != keys[:-1])] if len(keys) else keys
+        lo = keys // max(count, 1)
+        hi = keys % max(count, 1)
+
+        # Both directions of every edge, grouped by source vertex
+        self.indptr, self.indices = _csr(np.concatenate((lo, hi)), np.concatenate((hi, lo)), count)
+        sources = np.repeat(np.arange(count), np.diff(self.indptr))
+        self.weights = np.linalg.norm(self.points[self.indices] - self.points[sources], axis=1)
+        self.edge_length = float(np.median(self.weights)) if len(self.weights) else 1.0
+
+        # Triangles around each vertex, for locating picked points
+        self.tri_indptr, self.vertex_triangles = _csr(a, np.repeat(np.arange(len(self.triangles)), 3), count)
+        extent = np.ptp(self.points, axis=0) if count else np.zeros(3)
+        self.size = float(np.linalg.norm(extent)) or 1.0
+
+    def _unit_normals(self):
+        corners = self.points[self.triangles]
+        normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        return normals / np.where(lengths > 0.0, lengths, 1.0)
+
+    @property
+    def edge_count(self):
+        return len(self.indices) // 2
+
+    # Triangle a surface point lies on and the closest point on it, searched among the triangles
+    # around the nearest vertices first and over every triangle if none of those is close enough
+    def locate(self, point):
+        point = np.asarray(point, dtype=np.float64).reshape(3)
+        distances = _distances(self.points, point)
+        k = min(LOCATE_VERTICES, len(distances))
+        near = np.argpartition(distances, k - 1)[:k]
+        slots, _ = expand_ranges(self.tri_indptr[near], self.tri_indptr[near + 1] - self.tri_indptr[near])
+        triangle, closest, distance = self._closest_triangle(point, np.unique(self.vertex_triangles[slots]))
+        if distance > LOCATE_TOLERANCE * self.size:
+            for lo in range(0, len(self.triangles), LOCATE_CHUNK):
+                candidates = np.arange(lo, min(lo + LOCATE_CHUNK, len(self.triangles)))
+                found = self._closest_triangle(point, candidates)
+                if found[2] < distance:
+                    triangle, closest, distance = found
+        return triangle, closest
+
+    def _closest_triangle(self, point, triangles):
+        if not len(triangles):
+            return -1, point, np.inf
+        corners = self.points[self.triangles[triangles]]
+        closest = closest_points_on_triangles(
+            np.broadcast_to(point, (len(triangles), 3)), corners[:, 0], corners[:, 1], corners[:, 2]
+        )
+        distances = np.linalg.norm(closest - point, axis=1)
+        best = int(np.argmin(distances))
+        return int(triangles[best]), closest[best], float(distances[best])
+
+    # Shortest path along the surface between two points on the mesh.
+    # Returns the path as an N x 3 polyline from start to end and its length.
+    def shortest_path(self, start, end):
+        start_triangle, start = self.locate(start)
+        end_triangle, end = self.locate(end)
+        if start_triangle == end_triangle:
+            return np.array([start, end]), float(np.linalg.norm(end - start))
+
+        # Bidirectional A*: state v is vertex v reached from the start, state v + count is vertex v reached from the
+        # end. The search from the start enters the graph at the start triangle's corners, the one from the end at the
+        # end triangle's. Both order their states by distance plus half the difference of the straight line distances
+        # to the two ends, a lower bound from either side, so they share one key scale and run as one frontier.
+        count = len(self.points)
+        potential = 0.5 * (_distances(self.points, end) - _distances(self.points, start))
+        potential = np.concatenate((potential, -potential))
+        dist = np.full(2 * count, np.inf)
+        pred = np.full(2 * count, -1, dtype=np.int64)
+        entry = self.triangles[start_triangle]
+        exits = self.triangles[end_triangle] + count
+        dist[entry] = np.linalg.norm(self.points[entry] - start, axis=1)
+        dist[exits] = np.linalg.norm(self.points[exits - count] - end, axis=1)
+
+        # Shortest path found so far and the state where its two halves meet
+        meeting = dist[entry] + dist[entry + count]
+        best = float(meeting.min())
+        meet = int(entry[np.argmin(meeting)])
+
+        # Frontier states are processed in buckets of key, each bucket relaxed until it settles. States updated past
+        # the current bucket are deferred and merged once per bucket. The search ends once the smallest keys left
+        # on the two sides add up to the best path, no path through the remaining states can be shorter.
+        bucket_width = BUCKET_EDGES * self.edge_length
+        slot_of = np.empty(2 * count, dtype=np.int64)
+        deferred = [entry, exits]
+        while deferred:
+            queue = np.unique(np.concatenate(deferred))
+            keys = dist[queue] + potential[queue]
+            forward = queue < count
+            if not forward.any() or forward.all() or keys[forward].min() + keys[~forward].min() >= best:
+                break
+            limit = keys.min() + bucket_width
+            in_bucket = keys < limit
+            bucket = queue[in_bucket]
+            deferred = [queue[~in_bucket]]
+            while len(bucket):
+                # Every edge leaving the bucket, as CSR slots of the vertices the states stand for
+                offset = np.where(bucket < count, 0, count)
+                starts = self.indptr[bucket - offset]
+                counts = self.indptr[bucket - offset + 1] - starts
+                ends = np.cumsum(counts)
+                slots = np.arange(ends[-1]) + np.repeat(starts - ends + counts, counts)
+                sources = np.repeat(bucket, counts)
+                targets = self.indices[slots] + np.repeat(offset, counts)
+                candidate = np.repeat(dist[bucket], counts) + self.weights[slots]
+                better = candidate < dist[targets]
+                if not better.any():
+                    break
+
+                # Keep the shortest candidate per target state, ties (common on regular meshes) are dropped
+                # by keeping the last slot written for each target instead of sorting
+                sources, targets, candidate = sources[better], targets[better], candidate[better]
+                np.minimum.at(dist, targets, candidate)
+                won = np.flatnonzero(candidate == dist[targets])
+                slot_of[targets[won]] = won
+                won = won[slot_of[targets[won]] == won]
+                targets, candidate = targets[won], candidate[won]
+                pred[targets] = sources[won]
+
+                # Targets the other side already reached complete a path
+                meeting = candidate + dist[np.where(targets < count, targets + count, targets - count)]
+                closest = int(np.argmin(meeting))
+                if meeting[closest] < best:
+                    best, meet = float(meeting[closest]), int(targets[closest]) % count
+
+                in_bucket = candidate + potential[targets] < limit
+                bucket = targets[in_bucket]
+                deferred.append(targets[~in_bucket])
+
+        if not np.isfinite(best):
+            return None, np.inf
+
+        # Walk the predecessors from the meeting vertex back to both ends
+        chain = self._walk(pred, meet)[::-1] + [vertex - count for vertex in self._walk(pred, meet + count)[1:]]
+        return np.vstack((start, self.points[chain], end)), best
+
+    @staticmethod
+    def _walk(pred, state):
+        chain = []
+        while state >= 0:
+            chain.append(state)
+            state = int(pred[state])
+        return chain
+
+
+class GeodesicGraphCache:
+
+    # Constructor, mesh_raycast is the raycast backend that supplies mesh data and rebuild notifications
+    def __init__(self, mesh_raycast):
+        self._mr = mesh_raycast
+
+        # Built on query workers and dropped on the UI thread, a graph built across an invalidation is not stored
+        self._graphs = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._mr.add_rebuild_callback(self.invalidate)
+
+    # Graph of a mesh path, built on first use
+    def get(self, mesh_path):
+        mesh_path = str(mesh_path)
+        with self._lock:
+            if mesh_path in self._graphs:
+                return self._graphs[mesh_path]
+            generation = self._generation
+        data = self._mr.get_mesh_data(mesh_path)
+        graph = MeshGraph(data.world_points, data.triangles) if data is not None else None
+        with self._lock:
+            if generation == self._generation:
+                self._graphs[mesh_path] = graph
+        return graph
+
+    # Shortest surface path between two points on one mesh, returns (polyline, length) or (None, inf)
+    def shortest_path(self, mesh_path, start, end):
+        graph = self.get(mesh_path)
+        if graph is None:
+            return None, np.inf
+        return graph.shortest_path(start, end)
+
+    # Drop the graphs of the given mesh paths, or every graph when paths is None
+    def invalidate(self, paths=None):
+        with self._lock:
+            self._generation += 1
+            if paths is None:
+                self._graphs.clear()
+                return
+            for path in paths:
+                self._graphs.pop(str(path), None)
@@ -0,0 +1,101 @@
+'''
+Chooses which segment labels are drawn, so label nodes follow what is on screen
+instead of the number of segments. Labels are projected in vectorized passes:
+all of them when the camera or the measurements change, only the new ones when
+segments are added. Labels behind the camera, outside the viewport or on
+segments shorter than a few pixels on screen are culled. Of the labels left,
+only the one on the longest segment is kept in each screen cell, so dense
+clusters are decimated instead of overlapping.
+'''
+
+import numpy as np
+
+
+class LabelSet:
+
+    # Segment labels of one measurement group: anchor positions, segment lengths and their formatted text.
+    # Text is formatted once per segment, when the segment is added. Added chunks are joined on first read.
+    def __init__(self):
+        self._anchors = []
+        self._lengths = []
+        self.texts = []
+
+    def __len__(self):
+        return len(self.texts)
+
+    def extend(self, anchors, lengths, texts):
+        self._anchors.append(np.asarray(anchors, dtype=np.float64).reshape(-1, 3))
+        self._lengths.append(np.asarray(lengths, dtype=np.float64).reshape(-1))
+        self.texts.extend(texts)
+
+    @property
+    def anchors(self):
+        if len(self._anchors) != 1:
+            self._anchors = [np.concatenate(self._anchors) if self._anchors else np.zeros((0, 3))]
+        return self._anchors[0]
+
+    @property
+    def lengths(self):
+        if len(self._lengths) != 1:
+            self._lengths = [np.concatenate(self._lengths) if self._lengths else np.zeros(0)]
+        return self._lengths[0]
+
+
+class LabelLayout:
+
+    # Constructor, min_pixels is the shortest segment on screen that gets a label and cell_size the (width, height)
+    # in pixels of the screen cells that hold one label each
+    def __init__(self, camera, viewport_size, min_pixels, cell_size):
+        self.camera = camera
+        self.width, self.height = viewport_size
+        self.min_pixels = min_pixels
+        self.cell_width = max(float(cell_size[0]), 1.0)
+        self.cell_height = max(float(cell_size[1]), 1.0)
+        self._columns = int(np.ceil(self.width / self.cell_width)) + 1
+        self._cell_count = self._columns * (int(np.ceil(self.height / self.cell_height)) + 1)
+
+        # Label shown in each occupied cell as (segment length, anchor, text), keyed by cell
+        self.cells = {}
+
+    # Cells and indices of the labels that are on screen, in front of the camera and long enough on screen.
+    # Clip w is the depth for a perspective camera and 1 for an orthographic one, so a pixel at an anchor is
+    # 2 w / (projection[1][1] * height) world units either way.
+    def _on_screen(self, anchors, lengths):
+        view_projection = self.camera.view_projection
+        clip = anchors @ np.ascontiguousarray(view_projection[:3, (0, 1, 3)]) + view_projection[3, (0, 1, 3)]
+        x, y, w = clip[:, 0], clip[:, 1], clip[:, 2]
+        pixel = 2.0 / (abs(self.camera.projection[1, 1]) * self.height)
+        visible = (w > 1e-9) & (np.abs(x) <= w) & (np.abs(y) <= w)
+        index = np.flatnonzero(visible & (lengths >= self.min_pixels * pixel * w))
+
+        # On screen x / w and y / w are in [-1, 1], so truncating their cell coordinates rounds down
+        w = w[index]
+        columns = ((x[index] / w + 1.0) * (0.5 * self.width / self.cell_width)).astype(np.int64)
+        rows = ((y[index] / w + 1.0) * (0.5 * self.height / self.cell_height)).astype(np.int64)
+        return rows * self._columns + columns, index
+
+    # Add labels to the layout, each takes its cell when the cell is free or holds a shorter segment.
+    # Returns the cells whose label changed.
+    def place(self, anchors, lengths, texts):
+        if not len(texts):
+            return []
+        keys, index = self._on_screen(anchors, lengths)
+        if not len(index):
+            return []
+
+        # Only the longest label of each cell competes with the one already there. Cells are few, so the longest
+        # per cell is scattered into a per cell array instead of sorting the labels, ties go to the first label.
+        longest = np.full(self._cell_count, -np.inf)
+        np.maximum.at(longest, keys, lengths[index])
+        best = np.flatnonzero(lengths[index] == longest[keys])[::-1]
+        winner = np.full(self._cell_count, -1, dtype=np.int64)
+        winner[keys[best]] = index[best]
+        keys = np.flatnonzero(winner >= 0)
+        changed = []
+        for key, i in zip(keys.tolist(), winner[keys].tolist()):
+            length = float(lengths[i])
+            held = self.cells.get(key)
+            if held is None or length > held[0]:
+                self.cells[key] = (length, anchors[i].tolist(), texts[i])
+                changed.append(key)
+        return changed
@@ -0,0 +1,110 @@
+'''
+Array backed collection of measurement groups with stable IDs.
+Each group lives in a slot, deleted slots go on a free list for reuse, and an
+ID packs the slot with a per-slot generation so that IDs of deleted groups
+never resolve to whatever later reuses their slot.
+'''
+
+import numpy as np
+
+# IDs are generation << SLOT_BITS | slot
+SLOT_BITS = 32
+SLOT_MASK = (1 << SLOT_BITS) - 1
+
+
+class MeasurementCollection:
+
+    # Constructor
+    def __init__(self, capacity=16):
+        capacity = max(int(capacity), 1)
+        self._values = [None] * capacity
+        self._generations = np.zeros(capacity, dtype=np.int64)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._visible = np.ones(capacity, dtype=bool)
+        self._free = list(range(capacity - 1, -1, -1))
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, group_id):
+        return self._slot(group_id) is not None
+
+    # Slot of a live group, or None for unknown or deleted IDs
+    def _slot(self, group_id):
+        if group_id is None:
+            return None
+        slot = int(group_id) & SLOT_MASK
+        if slot >= len(self._values) or not self._alive[slot]:
+            return None
+        if self._generations[slot] != int(group_id) >> SLOT_BITS:
+            return None
+        return slot
+
+    def _grow(self):
+        old = len(self._values)
+        new = old * 2
+        self._values.extend([None] * (new - old))
+        self._generations = np.concatenate((self._generations, np.zeros(new - old, dtype=np.int64)))
+        self._alive = np.concatenate((self._alive, np.zeros(new - old, dtype=bool)))
+        self._visible = np.concatenate((self._visible, np.ones(new - old, dtype=bool)))
+        self._free.extend(range(new - 1, old - 1, -1))
+
+    # Store a value in a free slot, returns its ID
+    def add(self, value):
+        if not self._free:
+            self._grow()
+        slot = self._free.pop()
+        self._values[slot] = value
+        self._alive[slot] = True
+        self._visible[slot] = True
+        self._count += 1
+        return int(self._generations[slot]) << SLOT_BITS | slot
+
+    # Remove a group in O(1), returns its value or None if the ID is not live
+    def remove(self, group_id):
+        slot = self._slot(group_id)
+        if slot is None:
+            return None
+        value = self._values[slot]
+        self._values[slot] = None
+        self._alive[slot] = False
+        self._generations[slot] += 1
+        self._free.append(slot)
+        self._count -= 1
+        return value
+
+    def get(self, group_id, default=None):
+        slot = self._slot(group_id)
+        return default if slot is None else self._values[slot]
+
+    def set_visible(self, group_id, visible):
+        slot = self._slot(group_id)
+        if slot is None:
+            return False
+        self._visible[slot] = bool(visible)
+        return True
+
+    def is_visible(self, group_id):
+        slot = self._slot(group_id)
+        return slot is not None and bool(self._visible[slot])
+
+    # IDs of every live group in slot order, optionally only the visible ones
+    def ids(self, visible_only=False):
+        mask = self._alive & self._visible if visible_only else self._alive
+        slots = np.flatnonzero(mask)
+        return ((self._generations[slots] << SLOT_BITS) | slots).tolist()
+
+    def items(self):
+        return [(group_id, self._values[group_id & SLOT_MASK]) for group_id in self.ids()]
+
+    # Remove every group, all outstanding IDs become invalid
+    def clear(self):
+        slots = np.flatnonzero(self._alive)
+        for slot in slots:
+            self._values[slot] = None
+        self._generations[slots] += 1
+        self._alive[:] = False
+        self._visible[:] = True
+        self._free = list(range(len(self._values) - 1, -1, -1))
+        self._count = 0
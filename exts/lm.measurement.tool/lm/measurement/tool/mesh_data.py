@@ -0,0 +1,198 @@
+'''
+Reads UsdGeom.Mesh topology and points into NumPy arrays.
+Mesh data is cached per prim path so the raycast backends and measurement
+modes share one copy of each mesh, and the BVH is only built when first needed.
+Only the main thread reads the stage, since it is also the thread that edits
+it. Queries on worker threads see the meshes read before they were submitted,
+as read-only arrays, and None for the others.
+'''
+
+import threading
+
+import numpy as np
+from pxr import Usd, UsdGeom
+
+from .bvh import TriangleBvh
+
+# Fan triangulation of polygon faces, returns T x 3 vertex indices and the face each triangle came from
+def triangulate(face_vertex_counts, face_vertex_indices):
+    counts = np.asarray(face_vertex_counts, dtype=np.int64)
+    indices = np.asarray(face_vertex_indices, dtype=np.int64)
+    offsets = np.cumsum(counts) - counts
+    tri_counts = np.maximum(counts - 2, 0)
+
+    faces = np.repeat(np.arange(len(counts)), tri_counts)
+    corner = np.arange(int(tri_counts.sum())) - np.repeat(np.cumsum(tri_counts) - tri_counts, tri_counts) + 1
+    base = offsets[faces]
+    triangles = np.stack((indices[base], indices[base + corner], indices[base + corner + 1]), axis=1)
+    return triangles, faces
+
+
+# Apply a row-vector 4x4 transform (USD convention) to an N x 3 array of points
+def transform_points(points, matrix):
+    return points @ matrix[:3, :3] + matrix[3, :3]
+
+
+# Whether the caller runs on the main thread, the only one that may read the stage
+def on_main_thread():
+    return threading.current_thread() is threading.main_thread()
+
+
+def _frozen(array):
+    array.setflags(write=False)
+    return array
+
+
+class MeshData:
+
+    # Constructor, points are in the mesh's local space and local_to_world is a 4x4 row-vector matrix
+    def __init__(self, path, points, face_vertex_counts, face_vertex_indices, local_to_world=None):
+        self.path = str(path)
+        self.points = _frozen(np.array(points, dtype=np.float64).reshape(-1, 3))
+        self.face_vertex_counts = _frozen(np.array(face_vertex_counts, dtype=np.int64))
+        self.face_vertex_indices = _frozen(np.array(face_vertex_indices, dtype=np.int64))
+        if local_to_world is None:
+            local_to_world = np.identity(4)
+        self.local_to_world = _frozen(np.array(local_to_world, dtype=np.float64))
+
+        self._triangles = None
+        self._triangle_faces = None
+        self._world_points = None
+        self._bounds = None
+        self._bvh = None
+
+    # Triangulated topology, computed on first access
+    @property
+    def triangles(self):
+        if self._triangles is None:
+            self._triangles, self._triangle_faces = triangulate(self.face_vertex_counts, self.face_vertex_indices)
+        return self._triangles
+
+    @property
+    def triangle_faces(self):
+        if self._triangle_faces is None:
+            self.triangles
+        return self._triangle_faces
+
+    @property
+    def world_points(self):
+        if self._world_points is None:
+            self._world_points = transform_points(self.points, self.local_to_world)
+        return self._world_points
+
+    # World space bounds of the mesh points, computed on first access
+    @property
+    def bounds(self):
+        if self._bounds is None:
+            if not len(self.points):
+                self._bounds = (np.zeros(3), np.zeros(3))
+            else:
+                self._bounds = (self.world_points.min(axis=0), self.world_points.max(axis=0))
+        return self._bounds
+
+    # World space BVH over the triangles, built on first access
+    @property
+    def bvh(self):
+        if self._bvh is None:
+            self._bvh = TriangleBvh(self.world_points, self.triangles)
+        return self._bvh
+
+    # Whether the BVH was built, i.e. the mesh has been queried since it was read
+    @property
+    def has_bvh(self):
+        return self._bvh is not None
+
+
+# Read a UsdGeom.Mesh prim into MeshData, returns None if the prim has no usable geometry
+def read_mesh_data(prim, xform_cache=None, time=Usd.TimeCode.Default()):
+    mesh = UsdGeom.Mesh(prim)
+    if not mesh:
+        return None
+    points = mesh.GetPointsAttr().Get(time)
+    counts = mesh.GetFaceVertexCountsAttr().Get(time)
+    indices = mesh.GetFaceVertexIndicesAttr().Get(time)
+    if not points or not counts or not indices:
+        return None
+
+    if xform_cache is None:
+        xform_cache = UsdGeom.XformCache(time)
+    local_to_world = np.array(xform_cache.GetLocalToWorldTransform(prim), dtype=np.float64)
+    return MeshData(prim.GetPath(), np.asarray(points), np.asarray(counts), np.asarray(indices), local_to_world)
+
+
+# World space bounds of prims from their authored extents, without reading any points.
+# Returns N x 3 min and max arrays, prims without an extent get an infinite box.
+def read_world_bounds(stage, paths, time=Usd.TimeCode.Default()):
+    cache = UsdGeom.BBoxCache(time, [UsdGeom.Tokens.default_, UsdGeom.Tokens.render], useExtentsHint=True)
+    bounds_min = np.full((len(paths), 3), -np.inf)
+    bounds_max = np.full((len(paths), 3), np.inf)
+    for i, path in enumerate(paths):
+        prim = stage.GetPrimAtPath(str(path))
+        if not prim:
+            continue
+        box = cache.ComputeWorldBound(prim).ComputeAlignedRange()
+        if not box.IsEmpty():
+            bounds_min[i] = box.GetMin()
+            bounds_max[i] = box.GetMax()
+    return bounds_min, bounds_max
+
+
+class MeshDataCache:
+
+    # Constructor
+    def __init__(self, stage=None):
+        self._stage = stage
+
+        # Meshes are read and dropped on the main thread, queries on workers only look them up
+        self._meshes = {}
+        self._xform_cache = UsdGeom.XformCache()
+        self._lock = threading.Lock()
+
+    # Switching stages drops everything read from the previous one
+    def set_stage(self, stage):
+        if stage != self._stage:
+            self._stage = stage
+            self.clear()
+
+    def get_stage(self):
+        return self._stage
+
+    # Cached MeshData for a prim path, read from the stage on the first request from the main thread. Other threads
+    # get None for meshes that were not read yet.
+    def get(self, path):
+        path = str(path)
+        with self._lock:
+            if path in self._meshes or self._stage is None or not on_main_thread():
+                return self._meshes.get(path)
+        prim = self._stage.GetPrimAtPath(path)
+        data = read_mesh_data(prim, self._xform_cache) if prim and prim.IsValid() else None
+        with self._lock:
+            self._meshes[path] = data
+        return data
+
+    # All mesh prim paths under root, optionally filtered by filter_fn(prim)
+    def find_mesh_paths(self, root=None, filter_fn=None):
+        if self._stage is None:
+            return []
+        if root is None:
+            root = self._stage.GetPseudoRoot()
+        elif not isinstance(root, Usd.Prim):
+            root = self._stage.GetPrimAtPath(str(root))
+        return [
+            prim.GetPath().pathString
+            for prim in Usd.PrimRange(root)
+            if prim.IsA(UsdGeom.Mesh) and (filter_fn is None or filter_fn(prim))
+        ]
+
+    # Drop cached data for the given paths, or for every mesh when paths is None, called on the main thread
+    def invalidate(self, paths=None):
+        self._xform_cache.Clear()
+        with self._lock:
+            if paths is None:
+                self._meshes.clear()
+                return
+            for path in paths:
+                self._meshes.pop(str(path), None)
+
+    def clear(self):
+        self.invalidate()
@@ -1,42 +1,259 @@
+import time
+
 import carb
-import omni.kit.mesh.raycast
+import numpy as np
 import omni.usd
 
+from .bvh import boxes_in_frustum
+from .bvh_raycast import BvhMeshRaycast
+from .flood import stream_flood, collect_flood
+from .mesh_data import MeshDataCache, read_world_bounds
+from .raycast_result import RaycastBatchResult, empty_ray_hits
+from .stage_listener import (
+    StageListener, RebuildStats, resolve_changes, relist_mesh_paths, REFRESH_EVENTS, REFRESH_FAST,
+)
+from . import profiling
+
+# omni.kit.mesh.raycast is optional, the local BVH backend is used when it is not available
+try:
+    import omni.kit.mesh.raycast
+    HAS_OMNI_RAYCAST = True
+except ImportError:
+    HAS_OMNI_RAYCAST = False
+
 PHYSICS_WAIT_FRAMES = 20
 
+# Setting that selects the raycast backend, "omni" for omni.kit.mesh.raycast or "bvh" for the local BVH
+BACKEND_SETTING = "/exts/lm.measurement.tool/raycast/backend"
+
+# How acceleration data follows stage edits, "events" rebuilds only the meshes named by USD change notices,
+# "fast" keeps the engine's stage wide background refresh. Unset, each backend uses its own default.
+REFRESH_MODE_SETTING = "/exts/lm.measurement.tool/raycast/refreshMode"
+
+
+# Create the raycast backend selected in the extension settings
+def create_mesh_raycast(backend=None, refresh_mode=None):
+    settings = carb.settings.get_settings()
+    if backend is None:
+        backend = settings.get(BACKEND_SETTING) or "omni"
+    if refresh_mode is None:
+        refresh_mode = settings.get(REFRESH_MODE_SETTING) or None
+    if backend == "bvh" or not HAS_OMNI_RAYCAST:
+        return BvhMeshRaycast(refresh_mode=refresh_mode or REFRESH_EVENTS)
+    return MeshRaycast(refresh_mode=refresh_mode or REFRESH_FAST)
+
 
 class MeshRaycast:
-    def __init__(self):
+    # Flood sampling threads when the workers setting is 0. The engine's getFloodPoints is not known to be safe to
+    # call from several threads at once, so one thread calls it unless more are asked for.
+    FLOOD_WORKERS = 1
+
+    # The engine's own stage wide refresh is the default. "events" turns it off and hands the engine the allowed
+    # mesh paths again after an edit, which relies on the engine rebuilding its BVH whenever it is handed them.
+    def __init__(self, refresh_mode=REFRESH_FAST):
         self._usd_context = omni.usd.get_context()
         self._mr = omni.kit.mesh.raycast.acquire_mesh_raycast_interface()
         self._meshPaths = []
         self._rootPath = None
+        self._filter_fn = None
         self._limit_to_selection = False
+        self.sub = None
+
+        # Mesh index -> path lookups and per-mesh vertex arrays, both dropped whenever the BVH is rebuilt
+        self._path_cache = {}
+        self._mesh_data = MeshDataCache()
+        self._rebuild_callbacks = []
+
+        # In "events" mode the background refresh is off, the mesh paths of the scene are listed from USD and
+        # handed to the engine again only when a change notice touches one of them
+        self._refresh_mode = refresh_mode
+        self._listener = StageListener()
+        self._stats = RebuildStats(refresh_mode)
+        self._scene_paths = []
+
+        # Row-vector view projection matrix the allowed meshes are restricted to, None for every mesh.
+        # World bounds come from authored extents and are cached per path until the mesh changes.
+        self._view_projection = None
+        self._frustum_dirty = False
+        self._world_bounds = {}
+
+    def _follows_events(self):
+        return self._refresh_mode == REFRESH_EVENTS
 
     def createScene(self, rootPrim, filter_fn):
         self._limit_to_selection = False
+        self._rootPath = rootPrim
+        self._filter_fn = filter_fn
         self.sub = self._mr.get_mesh_raycast_event_stream().create_subscription_to_pop_by_type(
             int(omni.kit.mesh.raycast.RaycastEventType.BVH_REBUILT), self._on_bvh_rebuilt
         )
-        self._mr.set_bvh_refresh_rate(omni.kit.mesh.raycast.BvhRefreshRate.FAST, True)
-        self._mr.set_allowed_mesh_paths([])
-        self._meshPaths = self._mr.get_mesh_paths()
-        self._filter_fn = filter_fn
+        if self._follows_events():
+            self._mr.set_bvh_refresh_rate(omni.kit.mesh.raycast.BvhRefreshRate.SLOW, False)
+            self._list_scene()
+        else:
+            self._mr.set_bvh_refresh_rate(omni.kit.mesh.raycast.BvhRefreshRate.FAST, True)
+            self._mr.set_allowed_mesh_paths([])
+            self._meshPaths = self._mr.get_mesh_paths()
+        self._mesh_data.set_stage(self._usd_context.get_stage())
+        self._clear_caches()
 
     def createSelectionScene(self, meshes):
         self._limit_to_selection = True
+        self._scene_paths = [mesh.pathString for mesh in meshes]
+        self._meshPaths = list(self._scene_paths)
 
-        self._meshPaths.clear()
-        for mesh in meshes:
-            self._meshPaths.append(mesh.pathString)
-
-        self._mr.set_bvh_refresh_rate(omni.kit.mesh.raycast.BvhRefreshRate.FAST, True)
-        self._mr.set_allowed_mesh_paths(self._meshPaths)
+        if self._follows_events():
+            self._mr.set_bvh_refresh_rate(omni.kit.mesh.raycast.BvhRefreshRate.SLOW, False)
+            self._list_scene()
+        else:
+            self._mr.set_bvh_refresh_rate(omni.kit.mesh.raycast.BvhRefreshRate.FAST, True)
+            self._mr.set_allowed_mesh_paths(self._meshPaths)
+        self._mesh_data.set_stage(self._usd_context.get_stage())
+        self._clear_caches()
 
     def clearScene(self):
         self.sub = None
         self._mr.set_bvh_refresh_rate(omni.kit.mesh.raycast.BvhRefreshRate.SLOW, False)
+        self._listener.revoke()
         self._meshPaths.clear()
+        self._scene_paths = []
+        self._world_bounds.clear()
+        self._clear_caches()
+
+    # List the scene's mesh paths from USD and hand them to the engine, which builds their BVH once
+    def _list_scene(self):
+        start = time.perf_counter()
+        stage = self._usd_context.get_stage()
+        self._mesh_data.set_stage(stage)
+        self._listener.set_stage(stage)
+        self._listener.take()
+        if not self._limit_to_selection:
+            self._scene_paths = self._mesh_data.find_mesh_paths(self._rootPath, self._filter_fn)
+        self._world_bounds.clear()
+        self._submit_paths()
+        self._record_rebuild(True, len(self._meshPaths), start)
+
+    # Allowed mesh paths for the engine, the scene's meshes inside the view frustum when one is set
+    def _active_paths(self):
+        paths = self._scene_paths
+        if self._view_projection is None or not paths:
+            return list(paths)
+        missing = [path for path in paths if path not in self._world_bounds]
+        if missing:
+            bounds_min, bounds_max = read_world_bounds(self._mesh_data.get_stage(), missing)
+            self._world_bounds.update(zip(missing, zip(bounds_min, bounds_max)))
+        bounds = [self._world_bounds[path] for path in paths]
+        bounds_min = np.array([lo for lo, _ in bounds])
+        bounds_max = np.array([hi for _, hi in bounds])
+        visible = boxes_in_frustum(self._view_projection, bounds_min, bounds_max)
+        return [path for path, keep in zip(paths, visible.tolist()) if keep]
+
+    # Hand the allowed mesh paths to the engine, an empty list would allow every mesh so it is not sent
+    def _submit_paths(self, paths=None):
+        if paths is None:
+            paths = self._active_paths()
+        if not paths:
+            return False
+        self._meshPaths = paths
+        self._mr.set_allowed_mesh_paths(paths)
+        return True
+
+    # Restrict the engine to the meshes whose bounds intersect a view frustum, None allows every mesh
+    def set_view_frustum(self, view_projection):
+        self._view_projection = None if view_projection is None else np.array(view_projection, dtype=np.float64)
+        self._frustum_dirty = True
+
+    # Apply stage edits collected from change notices, called once per app update on the main thread.
+    # Only the edited meshes' cached data is dropped, and the engine is handed the allowed paths again
+    # only when an edit touched one of them or the meshes inside the view frustum changed.
+    def update(self):
+        stage = self._usd_context.get_stage()
+        if not self._follows_events() or self.sub is None:
+            # The engine follows the stage by itself, only the mesh data read from the previous stage is dropped
+            if stage != self._mesh_data.get_stage():
+                self._mesh_data.set_stage(stage)
+                self._clear_caches()
+            return
+        if stage != self._listener.get_stage():
+            self._list_scene()
+            self._clear_caches()
+            return
+        if not self._listener.has_changes() and not self._frustum_dirty:
+            return
+
+        start = time.perf_counter()
+        changes = self._listener.take()
+        dirty, resynced = resolve_changes(changes, self._scene_paths)
+        listed = False
+        if resynced and not self._limit_to_selection:
+            self._scene_paths = relist_mesh_paths(
+                self._mesh_data, self._scene_paths, resynced, self._rootPath, self._filter_fn
+            )
+            listed = True
+        for path in dirty:
+            self._world_bounds.pop(path, None)
+        if dirty:
+            self._clear_caches(dirty)
+
+        previous = self._meshPaths
+        resubmit = listed or bool(dirty.intersection(previous))
+        active = None
+        if self._frustum_dirty or listed:
+            self._frustum_dirty = False
+            active = self._active_paths()
+            resubmit = resubmit or active != previous
+        if resubmit and self._submit_paths(active):
+            self._record_rebuild(False, len(dirty), start)
+
+    def _record_rebuild(self, full, mesh_count, start):
+        elapsed = self._stats.add(full, mesh_count, start)
+        profiling.record("raycast.rebuild.full" if full else "raycast.rebuild.partial", elapsed)
+        profiling.count("raycast.meshes_rebuilt", mesh_count)
+
+    # Rebuild counts and times, for comparing the refresh modes
+    def get_rebuild_stats(self):
+        stats = self._stats.as_dict(self._listener)
+        stats["meshes"] = len(self._scene_paths) if self._follows_events() else len(self._meshPaths)
+        stats["active_meshes"] = len(self._meshPaths)
+        return stats
+
+    # Mesh path for an index reported by the raycast interface, looked up once per BVH build
+    def get_mesh_path_from_index(self, mesh_index):
+        mesh_path = self._path_cache.get(mesh_index)
+        if mesh_path is None:
+            mesh_path = self._mr.get_mesh_path_from_index(mesh_index)
+            self._path_cache[mesh_index] = mesh_path
+        return mesh_path
+
+    # Points and topology of a mesh as read from USD, cached until the next BVH rebuild. Query workers only see the
+    # meshes already read on the main thread, see prefetch_mesh_data.
+    def get_mesh_data(self, mesh_path):
+        return self._mesh_data.get(mesh_path)
+
+    # Read the meshes a query will need, called on the main thread before the query is submitted
+    def prefetch_mesh_data(self, mesh_paths):
+        for mesh_path in mesh_paths:
+            self._mesh_data.get(mesh_path)
+
+    # Local space positions of every vertex of a mesh as one contiguous N x 3 array, None if unavailable
+    def get_vertex_positions(self, mesh_path):
+        data = self.get_mesh_data(mesh_path)
+        return data.points if data is not None else None
+
+    # Callbacks run whenever cached mesh data is dropped, so derived caches can follow
+    def add_rebuild_callback(self, fn):
+        self._rebuild_callbacks.append(fn)
+
+    def remove_rebuild_callback(self, fn):
+        if fn in self._rebuild_callbacks:
+            self._rebuild_callbacks.remove(fn)
+
+    # Callbacks are passed the mesh paths whose data was dropped, or None when everything was
+    def _clear_caches(self, paths=None):
+        self._path_cache.clear()
+        self._mesh_data.invalidate(paths)
+        for fn in list(self._rebuild_callbacks):
+            fn(paths)
 
     def raycast_closest(self, origin, dir, maxDist):
         hitResult = self._mr.closestRaycast(origin, dir, maxDist)
@@ -45,19 +262,37 @@ class MeshRaycast:
             hitReport["hit"] = True
             hitReport["position"] = hitResult.position
             hitReport["normal"] = hitResult.normal
-            hitReport["collision"] = self._mr.get_mesh_path_from_index(hitResult.meshIndex)
+
+            # The engine reports no distance, it is the one the BVH backend gives for a unit direction
+            hitReport["distance"] = float(np.linalg.norm(np.subtract(hitResult.position, origin)))
+            hitReport["collision"] = self.get_mesh_path_from_index(hitResult.meshIndex)
         else:
             hitReport["hit"] = False
         return hitReport
 
+    # Cast many rays in one call, origins and dirs are N x 3 arrays.
+    # Returns a RaycastBatchResult, mesh paths are only looked up for the hits that ask for them.
+    # omni.kit.mesh.raycast answers one ray per call, so the rays are still cast one by one from Python, only the
+    # results are gathered in one array. Large batches should use the bvh backend.
+    def raycast_batch(self, origins, dirs, max_dist):
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+        dirs = np.asarray(dirs, dtype=np.float64).reshape(-1, 3)
+        records = empty_ray_hits(len(origins))
+        closest = self._mr.closestRaycast
+        for i, (origin, direction) in enumerate(zip(origins.tolist(), dirs.tolist())):
+            hitResult = closest(origin, direction, max_dist)
+            if hitResult.meshIndex >= 0:
+                records[i] = (True, hitResult.position, hitResult.normal, 0.0, hitResult.meshIndex)
+        hit = records["hit"]
+        records["distance"][hit] = np.linalg.norm(records["position"][hit] - origins[hit], axis=1)
+        return RaycastBatchResult(records, self.get_mesh_path_from_index)
+
     def spherecast(self, origin, radius, dir, maxDist):
         overlap_result = self._mr.spherecast(origin, dir, radius, maxDist)
         overlap_report = {}
         if len(overlap_result):
             overlap_report["overlap"] = True
-            overlap_report["collisions"] = [
-                self._mr.get_mesh_path_from_index(mesh_index) for mesh_index in overlap_result
-            ]
+            overlap_report["collisions"] = [self.get_mesh_path_from_index(mesh_index) for mesh_index in overlap_result]
         else:
             overlap_report["overlap"] = False
         return overlap_report
@@ -71,26 +306,55 @@ class MeshRaycast:
             overlap_report["collisions_faces"] = {}
             overlap_report["collision_vert_positions"] = {}
             for r in overlap_result:
-                mesh_path = self._mr.get_mesh_path_from_index(r.meshIndex)
+                mesh_path = self.get_mesh_path_from_index(r.meshIndex)
                 overlap_report["collisions"][mesh_path] = r.vertexIndices
                 overlap_report["collisions_faces"][mesh_path] = r.faceIndices
-                overlap_report["collision_vert_positions"][mesh_path] = [self._mr.get_vertex_local_position(mesh_path, i) for i in r.vertexIndices]
+
+                # Gather from the mesh's cached vertex array instead of one interface call per vertex
+                positions = self.get_vertex_positions(mesh_path)
+                if positions is not None:
+                    positions = positions[np.asarray(r.vertexIndices, dtype=np.int64)]
+                else:
+                    positions = [self._mr.get_vertex_local_position(mesh_path, i) for i in r.vertexIndices]
+                overlap_report["collision_vert_positions"][mesh_path] = positions
         else:
             overlap_report["overlap"] = False
         return overlap_report
 
-    def get_flood_data(self, mesh_paths, density):
-        positions = []
-        normals = []
-        for mesh_path in mesh_paths:
-            result = self._mr.getFloodPoints(mesh_path.pathString, density, False)
-            positions.extend(result["positions"])
-            normals.extend(result["normals"])
-        return positions, normals
+    # Flood points of the engine, density is the number of points per unit of world space area. A stream of
+    # FloodBlocks with meshes sampled on up to workers threads, see stream_flood.
+    def iter_flood_data(self, mesh_paths, density, max_points=None, memory_budget=None, workers=1):
+        return stream_flood(
+            lambda mesh_path, index: self._flood_samples(mesh_path, density),
+            mesh_paths, max_points, memory_budget, workers,
+        )
+
+    # Positions and normals of every sample as two N x 3 arrays
+    def get_flood_data(self, mesh_paths, density, max_points=None):
+        return collect_flood(self.iter_flood_data(mesh_paths, density, max_points))
+
+    # The engine samples a mesh in one call, its lists are turned into arrays before they are split into blocks
+    def _flood_samples(self, mesh_path, density):
+        result = self._mr.getFloodPoints(mesh_path, density, False)
+        positions = np.array(result["positions"], dtype=np.float64).reshape(-1, 3)
+        normals = np.array(result["normals"], dtype=np.float64).reshape(-1, 3)
+        yield positions, normals
 
     def get_mesh_paths(self):
         return self._meshPaths
 
     def _on_bvh_rebuilt(self, event: carb.events.IEvent):
+        self._stats.engine_rebuilds += 1
+        profiling.count("raycast.engine_rebuilds")
+        if self._follows_events():
+            # The rebuild was asked for by update(), which already dropped the data of the edited meshes.
+            # Only the mesh indices may have changed.
+            self._path_cache.clear()
+            return
+
+        # Mesh indices and vertex data may have changed with the rebuild
+        start = time.perf_counter()
+        self._clear_caches()
         if not self._limit_to_selection:
             self._meshPaths = self._mr.get_mesh_paths()
+        self._record_rebuild(True, len(self._meshPaths), start)
@@ -0,0 +1,80 @@
+'''
+Compact, growable storage for measurement points.
+Points are kept in a single N x 3 float64 NumPy array so that distances and
+label positions can be computed for every segment in one vectorized pass.
+'''
+
+import numpy as np
+
+class PointBuffer:
+
+    # Constructor
+    def __init__(self, capacity=64):
+        self._data = np.empty((max(int(capacity), 1), 3), dtype=np.float64)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return iter(self.array)
+
+    def __getitem__(self, index):
+        return self.array[index]
+
+    # Read only view of the stored points, no copy is made
+    @property
+    def array(self):
+        view = self._data[:self._size]
+        view.flags.writeable = False
+        return view
+
+    # Grow the backing array geometrically so appends are amortized O(1)
+    def _reserve(self, size):
+        if size <= len(self._data):
+            return
+        capacity = max(size, len(self._data) * 2)
+        data = np.empty((capacity, 3), dtype=np.float64)
+        data[:self._size] = self._data[:self._size]
+        self._data = data
+
+    # Mutator methods
+    def append(self, point):
+        self._reserve(self._size + 1)
+        self._data[self._size] = point
+        self._size += 1
+
+    def extend(self, points):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        self._reserve(self._size + len(points))
+        self._data[self._size:self._size + len(points)] = points
+        self._size += len(points)
+
+    # Overwrite the points at the given indices, which must be below len(self)
+    def set(self, indices, points):
+        self._data[indices] = points
+
+    def clear(self):
+        self._size = 0
+
+    # Batch queries, each returns one value per segment starting at point index first
+    def segment_vectors(self, first=0):
+        points = self.array[first:]
+        return points[1:] - points[:-1]
+
+    def distances(self, first=0):
+        return np.linalg.norm(self.segment_vectors(first), axis=1)
+
+    def midpoints(self, first=0):
+        points = self.array[first:]
+        return (points[1:] + points[:-1]) * 0.5
+
+    # Running length along the polyline, one entry per point starting at 0
+    def cumulative_lengths(self):
+        lengths = np.zeros(self._size, dtype=np.float64)
+        if self._size > 1:
+            np.cumsum(self.distances(), out=lengths[1:])
+        return lengths
+
+    def tolist(self):
+        return self.array.tolist()
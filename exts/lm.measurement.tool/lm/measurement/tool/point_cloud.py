@@ -0,0 +1,422 @@
+'''
+Picking on UsdGeom.Points prims. Each point cloud gets a PointIndex: its points
+in the prim's local space, sorted along a Morton curve so that every run of
+LEAF_POINTS consecutive points is a compact leaf, under an implicit tree of
+boxes in which every FANOUT consecutive nodes share a parent. A pick walks the
+tree one level at a time against a cone around the click ray, whose radius is
+a number of pixels at every depth, then tests the points of the leaves it
+reaches in order of depth until no leaf can hold a nearer point. Of the points
+in the cone, the pick is the one closest to the ray among those at about the
+depth of the nearest one, so points hidden behind the visible surface are not
+picked. Points are read on the main thread and indexed once per prim on a
+background thread, the index is kept until the prim's points change and its
+transform is applied at pick time. Large indexes are written to disk under a
+hash of their points and memory-mapped, so they stay out of memory and are
+reused by later sessions. The files of a cloud whose points change are removed,
+and files not used for a number of days are removed from the folder.
+'''
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import carb
+import numpy as np
+from pxr import Usd, UsdGeom
+
+from .bvh import expand_ranges, morton_codes, ray_box_intervals, safe_inverse
+from .stage_listener import StageListener, paths_under
+
+# Points per leaf of the index
+LEAF_POINTS = 256
+
+# Children per node of the index
+FANOUT = 8
+
+# Indexes of clouds with at least this many points are written to disk and memory-mapped
+MMAP_POINTS = 1 << 23
+
+# Points whose Morton codes are computed at once while building, bounds the temporary memory
+BUILD_CHUNK = 1 << 22
+
+# Leaves whose points a pick tests at once, in order of depth
+PICK_LEAVES = 64
+
+# Bumped whenever the layout of the index files changes
+INDEX_FORMAT_VERSION = 1
+
+# Index files not used for this many days are removed from the cache folder, 0 keeps them
+CACHE_MAX_AGE_DAYS = 7
+
+# Suffixes of the files of a memory-mapped index
+INDEX_FILE_SUFFIXES = (".points.npy", ".levels.npz")
+
+
+class PointIndex:
+
+    # Constructor, points are the N x 3 float32 local positions in Morton order and levels the (min, max) boxes of
+    # the nodes of each level, from the leaves up to the root. files are the paths a mapped index was read from.
+    def __init__(self, points, levels, files=()):
+        self.points = points
+        self.levels = levels
+        self.files = tuple(files)
+
+    def __len__(self):
+        return len(self.points)
+
+    # Whether the points are memory-mapped from a file
+    @property
+    def mapped(self):
+        return isinstance(self.points, np.memmap)
+
+    # The point closest to a world space ray within a cone around it, among the points no deeper than the nearest
+    # point in the cone plus the cone's radius there. The ray runs from origin along the unit direction, the cone's
+    # radius at t along it is radius + growth * t. matrix is the local to world transform of the points (row
+    # vectors), inverse its inverse and scale the largest local length of a world unit. Returns (t, index into
+    # self.points) or None.
+    def pick(self, origin, direction, radius, growth, max_t=np.inf, matrix=None, inverse=None, scale=1.0):
+        if not self.levels:
+            return None
+        origin = np.asarray(origin, dtype=np.float64)
+        direction = np.asarray(direction, dtype=np.float64)
+        if matrix is None:
+            matrix = inverse = np.identity(4)
+
+        # In local space t keeps its world meaning, boxes are padded by the cone's radius at their far end
+        local_origin = origin @ inverse[:3, :3] + inverse[3, :3]
+        local_direction = direction @ inverse[:3, :3]
+        length_sq = float(local_direction @ local_direction)
+        inverse_direction = safe_inverse(local_direction)[None]
+        nodes = np.arange(len(self.levels[-1][0]))
+        for level in range(len(self.levels) - 1, -1, -1):
+            lo, hi = self.levels[level]
+            box_min = lo[nodes].astype(np.float64)
+            box_max = hi[nodes].astype(np.float64)
+            far = (np.where(local_direction > 0.0, box_max, box_min) - local_origin) @ local_direction / length_sq
+            pad = ((radius + growth * np.maximum(far, 0.0)) * scale)[:, None]
+            tnear, tfar = ray_box_intervals(box_min - pad, box_max + pad, local_origin[None], inverse_direction)
+            tnear = np.maximum(tnear, 0.0)
+            keep = (tfar >= tnear) & (tnear <= max_t)
+            nodes = nodes[keep]
+            near = tnear[keep]
+            if not len(nodes):
+                return None
+            if level:
+                starts = nodes * FANOUT
+                nodes, _ = expand_ranges(starts, np.minimum(FANOUT, len(self.levels[level - 1][0]) - starts))
+
+        # Leaves in order of depth, until the nearest point found so far rules out the rest
+        order = np.argsort(near, kind="stable")
+        leaves = nodes[order]
+        near = near[order]
+        found_t = []
+        found_index = []
+        found_offset = []
+        limit = np.inf
+        for first in range(0, len(leaves), PICK_LEAVES):
+            if near[first] > limit:
+                break
+            starts = leaves[first:first + PICK_LEAVES] * LEAF_POINTS
+            indices, _ = expand_ranges(starts, np.minimum(LEAF_POINTS, len(self.points) - starts))
+            relative = self.points[indices].astype(np.float64) @ matrix[:3, :3] + (matrix[3, :3] - origin)
+            t = relative @ direction
+            offset_sq = np.maximum(np.einsum("ij,ij->i", relative, relative) - t * t, 0.0)
+            cone = radius + growth * t
+            inside = np.flatnonzero((t >= 0.0) & (t <= max_t) & (offset_sq <= cone * cone))
+            if not len(inside):
+                continue
+            found_t.append(t[inside])
+            found_index.append(indices[inside])
+            found_offset.append(np.sqrt(offset_sq[inside]) / np.maximum(cone[inside], 1e-300))
+            nearest = min(float(values.min()) for values in found_t)
+            limit = nearest + radius + growth * nearest
+        if not found_t:
+            return None
+
+        # Closest to the ray in units of the cone's radius at its depth, the pixels it is off the click
+        t = np.concatenate(found_t)
+        offset = np.where(t <= limit, np.concatenate(found_offset), np.inf)
+        best = int(np.argmin(offset))
+        return float(t[best]), int(np.concatenate(found_index)[best])
+
+
+# Boxes of the leaves of points in Morton order, then of every FANOUT consecutive nodes up to a single root
+def _node_levels(points):
+    if not len(points):
+        return []
+    starts = np.arange(0, len(points), LEAF_POINTS)
+    lo = np.empty((len(starts), 3), dtype=np.float32)
+    hi = np.empty((len(starts), 3), dtype=np.float32)
+
+    # One contiguous column at a time, reduceat runs far faster along it than down an N x 3 array
+    for axis in range(3):
+        column = np.ascontiguousarray(points[:, axis])
+        lo[:, axis] = np.minimum.reduceat(column, starts)
+        hi[:, axis] = np.maximum.reduceat(column, starts)
+    levels = [(lo, hi)]
+    while len(lo) > 1:
+        starts = np.arange(0, len(lo), FANOUT)
+        lo = np.minimum.reduceat(lo, starts, axis=0)
+        hi = np.maximum.reduceat(hi, starts, axis=0)
+        levels.append((lo, hi))
+    return levels
+
+
+# Sort local positions along a Morton curve over their bounds, returns the float32 positions in that order. Points
+# in one Morton cell may come in any order, so the sort need not be stable, and take gathers rows faster than
+# indexing does.
+def morton_sorted(points):
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 3)
+    if not len(points):
+        return points
+    lo = np.array([points[:, axis].min() for axis in range(3)], dtype=np.float64)
+    hi = np.array([points[:, axis].max() for axis in range(3)], dtype=np.float64)
+    codes = np.empty(len(points), dtype=np.uint32)
+    for start in range(0, len(points), BUILD_CHUNK):
+        codes[start:start + BUILD_CHUNK] = morton_codes(points[start:start + BUILD_CHUNK], lo, hi)
+    order = np.argsort(codes)
+    del codes
+    return np.take(points, order, axis=0)
+
+
+def build_point_index(points):
+    points = morton_sorted(points)
+    return PointIndex(points, _node_levels(points))
+
+
+# Hex digest naming the index files of a set of local positions
+def points_digest(points):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{INDEX_FORMAT_VERSION}:{len(points)}:".encode())
+    digest.update(np.ascontiguousarray(points, dtype=np.float32).data)
+    return digest.hexdigest()
+
+
+# Index of points memory-mapped from files in directory, built and written there first unless a previous session
+# already did. Files are written under temporary names and renamed, so a partly written index is never read. Reused
+# files are touched, so their age counts from their last use.
+def mapped_point_index(points, directory):
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, points_digest(points))
+    points_path, levels_path = (base + suffix for suffix in INDEX_FILE_SUFFIXES)
+    if os.path.exists(points_path) and os.path.exists(levels_path):
+        for path in (points_path, levels_path):
+            os.utime(path)
+    else:
+        index = build_point_index(points)
+        temporary = f"{base}.{os.getpid()}.{threading.get_ident()}"
+        np.save(temporary + ".points.npy", index.points)
+        with open(temporary + ".levels.npz", "wb") as f:
+            boxes = {f"lo{level}": lo for level, (lo, _) in enumerate(index.levels)}
+            boxes.update({f"hi{level}": hi for level, (_, hi) in enumerate(index.levels)})
+            np.savez(f, **boxes)
+        os.replace(temporary + ".points.npy", points_path)
+        os.replace(temporary + ".levels.npz", levels_path)
+    with np.load(levels_path) as archive:
+        levels = [(archive[f"lo{level}"], archive[f"hi{level}"]) for level in range(len(archive.files) // 2)]
+    return PointIndex(np.load(points_path, mmap_mode="r"), levels, (points_path, levels_path))
+
+
+# Remove files. A file that cannot be removed, e.g. one still mapped on Windows, is left for a later cleanup.
+def remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# Remove the index files in directory, and the temporary files of interrupted writes, last used more than max_age
+# seconds ago
+def remove_stale_index_files(directory, max_age):
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return
+    oldest = time.time() - max_age
+    remove_files(
+        entry.path for entry in entries
+        if entry.name.endswith(INDEX_FILE_SUFFIXES) and entry.is_file() and entry.stat().st_mtime < oldest
+    )
+
+
+class PointCloudPick:
+
+    # Constructor, a picked point of the cloud at path, t along the ray
+    def __init__(self, path, position, t):
+        self.path = path
+        self.position = position
+        self.t = t
+
+
+class _Cloud:
+
+    # A built index with its prim's local to world matrix (row vectors), the inverse and the largest local length of
+    # a world unit
+    def __init__(self, index, matrix):
+        self.index = index
+        self.matrix = matrix
+        self.inverse = np.linalg.inv(matrix)
+        self.scale = float(np.linalg.svd(self.inverse[:3, :3], compute_uv=False).max())
+
+
+class PointCloudCache:
+
+    # Constructor, indexes of clouds with at least mmap_points points are memory-mapped from files in cache_dir
+    # (a folder in the system's temporary directory by default). Files there not used for max_age_days are removed
+    # in the background.
+    def __init__(
+        self, stage=None, cache_dir=None, mmap_points=MMAP_POINTS, max_age_days=CACHE_MAX_AGE_DAYS,
+        time=Usd.TimeCode.Default(),
+    ):
+        self._stage = None
+        self._time = time
+        self._listener = StageListener(geometry_attributes=frozenset(("points",)))
+        self._xform_cache = UsdGeom.XformCache(time)
+        self.cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), "lm.measurement.tool.points")
+        self.mmap_points = mmap_points
+
+        # Paths of the Points prims on the stage, None until listed. Picks read the ready clouds from a dict that is
+        # replaced as a whole, so they see a consistent set from any thread.
+        self._paths = None
+        self._indexes = {}
+        self._clouds = {}
+        self._building = set()
+        self._built = 0
+        self._clouds_built = 0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lm.measurement.tool.points")
+        if max_age_days > 0:
+            self._pool.submit(remove_stale_index_files, self.cache_dir, max_age_days * 86400.0)
+
+        # Counts the invalidations of each path, a build started before its path was invalidated is dropped while
+        # the builds of other paths go on
+        self._generations = {}
+        self.set_stage(stage)
+
+    def get_stage(self):
+        return self._stage
+
+    def set_stage(self, stage):
+        if stage == self._stage:
+            return
+        self._stage = stage
+        self._listener.set_stage(stage)
+        self._xform_cache.Clear()
+        self.invalidate()
+
+    # Whether any point cloud is ready to be picked
+    def has_clouds(self):
+        return bool(self._clouds)
+
+    def get_paths(self):
+        return list(self._paths or [])
+
+    # The built index of a cloud, None while it is not built
+    def get(self, path):
+        with self._lock:
+            return self._indexes.get(str(path))
+
+    # Apply the stage edits collected from change notices and start building the indexes of clouds that have none.
+    # Called on the main thread, which reads the points, the background thread only sorts them and writes files.
+    def update(self):
+        if self._stage is None:
+            return
+        moved = False
+        if self._listener.has_changes():
+            changes = self._listener.take()
+            self._xform_cache.Clear()
+            moved = True
+            dropped = set(changes.geometry)
+            if changes.resynced:
+                dropped.update(paths_under(self._paths or [], changes.resynced))
+                self._paths = None
+            if dropped:
+                self.invalidate(dropped)
+        if self._paths is None:
+            prims = Usd.PrimRange(self._stage.GetPseudoRoot())
+            self._paths = [prim.GetPath().pathString for prim in prims if prim.IsA(UsdGeom.Points)]
+        with self._lock:
+            missing = [path for path in self._paths if path not in self._indexes and path not in self._building]
+            self._building.update(missing)
+            generations = [self._generations.get(path, 0) for path in missing]
+        for path, generation in zip(missing, generations):
+            points = UsdGeom.Points(self._stage.GetPrimAtPath(path)).GetPointsAttr().Get(self._time)
+            points = np.asarray(points if points else [], dtype=np.float32).reshape(-1, 3)
+            self._pool.submit(self._build, path, points, generation)
+        if moved or self._built != self._clouds_built:
+            self._refresh_clouds()
+
+    # Local to world matrices of the built clouds
+    def _refresh_clouds(self):
+        with self._lock:
+            indexes = dict(self._indexes)
+            self._clouds_built = self._built
+        clouds = {}
+        for path, index in indexes.items():
+            prim = self._stage.GetPrimAtPath(path) if self._stage is not None else None
+            if prim and index is not None and len(index):
+                matrix = np.array(self._xform_cache.GetLocalToWorldTransform(prim), dtype=np.float64)
+                clouds[path] = _Cloud(index, matrix)
+        self._clouds = clouds
+
+    # Build a cloud's index, runs on the background thread
+    def _build(self, path, points, generation):
+        index = None
+        try:
+            if len(points) >= self.mmap_points:
+                index = mapped_point_index(points, self.cache_dir)
+            elif len(points):
+                index = build_point_index(points)
+        except Exception as e:
+            carb.log_error(f"[lm.measurement.tool] Failed to index the points of {path}: {e}")
+        with self._lock:
+            if generation == self._generations.get(path, 0):
+                self._indexes[path] = index
+                self._building.discard(path)
+                self._built += 1
+
+    # Wait for the builds started so far
+    def wait(self):
+        self._pool.submit(lambda: None).result()
+
+    # The pick of every ready cloud nearest along a world space ray, see PointIndex.pick. Returns a PointCloudPick
+    # or None.
+    def pick(self, origin, direction, radius, growth, max_t=np.inf):
+        origin = np.asarray(origin, dtype=np.float64).reshape(3)
+        direction = np.asarray(direction, dtype=np.float64).reshape(3)
+        direction = direction / np.linalg.norm(direction)
+        best = None
+        for path, cloud in self._clouds.items():
+            limit = best.t if best is not None else max_t
+            found = cloud.index.pick(
+                origin, direction, radius, growth, limit, cloud.matrix, cloud.inverse, cloud.scale
+            )
+            if found is not None and (best is None or found[0] < best.t):
+                local = cloud.index.points[found[1]].astype(np.float64)
+                best = PointCloudPick(path, local @ cloud.matrix[:3, :3] + cloud.matrix[3, :3], found[0])
+        return best
+
+    # Drop the indexes of the given prim paths, or every index when paths is None. The files of the indexes dropped
+    # for given paths are removed, their points changed, those of every index are kept for when the stage is opened
+    # again.
+    def invalidate(self, paths=None):
+        with self._lock:
+            dropped = set(self._indexes) | self._building if paths is None else {str(path) for path in paths}
+            for path in dropped:
+                self._generations[path] = self._generations.get(path, 0) + 1
+            self._building -= dropped
+            indexes = [self._indexes.pop(path) for path in dropped if path in self._indexes]
+            if paths is None:
+                self._paths = None
+            used = {file for index in self._indexes.values() if index is not None for file in index.files}
+        self._refresh_clouds()
+        if paths is not None:
+            remove_files({file for index in indexes if index is not None for file in index.files} - used)
+
+    def shutdown(self):
+        self._listener.revoke()
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,175 @@
+'''
+Lightweight instrumentation for the measurement pipeline.
+Named spans feed rolling latency histograms (p50/p95/p99) and plain counters.
+Everything is toggled by a carb setting; while disabled a span is a shared
+no-op context manager, so instrumented code pays one attribute check per span.
+Snapshots can be scraped with get_profiler().snapshot() or dumped as JSON.
+'''
+
+import json
+import time
+
+import numpy as np
+import carb
+
+# Settings that enable profiling and pick the file snapshots are dumped to on shutdown (empty for none)
+PROFILING_ENABLED_SETTING = "/exts/lm.measurement.tool/profiling/enabled"
+PROFILING_DUMP_SETTING = "/exts/lm.measurement.tool/profiling/dumpPath"
+
+# Number of recent samples each histogram keeps
+HISTOGRAM_WINDOW = 1024
+
+
+class LatencyHistogram:
+
+    # Constructor, keeps the most recent window samples in a ring buffer
+    def __init__(self, window=HISTOGRAM_WINDOW):
+        self._samples = np.zeros(max(int(window), 1), dtype=np.float64)
+        self._next = 0
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds):
+        self._samples[self._next] = seconds
+        self._next = (self._next + 1) % len(self._samples)
+        self.count += 1
+        self.total += seconds
+
+    # Summary in milliseconds, percentiles cover the rolling window and count/total cover every sample
+    def stats(self):
+        window = self._samples[:min(self.count, len(self._samples))] * 1000.0
+        if not len(window):
+            return {"count": 0}
+        p50, p95, p99 = np.percentile(window, (50, 95, 99))
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000.0,
+            "mean_ms": float(window.mean()),
+            "p50_ms": float(p50),
+            "p95_ms": float(p95),
+            "p99_ms": float(p99),
+            "max_ms": float(window.max()),
+        }
+
+
+class _NullSpan:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+
+    def __init__(self, histogram):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self._histogram.add(time.perf_counter() - self._start)
+        return False
+
+
+class Profiler:
+
+    # Constructor
+    def __init__(self, enabled=False, window=HISTOGRAM_WINDOW):
+        self.enabled = enabled
+        self._window = window
+        self._histograms = {}
+        self._counters = {}
+        self._settings_sub = None
+
+    # Time the body of a with block under name
+    def span(self, name):
+        if not self.enabled:
+            return _NULL_SPAN
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            histogram = self._histograms[name] = LatencyHistogram(self._window)
+        return _Span(histogram)
+
+    # Add a duration measured elsewhere, e.g. across threads where a with block does not fit
+    def record(self, name, seconds):
+        if not self.enabled:
+            return
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            histogram = self._histograms[name] = LatencyHistogram(self._window)
+        histogram.add(seconds)
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def reset(self):
+        self._histograms.clear()
+        self._counters.clear()
+
+    def snapshot(self):
+        return {
+            "enabled": self.enabled,
+            "spans": {name: histogram.stats() for name, histogram in sorted(self._histograms.items())},
+            "counters": dict(sorted(self._counters.items())),
+        }
+
+    # Write a JSON snapshot to path, or to the dump path setting when path is None. Returns the path written.
+    def dump(self, path=None):
+        path = path or carb.settings.get_settings().get(PROFILING_DUMP_SETTING)
+        if not path:
+            return None
+        with open(path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        return path
+
+    # Follow the enabled setting, so profiling can be switched on in a running app
+    def watch_settings(self):
+        if self._settings_sub is not None:
+            return
+        settings = carb.settings.get_settings()
+        self.enabled = bool(settings.get(PROFILING_ENABLED_SETTING))
+        self._settings_sub = settings.subscribe_to_node_change_events(
+            PROFILING_ENABLED_SETTING, self._on_setting_changed
+        )
+
+    def _on_setting_changed(self, *args):
+        self.enabled = bool(carb.settings.get_settings().get(PROFILING_ENABLED_SETTING))
+
+    # Stop following the setting and dump a final snapshot if a dump path is set
+    def shutdown(self):
+        if self._settings_sub is not None:
+            carb.settings.get_settings().unsubscribe_to_change_events(self._settings_sub)
+            self._settings_sub = None
+        if self._histograms or self._counters:
+            try:
+                self.dump()
+            except OSError as e:
+                carb.log_error(f"[lm.measurement.tool] Failed to write profiling snapshot: {e}")
+
+
+_profiler = Profiler()
+
+
+# The profiler shared by the whole extension
+def get_profiler():
+    return _profiler
+
+
+def span(name):
+    return _profiler.span(name)
+
+
+def record(name, seconds):
+    _profiler.record(name, seconds)
+
+
+def count(name, amount=1):
+    _profiler.count(name, amount)
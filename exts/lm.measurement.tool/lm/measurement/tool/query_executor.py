@@ -0,0 +1,165 @@
+'''
+Runs raycast and overlap queries on a worker thread pool.
+Results are handed back on the main thread when poll() is called from the app
+update loop. Ordered queries, such as clicks, are applied in submission order
+among themselves, so clicks land in the model in the order they were made.
+Every other query is applied as soon as it finishes, without waiting for slower
+ones. Submitting a query under a key cancels any older query with the same key
+that has not been applied yet, e.g. superseded hover casts.
+'''
+
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import carb
+
+
+# Threads or processes to use for a workers setting, 0 or less (or unset) means one per CPU
+def resolve_workers(setting):
+    if setting is not None and int(setting) > 0:
+        return int(setting)
+    return os.cpu_count() or 1
+
+
+class Query:
+
+    def __init__(self, fn, args, callback, key, ordered=False):
+        self.fn = fn
+        self.args = args
+        self.callback = callback
+        self.key = key
+        self.ordered = ordered
+        self.future = None
+        self.cancelled = False
+        self.submitted = time.perf_counter()
+
+    def done(self):
+        return self.cancelled or self.future is None or self.future.done()
+
+
+class QueryExecutor:
+
+    # Constructor, with max_workers 0 every query runs inline and its callback is called immediately
+    def __init__(self, max_workers=1):
+        self._pool = None
+        if max_workers > 0:
+            self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="lm.measurement.tool.query")
+        self._pending = deque()
+        self._latest = {}
+
+        self.submitted = 0
+        self.applied = 0
+        self.cancelled = 0
+        self.failed = 0
+
+    @property
+    def is_async(self):
+        return self._pool is not None
+
+    def __len__(self):
+        return len(self._pending)
+
+    # Whether a query was submitted but has not been applied or cancelled yet
+    def is_pending(self, query):
+        return not query.cancelled and query in self._pending
+
+    # Run fn(*args) on the pool, callback(result) is called on the main thread from poll(). An ordered query's
+    # callback is only called after those of the ordered queries submitted before it.
+    def submit(self, fn, *args, callback=None, key=None, ordered=False):
+        query = Query(fn, args, callback, key, ordered)
+        self.submitted += 1
+        if key is not None:
+            previous = self._latest.get(key)
+            if previous is not None:
+                self.cancel(previous)
+            self._latest[key] = query
+
+        if self._pool is None:
+            self._apply(query, self._run_inline(query))
+            return query
+        query.future = self._pool.submit(fn, *args)
+        self._pending.append(query)
+        return query
+
+    def _run_inline(self, query):
+        try:
+            return query.fn(*query.args)
+        except Exception as e:
+            query.cancelled = True
+            self.failed += 1
+            carb.log_error(f"[lm.measurement.tool] Query failed: {e}")
+
+    # A cancelled query is never applied, it is also skipped by the pool if it has not started yet
+    def cancel(self, query):
+        if query.cancelled:
+            return
+        query.cancelled = True
+        if query.future is not None:
+            query.future.cancel()
+        self.cancelled += 1
+
+    def cancel_all(self, key=None):
+        for query in self._pending:
+            if key is None or query.key == key:
+                self.cancel(query)
+
+    # Apply finished queries. An ordered query waits for the ordered queries submitted before it, the others never
+    # wait. Returns the number applied.
+    def poll(self):
+        ready = []
+        ordered_running = False
+        for query in self._pending:
+            if not query.done():
+                ordered_running = ordered_running or query.ordered
+            elif query.cancelled or not query.ordered or not ordered_running:
+                ready.append(query)
+
+        # Callbacks may submit new queries, they are appended behind the ones collected here
+        applied = 0
+        for query in ready:
+            self._pending.remove(query)
+            if query.cancelled:
+                self._forget(query)
+                continue
+            try:
+                result = query.future.result()
+            except Exception as e:
+                self.failed += 1
+                self._forget(query)
+                carb.log_error(f"[lm.measurement.tool] Query failed: {e}")
+                continue
+            self._apply(query, result)
+            applied += 1
+        return applied
+
+    def _apply(self, query, result):
+        self._forget(query)
+        if query.cancelled:
+            return
+        self.applied += 1
+        if query.callback is not None:
+            query.callback(result)
+
+    def _forget(self, query):
+        if query.key is not None and self._latest.get(query.key) is query:
+            del self._latest[query.key]
+
+    # Block until every pending query has finished and apply them, used headless and in tests
+    def wait(self, timeout=None):
+        for query in list(self._pending):
+            if not query.cancelled:
+                try:
+                    query.future.exception(timeout)
+                except Exception:
+                    pass
+        return self.poll()
+
+    def shutdown(self):
+        self.cancel_all()
+        self._pending.clear()
+        self._latest.clear()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
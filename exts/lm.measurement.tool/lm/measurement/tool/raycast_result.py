@@ -0,0 +1,55 @@
+'''
+Result container for batched raycasts, shared by the raycast backends.
+Hits are stored in one structured NumPy array and mesh paths are only
+resolved, once per mesh, for the hits that ask for them.
+'''
+
+import numpy as np
+
+# One record per ray
+RAY_HIT_DTYPE = np.dtype([
+    ("hit", np.bool_),
+    ("position", np.float64, (3,)),
+    ("normal", np.float64, (3,)),
+    ("distance", np.float64),
+    ("mesh_index", np.int64),
+])
+
+
+# Records for count rays with every ray marked as a miss
+def empty_ray_hits(count):
+    records = np.zeros(count, dtype=RAY_HIT_DTYPE)
+    records["distance"] = np.inf
+    records["mesh_index"] = -1
+    return records
+
+
+class RaycastBatchResult:
+
+    # Constructor, resolve_path maps a mesh index to its prim path
+    def __init__(self, records, resolve_path):
+        self.records = records
+        self._resolve_path = resolve_path
+        self._paths = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    # Field names return whole columns, e.g. result["position"] is N x 3
+    def __getitem__(self, key):
+        return self.records[key]
+
+    # Mesh path of ray i, None on a miss
+    def mesh_path(self, i):
+        mesh_index = int(self.records["mesh_index"][i])
+        if mesh_index < 0:
+            return None
+        if mesh_index not in self._paths:
+            self._paths[mesh_index] = self._resolve_path(mesh_index)
+        return self._paths[mesh_index]
+
+    # Mesh paths for several rays at once, None for misses
+    def mesh_paths(self, indices=None):
+        if indices is None:
+            indices = range(len(self.records))
+        return [self.mesh_path(i) for i in indices]
@@ -3,10 +3,15 @@ Set up the gestures in the viewport and update the model when one occurs.
 Draws the ruler in the scene based on the model.
 '''
 
+import os
+import time
 import weakref
+from collections import deque
+import numpy as np
 from omni.ui import scene as sc
 from omni.ui import color as cl
 import omni.kit
+import omni.kit.app
 import omni.appwindow
 import omni.usd
 import carb
@@ -17,7 +22,81 @@ from omni.kit.viewport.utility import get_active_viewport_window
 from omni import ui
 
 from .ruler_model import RulerModel
-from .mesh_raycast import MeshRaycast
+from .mesh_raycast import create_mesh_raycast
+from .snapping import SnapIndexCache
+from .geodesic import GeodesicGraphCache
+from .clearance import ClearanceQuery
+from .deviation import DeviationAnalysis, apply_overlay, clear_overlay, auto_color_limit
+from .bounds import BoundsCache, BOX_EDGES
+from .area_volume import AreaVolumeCache
+from .label_layout import LabelSet, LabelLayout
+from .anchors import PointAnchors
+from .tracks import TrackCache
+from .section import SectionCache, SectionPlane
+from .flood import consume_flood
+from .point_cloud import PointCloudCache, CACHE_MAX_AGE_DAYS, MMAP_POINTS
+from .stage_listener import paths_under
+from .view_transform import ViewTransformCache
+from .session_io import SessionGroup, save_session, load_session
+from .query_executor import QueryExecutor, resolve_workers
+from . import profiling
+
+# Settings for snapping picked points to the nearest vertex or edge
+SNAP_ENABLED_SETTING = "/exts/lm.measurement.tool/snap/enabled"
+SNAP_TOLERANCE_SETTING = "/exts/lm.measurement.tool/snap/tolerancePixels"
+
+# How segments between two points on the same mesh are measured, "straight" or "surface" (shortest path along the mesh)
+MEASURE_MODE_SETTING = "/exts/lm.measurement.tool/measure/mode"
+
+# Number of worker threads raycasts run on, 0 runs them on the UI thread
+ASYNC_WORKERS_SETTING = "/exts/lm.measurement.tool/raycast/asyncWorkers"
+
+# Only keep acceleration data for meshes inside the camera frustum
+FRUSTUM_CULLING_SETTING = "/exts/lm.measurement.tool/raycast/frustumCulling"
+
+# Deviation maps: working memory budget in megabytes, worker threads (0 for one per CPU) and the distance at which
+# the overlay colors saturate (0 to fit the measured distances)
+DEVIATION_MEMORY_SETTING = "/exts/lm.measurement.tool/deviation/memoryBudgetMB"
+DEVIATION_WORKERS_SETTING = "/exts/lm.measurement.tool/deviation/workers"
+DEVIATION_COLOR_RANGE_SETTING = "/exts/lm.measurement.tool/deviation/colorRange"
+
+# Box dimension mode draws around each selected prim, "oriented" for a close to minimal box or "aligned" for the
+# world axis aligned one
+DIMENSIONS_BOX_SETTING = "/exts/lm.measurement.tool/dimensions/box"
+
+# Threads the meshes of a multi-selection are summed on for area and volume readouts, 0 for one per CPU
+AREA_WORKERS_SETTING = "/exts/lm.measurement.tool/area/workers"
+
+# Normal of a newly placed section plane, "x", "y" or "z" for a world axis or "view" to face the camera
+SECTION_AXIS_SETTING = "/exts/lm.measurement.tool/section/axis"
+
+# Flood sampling (F): points per square unit of surface, cap on the points (0 for none), megabytes of samples
+# waiting to be consumed, sampling threads (0 for one per CPU) and the file samples are written to, empty for none
+FLOOD_DENSITY_SETTING = "/exts/lm.measurement.tool/flood/density"
+FLOOD_MAX_POINTS_SETTING = "/exts/lm.measurement.tool/flood/maxPoints"
+FLOOD_MEMORY_SETTING = "/exts/lm.measurement.tool/flood/memoryBudgetMB"
+FLOOD_WORKERS_SETTING = "/exts/lm.measurement.tool/flood/workers"
+FLOOD_EXPORT_PATH_SETTING = "/exts/lm.measurement.tool/flood/exportPath"
+
+# Picking on UsdGeom.Points prims: the radius in pixels around the click that points are picked within, the point
+# count from which a cloud's index is memory-mapped from a file and the folder those files are kept in, empty for a
+# folder in the system's temporary directory
+POINT_CLOUD_RADIUS_SETTING = "/exts/lm.measurement.tool/pointCloud/pickRadiusPixels"
+POINT_CLOUD_MMAP_SETTING = "/exts/lm.measurement.tool/pointCloud/mmapPoints"
+POINT_CLOUD_CACHE_DIR_SETTING = "/exts/lm.measurement.tool/pointCloud/cacheDir"
+POINT_CLOUD_CACHE_AGE_SETTING = "/exts/lm.measurement.tool/pointCloud/cacheMaxAgeDays"
+
+# Segment labels shorter than this on screen are not drawn, and of labels closer than one cell (width and height
+# in pixels) only the one on the longest segment is
+LABEL_MIN_PIXELS_SETTING = "/exts/lm.measurement.tool/labels/minSegmentPixels"
+LABEL_CELL_WIDTH_SETTING = "/exts/lm.measurement.tool/labels/cellWidthPixels"
+LABEL_CELL_HEIGHT_SETTING = "/exts/lm.measurement.tool/labels/cellHeightPixels"
+
+# File the current measurements are saved to before they are cleared and restored from on start, empty to disable
+AUTOSAVE_PATH_SETTING = "/exts/lm.measurement.tool/session/autosavePath"
+
+# Number of recent hover raycasts kept for latency statistics
+HOVER_LATENCY_SAMPLES = 240
 
 # What tool is currently active
 class ToolType(Enum):
@@ -49,14 +128,8 @@ class _ClickGesture(sc.ClickGesture):
         # Update the line whenever a click happens
         if self.__manipulator._tool.value == 1: # Check if the ruler tool is enabled
             self._start = not self._start
-            model = self.__manipulator.model
-            point = self.__manipulator.click_ray()
-            if point:
-                print(point)
-                model.add_point(point)
-                self.__manipulator.invalidate() # Redraw the line
-            else:
-                print("[lm.measurement.tool] No mesh at this point")
+            # The raycast runs off the UI thread, the point is added to the model once it completes
+            self.__manipulator.pick_point()
 
 # Double click gesture to clear any active measurements
 class _DoubleClickGesture(sc.DoubleClickGesture):
@@ -70,8 +143,9 @@ class _DoubleClickGesture(sc.DoubleClickGesture):
         # Clear the list of points and remove the lines on double click
         if self.__manipulator._tool.value == 1: # Check if the ruler tool is enabled
             model = self.__manipulator.model
+            self.__manipulator.cancel_queries()
+            self.__manipulator.autosave()
             model.clear_points()
-            self.__manipulator.invalidate()
 
 # Ruler Manipulator class, add the gestures to the screen and draw measurement lines from the model, if any
 class RulerManipulator(sc.Manipulator):
@@ -86,12 +160,83 @@ class RulerManipulator(sc.Manipulator):
         self._active = False
 
         self._viewport = omni.kit.viewport_legacy.get_viewport_interface()
-        self._mr = MeshRaycast()
+        self._mr = create_mesh_raycast()
+        self._snap_cache = SnapIndexCache(self._mr)
+        self._geodesic = GeodesicGraphCache(self._mr)
+        self._clearance = ClearanceQuery(self._mr)
+        self._deviation = DeviationAnalysis(self._mr)
+
+        # Results of the last deviation map, shown as vertex colors until cleared
+        self.deviation_results = []
+
+        # Dimension mode draws the box of every selected prim, kept current as the selection and stage change.
+        # Boxes are cached per prim, so selecting a prim again redraws it without measuring.
+        self._bounds = BoundsCache()
+        self._dimensions_enabled = False
+        self._dimension_paths = None
+        self._dimension_root = None
+        self.dimension_results = []
+
+        # Points picked on a prim are anchored to it and follow it when it moves. Only the points anchored to prims
+        # named by a change notice are recomputed.
+        self._anchors = PointAnchors()
+
+        # Area and volume readouts for the selected prims, kept current like dimension mode
+        area_workers = resolve_workers(carb.settings.get_settings().get(AREA_WORKERS_SETTING))
+        self._area_volume = AreaVolumeCache(self._mr, area_workers)
+        self._area_volume_enabled = False
+        self._area_volume_state = None
+        self._area_volume_root = None
+        self.area_volume_results = []
+
+        # Distances of a measurement over the animation range, cached per point set and range until a transform changes.
+        # The last track's closest approach is drawn until the next track.
+        self._tracks = TrackCache()
+        self._track_root = None
+        self.track_result = None
+
+        # Section mode cuts the selected meshes with a plane, placed by clicking while it is on. Triangles are kept
+        # sorted along the plane normal per mesh, so moving the plane only cuts the triangles near it.
+        self._sections = SectionCache(self._mr)
+        self._section_enabled = False
+        self._section_plane = None
+        self._section_state = None
+        self._section_root = None
+        self.section_result = None
+
+        # Summary of the last flood sampling, its points are only kept in the export file
+        self.flood_result = None
+
+        # Point clouds are picked alongside the meshes, each through an index built in the background the first
+        # time the cloud is seen. Until it is ready, clicks pass through the cloud.
+        settings = carb.settings.get_settings()
+        max_age_days = settings.get(POINT_CLOUD_CACHE_AGE_SETTING)
+        self._point_clouds = PointCloudCache(
+            cache_dir=settings.get(POINT_CLOUD_CACHE_DIR_SETTING) or None,
+            mmap_points=int(settings.get(POINT_CLOUD_MMAP_SETTING) or MMAP_POINTS),
+            max_age_days=CACHE_MAX_AGE_DAYS if max_age_days is None else float(max_age_days),
+        )
+
+        # Raycasts are queued on worker threads and their results applied from the update loop, in click order
+        workers = carb.settings.get_settings().get(ASYNC_WORKERS_SETTING)
+        self._queries = QueryExecutor(1 if workers is None else int(workers))
+        # Clearance, deviation, area and volume and flood sampling take seconds, so they run on a worker of their own
+        # and never hold up the clicks queued behind them, nor the UI thread when clicks are raycast inline
+        self._analyses = QueryExecutor(1)
         self.viewport_window = get_active_viewport_window()
         self._viewport_window = self._viewport.get_viewport_window()
+
+        # Camera and viewport transforms for mouse to ray conversion, recomputed only when they change
+        self._view_cache = ViewTransformCache(lambda: self.scene_view.model, self._viewport_window)
+
+        # Camera the raycast scene was last restricted to, None while frustum culling is off
+        self._frustum_camera = None
         
         self._usd_context = self._get_context()
 
+        # Span timings are only collected while the profiling setting is on
+        profiling.get_profiler().watch_settings()
+
         # Set up a carb input interface to listen for mouse events
         self._input = carb.input.acquire_input_interface()
         self._input_sub_id = None
@@ -99,22 +244,86 @@ class RulerManipulator(sc.Manipulator):
         self.mx = 0
         self.my = 0
 
+        # Retained scene nodes for the drawn segments, one container per measurement group.
+        # Model updates only touch the group that changed, containers of deleted groups are reused.
+        self._segment_root = None
+        self._group_roots = {}
+        self._drawn_points = {}
+        self._drawn_paths = {}
+        self._drawn_moves = {}
+        self._spare_roots = []
+
+        # Segment labels are kept per group with their text formatted once, and drawn from a pool of label nodes
+        # only where they are on screen and not crowded out. Each shown label holds a node slot, keyed by its
+        # screen cell. Everything is laid out again when the camera moves or segments are removed or hidden,
+        # new segments are only placed into the current layout.
+        self._labels = {}
+        self._label_root = None
+        self._label_nodes = []
+        self._label_state = []
+        self._label_slots = {}
+        self._free_label_slots = []
+        self._label_layout = None
+        self._label_view = None
+        self._labels_dirty = False
+        self._label_pending = []
+        self._visible_labels = None
+
+        # Number of scene items created by the most recent build or update, and in total
+        self.items_rebuilt = 0
+        self.items_rebuilt_total = 0
+
+        # Hover preview, mouse moves are coalesced and raycast at most once per rendered frame
+        self._preview_root = None
+        self._update_sub = None
+        self._hover_pos = None
+        self._hover_query = None
+        self._snap_query = None
+        self._hover_latency = deque(maxlen=HOVER_LATENCY_SAMPLES)
+        self.hover_casts_dropped = 0
+
     # Set up the tool when its enabled
     def _start(self):
         # Disable object selection in the viewport
         self._viewport_window.set_enabled_picking(False)
 
+        # Pick up where the last session left off
+        self.restore_autosave()
+
+        # Collect the meshes to raycast against on the UI thread, kept current from stage change notices
+        self._mr.createScene(None, None)
+        self._mr.update()
+
         # Register input events
         self._input_sub_id = self._input.subscribe_to_input_events(self._on_input_event, order=-10000)
 
+        # Pending hover raycasts are serviced once per app update
+        self._update_sub = omni.kit.app.get_app().get_update_event_stream().create_subscription_to_pop(
+            self._on_update, name="lm.measurement.tool hover preview"
+        )
+
     # Clean up the tool when its disabled
     def _stop(self):
         # Re-enable object selection in the viewport
         self._viewport_window.set_enabled_picking(True)
 
-        # Clear out the model and start anew
+        # Keep the measurements, then clear out the model and start anew
+        self.autosave()
         self.model.clear_points()
-        self.invalidate()
+
+        # Drop queued raycasts, stop servicing hover raycasts and remove the preview and deviation colors
+        self.cancel_queries()
+        self._analyses.cancel_all()
+        self.clear_deviation()
+        self._update_sub = None
+        self._hover_pos = None
+        self._clear_preview()
+        self.show_dimensions(False)
+        self.show_area_volume(False)
+
+        # Stop maintaining acceleration data while the tool is off
+        self._mr.clearScene()
+        self._frustum_camera = None
 
         # Unregister input events
         if self._input_sub_id is not None:
@@ -137,12 +346,50 @@ class RulerManipulator(sc.Manipulator):
 
     # Process abstract input events
     def _on_input_event(self, event, *_):
-        # Listen for mouse events, return on anything else
+        # Listen for mouse and keyboard events, return on anything else
         if event.deviceType == carb.input.DeviceType.MOUSE:
             return self._on_global_mouse_event(event.event)
+        elif event.deviceType == carb.input.DeviceType.KEYBOARD:
+            return self._on_keyboard_event(event.event)
         else:
             return True
 
+    # Enter starts a new measurement group, Delete removes the group being measured,
+    # C measures the clearance between the two selected prims and D the deviation of the first from the second,
+    # B toggles the box dimensions of the selected prims and V their area and volume,
+    # T measures the active group over the animation range, X toggles section mode and F flood samples the selection.
+    # The keyboard hook is global, so keys are only handled while the viewport has focus and not while typing elsewhere.
+    def _on_keyboard_event(self, event, *_):
+        if event.type != carb.input.KeyboardEventType.KEY_PRESS or self._tool != ToolType.RULER:
+            return True
+        if not self._viewport_focused():
+            return True
+        if event.input == carb.input.KeyboardInput.ENTER:
+            self.model.new_group()
+            self._clear_preview()
+        elif event.input == carb.input.KeyboardInput.DEL:
+            self.model.delete_group(self.model.get_active_group())
+        elif event.input == carb.input.KeyboardInput.C:
+            self.measure_clearance()
+        elif event.input == carb.input.KeyboardInput.D:
+            self.measure_deviation()
+        elif event.input == carb.input.KeyboardInput.B:
+            self.show_dimensions(not self._dimensions_enabled)
+        elif event.input == carb.input.KeyboardInput.V:
+            self.show_area_volume(not self._area_volume_enabled)
+        elif event.input == carb.input.KeyboardInput.T:
+            self.measure_track()
+        elif event.input == carb.input.KeyboardInput.X:
+            self.show_section(not self._section_enabled)
+        elif event.input == carb.input.KeyboardInput.F:
+            self.sample_flood()
+        return True
+
+    # Whether the viewport window has keyboard focus, assumed when there is no window to ask
+    def _viewport_focused(self):
+        window = self.viewport_window
+        return window is None or bool(getattr(window, "focused", True))
+
     # Process any mouse events
     def _on_global_mouse_event(self, event, *_):
         # Get the screen position of a left click event
@@ -154,6 +401,14 @@ class RulerManipulator(sc.Manipulator):
 
             self._update_mouse_position(x, y)
 
+        # Remember only the latest hover position, the raycast happens on the next update
+        elif event.type == carb.input.MouseEventType.MOVE:
+            x,y = self._get_position_in_viewport(event.normalized_coords)
+            self._hover_pos = None if x is None or y is None else (x, y)
+            if self._hover_pos is None:
+                self._clear_preview()
+        return True
+
     # Update mouse position variables
     def _update_mouse_position(self, x, y):
         self.mx = x
@@ -161,63 +416,12 @@ class RulerManipulator(sc.Manipulator):
 
     # Get the relative mouse position within the acitve viewport
     def _get_position_in_viewport(self, coords):
-        if coords.x < 0.0 or coords.x > 1.0 or coords.y < 0.0 or coords.y > 1.0:
-            return (None, None)
-
-        viewport_window = self._viewport_window
-        if not viewport_window:
-            return (None, None)
-
-        # In kit, there may be a tab bar
-        tab_bar_height = 22 if viewport_window.dock_tab_bar_visible else 0
-
-        # Dock splitter is different between kit and view
-        window_title = carb.settings.get_settings().get("/app/window/title")
-        if window_title is not None and window_title == "Omniverse View":
-            dock_splitter_size = 0
-        else:
-            dock_splitter_size = 4
-
-        # Remove dock splitter and tab bar from viewport window size
-        width = viewport_window.width - dock_splitter_size * 2
-        height = viewport_window.height - dock_splitter_size * 2 - tab_bar_height
-
-        # Get screen position relative to the main window
-        x = coords.x * width + viewport_window.position_x + dock_splitter_size
-        y = coords.y * height + viewport_window.position_y + dock_splitter_size + tab_bar_height
-
-        # Get valid viewport texture area
-        rect = self._viewport_window.get_viewport_rect()
-
-        # Calculate the dimensions of the viewport rectangle
-        rect_w = float(rect[2] - rect[0])
-        rect_h = float(rect[3] - rect[1])
-        if rect_w / rect_h > width / height:
-            rect_h = rect_h / rect_w * width
-            rect_w = width
-            h_diff = (height - rect_h) * 0.5
-            rect = [0, h_diff, width, height - h_diff]
-        else:
-            rect_w = rect_w / rect_h * height + dock_splitter_size * 2
-            rect_h = height
-            w_diff = (width - rect_w) * 0.5
-            rect= [w_diff, 0, width - w_diff, height]
-
-        # Calculate relative x,y position based on screen size
-        x = coords.x * width
-        y = coords.y * height
-
-        # Return if relative x,y is outside of viewport rectangle
-        if x < rect[0] or y < rect[1] or x > rect[2] or y > rect[3]:
+        # The viewport rectangle is cached and only recomputed when the window geometry changes
+        with profiling.span("viewport_position"):
+            mx, my = self._view_cache.to_ndc((coords.x, coords.y))[0]
+        if np.isnan(mx):
             return (None, None)
-
-        # Calculate mouse position in viewport rectangle
-        mx = (x - rect[0]) / (rect[2] - rect[0])
-        my = (y - rect[1]) / (rect[3] - rect[1])
-        mx = mx * 2.0 - 1.0
-        my = -(my * 2.0 - 1.0)
-
-        return (mx, my)
+        return (float(mx), float(my))
 
     # Return click position as a tuple
     def get_mouse_pos(self):
@@ -234,80 +438,1001 @@ class RulerManipulator(sc.Manipulator):
         # Set the gesture(s) on the screen
         sc.Screen(gestures=self.gestures or [_ClickGesture(weakref.proxy(self)), _DoubleClickGesture(weakref.proxy(self))])
 
-        # Draw the measurement lines
-        self._draw_shape()
+        # Container for the measurement lines and labels, later model updates append to it directly
+        self._segment_root = sc.Transform()
+        self._group_roots = {}
+        self._drawn_points = {}
+        self._drawn_paths = {}
+        self._drawn_moves = {}
+        self._spare_roots = []
+        self._labels = {}
+        self._label_root = sc.Transform()
+        self._label_nodes = []
+        self._label_state = []
+        self._label_slots = {}
+        self._free_label_slots = []
+        self._label_pending = []
+        self._visible_labels = None
+        self._reset_rebuild_count(3)
 
-        # Set up labels above the lines to show the distance between the two endpoints
-        points = self.model.get_value(self.model.get_item('points'))
-        for i in range(len(points) - 1):
-        # Position the distance labels above the center of the lines
-            position = self.model.get_midpoint(points[i], points[i+1])
-            with sc.Transform(transform=sc.Matrix44.get_translation_matrix(*position)):
-                with sc.Transform(look_at=sc.Transform.LookAt.CAMERA):
-                    with sc.Transform(scale_to=sc.Space.SCREEN):
-                        with sc.Transform(transform=sc.Matrix44.get_translation_matrix(0,5,0)):
-                            sc.Label(f"{self.model.calculate_dist(points[i], points[i+1])} cm", alignment=ui.Alignment.CENTER_BOTTOM, size=20)
+        # Draw the measurement lines, then the labels that are on screen
+        with profiling.span("draw.build"):
+            for group_id in self.model.get_group_ids():
+                self._update_group(group_id)
+            self._layout_labels()
 
-    # Method called when a click event occurs.
-    # Creates a new measurement line point based on raycast from mouse click to nearest object in the scene.
-    # TODO Ensure the mouse coordinates and measurement lines are accurate to world space
-    def click_ray(self):
-        pos = self.get_mouse_pos()
-        #api = self.viewport_window.viewport_api
+        # Container for the hover preview segment, redrawn whenever the cursor's hit point changes
+        self._preview_root = sc.Transform()
+
+        # Container for the dimension mode boxes, drawn again from the cached boxes
+        self._dimension_root = sc.Transform()
+        self._draw_dimensions()
 
-        model = self.scene_view.model   # Get the current camera model
-        proj = model.projection         # Get camera projection matrix
-        invProj = proj.get_inverse()    # Invert projection matrix for camera coords
-        view = model.view               # Get camera view matrix
-        invView = view.get_inverse()    # Invert view matrix for world coords
+        # Container for the area and volume readouts
+        self._area_volume_root = sc.Transform()
+        self._draw_area_volume()
 
-        # Get the position of the camera in world coordinates
-        worldCam = Gf.Vec4d(invView[12], invView[13], invView[14], 1)
+        # Container for the closest approach of the last track
+        self._track_root = sc.Transform()
+        self._draw_track()
 
-        # Convert the mouse click to homogeneous coords
-        position = Gf.Vec4d(pos[0] * worldCam[2], pos[1] * worldCam[2], 1, 1)
+        # Container for the section outline, width and readout
+        self._section_root = sc.Transform()
+        self._draw_section()
 
-        # Convert to Gf matrices to make the math easier
-        p = Gf.Matrix4d(*invProj)
-        v = Gf.Matrix4d(*invView)
+    # Method called when a click event occurs.
+    # Creates a new measurement line point based on raycast from mouse click to nearest object in the scene.
+    # TODO Ensure the mouse coordinates and measurement lines are accurate to world space
+    def click_ray(self, pos=None):
+        if pos is None:
+            pos = self.get_mouse_pos()
+        return self._cast_ray(*self._pick_ray(pos))
 
-        camPos = position * p           # Convert the position to homogeneous camera coords
-        wrldPos = camPos * v            # Convert from homogeneous camera to homogeneous world
-        print(wrldPos)
-        # Divide by w to get the position in world coordinates
-        origin = (wrldPos[0] + worldCam[0], wrldPos[1] + worldCam[1], wrldPos[2] + worldCam[2])
-        print(origin)
+    # Ray, snap and point cloud pick parameters for a viewport position, reads the camera and settings so it runs on
+    # the UI thread
+    def _pick_ray(self, pos):
+        # Unproject through the cached camera transform, the ray fires along the camera's forward vector
+        with profiling.span("click_ray.unproject"):
+            origins, dirs = self._view_cache.screen_to_rays(pos)
+        snap = None
+        settings = carb.settings.get_settings()
+        if settings.get(SNAP_ENABLED_SETTING):
+            snap = (settings.get(SNAP_TOLERANCE_SETTING) or 10, self._view_cache.pixel_size_function())
+        cloud = None
+        if self._point_clouds.has_clouds():
+            cloud = (settings.get(POINT_CLOUD_RADIUS_SETTING) or 6, self._view_cache.pixel_size_function())
+        return tuple(origins[0].tolist()), dirs[0], snap, cloud
 
-        # Find the camera's forward vector
-        camFor = Gf.Vec3d(invView[8], invView[9], invView[10])
+    # Raycast and snap for a ray from _pick_ray. Touches no UI state, so it can run on a worker thread.
+    def _cast_ray(self, origin, direction, snap, cloud=None):
+        return self._cast_hit(origin, direction, snap, cloud)[0]
 
+    # Same as _cast_ray, also returns the path of the hit mesh or point cloud (None on a miss) and the snap
+    # parameters when the hit still has to be snapped, because the worker had no data for the mesh yet
+    def _cast_hit(self, origin, direction, snap, cloud=None):
         rayDist = 1000000000            # Pew pew
-        # get_inverse returns the forward vector in eye coords, need to flip it to face forward
         # Fire a ray from the mouse to look for intersection with any scene objects
-        hit = self._mr.raycast_closest(origin, -camFor, rayDist)
+        with profiling.span("click_ray.raycast"):
+            hit = self._mr.raycast_closest(origin, direction, rayDist)
         hit_pos = False
+        mesh_path = None
+        unsnapped = None
         if hit["hit"]:
             # If the ray intersects with an object, store the position of the intersection in world coords
-            print("[lm.measurement.tool] Hit!")
             dist = hit.get("distance", 1.0)
             if dist > 0:
                 hit_pos = [hit["position"][0], hit["position"][1], hit["position"][2]]
+                mesh_path = hit["collision"]
+                if snap is not None and self._mr.get_mesh_data(mesh_path) is None:
+                    unsnapped = snap
+                elif snap is not None:
+                    with profiling.span("click_ray.snap"):
+                        hit_pos = self._snap_point(mesh_path, hit_pos, *snap)
+
+        # A point cloud point in front of the mesh hit is picked instead, it needs no snapping
+        if cloud is not None:
+            max_t = hit.get("distance", rayDist) if mesh_path is not None else rayDist
+            with profiling.span("click_ray.point_cloud"):
+                picked = self._pick_point_cloud(origin, direction, max_t, *cloud)
+            if picked is not None:
+                hit_pos = picked.position.tolist()
+                mesh_path = picked.path
+                unsnapped = None
+
+        return hit_pos, mesh_path, unsnapped
+
+    # Snap a hit returned unsnapped by _cast_hit, once its mesh was read on the main thread
+    def _snap_hit(self, point, mesh_path, snap):
+        if snap is not None:
+            with profiling.span("click_ray.snap"):
+                point = self._snap_point(mesh_path, point, *snap)
+        return point, mesh_path, None
+
+    # Nearest point cloud point to a ray within a radius in pixels, the radius grows along the ray with the pixel size
+    def _pick_point_cloud(self, origin, direction, max_t, radius_pixels, pixel_size):
+        origin = np.asarray(origin, dtype=np.float64)
+        direction = np.asarray(direction, dtype=np.float64)
+        direction = direction / np.linalg.norm(direction)
+        sizes = pixel_size(np.stack((origin, origin + direction))) * radius_pixels
+        radius = float(sizes[0])
+        return self._point_clouds.pick(origin, direction, radius, float(sizes[1]) - radius, max_t)
+
+    # Move a hit to the nearest vertex or edge of the hit mesh within the screen space snap tolerance
+    def _snap_point(self, mesh_path, point, tolerance_pixels, pixel_size):
+        tolerance = tolerance_pixels * float(pixel_size(point)[0])
+        position, _ = self._snap_cache.snap(mesh_path, point, tolerance)
+        return position.tolist()
+
+    # Queue a raycast at the last click position, the hit is added to the group that was active when clicking
+    def pick_point(self):
+        start = time.perf_counter()
+        group_id = self.model.get_active_group()
+        self._queries.submit(
+            self._cast_hit, *self._pick_ray(self.get_mouse_pos()), ordered=True,
+            callback=lambda hit: self._apply_click(hit, group_id, start),
+        )
+
+    # The stage is only read here, so a hit on a mesh the worker had no data for is snapped by a second query once
+    # the mesh is read. Clicks behind it go through the same queue to still land in click order.
+    def _apply_click(self, hit, group_id, start):
+        point, mesh_path, unsnapped = hit
+        if unsnapped is not None or (self._snap_query is not None and self._queries.is_pending(self._snap_query)):
+            if unsnapped is not None:
+                self._mr.prefetch_mesh_data([mesh_path])
+            self._snap_query = self._queries.submit(
+                self._snap_hit, point, mesh_path, unsnapped, ordered=True,
+                callback=lambda snapped: self._add_hit(snapped[0], snapped[1], group_id, start),
+            )
+            return
+        self._add_hit(point, mesh_path, group_id, start)
+
+    # In section mode a hit moves the section plane there instead of adding a point
+    def _add_hit(self, point, mesh_path, group_id, start):
+        if point and self._section_enabled:
+            self.set_section_plane(point)
+        elif point:
+            profiling.count("click.hit")
+            with profiling.span("click.model_update"):
+                # The manipulator appends the new segment on model update
+                self.model.add_point(point, group_id, mesh_path)
+            self._measure_surface(group_id, mesh_path)
+        else:
+            profiling.count("click.miss")
+            carb.log_info("[lm.measurement.tool] No mesh at this point")
+        profiling.record("click.latency", time.perf_counter() - start)
+
+    # In surface mode, queue the shortest path along the mesh for a new segment whose two points were picked on
+    # the same mesh. The segment is drawn straight until the path is found, then redrawn along it.
+    def _measure_surface(self, group_id, mesh_path):
+        if mesh_path is None or carb.settings.get_settings().get(MEASURE_MODE_SETTING) != "surface":
+            return
+        item = self.model.get_group_item(group_id)
+        index = len(item.value) - 2 if item is not None else -1
+        if index < 0 or self.model.get_point_mesh(index, group_id) != str(mesh_path):
+            return
+        start, end = item.value[index].copy(), item.value[index + 1].copy()
+        self._mr.prefetch_mesh_data([mesh_path])
+        self._queries.submit(
+            self._surface_path, mesh_path, start, end,
+            callback=lambda path: self._apply_surface_path(path, group_id, index, start),
+        )
+
+    # Shortest surface path between two points, runs on a worker thread
+    def _surface_path(self, mesh_path, start, end):
+        with profiling.span("surface.path"):
+            path, _ = self._geodesic.shortest_path(mesh_path, start, end)
+        return path
+
+    def _apply_surface_path(self, path, group_id, index, start):
+        # The segment may have been cleared or replaced while the path was computed
+        item = self.model.get_group_item(group_id)
+        if path is None or item is None or len(item.value) <= index + 1 or not np.array_equal(item.value[index], start):
+            return
+        self.model.set_segment_path(index, path, group_id)
+
+    # Queue the closest pair of points between the meshes under two prims, by default the two prims selected on the
+    # stage. The pair is drawn as a new measurement group once found.
+    def measure_clearance(self, path_a=None, path_b=None):
+        path_a, path_b = self._prim_pair(path_a, path_b, "the clearance between them")
+        if path_a is None:
+            return None
+        self._prefetch_meshes([path_a, path_b])
+        start = time.perf_counter()
+        return self._analyses.submit(
+            self._closest_pair, str(path_a), str(path_b),
+            callback=lambda result: self._apply_clearance(result, path_a, path_b, start),
+        )
+
+    # The given prim paths, or the two prims selected on the stage when either is missing
+    def _prim_pair(self, path_a, path_b, purpose):
+        if path_a is not None and path_b is not None:
+            return path_a, path_b
+        selected = list(self._usd_context.get_selection().get_selected_prim_paths())
+        if len(selected) != 2:
+            carb.log_warn(f"[lm.measurement.tool] Select two prims to measure {purpose}")
+            return None, None
+        return selected[0], selected[1]
+
+    # Read the meshes at or under prim paths on the main thread, so the query submitted next finds their data
+    def _prefetch_meshes(self, paths):
+        self._mr.prefetch_mesh_data(paths_under(self._mr.get_mesh_paths(), [str(path) for path in paths]))
+
+    # Closest pair between two prims, runs on a worker thread
+    def _closest_pair(self, path_a, path_b):
+        with profiling.span("clearance.closest_pair"):
+            return self._clearance.closest(path_a, path_b)
+
+    def _apply_clearance(self, result, path_a, path_b, start):
+        profiling.record("clearance.latency", time.perf_counter() - start)
+        if result is None:
+            carb.log_warn(f"[lm.measurement.tool] No meshes to measure the clearance between {path_a} and {path_b}")
+            return
+        group_id = self.model.new_group()
+        self.model.add_point(result.point_a.tolist(), group_id, result.mesh_a)
+        self.model.add_point(result.point_b.tolist(), group_id, result.mesh_b)
+        self.model.new_group()
+        carb.log_info(f"[lm.measurement.tool] Clearance between {path_a} and {path_b}: {result.distance:.3f}")
+
+    # Queue a deviation map of the meshes under path from the nearest surfaces under reference_path, by default the
+    # first and second prim selected on the stage. The measured vertices are colored once the distances are in.
+    def measure_deviation(self, path=None, reference_path=None):
+        path, reference_path = self._prim_pair(path, reference_path, "the deviation of the first from the second")
+        if path is None:
+            return None
+        settings = carb.settings.get_settings()
+        budget = float(settings.get(DEVIATION_MEMORY_SETTING) or 256) * (1 << 20)
+        workers = resolve_workers(settings.get(DEVIATION_WORKERS_SETTING))
+        self._prefetch_meshes([path, reference_path])
+        start = time.perf_counter()
+        return self._analyses.submit(
+            self._measure_deviation, str(path), str(reference_path), budget, workers,
+            callback=lambda results: self._apply_deviation(results, path, reference_path, start),
+        )
+
+    # Deviation map between two prims, runs on a worker thread
+    def _measure_deviation(self, path, reference_path, budget, workers):
+        with profiling.span("deviation.measure"):
+            return self._deviation.measure(path, reference_path, budget, workers)
+
+    def _apply_deviation(self, results, path, reference_path, start):
+        profiling.record("deviation.latency", time.perf_counter() - start)
+        self.clear_deviation()
+        if not results:
+            carb.log_warn(f"[lm.measurement.tool] No meshes to measure the deviation of {path} from {reference_path}")
+            return
+        self.deviation_results = results
+        limit = carb.settings.get_settings().get(DEVIATION_COLOR_RANGE_SETTING) or auto_color_limit(results)
+        apply_overlay(self._usd_context.get_stage(), results, limit)
+        for result in results:
+            stats = result.statistics()
+            carb.log_info(
+                f"[lm.measurement.tool] Deviation of {result.mesh_path} from {reference_path}: "
+                + ", ".join(f"{key} {value:.4g}" for key, value in stats.items())
+            )
+
+    # Remove the colors of the last deviation map
+    def clear_deviation(self):
+        if self.deviation_results:
+            clear_overlay(self._usd_context.get_stage(), [result.mesh_path for result in self.deviation_results])
+            self.deviation_results = []
+
+    # Turn dimension mode on or off. While it is on, the selected prims are measured whenever the selection changes
+    # or a stage edit touches one of them, and their boxes are drawn with their width, height and depth.
+    def show_dimensions(self, enabled=True):
+        self._dimensions_enabled = enabled
+        self._dimension_paths = None
+        if enabled:
+            self._update_dimensions()
+        else:
+            self._analyses.cancel_all("dimensions")
+            self.dimension_results = []
+            self._draw_dimensions()
+
+    # Called every update while dimension mode is on, boxes of unchanged prims come from the cache on the UI thread.
+    # The points of the other prims are read here and their boxes fitted on the analysis worker.
+    def _update_dimensions(self):
+        if not self._dimensions_enabled:
+            return
+        self._bounds.set_stage(self._usd_context.get_stage())
+        dropped = self._bounds.update()
+        paths = tuple(str(path) for path in self._usd_context.get_selection().get_selected_prim_paths())
+        if paths == self._dimension_paths and not dropped.intersection(paths):
+            return
+        self._dimension_paths = paths
+        cached = [self._bounds.peek(path) for path in paths]
+        if all(bounds is not None for bounds in cached):
+            self._analyses.cancel_all("dimensions")
+            self._apply_dimensions(cached, None)
+            return
+        start = time.perf_counter()
+        with profiling.span("dimensions.read"):
+            snapshots = [self._bounds.snapshot(path) if bounds is None else None for path, bounds in zip(paths, cached)]
+        self._analyses.submit(
+            self._measure_dimensions, cached, snapshots, key="dimensions",
+            callback=lambda results: self._apply_dimensions(results, start),
+        )
 
-        return hit_pos
+    # Bounds of each prim, the cached ones or fitted to their snapshot, runs on a worker thread
+    def _measure_dimensions(self, cached, snapshots):
+        with profiling.span("dimensions.measure"):
+            return [
+                bounds if snapshot is None else self._bounds.compute(snapshot)
+                for bounds, snapshot in zip(cached, snapshots)
+            ]
+
+    def _apply_dimensions(self, results, start):
+        if start is not None:
+            profiling.record("dimensions.latency", time.perf_counter() - start)
+        self.dimension_results = [bounds for bounds in results if bounds is not None]
+        self._draw_dimensions()
+
+    # Box edges of every measured prim with width, height and depth labels on the three edges from one corner
+    def _draw_dimensions(self):
+        if self._dimension_root is None:
+            return
+        self._dimension_root.clear()
+        if not self.dimension_results:
+            return
+        oriented = (carb.settings.get_settings().get(DIMENSIONS_BOX_SETTING) or "oriented") != "aligned"
+        up_axis = UsdGeom.GetStageUpAxis(self._usd_context.get_stage())
+        with self._dimension_root:
+            for bounds in self.dimension_results:
+                corners = bounds.corners(oriented)
+                for a, b in BOX_EDGES:
+                    sc.Line(corners[a].tolist(), corners[b].tolist())
+                dimensions, order = bounds.dimensions(oriented, up_axis)
+                for name, (size, _), axis in zip("WHD", dimensions, order):
+                    midpoint = (corners[0] + corners[1 << axis]) * 0.5
+                    self._draw_label(midpoint.tolist(), f"{name} {round(size, 3)} cm")
+                self._count_rebuilt(12 + 3 * 5)
+
+    # Turn the area and volume readouts on or off. While they are on, the selected prims are measured whenever the
+    # selection changes or one of their meshes is edited, and each gets a label with its area and enclosed volume.
+    def show_area_volume(self, enabled=True):
+        self._area_volume_enabled = enabled
+        self._area_volume_state = None
+        if enabled:
+            self._update_area_volume()
+        else:
+            self._analyses.cancel_all("area_volume")
+            self.area_volume_results = []
+            self._draw_area_volume()
+
+    # Called every update while the readouts are on, meshes measured before come from the cache
+    def _update_area_volume(self):
+        if not self._area_volume_enabled:
+            return
+        paths = tuple(str(path) for path in self._usd_context.get_selection().get_selected_prim_paths())
+        state = (paths, self._area_volume.generation)
+        if state == self._area_volume_state:
+            return
+        self._area_volume_state = state
+        self._prefetch_meshes(paths)
+        start = time.perf_counter()
+        self._analyses.submit(
+            self._measure_area_volume, paths, key="area_volume",
+            callback=lambda results: self._apply_area_volume(results, start),
+        )
+
+    # Area and volume of each prim, runs on a worker thread
+    def _measure_area_volume(self, paths):
+        with profiling.span("area_volume.measure"):
+            return self._area_volume.measure(paths)
+
+    def _apply_area_volume(self, results, start):
+        profiling.record("area_volume.latency", time.perf_counter() - start)
+        self.area_volume_results = [result for result in results if result.meshes]
+        self._draw_area_volume()
+
+    # One label per measured prim at the center of its meshes. Open meshes enclose no volume, when only some of a
+    # prim's meshes are closed the volume is theirs.
+    def _draw_area_volume(self):
+        if self._area_volume_root is None:
+            return
+        self._area_volume_root.clear()
+        with self._area_volume_root:
+            for result in self.area_volume_results:
+                text = f"A {round(result.area, 3)} cm2"
+                if result.volume > 0.0:
+                    text += f"  V {round(result.volume, 3)} cm3" + ("" if result.closed else " (closed meshes)")
+                self._draw_label(result.center.tolist(), text)
+        self._count_rebuilt(5 * len(self.area_volume_results))
+
+    # Queue the distances of a group's segments (the active group by default) at every step from time code start to
+    # end, by default the stage's animation range. Anchored points move with their prims at every time code, the
+    # others stay where they are.
+    def measure_track(self, group_id=None, start=None, end=None, step=1.0):
+        group_id = self.model.get_active_group() if group_id is None else group_id
+        item = self.model.get_group_item(group_id)
+        if item is None or len(item.value) < 2:
+            carb.log_warn("[lm.measurement.tool] Measure at least two points to track their distance over time")
+            return None
+        stage = self._usd_context.get_stage()
+        self._tracks.set_stage(stage)
+        self._tracks.update()
+        if start is None:
+            start = stage.GetStartTimeCode() if stage is not None else 0.0
+        if end is None:
+            end = stage.GetEndTimeCode() if stage is not None else start
+        points = [
+            self._anchors.get_anchor(group_id, index) or (None, position)
+            for index, position in enumerate(item.value.array)
+        ]
+        begin = time.perf_counter()
+        track = self._tracks.peek(points, start, end, step)
+        if track is not None:
+            self._analyses.cancel_all("track")
+            self._apply_track(track, begin)
+            return None
+        # The transforms are read here, the worker only places the points and measures them
+        with profiling.span("track.read"):
+            snapshot = self._tracks.snapshot(points, start, end, step)
+        return self._analyses.submit(
+            self._measure_track, snapshot, key="track",
+            callback=lambda track: self._apply_track(track, begin),
+        )
+
+    # Track of the points, runs on a worker thread
+    def _measure_track(self, snapshot):
+        with profiling.span("track.evaluate"):
+            return self._tracks.compute(snapshot)
+
+    def _apply_track(self, track, begin):
+        profiling.record("track.latency", time.perf_counter() - begin)
+        self.track_result = track
+        summary = zip(track.minimum.tolist(), track.maximum.tolist(), track.closest_time.tolist())
+        for k, (low, high, at) in enumerate(summary):
+            carb.log_info(
+                f"[lm.measurement.tool] Segment {k} over {len(track.times)} time codes: "
+                f"min {low:.3f} at {at:g}, max {high:.3f}"
+            )
+        self._draw_track()
+
+    # Write the last track to a .csv or .npz file, see MeasurementTrack.save
+    def save_track(self, path):
+        if self.track_result is None:
+            carb.log_warn("[lm.measurement.tool] No track to save, press T to measure one")
+            return
+        self.track_result.save(path)
+
+    # Each segment of the last track where it came closest, labeled with the distance and time code
+    def _draw_track(self):
+        if self._track_root is None:
+            return
+        self._track_root.clear()
+        if self.track_result is None:
+            return
+        track = self.track_result
+        with self._track_root:
+            closest = zip(track.closest_points().tolist(), track.minimum.tolist(), track.closest_time.tolist())
+            for (a, b), low, at in closest:
+                sc.Line(a, b)
+                self._draw_label([(a[k] + b[k]) * 0.5 for k in range(3)], f"min {round(low, 3)} cm @ {at:g}")
+        self._count_rebuilt(6 * track.segment_count)
+
+    # Turn section mode on or off. While it is on, the selected meshes (every mesh when nothing is selected) are cut
+    # by the section plane whenever the selection, the plane or a mesh changes, and the cut is drawn with its
+    # perimeter, enclosed area and widest extent. The first plane goes through the center of the meshes.
+    def show_section(self, enabled=True):
+        self._section_enabled = enabled
+        self._section_state = None
+        if enabled:
+            if self._section_plane is None:
+                origin = self._sections.center(self._section_paths())
+                self.set_section_plane(origin if origin is not None else (0.0, 0.0, 0.0))
+            self._update_section()
+        else:
+            self._queries.cancel_all("section")
+            self.section_result = None
+            self._draw_section()
+
+    # Move the section plane to origin, normal keeps the current normal or for a new plane comes from the axis setting.
+    # Moving the plane along its normal, as when dragging it, reuses the triangle order of the last cut.
+    def set_section_plane(self, origin, normal=None):
+        if normal is None:
+            normal = self._section_plane.normal if self._section_plane is not None else self._section_axis()
+        self._section_plane = SectionPlane(origin, normal)
+        return self._section_plane
+
+    def _section_axis(self):
+        axis = (carb.settings.get_settings().get(SECTION_AXIS_SETTING) or "view").lower()
+        if axis in ("x", "y", "z"):
+            return np.eye(3)["xyz".index(axis)]
+        return self._view_cache.camera().forward
+
+    def _section_paths(self):
+        return tuple(str(path) for path in self._usd_context.get_selection().get_selected_prim_paths()) or ("/",)
+
+    # Called every update while section mode is on, only queues a cut when something it depends on changed
+    def _update_section(self):
+        if not self._section_enabled or self._section_plane is None:
+            return
+        paths = self._section_paths()
+        state = (paths, self._section_plane.key(), self._sections.generation)
+        if state == self._section_state:
+            return
+        self._section_state = state
+        self._prefetch_meshes(paths)
+        start = time.perf_counter()
+        self._queries.submit(
+            self._measure_section, paths, self._section_plane, key="section",
+            callback=lambda result: self._apply_section(result, start),
+        )
+
+    # Section of the meshes, runs on a worker thread
+    def _measure_section(self, paths, plane):
+        with profiling.span("section.cut"):
+            return self._sections.section(paths, plane)
+
+    def _apply_section(self, result, start):
+        profiling.record("section.latency", time.perf_counter() - start)
+        self.section_result = result
+        self._draw_section()
+
+    # Every polyline of the section, its widest extent and a label with perimeter, area and width at its center
+    def _draw_section(self):
+        if self._section_root is None:
+            return
+        self._section_root.clear()
+        result = self.section_result
+        if result is None or not result.polylines:
+            return
+        with self._section_root:
+            for polyline, closed in zip(result.polylines, result.closed):
+                points = np.vstack((polyline, polyline[:1])) if closed else polyline
+                sc.Curve(points.tolist(), curve_type=sc.Curve.CurveType.LINEAR)
+            a, b = result.width_points.tolist()
+            sc.Line(a, b)
+            text = f"P {round(result.perimeter, 3)} cm  A {round(result.area, 3)} cm2  W {round(result.width, 3)} cm"
+            self._draw_label(result.center.tolist(), text)
+        self._count_rebuilt(len(result.polylines) + 6)
+
+    # Queue flood sampling of the meshes at or under paths, by default the selection or every mesh when nothing is
+    # selected. The samples are streamed in blocks into a summary and, when export_path or the export setting is set,
+    # into a .csv or .ply file, so they are never held in memory as a whole.
+    def sample_flood(self, paths=None, density=None, export_path=None):
+        settings = carb.settings.get_settings()
+        if paths is None:
+            paths = tuple(str(path) for path in self._usd_context.get_selection().get_selected_prim_paths()) or ("/",)
+        mesh_paths = paths_under(self._mr.get_mesh_paths(), [str(path) for path in paths])
+        if not mesh_paths:
+            carb.log_warn("[lm.measurement.tool] No meshes to flood sample")
+            return None
+        density = float(density or settings.get(FLOOD_DENSITY_SETTING) or 1.0)
+        max_points = int(settings.get(FLOOD_MAX_POINTS_SETTING) or 0) or None
+        budget = float(settings.get(FLOOD_MEMORY_SETTING) or 64) * (1 << 20)
+        workers = resolve_workers(settings.get(FLOOD_WORKERS_SETTING) or self._mr.FLOOD_WORKERS)
+        export_path = export_path or settings.get(FLOOD_EXPORT_PATH_SETTING) or None
+        self._mr.prefetch_mesh_data(mesh_paths)
+        start = time.perf_counter()
+        return self._analyses.submit(
+            self._sample_flood, mesh_paths, density, max_points, budget, workers, export_path, key="flood",
+            callback=lambda summary: self._apply_flood(summary, export_path, start),
+        )
+
+    # Stream the samples into a summary and the export file, runs on a worker thread
+    def _sample_flood(self, mesh_paths, density, max_points, budget, workers, export_path):
+        with profiling.span("flood.sample"):
+            blocks = self._mr.iter_flood_data(mesh_paths, density, max_points, budget, workers)
+            return consume_flood(blocks, export_path)
+
+    def _apply_flood(self, summary, export_path, start):
+        profiling.record("flood.latency", time.perf_counter() - start)
+        self.flood_result = summary
+        written = f", written to {export_path}" if export_path else ""
+        carb.log_info(
+            f"[lm.measurement.tool] Flood sampled {summary.count} points on {len(summary.mesh_counts)} meshes{written}"
+        )
+
+    # Drop every raycast that has not been applied yet
+    def cancel_queries(self):
+        self._queries.cancel_all()
+        self._hover_query = None
+
+    # Called once per app update while the tool is active.
+    # Applies finished raycasts and stage edits, then queues a raycast for the latest hover position if there is one.
+    def _on_update(self, event):
+        self._queries.poll()
+        self._analyses.poll()
+        self._update_anchors()
+        self._update_raycast_scene()
+        self._update_dimensions()
+        self._update_area_volume()
+        self._update_section()
+        self._update_point_clouds()
+        self._update_labels()
+        if self._hover_pos is None or self._tool != ToolType.RULER:
+            return
+        pos = self._hover_pos
+        self._hover_pos = None
+
+        points = self.model.get_value(self.model.get_item('points'))
+        if not len(points):
+            return
+
+        # A newer position supersedes a hover cast that has not been applied yet, the executor cancels it when the
+        # new one is submitted under the same key
+        if self._hover_query is not None and self._queries.is_pending(self._hover_query):
+            self.hover_casts_dropped += 1
+            profiling.count("hover.dropped")
+        start = time.perf_counter()
+        self._hover_query = self._queries.submit(
+            self._cast_hit, *self._pick_ray(pos), key="hover", callback=lambda hit: self._apply_hover(hit, start)
+        )
+
+    # Once per frame, lay the segment labels out again when the camera or viewport moved or segments were removed
+    # or hidden, otherwise place the segments added since the last frame
+    def _update_labels(self):
+        if self._label_root is None:
+            return
+        if self._labels_dirty or self._label_view != (self._view_cache.camera(), self._view_cache.viewport()):
+            with profiling.span("draw.labels"):
+                self._layout_labels()
+        elif self._label_pending:
+            with profiling.span("draw.labels"):
+                self._place_labels(*self._take_pending_labels())
+
+    # Move the points anchored to prims that moved since the last update, only their groups are redrawn
+    def _update_anchors(self):
+        self._anchors.set_stage(self._usd_context.get_stage())
+        for move in self._anchors.update():
+            self.model.move_points(move.indices, move.positions, move.group_id, move.segment_transforms)
+
+    # Start indexing point clouds that appeared or changed since the last update
+    def _update_point_clouds(self):
+        self._point_clouds.set_stage(self._usd_context.get_stage())
+        with profiling.span("point_cloud.update"):
+            self._point_clouds.update()
+
+    # Follow the camera when frustum culling is on, then let the backend apply collected stage edits
+    def _update_raycast_scene(self):
+        if carb.settings.get_settings().get(FRUSTUM_CULLING_SETTING):
+            camera = self._view_cache.camera()
+            if camera is not self._frustum_camera:
+                self._frustum_camera = camera
+                self._mr.set_view_frustum(camera.view_projection)
+        elif self._frustum_camera is not None:
+            self._frustum_camera = None
+            self._mr.set_view_frustum(None)
+        with profiling.span("raycast.update"):
+            self._mr.update()
+
+    # Rebuild counts and times of the raycast backend's acceleration data
+    def get_rebuild_stats(self):
+        return self._mr.get_rebuild_stats()
+
+    # The preview of a hit the worker could not snap is drawn unsnapped, its mesh is read here for the next casts
+    def _apply_hover(self, hit, start):
+        position, mesh_path, unsnapped = hit
+        if unsnapped is not None:
+            self._mr.prefetch_mesh_data([mesh_path])
+        self._hover_latency.append((time.perf_counter() - start) * 1000.0)
+        profiling.record("hover.latency", time.perf_counter() - start)
+        points = self.model.get_value(self.model.get_item('points'))
+        if not len(points):
+            return
+        with profiling.span("hover.draw"):
+            self._draw_preview(points[-1].tolist(), position)
+
+    # Rubber band segment from the last point to the cursor's hit point
+    def _draw_preview(self, start, end):
+        self._clear_preview()
+        if not end or self._preview_root is None:
+            return
+        distance = round(float(np.linalg.norm(np.subtract(end, start))), 3)
+        midpoint = ((np.asarray(start) + np.asarray(end)) * 0.5).tolist()
+        with self._preview_root:
+            sc.Line(start, end)
+            self._draw_label(midpoint, f"{distance} cm")
+
+    def _clear_preview(self):
+        if self._preview_root is not None:
+            self._preview_root.clear()
+
+    # Latency of recent hover raycasts in milliseconds
+    def get_hover_latency_stats(self):
+        if not self._hover_latency:
+            return {"count": 0, "dropped": self.hover_casts_dropped}
+        samples = np.fromiter(self._hover_latency, dtype=np.float64)
+        return {
+            "count": len(samples),
+            "dropped": self.hover_casts_dropped,
+            "mean": float(samples.mean()),
+            "p50": float(np.percentile(samples, 50)),
+            "p95": float(np.percentile(samples, 95)),
+            "max": float(samples.max()),
+        }
 
     # Called when a value in the model is changed and _item_changed is called
     def on_model_updated(self, item):
-        # Update the line based on the model
-        self.invalidate()
+        # Nothing has been built yet, the first build will draw everything
+        if self._segment_root is None:
+            self.invalidate()
+            return
+
+        self._reset_rebuild_count()
+        with profiling.span("draw.update"):
+            self._apply_model_update(item)
 
-    # Draw the line based on any points stored in the model
-    def _draw_shape(self):
+    def _apply_model_update(self, item):
+        if item is None:
+            # Every group changed, drop all retained nodes and redraw whatever is left
+            self._segment_root.clear()
+            self._group_roots = {}
+            self._drawn_points = {}
+            self._drawn_paths = {}
+            self._drawn_moves = {}
+            self._spare_roots = []
+            self._anchors.clear()
+            self._labels = {}
+            self._labels_dirty = True
+            self._visible_labels = None
+            self._clear_preview()
+            for group_id in self.model.get_group_ids():
+                self._update_group(group_id)
+            return
+        self._update_group(item.group_id)
+
+    # Bring one group's retained nodes in line with the model
+    def _update_group(self, group_id):
+        item = self.model.get_group_item(group_id)
+        if item is None:
+            # The group was deleted, hide its container and keep it for the next new group
+            root = self._group_roots.pop(group_id, None)
+            self._drawn_points.pop(group_id, None)
+            self._drawn_paths.pop(group_id, None)
+            self._drawn_moves.pop(group_id, None)
+            self._anchors.remove(group_id)
+            self._labels.pop(group_id, None)
+            self._labels_dirty = True
+            self._visible_labels = None
+            if root is not None:
+                root.clear()
+                root.visible = False
+                self._spare_roots.append(root)
+            self._clear_preview()
+            return
+
+        root = self._group_roots.get(group_id)
+        if root is None:
+            root = self._new_group_root(group_id)
+        visible = self.model.is_group_visible(group_id)
+        if root.visible != visible:
+            root.visible = visible
+            self._labels_dirty = True
+            self._visible_labels = None
+
+        if (
+            len(item.value) < self._drawn_points[group_id]
+            or len(item.segment_paths) != self._drawn_paths[group_id]
+            or item.moves != self._drawn_moves[group_id]
+        ):
+            # Points were removed or moved or a drawn segment got a surface path, drop the group's nodes and redraw
+            # whatever is left
+            root.clear()
+            self._anchors.remove(group_id, len(item.value))
+            self._drawn_points[group_id] = 0
+            self._drawn_paths[group_id] = len(item.segment_paths)
+            self._drawn_moves[group_id] = item.moves
+            self._labels[group_id] = LabelSet()
+            self._labels_dirty = True
+            self._visible_labels = None
+            self._clear_preview()
+        self._anchor_points(group_id, item)
+        with root:
+            self._draw_shape(group_id)
+
+    def _new_group_root(self, group_id):
+        if self._spare_roots:
+            root = self._spare_roots.pop()
+        else:
+            with self._segment_root:
+                root = sc.Transform()
+            self._count_rebuilt(1)
+        self._group_roots[group_id] = root
+        self._drawn_points[group_id] = 0
+        self._drawn_paths[group_id] = 0
+        self._drawn_moves[group_id] = self.model.get_group_item(group_id).moves
+        self._labels[group_id] = LabelSet()
+        return root
+
+    # Anchor the points of a group that were picked on a prim and have not been drawn yet
+    def _anchor_points(self, group_id, item):
+        points = item.value.array
+        for index in range(self._drawn_points[group_id], len(points)):
+            prim_path = item.mesh_paths.get(index)
+            if prim_path is not None:
+                self._anchors.add(group_id, index, prim_path, points[index])
+
+    # Draw the lines of any segments of a group that have not been drawn yet and queue their distance labels.
+    # Midpoints and distances for the new segments are computed in one vectorized pass.
+    def _draw_shape(self, group_id):
         if not self.model:
             return
-        points = self.model.get_value(self.model.get_item('points'))
-        if len(points) > 1:
-            # Curve allows for more than one active measurement at a time
-            sc.Curve(points, curve_type=sc.Curve.CurveType.LINEAR)
+        points = self.model.get_group_item(group_id).value
+        first = max(self._drawn_points[group_id] - 1, 0)
+        if len(points) - first < 2:
+            self._drawn_points[group_id] = len(points)
+            return
+
+        segment_points = points[first:].tolist()
+        midpoints = self.model.get_midpoints(first, group_id)
+        distances = self.model.get_distances(first=first, group_id=group_id)
+        for i in range(len(distances)):
+            path = self.model.get_segment_path(first + i, group_id)
+            if path is None:
+                sc.Line(segment_points[i], segment_points[i + 1])
+            else:
+                sc.Curve(path.tolist(), curve_type=sc.Curve.CurveType.LINEAR)
+        texts = [f"{distance} cm" for distance in distances.tolist()]
+        self._labels[group_id].extend(midpoints, distances, texts)
+        self._visible_labels = None
+        if self.model.is_group_visible(group_id):
+            self._label_pending.append((midpoints, distances, texts))
+        self._count_rebuilt(len(distances))
+        self._drawn_points[group_id] = len(points)
+
+    # Position a distance label above the center of a line, returns the positioning transform and the label
+    def _draw_label(self, position, text):
+        anchor = sc.Transform(transform=sc.Matrix44.get_translation_matrix(*position))
+        with anchor:
+            with sc.Transform(look_at=sc.Transform.LookAt.CAMERA):
+                with sc.Transform(scale_to=sc.Space.SCREEN):
+                    with sc.Transform(transform=sc.Matrix44.get_translation_matrix(0,5,0)):
+                        label = sc.Label(text, alignment=ui.Alignment.CENTER_BOTTOM, size=20)
+        return anchor, label
+
+    # Lay out the segment labels of the visible groups from scratch. Labels that keep their cell keep their node,
+    # so the cost follows the number of labels shown.
+    def _layout_labels(self):
+        if self._label_root is None:
+            return
+        self._labels_dirty = False
+        self._label_pending = []
+        camera = self._view_cache.camera()
+        viewport = self._view_cache.viewport()
+        self._label_view = (camera, viewport)
+        self._label_layout = None
+        if viewport is not None:
+            size = (viewport.rect[2] - viewport.rect[0], viewport.rect[3] - viewport.rect[1])
+            self._label_layout = LabelLayout(camera, size, *self._label_settings())
+
+        previous = self._label_slots
+        self._label_slots = {}
+        # The visible groups' labels are joined once and reused while only the camera moves
+        if self._visible_labels is None:
+            groups = [
+                labels for group_id, labels in self._labels.items()
+                if len(labels) and self.model.is_group_visible(group_id)
+            ]
+            self._visible_labels = (
+                np.concatenate([labels.anchors for labels in groups]) if groups else np.zeros((0, 3)),
+                np.concatenate([labels.lengths for labels in groups]) if groups else np.zeros(0),
+                [text for labels in groups for text in labels.texts],
+            )
+        self._place_labels(*self._visible_labels, previous)
+        for slot in previous.values():
+            self._label_nodes[slot][0].visible = False
+            self._label_state[slot] = None
+            self._free_label_slots.append(slot)
+
+    # Minimum segment length on screen and label cell width and height, all in pixels
+    def _label_settings(self):
+        settings = carb.settings.get_settings()
+        values = []
+        for path, default in (
+            (LABEL_MIN_PIXELS_SETTING, 4.0), (LABEL_CELL_WIDTH_SETTING, 96.0), (LABEL_CELL_HEIGHT_SETTING, 24.0)
+        ):
+            value = settings.get(path)
+            values.append(default if value is None else float(value))
+        return values[0], values[1:]
+
+    def _take_pending_labels(self):
+        pending = self._label_pending
+        self._label_pending = []
+        anchors = np.concatenate([np.asarray(anchors).reshape(-1, 3) for anchors, _, _ in pending])
+        lengths = np.concatenate([np.asarray(lengths).reshape(-1) for _, lengths, _ in pending])
+        return anchors, lengths, [text for _, _, texts in pending for text in texts]
+
+    # Put labels into the current layout and show the ones that won a cell, reusing the nodes in previous
+    # (cell -> slot) first. Without a viewport to lay out against every label is shown.
+    def _place_labels(self, anchors, lengths, texts, previous=None):
+        if self._label_layout is None:
+            for position, text in zip(np.asarray(anchors).tolist(), texts):
+                self._show_label(-1 - len(self._label_slots), position, text, previous)
+        else:
+            cells = self._label_layout.cells
+            for key in self._label_layout.place(anchors, lengths, texts):
+                _, position, text = cells[key]
+                self._show_label(key, position, text, previous)
+        profiling.count("draw.labels", len(self._label_slots))
+
+    def _show_label(self, key, position, text, previous):
+        slot = self._label_slots.get(key)
+        if slot is None and previous:
+            slot = previous.pop(key, None)
+        if slot is None:
+            if self._free_label_slots:
+                slot = self._free_label_slots.pop()
+            else:
+                with self._label_root:
+                    self._label_nodes.append(self._draw_label(position, text))
+                self._label_state.append((position, text))
+                self._count_rebuilt(5)
+                self._label_slots[key] = len(self._label_nodes) - 1
+                return
+        self._label_slots[key] = slot
+        anchor, label = self._label_nodes[slot]
+        state = self._label_state[slot]
+        if state is None:
+            anchor.visible = True
+        if state is None or state[0] != position:
+            anchor.transform = sc.Matrix44.get_translation_matrix(*position)
+        if state is None or state[1] != text:
+            label.text = text
+        self._label_state[slot] = (position, text)
+
+    # Number of segment labels currently drawn
+    @property
+    def labels_shown(self):
+        return len(self._label_slots)
+
+    # Rebuild counters, used to confirm that updates only create items for new segments
+    def _reset_rebuild_count(self, count=0):
+        self.items_rebuilt = 0
+        self._count_rebuilt(count)
+
+    def _count_rebuilt(self, count):
+        self.items_rebuilt += count
+        self.items_rebuilt_total += count
+        profiling.count("draw.items", count)
+
+    # Save every measurement group with its surface paths and anchors to a .npz file or USD layer
+    def save_session(self, path):
+        items = [self.model.get_group_item(group_id) for group_id in self.model.get_group_ids()]
+        save_session(path, [SessionGroup(item.value.array, item.segment_paths, item.mesh_paths) for item in items])
+
+    # Replace the current measurements with a saved session, drawn in one batch. Points are anchored again to the
+    # prims they were picked on.
+    def load_session(self, path):
+        groups = load_session(path)
+        self.model.set_groups(
+            [group.points for group in groups],
+            [group.segment_paths for group in groups],
+            [group.mesh_paths for group in groups],
+        )
+
+    def _has_points(self):
+        return any(len(self.model.get_group_item(group_id).value) for group_id in self.model.get_group_ids())
+
+    def _autosave_path(self):
+        return carb.settings.get_settings().get(AUTOSAVE_PATH_SETTING) or None
+
+    # Save to the autosave path if one is set, empty sessions never overwrite a saved one
+    def autosave(self):
+        path = self._autosave_path()
+        if path is None or not self._has_points():
+            return
+        try:
+            self.save_session(path)
+        except Exception as e:
+            carb.log_error(f"[lm.measurement.tool] Failed to save measurements to {path}: {e}")
+
+    def restore_autosave(self):
+        path = self._autosave_path()
+        if path is None or not os.path.exists(path) or self._has_points():
+            return
+        try:
+            self.load_session(path)
+        except Exception as e:
+            carb.log_error(f"[lm.measurement.tool] Failed to load measurements from {path}: {e}")
+
+    # Stop the query workers, called when the viewport scene is destroyed
+    def destroy(self):
+        self._queries.shutdown()
+        self._analyses.shutdown()
+        self._area_volume.shutdown()
+        self._point_clouds.shutdown()
 
     # Toggle the tool on or off using input from toolbar buttons
     # TODO Make tool states exclusive (i.e. only line or angle measure active at a time, not both at once)
@@ -4,19 +4,38 @@ Handles calcuation of distance for measurement objects.
 '''
 
 from math import sqrt
+import numpy as np
 from omni.ui import scene as sc
 
+from .point_buffer import PointBuffer
+from .measurement_collection import MeasurementCollection
+from .geodesic import polyline_length, polyline_midpoint
+
 class RulerModel(sc.AbstractManipulatorModel):
 
     # Absctract container class(es)
     class ListItem(sc.AbstractManipulatorItem):
-        def __init__(self, value=[]):
-            self.value = value
+        def __init__(self, value=None, group_id=None):
+            self.value = value if value is not None else PointBuffer()
+            self.group_id = group_id
+            # Mesh each clicked point was picked on, by point index
+            self.mesh_paths = {}
+            # Surface paths replacing the straight line of a segment, by the index of the segment's first point
+            self.segment_paths = {}
+            # Number of times points were moved in place, see move_points
+            self.moves = 0
 
     # Constructor
     def __init__(self):
         super().__init__()
-        self._points = RulerModel.ListItem()
+        # Independent measurement groups, new points are added to the active one
+        self._groups = MeasurementCollection()
+        self._points = self._new_group_item()
+
+    def _new_group_item(self):
+        item = RulerModel.ListItem()
+        item.group_id = self._groups.add(item)
+        return item
 
     # Find the distance between any two points
     def calculate_dist(self, startpoint, endpoint):
@@ -38,22 +57,173 @@ class RulerModel(sc.AbstractManipulatorModel):
 
         return midpoint
 
+    # Batch queries over every segment of a group's points (the active group by default), returned as NumPy arrays
+    # Segment queries can start from a given point index to only cover newly added segments
+    # Segments with a surface path are measured along the path instead of in a straight line
+    def get_distances(self, decimals=3, first=0, group_id=None):
+        item = self._group_item(group_id)
+        distances = item.value.distances(first)
+        for index, path in item.segment_paths.items():
+            if first <= index < first + len(distances):
+                distances[index - first] = polyline_length(path)
+        return distances.round(decimals)
+
+    def get_midpoints(self, first=0, group_id=None):
+        item = self._group_item(group_id)
+        midpoints = item.value.midpoints(first)
+        for index, path in item.segment_paths.items():
+            if first <= index < first + len(midpoints):
+                midpoints[index - first] = polyline_midpoint(path)
+        return midpoints
+
+    def get_cumulative_lengths(self, group_id=None):
+        item = self._group_item(group_id)
+        if not item.segment_paths:
+            return item.value.cumulative_lengths()
+        lengths = np.zeros(len(item.value), dtype=np.float64)
+        if len(lengths) > 1:
+            np.cumsum(self.get_distances(decimals=12, group_id=group_id), out=lengths[1:])
+        return lengths
+
+    # Surface path of the segment starting at point index, or None when it is drawn as a straight line
+    def get_segment_path(self, index, group_id=None):
+        return self._group_item(group_id).segment_paths.get(index)
+
+    def get_point_mesh(self, index, group_id=None):
+        return self._group_item(group_id).mesh_paths.get(index)
+
+    def _group_item(self, group_id):
+        return self._points if group_id is None else self._groups.get(group_id)
+
     # Accessor methods for private values
     def get_item(self, item):
         if item == 'points':
             return self._points
 
     def get_value(self, item):
-        if item == self._points:
-            return self._points.value
+        if isinstance(item, RulerModel.ListItem):
+            return item.value
+
+    # Measurement groups
+    def get_active_group(self):
+        return self._points.group_id
+
+    def get_group_ids(self, visible_only=False):
+        return self._groups.ids(visible_only)
+
+    def get_group_item(self, group_id):
+        return self._groups.get(group_id)
+
+    def has_group(self, group_id):
+        return group_id in self._groups
+
+    def is_group_visible(self, group_id):
+        return self._groups.is_visible(group_id)
+
+    # Start a new measurement, later points are added to it. An empty active group is reused.
+    def new_group(self):
+        if len(self._points.value):
+            self._points = self._new_group_item()
+        return self._points.group_id
+
+    def set_active_group(self, group_id):
+        item = self._groups.get(group_id)
+        if item is not None:
+            self._points = item
+
+    # Delete one group, only that group is invalidated
+    def delete_group(self, group_id):
+        item = self._groups.remove(group_id)
+        if item is None:
+            return
+        if item is self._points:
+            self._points = self._new_group_item()
+        self._item_changed(item)
+
+    def set_group_visible(self, group_id, visible):
+        if self._groups.is_visible(group_id) != bool(visible) and self._groups.set_visible(group_id, visible):
+            self._item_changed(self._groups.get(group_id))
 
     # Mutator methods for private values
-    def add_point(self, point):
-        self.get_value(self.get_item('points')).append(point)
-        self._item_changed(self._points)
+    # Points go to the active group unless a group is given, points for deleted groups are dropped
+    # mesh_path is the mesh the point was picked on, if any
+    def add_point(self, point, group_id=None, mesh_path=None):
+        item = self._points if group_id is None else self._groups.get(group_id)
+        if item is None:
+            return
+        self.get_value(item).append(point)
+        if mesh_path is not None:
+            item.mesh_paths[len(item.value) - 1] = str(mesh_path)
+        self._item_changed(item)
 
-    def clear_points(self):
-        self.get_value(self.get_item('points')).clear()
+    # Draw and measure the segment starting at point index along a surface path (an N x 3 polyline) instead
+    # of a straight line. Paths for deleted groups or points are dropped.
+    def set_segment_path(self, index, path, group_id=None):
+        item = self._group_item(group_id)
+        if item is None or not 0 <= index < len(item.value) - 1:
+            return
+        item.segment_paths[index] = np.asarray(path, dtype=np.float64).reshape(-1, 3)
+        self._item_changed(item)
+
+    # Move points of a group in place, e.g. when the prims they are anchored to moved. The surface path of a segment
+    # is moved along by its 4 x 4 matrix (row vectors) in segment_transforms, and dropped when it has none.
+    def move_points(self, indices, positions, group_id=None, segment_transforms=None):
+        item = self._group_item(group_id)
+        if item is None:
+            return
+        indices = np.asarray(indices, dtype=np.int64)
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        if len(indices) and indices.max() >= len(item.value):
+            keep = indices < len(item.value)
+            indices, positions = indices[keep], positions[keep]
+        if not len(indices):
+            return
+        item.value.set(indices, positions)
+        if item.segment_paths:
+            moved = set(indices.tolist())
+            transforms = segment_transforms or {}
+            for index in [index for index in item.segment_paths if index in moved or index + 1 in moved]:
+                matrix = transforms.get(index)
+                if matrix is None:
+                    del item.segment_paths[index]
+                else:
+                    item.segment_paths[index] = item.segment_paths[index] @ matrix[:3, :3] + matrix[3, :3]
+        item.moves += 1
+        self._item_changed(item)
+
+    # Replace every point of the active group at once, e.g. when loading a saved session, so the manipulator redraws
+    # in one batch
+    def set_points(self, points):
+        buffer = self.get_value(self.get_item('points'))
+        self._points.mesh_paths.clear()
+        self._points.segment_paths.clear()
+        if len(buffer):
+            buffer.clear()
+            self._item_changed(self._points)
+        buffer.extend(points)
         self._item_changed(self._points)
-        
 
+    # Replace every group at once, e.g. when loading a saved session. The last group becomes the active one.
+    # segment_paths has one dict of surface paths per group, see set_segment_path, and mesh_paths one dict of the
+    # meshes points were picked on, see add_point.
+    def set_groups(self, groups, segment_paths=None, mesh_paths=None):
+        self._groups.clear()
+        self._points = None
+        for k, points in enumerate(groups):
+            self._points = self._new_group_item()
+            self._points.value.extend(points)
+            for index, path in (mesh_paths[k] if mesh_paths is not None else {}).items():
+                if 0 <= index < len(self._points.value):
+                    self._points.mesh_paths[index] = str(path)
+            for index, path in (segment_paths[k] if segment_paths is not None else {}).items():
+                if 0 <= index < len(self._points.value) - 1:
+                    self._points.segment_paths[index] = np.asarray(path, dtype=np.float64).reshape(-1, 3)
+        if self._points is None:
+            self._points = self._new_group_item()
+        self._item_changed(None)
+
+    # Remove every group, observers get a single update with no item
+    def clear_points(self):
+        self._groups.clear()
+        self._points = self._new_group_item()
+        self._item_changed(None)
@@ -0,0 +1,307 @@
+'''
+Cross sections of meshes by a plane. The cut is taken from the world space
+points and triangles the raycast backend already caches. For each mesh and
+plane normal, the triangles are sorted once by their lowest signed distance
+along the normal, so moving the plane along its normal only has to look at a
+thin slab of triangles, found by binary search. The crossing triangles are
+intersected with the plane in one vectorized pass. Every cut segment runs
+between two mesh edges, oriented by its triangle's winding, and the segments
+are chained into polylines through those edges. A section reports its
+perimeter, the area enclosed by its closed loops and its maximum caliper width
+(the longest distance across its convex hull).
+'''
+
+import threading
+
+import numpy as np
+
+from .bounds import convex_hull_2d
+from .stage_listener import paths_under
+
+# Triangles spanning more than this quantile of the triangle spans along the normal are tested on every cut
+# instead of widening the slab
+SLAB_QUANTILE = 0.999
+
+# Directions whose extreme points span the polygon that points are dropped inside of before the hull is searched
+HULL_DIRECTIONS = 32
+
+
+class SectionPlane:
+
+    # Constructor, the plane through origin with the given normal
+    def __init__(self, origin, normal):
+        self.origin = np.asarray(origin, dtype=np.float64).reshape(3)
+        normal = np.asarray(normal, dtype=np.float64).reshape(3)
+        self.normal = normal / max(float(np.linalg.norm(normal)), 1e-30)
+
+    @property
+    def offset(self):
+        return float(self.origin @ self.normal)
+
+    # Two unit vectors spanning the plane, (u, v, normal) is right handed
+    def basis(self):
+        helper = np.eye(3)[int(np.argmin(np.abs(self.normal)))]
+        u = np.cross(helper, self.normal)
+        u /= np.linalg.norm(u)
+        return u, np.cross(self.normal, u)
+
+    def key(self):
+        return tuple(self.origin.tolist()), tuple(self.normal.tolist())
+
+
+class SectionResult:
+
+    # Constructor, polylines are N x 3 arrays, closed says which of them are loops, area is the area they enclose
+    # and width_points the two section points furthest apart
+    def __init__(self, plane, polylines, closed, area, width_points):
+        self.plane = plane
+        self.polylines = polylines
+        self.closed = closed
+        self.area = area
+        self.width_points = width_points
+
+    @property
+    def perimeter(self):
+        total = 0.0
+        for polyline, closed in zip(self.polylines, self.closed):
+            points = np.vstack((polyline, polyline[:1])) if closed else polyline
+            total += float(np.linalg.norm(np.diff(points, axis=0), axis=1).sum())
+        return total
+
+    @property
+    def width(self):
+        if self.width_points is None:
+            return 0.0
+        return float(np.linalg.norm(self.width_points[1] - self.width_points[0]))
+
+    @property
+    def center(self):
+        if not self.polylines:
+            return self.plane.origin
+        points = np.vstack(self.polylines)
+        return (points.min(axis=0) + points.max(axis=0)) * 0.5
+
+
+class _MeshSlabs:
+
+    # Triangles of one mesh ordered by their lowest signed distance along normal. Triangles no wider along the
+    # normal than span are in the sorted slabs, the few wider ones are kept apart.
+    def __init__(self, data, normal):
+        self.normal = normal
+        self.points = data.world_points
+        self.triangles = data.triangles
+        self.distances = self.points @ normal
+        corners = self.distances[self.triangles]
+        lo = corners.min(axis=1)
+        hi = corners.max(axis=1)
+        spans = hi - lo
+        self.span = float(np.quantile(spans, SLAB_QUANTILE)) if len(spans) else 0.0
+        slab = spans <= self.span
+        index = np.flatnonzero(slab)
+        order = np.argsort(lo[index], kind="stable")
+        self.order = index[order]
+        self.lo = lo[self.order]
+        self.hi = hi[self.order]
+        self.wide = np.flatnonzero(~slab)
+        self.wide_lo = lo[self.wide]
+        self.wide_hi = hi[self.wide]
+
+    # Triangles with vertices on both sides of the plane at offset. A vertex on the plane counts as above it, as if
+    # the plane were moved down by an infinitesimal, so a triangle crosses when a corner is strictly below.
+    def crossing(self, offset):
+        first = np.searchsorted(self.lo, offset - self.span, side="left")
+        last = np.searchsorted(self.lo, offset, side="left")
+        near = np.flatnonzero(self.hi[first:last] >= offset) + first
+        wide = (self.wide_lo < offset) & (self.wide_hi >= offset)
+        return np.concatenate((self.order[near], self.wide[wide]))
+
+
+# Fraction along the edges from corners at signed distances da to corners at db where they meet the plane. The
+# corners of a cut edge are strictly on opposite sides, the guard only keeps degenerate input finite.
+def _edge_fractions(da, db):
+    difference = da - db
+    return np.divide(da, difference, out=np.zeros_like(da), where=difference != 0.0)
+
+
+# Cut segments of the crossing triangles (corners below and at or above the plane, see _MeshSlabs.crossing),
+# returned as start points, end points and the mesh edges (as vertex pair keys) they start and end on. Segments run
+# along normal x triangle normal, so a closed mesh's loops wind alike.
+def cut_segments(points, triangles, distances, offset):
+    corners = triangles
+    d = distances[corners] - offset
+    above = d >= 0.0
+    crossing = above.any(axis=1) & ~above.all(axis=1)
+    corners, d, above = corners[crossing], d[crossing], above[crossing]
+
+    # The corner alone on its side of the plane, the two cut edges run from it to the other two corners
+    lone = np.where(above.sum(axis=1) == 1, np.argmax(above, axis=1), np.argmin(above, axis=1))
+    rows = np.arange(len(corners))
+    a = corners[rows, lone]
+    b = corners[rows, (lone + 1) % 3]
+    c = corners[rows, (lone + 2) % 3]
+    da, db, dc = d[rows, lone], d[rows, (lone + 1) % 3], d[rows, (lone + 2) % 3]
+    start = points[a] + (points[b] - points[a]) * _edge_fractions(da, db)[:, None]
+    end = points[a] + (points[c] - points[a]) * _edge_fractions(da, dc)[:, None]
+    count = np.int64(len(points))
+    start_edge = np.minimum(a, b) * count + np.maximum(a, b)
+    end_edge = np.minimum(a, c) * count + np.maximum(a, c)
+
+    # Following the winding from a lone corner above the plane, the segment runs along normal x triangle normal.
+    # Below it runs the other way. Deciding from the corners keeps segments through a vertex on the plane, which
+    # have no length, oriented like their neighbours.
+    flip = ~above[rows, lone]
+    start[flip], end[flip] = end[flip], start[flip]
+    start_edge[flip], end_edge[flip] = end_edge[flip], start_edge[flip]
+    return start, end, start_edge, end_edge
+
+
+# Chain cut segments into polylines through the edges they share. Returns the polylines and whether each is closed.
+def chain_segments(start, end, start_edge, end_edge):
+    count = len(start)
+    if not count:
+        return [], []
+
+    # Segment starting on each segment's end edge, -1 at open ends
+    order = np.argsort(start_edge, kind="stable")
+    found = np.minimum(np.searchsorted(start_edge[order], end_edge), count - 1)
+    following = np.where(start_edge[order][found] == end_edge, order[found], -1)
+    has_previous = np.zeros(count, dtype=bool)
+    has_previous[following[following >= 0]] = True
+
+    following = following.tolist()
+    visited = np.zeros(count, dtype=bool)
+    polylines = []
+    closed = []
+
+    # Open chains from their first segment, then the loops that are left
+    for first in np.concatenate((np.flatnonzero(~has_previous), np.arange(count))).tolist():
+        if visited[first]:
+            continue
+        chain = [first]
+        visited[first] = True
+        segment = following[first]
+        while segment >= 0 and not visited[segment]:
+            visited[segment] = True
+            chain.append(segment)
+            segment = following[segment]
+        loop = segment == first
+        polyline = start[chain]
+        if not loop:
+            polyline = np.vstack((polyline, end[chain[-1]]))
+        polylines.append(polyline)
+        closed.append(loop)
+    return polylines, closed
+
+
+# Signed area of a closed polyline projected onto the plane spanned by u and v
+def _loop_area(polyline, u, v):
+    x = polyline @ u
+    y = polyline @ v
+    return 0.5 * float(x @ np.roll(y, -1) - y @ np.roll(x, -1))
+
+
+# Mask of the planar points not strictly inside the polygon of the extreme points in HULL_DIRECTIONS directions,
+# which holds every hull vertex. Leaves the hull search with the outline of the outermost loops.
+def _hull_candidates(planar):
+    angles = np.linspace(0.0, 2.0 * np.pi, HULL_DIRECTIONS, endpoint=False)
+    corners = planar[np.argmax(planar @ np.stack((np.cos(angles), np.sin(angles))), axis=0)]
+    edges = np.roll(corners, -1, axis=0) - corners
+    sides = planar @ np.stack((-edges[:, 1], edges[:, 0])) - (corners[:, 1] * edges[:, 0] - corners[:, 0] * edges[:, 1])
+    return (sides <= 0.0).any(axis=1)
+
+
+# The two points of N x 3 points on a plane that are furthest apart. They are an antipodal pair of their convex hull
+# in the plane, which rotating calipers find as the ends of each hull edge and the hull vertex furthest out the
+# opposite way, looked up by the angle of the edge's outward normal.
+def widest_pair(points, u, v):
+    if len(points) < 2:
+        return None
+    planar = np.column_stack((points @ u, points @ v))
+    hull = convex_hull_2d(planar[_hull_candidates(planar)])
+    if len(hull) < 3:
+        ends = hull if len(hull) == 2 else planar[:2]
+    else:
+        edges = np.roll(hull, -1, axis=0) - hull
+        angles = np.unwrap(np.arctan2(-edges[:, 0], edges[:, 1]))
+        opposite = angles[0] + np.mod(angles + np.pi - angles[0], 2.0 * np.pi)
+        across = np.searchsorted(angles, opposite) % len(hull)
+        first = np.concatenate((np.arange(len(hull)), (np.arange(len(hull)) + 1) % len(hull)))
+        second = np.concatenate((across, across))
+        best = int(np.argmax(((hull[first] - hull[second]) ** 2).sum(axis=1)))
+        ends = hull[[first[best], second[best]]]
+    index = [int(np.argmin(((planar - end) ** 2).sum(axis=1))) for end in ends]
+    return points[index]
+
+
+class SectionCache:
+
+    # Constructor, mesh_raycast is the raycast backend that supplies mesh data and rebuild notifications
+    def __init__(self, mesh_raycast):
+        self._mr = mesh_raycast
+        self._slabs = {}
+        self._lock = threading.Lock()
+
+        # Counts invalidations, so callers can tell whether results they hold may be stale
+        self.generation = 0
+        self._mr.add_rebuild_callback(self.invalidate)
+
+    # Section of every mesh at or under the given prim paths by plane, a SectionResult
+    def section(self, paths, plane):
+        mesh_paths = paths_under(self._mr.get_mesh_paths(), [str(path) for path in paths])
+        u, v = plane.basis()
+        polylines = []
+        closed = []
+        area = 0.0
+        for mesh_path in mesh_paths:
+            slabs = self._mesh_slabs(mesh_path, plane.normal)
+            if slabs is None:
+                continue
+            crossing = slabs.crossing(plane.offset)
+            if not len(crossing):
+                continue
+            segments = cut_segments(slabs.points, slabs.triangles[crossing], slabs.distances, plane.offset)
+            mesh_polylines, mesh_closed = chain_segments(*segments)
+
+            # Loops of one closed mesh wind alike around material and the other way around holes
+            area += abs(sum(_loop_area(polyline, u, v) for polyline, loop in zip(mesh_polylines, mesh_closed) if loop))
+            polylines += mesh_polylines
+            closed += mesh_closed
+        width_points = widest_pair(np.vstack(polylines), u, v) if polylines else None
+        return SectionResult(plane, polylines, closed, area, width_points)
+
+    # Center of the world bounds of every mesh at or under the given prim paths, None when there are none
+    def center(self, paths):
+        bounds = []
+        for mesh_path in paths_under(self._mr.get_mesh_paths(), [str(path) for path in paths]):
+            data = self._mr.get_mesh_data(mesh_path)
+            if data is not None and len(data.triangles):
+                bounds.append(data.bounds)
+        if not bounds:
+            return None
+        return (np.min([lo for lo, _ in bounds], axis=0) + np.max([hi for _, hi in bounds], axis=0)) * 0.5
+
+    # Slabs of one mesh for a normal, a mesh keeps the slabs of the last normal it was cut along
+    def _mesh_slabs(self, mesh_path, normal):
+        with self._lock:
+            slabs = self._slabs.get(mesh_path)
+            generation = self.generation
+        if slabs is not None and np.array_equal(slabs.normal, normal):
+            return slabs
+        data = self._mr.get_mesh_data(mesh_path)
+        if data is None or not len(data.triangles):
+            return None
+        slabs = _MeshSlabs(data, normal)
+        with self._lock:
+            if generation == self.generation:
+                self._slabs[mesh_path] = slabs
+        return slabs
+
+    # Drop the slabs of the given mesh paths, or of every mesh when paths is None
+    def invalidate(self, paths=None):
+        with self._lock:
+            self.generation += 1
+            if paths is None:
+                self._slabs.clear()
+                return
+            for path in paths:
+                self._slabs.pop(str(path), None)
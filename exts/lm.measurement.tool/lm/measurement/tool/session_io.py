@@ -0,0 +1,229 @@
+'''
+Saves and loads measurement sessions.
+A session is stored as one N x 3 point array plus the point count of each
+measurement group, either in a compressed NumPy .npz archive or as array
+attributes in a USD layer, so that even very large sessions are written and
+read in one block instead of per point. The surface paths of segments are
+stored the same way, as one array of polyline points with the index of each
+path's segment and its point count, and so are the prims points were picked on,
+as point indices and prim paths.
+'''
+
+import os
+import numpy as np
+
+try:
+    from pxr import Sdf, Vt
+except ImportError:
+    Sdf = None
+    Vt = None
+
+# Bumped whenever the stored layout changes. Version 2 added surface paths and the prims points are anchored to,
+# version 1 sessions load without them.
+SESSION_FORMAT_VERSION = 2
+
+# Where sessions live inside a USD layer
+SESSION_PRIM_PATH = "/MeasurementSession"
+POINTS_ATTRIBUTE = "lm:measurement:points"
+COUNTS_ATTRIBUTE = "lm:measurement:counts"
+VERSION_ATTRIBUTE = "lm:measurement:version"
+PATH_SEGMENTS_ATTRIBUTE = "lm:measurement:pathSegments"
+PATH_COUNTS_ATTRIBUTE = "lm:measurement:pathCounts"
+PATH_POINTS_ATTRIBUTE = "lm:measurement:pathPoints"
+ANCHOR_INDICES_ATTRIBUTE = "lm:measurement:anchorIndices"
+ANCHOR_PATHS_ATTRIBUTE = "lm:measurement:anchorPaths"
+
+USD_EXTENSIONS = (".usd", ".usda", ".usdc")
+
+
+def _is_usd_path(path):
+    return os.path.splitext(str(path))[1].lower() in USD_EXTENSIONS
+
+
+def _require_usd():
+    if Sdf is None:
+        raise RuntimeError("Saving or loading measurement sessions as USD layers requires pxr")
+
+
+class SessionGroup:
+
+    # Constructor, points is an N x 3 array, segment_paths maps the index of a segment's first point to the
+    # surface path (an M x 3 polyline) it is measured along and mesh_paths maps point indices to the prim path
+    # each was picked on
+    def __init__(self, points, segment_paths=None, mesh_paths=None):
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        self.segment_paths = dict(segment_paths or {})
+        self.mesh_paths = dict(mesh_paths or {})
+
+
+# Split the stored points back into groups, sessions without counts hold a single group
+def _split_groups(points, counts):
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    if counts is None:
+        return [points]
+    counts = np.asarray(counts, dtype=np.int64)
+    if counts.sum() != len(points):
+        raise ValueError("Measurement session group counts do not match its points")
+    return np.split(points, np.cumsum(counts)[:-1])
+
+
+# Every surface path of the groups as the index of its segment in the concatenated points, its point count and the
+# concatenated polyline points
+def _pack_paths(groups):
+    segments, counts, points = [], [], []
+    first = 0
+    for group in groups:
+        for index, path in sorted(group.segment_paths.items()):
+            path = np.asarray(path, dtype=np.float64).reshape(-1, 3)
+            segments.append(first + index)
+            counts.append(len(path))
+            points.append(path)
+        first += len(group.points)
+    return (
+        np.array(segments, dtype=np.int64),
+        np.array(counts, dtype=np.int64),
+        np.concatenate(points) if points else np.empty((0, 3), dtype=np.float64),
+    )
+
+
+# Index of every anchored point in the concatenated points and the prim path it is anchored to
+def _pack_anchors(groups):
+    indices, paths = [], []
+    first = 0
+    for group in groups:
+        for index, path in sorted(group.mesh_paths.items()):
+            indices.append(first + index)
+            paths.append(str(path))
+        first += len(group.points)
+    return np.array(indices, dtype=np.int64), np.array(paths, dtype=np.str_)
+
+
+# Group of each index into the concatenated points of groups and the index within that group
+def _locate(groups, indices):
+    starts = np.cumsum([0] + [len(group.points) for group in groups])
+    owners = np.searchsorted(starts, indices, side="right") - 1
+    return owners.tolist(), (np.asarray(indices) - starts[np.clip(owners, 0, len(groups))]).tolist()
+
+
+# Groups from the stored arrays, the optional arrays are None in sessions saved before they were stored
+def _unpack(
+    points, counts, path_segments=None, path_counts=None, path_points=None, anchor_indices=None, anchor_paths=None
+):
+    groups = [SessionGroup(points) for points in _split_groups(points, counts)]
+    if anchor_indices is not None and len(anchor_indices):
+        if len(anchor_paths) != len(anchor_indices):
+            raise ValueError("Measurement session anchors do not match their prim paths")
+        for owner, index, path in zip(*_locate(groups, np.asarray(anchor_indices, dtype=np.int64)), list(anchor_paths)):
+            if 0 <= owner < len(groups):
+                groups[owner].mesh_paths[index] = str(path)
+    if path_segments is None or not len(path_segments):
+        return groups
+    path_segments = np.asarray(path_segments, dtype=np.int64)
+    path_counts = np.asarray(path_counts, dtype=np.int64)
+    path_points = np.asarray(path_points, dtype=np.float64).reshape(-1, 3)
+    if len(path_counts) != len(path_segments) or path_counts.sum() != len(path_points):
+        raise ValueError("Measurement session surface paths do not match their points")
+
+    # Segment indices are into the concatenated points, find each path's group and its segment in the group
+    owners, segments = _locate(groups, path_segments)
+    for owner, segment, path in zip(owners, segments, np.split(path_points, np.cumsum(path_counts)[:-1])):
+        if 0 <= owner < len(groups):
+            groups[owner].segment_paths[segment] = path
+    return groups
+
+
+# Write a session to path, groups is a list of SessionGroup or of plain N x 3 point arrays.
+# The format is picked from the file extension (.npz or a USD layer).
+def save_session(path, groups):
+    groups = [group if isinstance(group, SessionGroup) else SessionGroup(group) for group in groups]
+    points = np.concatenate([group.points for group in groups]) if groups else np.empty((0, 3), dtype=np.float64)
+    counts = np.array([len(group.points) for group in groups], dtype=np.int64)
+    path_segments, path_counts, path_points = _pack_paths(groups)
+    anchor_indices, anchor_paths = _pack_anchors(groups)
+    path = str(path)
+    if _is_usd_path(path):
+        _save_layer(path, points, counts, path_segments, path_counts, path_points, anchor_indices, anchor_paths)
+    else:
+        # np.savez adds .npz to paths without it, write through a file object to keep the name as given
+        with open(path, "wb") as f:
+            np.savez_compressed(
+                f, version=np.int64(SESSION_FORMAT_VERSION), points=points, counts=counts,
+                path_segments=path_segments, path_counts=path_counts, path_points=path_points,
+                anchor_indices=anchor_indices, anchor_paths=anchor_paths,
+            )
+
+
+# Read the groups of a session written by save_session, a list of SessionGroup
+def load_session(path):
+    path = str(path)
+    if _is_usd_path(path):
+        return _load_layer(path)
+    with np.load(path) as data:
+        version = int(data["version"]) if "version" in data else SESSION_FORMAT_VERSION
+        _check_version(path, version)
+        optional = {
+            name: data[name] if name in data else None
+            for name in ("path_segments", "path_counts", "path_points", "anchor_indices", "anchor_paths")
+        }
+        return _unpack(data["points"], data["counts"] if "counts" in data else None, **optional)
+
+
+def _check_version(path, version):
+    if version > SESSION_FORMAT_VERSION:
+        raise ValueError(f"Measurement session {path} has unsupported version {version}")
+
+
+# Set a custom attribute of a prim spec, creating it when the layer does not have it yet
+def _set_attribute(prim, name, value_type, value):
+    attr = prim.attributes.get(name) or Sdf.AttributeSpec(prim, name, value_type)
+    attr.custom = True
+    attr.default = value
+
+
+def _save_layer(path, points, counts, path_segments, path_counts, path_points, anchor_indices, anchor_paths):
+    _require_usd()
+    layer = Sdf.Layer.FindOrOpen(path) if os.path.exists(path) else None
+    if layer is None:
+        layer = Sdf.Layer.CreateNew(path)
+
+    prim = layer.GetPrimAtPath(SESSION_PRIM_PATH) or Sdf.CreatePrimInLayer(layer, SESSION_PRIM_PATH)
+    prim.specifier = Sdf.SpecifierDef
+    prim.typeName = "Scope"
+
+    _set_attribute(prim, POINTS_ATTRIBUTE, Sdf.ValueTypeNames.Point3dArray, Vt.Vec3dArray.FromNumpy(points))
+    _set_attribute(prim, COUNTS_ATTRIBUTE, Sdf.ValueTypeNames.IntArray, Vt.IntArray.FromNumpy(counts.astype(np.int32)))
+    _set_attribute(prim, VERSION_ATTRIBUTE, Sdf.ValueTypeNames.Int, SESSION_FORMAT_VERSION)
+
+    # Written even when empty, so that no paths of an earlier session saved to the same layer are left behind
+    int_array = Sdf.ValueTypeNames.IntArray
+    _set_attribute(prim, PATH_SEGMENTS_ATTRIBUTE, int_array, Vt.IntArray.FromNumpy(path_segments.astype(np.int32)))
+    _set_attribute(prim, PATH_COUNTS_ATTRIBUTE, int_array, Vt.IntArray.FromNumpy(path_counts.astype(np.int32)))
+    _set_attribute(prim, PATH_POINTS_ATTRIBUTE, Sdf.ValueTypeNames.Point3dArray, Vt.Vec3dArray.FromNumpy(path_points))
+    _set_attribute(prim, ANCHOR_INDICES_ATTRIBUTE, int_array, Vt.IntArray.FromNumpy(anchor_indices.astype(np.int32)))
+    _set_attribute(prim, ANCHOR_PATHS_ATTRIBUTE, Sdf.ValueTypeNames.StringArray, Vt.StringArray(anchor_paths.tolist()))
+    layer.Save()
+
+
+def _load_layer(path):
+    _require_usd()
+    layer = Sdf.Layer.FindOrOpen(path)
+    if layer is None:
+        raise FileNotFoundError(path)
+    layer.Reload()
+    prim = layer.GetPrimAtPath(SESSION_PRIM_PATH)
+    points = _get_attribute(prim, POINTS_ATTRIBUTE)
+    if points is None:
+        return []
+    version = _get_attribute(prim, VERSION_ATTRIBUTE)
+    _check_version(path, SESSION_FORMAT_VERSION if version is None else int(version))
+    return _unpack(
+        points, _get_attribute(prim, COUNTS_ATTRIBUTE), _get_attribute(prim, PATH_SEGMENTS_ATTRIBUTE),
+        _get_attribute(prim, PATH_COUNTS_ATTRIBUTE), _get_attribute(prim, PATH_POINTS_ATTRIBUTE),
+        _get_attribute(prim, ANCHOR_INDICES_ATTRIBUTE), _get_attribute(prim, ANCHOR_PATHS_ATTRIBUTE),
+    )
+
+
+# Value of a custom attribute of a prim spec, None when the prim or the attribute is missing
+def _get_attribute(prim, name):
+    attr = prim.attributes.get(name) if prim else None
+    return attr.default if attr is not None else None
@@ -0,0 +1,137 @@
+'''
+Snaps picked points to the nearest mesh vertex or edge within a tolerance.
+Each mesh gets a SnapIndex built lazily from the vertex positions and face
+topology the raycast backend already reads, cached until its BVH is rebuilt.
+'''
+
+import threading
+
+import numpy as np
+
+from .spatial_index import UniformGrid
+
+
+# Unique undirected edges of polygon faces (triangulation diagonals are not included)
+def face_edges(face_vertex_counts, face_vertex_indices):
+    counts = np.asarray(face_vertex_counts, dtype=np.int64)
+    indices = np.asarray(face_vertex_indices, dtype=np.int64)
+    offsets = np.cumsum(counts) - counts
+    following = np.arange(len(indices)) + 1
+    following[(offsets + counts - 1)[counts > 0]] = offsets[counts > 0]
+    a = np.minimum(indices, indices[following])
+    b = np.maximum(indices, indices[following])
+
+    # Deduplicate on one packed integer key per edge after a plain sort, far faster than np.unique(axis=0)
+    stride = int(indices.max()) + 1 if len(indices) else 1
+    keys = np.sort(a * stride + b)
+    keys = keys[np.append(True, keys[1:] != keys[:-1])] if len(keys) else keys
+    return np.stack((keys // stride, keys % stride), axis=1)
+
+
+# Closest points on segments (a, b) to a single point
+def closest_points_on_segments(point, a, b):
+    ab = b - a
+    length_sq = np.einsum("ij,ij->i", ab, ab)
+    t = np.einsum("ij,ij->i", point - a, ab) / np.where(length_sq > 0.0, length_sq, 1.0)
+    return a + ab * np.clip(t, 0.0, 1.0)[:, None]
+
+
+class SnapIndex:
+
+    # Constructor, points are world space vertex positions and edges are E x 2 vertex indices
+    def __init__(self, points, edges):
+        self.points = np.asarray(points, dtype=np.float64)
+        self.edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        start = self.points[self.edges[:, 0]]
+        end = self.points[self.edges[:, 1]]
+
+        # Cells about one edge long keep vertex buckets small, edge cells are twice that so
+        # that most edges land in a single cell
+        lengths = np.linalg.norm(end - start, axis=1)
+        cell_size = float(np.median(lengths)) if len(lengths) else 1.0
+        self._vertex_grid = UniformGrid(self.points, self.points, cell_size)
+        self._edge_grid = UniformGrid(np.minimum(start, end), np.maximum(start, end), cell_size * 2.0)
+
+    # Nearest vertex within tolerance, returns (index, distance) or (-1, inf)
+    def nearest_vertex(self, point, tolerance):
+        candidates = self._vertex_grid.query_radius(point, tolerance)
+        if not len(candidates):
+            return -1, np.inf
+        distances = np.linalg.norm(self.points[candidates] - point, axis=1)
+        best = int(np.argmin(distances))
+        if distances[best] > tolerance:
+            return -1, np.inf
+        return int(candidates[best]), float(distances[best])
+
+    # Nearest point on any edge within tolerance, returns (position, distance) or (None, inf)
+    def nearest_edge_point(self, point, tolerance):
+        candidates = self._edge_grid.query_radius(point, tolerance)
+        if not len(candidates):
+            return None, np.inf
+        edges = self.edges[candidates]
+        closest = closest_points_on_segments(point, self.points[edges[:, 0]], self.points[edges[:, 1]])
+        distances = np.linalg.norm(closest - point, axis=1)
+        best = int(np.argmin(distances))
+        if distances[best] > tolerance:
+            return None, np.inf
+        return closest[best], float(distances[best])
+
+    # Snap to a vertex if one is in range, otherwise to an edge. Returns (position, "vertex" | "edge" | None).
+    def snap(self, point, tolerance):
+        point = np.asarray(point, dtype=np.float64)
+        vertex, _ = self.nearest_vertex(point, tolerance)
+        if vertex >= 0:
+            return self.points[vertex].copy(), "vertex"
+        position, _ = self.nearest_edge_point(point, tolerance)
+        if position is not None:
+            return position, "edge"
+        return point, None
+
+
+class SnapIndexCache:
+
+    # Constructor, mesh_raycast is the raycast backend that supplies mesh data and rebuild notifications
+    def __init__(self, mesh_raycast):
+        self._mr = mesh_raycast
+
+        # Built on query workers and dropped on the UI thread, an index built across an invalidation is not stored
+        self._indices = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._mr.add_rebuild_callback(self.invalidate)
+
+    # Snap index for a mesh path, built on first use
+    def get(self, mesh_path):
+        mesh_path = str(mesh_path)
+        with self._lock:
+            if mesh_path in self._indices:
+                return self._indices[mesh_path]
+            generation = self._generation
+        data = self._mr.get_mesh_data(mesh_path)
+        index = None
+        if data is not None:
+            index = SnapIndex(data.world_points, face_edges(data.face_vertex_counts, data.face_vertex_indices))
+        with self._lock:
+            if generation == self._generation:
+                self._indices[mesh_path] = index
+        return index
+
+    # Snap a world space point on a mesh, returns (position, kind) with kind None when nothing is in range
+    def snap(self, mesh_path, point, tolerance):
+        index = self.get(mesh_path)
+        if index is None:
+            return np.asarray(point, dtype=np.float64), None
+        return index.snap(point, tolerance)
+
+    # Drop the indices of the given mesh paths, or every index when paths is None
+    def invalidate(self, paths=None):
+        with self._lock:
+            self._generation += 1
+            if paths is None:
+                self._indices.clear()
+                return
+            for path in paths:
+                self._indices.pop(str(path), None)
+
+    def clear(self):
+        self.invalidate()
@@ -0,0 +1,171 @@
+'''
+Uniform grid over axis aligned boxes, used for nearest vertex and edge lookups.
+Items are bucketed by every cell their box touches and the buckets are stored
+as one sorted key array, so building and querying are both vectorized. Items
+whose box touches more than MAX_ITEM_CELLS cells go to a coarser grid of their
+own, which does the same in turn, so one long item among many short ones costs
+a few cells instead of filling the grid.
+'''
+
+import numpy as np
+
+from .bvh import expand_ranges
+
+# Upper bound on cells per axis, keeps linear cell keys well inside int64
+MAX_CELLS_PER_AXIS = 1 << 20
+
+# Cells one item may be bucketed in, larger items go to the coarser grid
+MAX_ITEM_CELLS = 64
+
+# Cell size of each coarser grid, in cells of the grid below it
+COARSE_CELLS = 4
+
+
+class UniformGrid:
+
+    # Constructor, box_min and box_max are N x 3 item bounds (equal for points)
+    def __init__(self, box_min, box_max, cell_size):
+        box_min = np.asarray(box_min, dtype=np.float64).reshape(-1, 3)
+        box_max = np.asarray(box_max, dtype=np.float64).reshape(-1, 3)
+        self.item_count = len(box_min)
+        self._keys = np.empty(0, dtype=np.int64)
+        self._starts = np.zeros(1, dtype=np.int64)
+        self._items = np.empty(0, dtype=np.int64)
+
+        # Coarser grid of the items too large for this one, with their ids in this grid
+        self._coarse = None
+        self._coarse_items = np.empty(0, dtype=np.int64)
+        if not self.item_count:
+            self._origin = np.zeros(3)
+            self._dims = np.ones(3, dtype=np.int64)
+            self.cell_size = 1.0
+            return
+
+        self._origin = box_min.min(axis=0)
+        extent = box_max.max(axis=0) - self._origin
+        self.cell_size = max(float(cell_size), float(extent.max()) / MAX_CELLS_PER_AXIS, 1e-12)
+        self._dims = np.floor(extent / self.cell_size).astype(np.int64) + 1
+
+        # One (cell key, item) entry per cell touched by each item's box.
+        # Most items sit in a single cell, only the rest pay for the range expansion.
+        lo = self._cells(box_min)
+        hi = self._cells(box_max)
+        span = hi - lo + 1
+        large = span.prod(axis=1) > MAX_ITEM_CELLS
+        if large.any():
+            self._coarse_items = np.flatnonzero(large)
+            self._coarse = UniformGrid(box_min[large], box_max[large], self.cell_size * COARSE_CELLS)
+            span[large] = 0
+        single = (span == 1).all(axis=1)
+        keys = [self._keys_of(lo[single])]
+        owners = [np.flatnonzero(single)]
+
+        multi = np.flatnonzero(~single & ~large)
+        if len(multi):
+            span = span[multi]
+            entries, owner = expand_ranges(np.zeros(len(multi), dtype=np.int64), span.prod(axis=1))
+            span = span[owner]
+            offset = np.stack(
+                (entries % span[:, 0], (entries // span[:, 0]) % span[:, 1], entries // (span[:, 0] * span[:, 1])),
+                axis=1,
+            )
+            keys.append(self._keys_of(lo[multi][owner] + offset))
+            owners.append(multi[owner])
+        keys = np.concatenate(keys)
+        owner = np.concatenate(owners)
+
+        if not len(keys):
+            return
+        sort = np.argsort(keys)
+        keys = keys[sort]
+        self._items = owner[sort]
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        self._keys = keys[first]
+        self._starts = np.append(np.flatnonzero(first), len(keys))
+
+    def _cells(self, points):
+        cells = np.floor((points - self._origin) / self.cell_size).astype(np.int64)
+        return np.clip(cells, 0, self._dims - 1)
+
+    def _keys_of(self, cells):
+        return cells[..., 0] + self._dims[0] * (cells[..., 1] + self._dims[1] * cells[..., 2])
+
+    # Ids of every item in a cell overlapping the query box, each id at most once
+    def query_box(self, box_min, box_max):
+        box_min = np.asarray(box_min, dtype=np.float64)
+        box_max = np.asarray(box_max, dtype=np.float64)
+        items = self._query_cells(box_min, box_max)
+        if self._coarse is not None:
+            items = np.union1d(items, self._coarse_items[self._coarse.query_box(box_min, box_max)])
+        return items
+
+    # Ids of the items bucketed in this grid's cells overlapping the query box
+    def _query_cells(self, box_min, box_max):
+        if not len(self._keys):
+            return np.empty(0, dtype=np.int64)
+        if (box_max < self._origin).any() or (box_min > self._origin + self._dims * self.cell_size).any():
+            return np.empty(0, dtype=np.int64)
+
+        lo = self._cells(box_min)
+        hi = self._cells(box_max)
+        if (hi - lo + 1).prod() > len(self._keys):
+            # The box covers more cells than are occupied, filter the occupied cells instead
+            plane = self._dims[0] * self._dims[1]
+            cells = np.stack(
+                (self._keys % self._dims[0], (self._keys // self._dims[0]) % self._dims[1], self._keys // plane), axis=1
+            )
+            slots = np.flatnonzero(((cells >= lo) & (cells <= hi)).all(axis=1))
+        else:
+            axes = [np.arange(lo[axis], hi[axis] + 1) for axis in range(3)]
+            keys = self._keys_of(np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, 3))
+            slots = np.searchsorted(self._keys, keys)
+            valid = slots < len(self._keys)
+            slots = slots[valid][self._keys[slots[valid]] == keys[valid]]
+        if not len(slots):
+            return np.empty(0, dtype=np.int64)
+        entries, _ = expand_ranges(self._starts[slots], self._starts[slots + 1] - self._starts[slots])
+        return np.unique(self._items[entries])
+
+    # Ids of every item in a cell within radius of a point
+    def query_radius(self, center, radius):
+        center = np.asarray(center, dtype=np.float64)
+        return self.query_box(center - radius, center + radius)
+
+    # Items in every cell overlapping each of a batch of query boxes, as (item ids, index of the box each belongs
+    # to). Items whose box lies outside all of those cells lie outside the query box. Boxes overlapping more than
+    # max_cells cells of this grid are skipped, the mask of boxes that were queried is returned with the items.
+    # The coarser grids are searched for every queried box, their cells are larger so it touches few of them.
+    def query_boxes(self, box_min, box_max, max_cells=8):
+        box_min = np.asarray(box_min, dtype=np.float64).reshape(-1, 3)
+        box_max = np.asarray(box_max, dtype=np.float64).reshape(-1, 3)
+        lo = self._cells(box_min)
+        hi = self._cells(box_max)
+        span = hi - lo + 1
+        queried = span.prod(axis=1) <= max_cells
+        boxes = np.flatnonzero(queried)
+        items, owner = self._query_boxes_cells(lo[boxes], span[boxes], boxes)
+        if self._coarse is not None and len(boxes):
+            coarse, coarse_owner, _ = self._coarse.query_boxes(box_min[boxes], box_max[boxes], np.inf)
+            items = np.concatenate((items, self._coarse_items[coarse]))
+            owner = np.concatenate((owner, boxes[coarse_owner]))
+        return items, owner, queried
+
+    # Items bucketed in this grid's cells overlapping the boxes starting at cells lo and spanning span cells, with
+    # the box ids each belongs to
+    def _query_boxes_cells(self, lo, span, boxes):
+        if not len(self._keys) or not len(boxes):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        # One key per cell of each box, decoded from a running index like the cells of items in the constructor
+        entries, owner = expand_ranges(np.zeros(len(boxes), dtype=np.int64), span.prod(axis=1))
+        span = span[owner]
+        offset = np.stack(
+            (entries % span[:, 0], (entries // span[:, 0]) % span[:, 1], entries // (span[:, 0] * span[:, 1])), axis=1
+        )
+        keys = self._keys_of(lo[owner] + offset)
+        slots = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        found = self._keys[slots] == keys
+        slots, owner = slots[found], owner[found]
+        entries, cell = expand_ranges(self._starts[slots], self._starts[slots + 1] - self._starts[slots])
+        return self._items[entries], boxes[owner[cell]]
@@ -0,0 +1,190 @@
+'''
+Follows USD change notices so the raycast backends can keep their acceleration
+data current without refreshing the whole stage in the background.
+Usd.Notice.ObjectsChanged notices are reduced to the meshes whose points or
+topology changed, the prims whose transform changed and the subtrees that were
+resynced (prims added, removed or recomposed). Changes accumulate between
+queries and are taken as one batch, then resolved to the mesh paths that
+actually need their data rebuilt.
+'''
+
+import threading
+import time
+
+from pxr import Tf, Usd, UsdGeom
+
+# Mesh attributes the acceleration data is built from, edits to any other attribute leave it valid
+GEOMETRY_ATTRIBUTES = frozenset(("points", "faceVertexCounts", "faceVertexIndices"))
+
+# Refresh modes, "events" rebuilds the meshes named by change notices, "fast" rebuilds the whole scene on any change
+REFRESH_EVENTS = "events"
+REFRESH_FAST = "fast"
+
+
+class StageChanges:
+
+    # Constructor, every set holds prim path strings
+    def __init__(self):
+        self.resynced = set()
+        self.geometry = set()
+        self.transforms = set()
+
+    def __bool__(self):
+        return bool(self.resynced or self.geometry or self.transforms)
+
+
+class StageListener:
+
+    # Constructor, listens to stage when one is given. Edits to attributes other than the transform and
+    # geometry_attributes are ignored.
+    def __init__(self, stage=None, geometry_attributes=GEOMETRY_ATTRIBUTES):
+        self._stage = None
+        self._geometry_attributes = geometry_attributes
+        self._key = None
+        self._lock = threading.Lock()
+        self._changes = StageChanges()
+
+        # Number of ObjectsChanged notices received, including ones that touched nothing relevant
+        self.notices = 0
+        self.set_stage(stage)
+
+    def get_stage(self):
+        return self._stage
+
+    # Listen to a different stage, changes collected for the previous one are dropped
+    def set_stage(self, stage):
+        if stage == self._stage and (stage is None or self._key is not None):
+            return
+        self.revoke()
+        self._stage = stage
+        if stage is not None:
+            self._key = Tf.Notice.Register(Usd.Notice.ObjectsChanged, self._on_objects_changed, stage)
+
+    def revoke(self):
+        if self._key is not None:
+            self._key.Revoke()
+            self._key = None
+        self._stage = None
+        self.take()
+
+    # Called by USD on the thread that edited the stage
+    def _on_objects_changed(self, notice, stage):
+        resynced = notice.GetResyncedPaths()
+        changed = notice.GetChangedInfoOnlyPaths()
+        with self._lock:
+            self.notices += 1
+            for path in resynced:
+                if path.IsPropertyPath():
+                    self._add_property(path)
+                else:
+                    self._changes.resynced.add(path.pathString)
+            for path in changed:
+                if path.IsPropertyPath():
+                    self._add_property(path)
+
+    def _add_property(self, path):
+        name = path.name
+        if name in self._geometry_attributes:
+            self._changes.geometry.add(path.GetPrimPath().pathString)
+        elif UsdGeom.Xformable.IsTransformationAffectedByAttrNamed(name):
+            self._changes.transforms.add(path.GetPrimPath().pathString)
+
+    def has_changes(self):
+        return bool(self._changes)
+
+    # Changes collected since the last call, the listener starts a new batch
+    def take(self):
+        with self._lock:
+            changes = self._changes
+            self._changes = StageChanges()
+        return changes
+
+
+# Drop paths that lie inside another path of the set
+def _subtree_roots(paths):
+    roots = []
+    for path in sorted(paths):
+        if not roots or not (path == roots[-1] or path.startswith(roots[-1].rstrip("/") + "/")):
+            roots.append(path)
+    return roots
+
+
+# Mesh paths from mesh_paths that are path itself or lie under it, for each of roots
+def paths_under(mesh_paths, roots):
+    roots = _subtree_roots(roots)
+    if not roots:
+        return []
+    if "/" in roots:
+        return list(mesh_paths)
+    exact = set(roots)
+    prefixes = tuple(root + "/" for root in roots)
+    return [path for path in mesh_paths if path in exact or path.startswith(prefixes)]
+
+
+# Mesh paths whose acceleration data a batch of changes invalidates: the meshes with edited geometry and every
+# mesh under a resynced prim or a prim whose transform changed. Returns (dirty paths, resynced subtree roots).
+def resolve_changes(changes, mesh_paths):
+    known = set(mesh_paths)
+    dirty = set(path for path in changes.geometry if path in known)
+    dirty.update(paths_under(mesh_paths, changes.resynced | changes.transforms))
+    return dirty, _subtree_roots(changes.resynced)
+
+
+# Mesh paths after the subtrees under resynced roots were recomposed: meshes under them are dropped, then
+# found again under each root that still exists. Only meshes under scene_root and passing filter_fn are listed.
+def relist_mesh_paths(cache, mesh_paths, resynced, scene_root=None, filter_fn=None):
+    removed = set(paths_under(mesh_paths, resynced))
+    paths = [path for path in mesh_paths if path not in removed]
+    if isinstance(scene_root, Usd.Prim):
+        scene_root = scene_root.GetPath().pathString
+    scene_root = str(scene_root) if scene_root else "/"
+    stage = cache.get_stage()
+    for root in _subtree_roots(resynced):
+        # Search the part of the resynced subtree that lies inside the scene
+        if paths_under([root], [scene_root]):
+            scope = root
+        elif paths_under([scene_root], [root]):
+            scope = scene_root
+        else:
+            continue
+        prim = stage.GetPrimAtPath(scope) if stage is not None else None
+        if prim and prim.IsValid():
+            paths.extend(cache.find_mesh_paths(prim, filter_fn))
+    return paths
+
+
+class RebuildStats:
+
+    # Constructor, mode is the refresh mode the backend runs in
+    def __init__(self, mode):
+        self.mode = mode
+        self.full_rebuilds = 0
+        self.partial_rebuilds = 0
+        self.meshes_rebuilt = 0
+        self.engine_rebuilds = 0
+        self.rebuild_time = 0.0
+        self.last_rebuild_time = 0.0
+
+    # Record one rebuild of mesh_count meshes that started at start (a perf_counter value)
+    def add(self, full, mesh_count, start):
+        elapsed = time.perf_counter() - start
+        if full:
+            self.full_rebuilds += 1
+        else:
+            self.partial_rebuilds += 1
+        self.meshes_rebuilt += mesh_count
+        self.rebuild_time += elapsed
+        self.last_rebuild_time = elapsed
+        return elapsed
+
+    def as_dict(self, listener=None):
+        return {
+            "mode": self.mode,
+            "notices": listener.notices if listener is not None else 0,
+            "full_rebuilds": self.full_rebuilds,
+            "partial_rebuilds": self.partial_rebuilds,
+            "meshes_rebuilt": self.meshes_rebuilt,
+            "engine_rebuilds": self.engine_rebuilds,
+            "rebuild_ms": self.rebuild_time * 1000.0,
+            "last_rebuild_ms": self.last_rebuild_time * 1000.0,
+        }
@@ -0,0 +1,231 @@
+'''
+Distances between measurement points over a range of time codes. Every point
+anchored to a prim is moved by the prim's local to world transform at each time
+code, read through one UsdGeom.XformCache that is moved from time code to time
+code so the prims of all points share the ancestors it caches. Prims whose
+transform and ancestors' transforms are not animated are read once. The points
+and segment distances of all time codes are then computed in vectorized passes
+over time. Only the transforms are read from the stage, on the main thread,
+the points and distances are then computed on any thread. Tracks are cached per
+point set and range until a transform on the stage changes.
+'''
+
+import threading
+
+import numpy as np
+from pxr import Usd, UsdGeom
+
+from .stage_listener import StageListener
+
+
+class MeasurementTrack:
+
+    # Constructor, times are the T time codes, points the T x N x 3 world positions of the N measured points and
+    # distances the T x (N - 1) lengths of their segments
+    def __init__(self, times, points, distances):
+        self.times = times
+        self.points = points
+        self.distances = distances
+
+    @property
+    def segment_count(self):
+        return self.distances.shape[1]
+
+    # Per segment shortest and longest distance over the range
+    @property
+    def minimum(self):
+        return self.distances.min(axis=0)
+
+    @property
+    def maximum(self):
+        return self.distances.max(axis=0)
+
+    # Per segment time code of closest approach, the first one when the minimum is reached more than once
+    @property
+    def closest_time(self):
+        return self.times[np.argmin(self.distances, axis=0)]
+
+    # The two points of each segment at its closest approach, (N - 1) x 2 x 3
+    def closest_points(self):
+        frames = np.argmin(self.distances, axis=0)
+        segments = np.arange(self.segment_count)
+        return np.stack((self.points[frames, segments], self.points[frames, segments + 1]), axis=1)
+
+    # Write the track as .csv (a time column, one distance column per segment and the summary in # comment lines)
+    # or .npz (every array, with the summary)
+    def save(self, path):
+        path = str(path)
+        if path.lower().endswith(".npz"):
+            np.savez_compressed(
+                path, times=self.times, points=self.points, distances=self.distances,
+                minimum=self.minimum, maximum=self.maximum, closest_time=self.closest_time,
+            )
+            return
+        summary = [
+            f"segment {k}: min {low:.6g} at time {at:g}, max {high:.6g}"
+            for k, (low, high, at) in enumerate(
+                zip(self.minimum.tolist(), self.maximum.tolist(), self.closest_time.tolist())
+            )
+        ]
+        header = "\n".join(summary + [",".join(["time"] + [f"segment_{k}" for k in range(self.segment_count)])])
+        np.savetxt(path, np.column_stack((self.times, self.distances)), delimiter=",", header=header, fmt="%.9g")
+
+
+# Whether the local to world transform of a prim may change over time
+def _time_varying(prim):
+    while prim and not prim.IsPseudoRoot():
+        if prim.IsA(UsdGeom.Xformable) and UsdGeom.Xformable(prim).TransformMightBeTimeVarying():
+            return True
+        prim = prim.GetParent()
+    return False
+
+
+# Time codes from start to end in steps of step, only start when end comes before it
+def track_times(start, end, step=1.0):
+    step = abs(float(step)) or 1.0
+    if end < start:
+        return np.array([float(start)])
+    return np.arange(float(start), float(end) + step * 0.5, step)
+
+
+# Local to world transforms of prims at every time code, reads the stage so it runs on the main thread. Returns a
+# read-only T x 4 x 4 array per prim path found on the stage, 1 x 4 x 4 for prims that are not animated.
+def read_transforms(stage, prim_paths, times):
+    times = np.asarray(times, dtype=np.float64).reshape(-1)
+    prims = [stage.GetPrimAtPath(str(path)) for path in prim_paths]
+    prims = {str(path): prim for path, prim in zip(prim_paths, prims) if prim}
+    if not prims or not len(times):
+        return {}
+
+    varying = [path for path, prim in prims.items() if _time_varying(prim)]
+    matrices = {}
+    cache = UsdGeom.XformCache(Usd.TimeCode(times[0]))
+    for path, prim in prims.items():
+        matrices[path] = np.array(cache.GetLocalToWorldTransform(prim), dtype=np.float64)[None]
+    if varying and len(times) > 1:
+        animated = np.empty((len(varying), len(times), 4, 4))
+        for t, time in enumerate(times.tolist()):
+            cache.SetTime(Usd.TimeCode(time))
+            for k, path in enumerate(varying):
+                animated[k, t] = cache.GetLocalToWorldTransform(prims[path])
+        for k, path in enumerate(varying):
+            matrices[path] = animated[k]
+    for matrix in matrices.values():
+        matrix.setflags(write=False)
+    return matrices
+
+
+# World positions of points over time, T x N x 3, from the transforms of read_transforms. Each point is
+# (prim_path, local_position) when it is anchored to a prim and (None, world_position) otherwise. Points of prims
+# without a transform stay at their local position.
+def place_points(points, times, transforms):
+    times = np.asarray(times, dtype=np.float64).reshape(-1)
+    positions = np.array([position for _, position in points], dtype=np.float64).reshape(-1, 3)
+    world = np.broadcast_to(positions, (len(times),) + positions.shape).copy()
+    if not len(times):
+        return world
+
+    # Points of one prim at once, local (K x 3) times each time code's matrix gives T x K x 3
+    by_prim = {}
+    for index, (path, _) in enumerate(points):
+        if path in transforms:
+            by_prim.setdefault(path, []).append(index)
+    for path, indices in by_prim.items():
+        matrix = transforms[path]
+        world[:, indices] = positions[indices] @ matrix[:, :3, :3] + matrix[:, None, 3, :3]
+    return world
+
+
+# Prim paths points are anchored to
+def anchor_paths(points):
+    return sorted(set(path for path, _ in points if path is not None))
+
+
+# World positions of points over time, T x N x 3, see place_points. Reads the stage, so it runs on the main thread.
+def evaluate_points(stage, points, times):
+    return place_points(points, times, read_transforms(stage, anchor_paths(points), times))
+
+
+# What a track needs from the stage, read on the main thread, see TrackCache.snapshot
+class TrackSnapshot:
+
+    def __init__(self, key, times, transforms, generation):
+        self.key = key
+        self.times = times
+        self.transforms = transforms
+        self.generation = generation
+
+
+class TrackCache:
+
+    # Constructor, follows the transform edits of stage
+    def __init__(self, stage=None):
+        self._stage = None
+        self._listener = StageListener(geometry_attributes=frozenset())
+        self._tracks = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.set_stage(stage)
+
+    def get_stage(self):
+        return self._stage
+
+    def set_stage(self, stage):
+        if stage == self._stage:
+            return
+        self._stage = stage
+        self._listener.set_stage(stage)
+        self.invalidate()
+
+    # Drop every track when a transform changed or prims were added or removed since the last call, called on the
+    # main thread. Returns whether tracks were dropped.
+    def update(self):
+        if not self._listener.has_changes():
+            return False
+        self._listener.take()
+        self.invalidate()
+        return True
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._tracks.clear()
+
+    @staticmethod
+    def _key(points, start, end, step):
+        points = tuple(
+            (path, tuple(np.asarray(position, dtype=np.float64).reshape(3).tolist())) for path, position in points
+        )
+        return points, float(start), float(end), float(step)
+
+    # Cached track of points (see place_points) from time code start to end in steps of step, None until computed
+    def peek(self, points, start, end, step=1.0):
+        with self._lock:
+            return self._tracks.get(self._key(points, start, end, step))
+
+    # Read the transforms of the prims the points are anchored to at every time code, called on the main thread.
+    # compute() turns the snapshot into the track on any thread.
+    def snapshot(self, points, start, end, step=1.0):
+        key = self._key(points, start, end, step)
+        times = track_times(start, end, step)
+        with self._lock:
+            generation = self._generation
+        transforms = read_transforms(self._stage, anchor_paths(key[0]), times) if self._stage is not None else {}
+        return TrackSnapshot(key, times, transforms, generation)
+
+    # Track of a snapshot, cached unless a transform changed since it was read
+    def compute(self, snapshot):
+        world = place_points(snapshot.key[0], snapshot.times, snapshot.transforms)
+        distances = np.sqrt(((world[:, 1:] - world[:, :-1]) ** 2).sum(axis=2))
+        track = MeasurementTrack(snapshot.times, world, distances)
+        with self._lock:
+            if snapshot.generation == self._generation:
+                self._tracks[snapshot.key] = track
+        return track
+
+    # Cached or computed track on the calling thread, which has to be the main thread
+    def get(self, points, start, end, step=1.0):
+        track = self.peek(points, start, end, step)
+        if track is None:
+            track = self.compute(self.snapshot(points, start, end, step))
+        return track
@@ -0,0 +1,165 @@
+'''
+Caches the camera and viewport transforms used to turn mouse positions into rays.
+The inverted camera matrices and the viewport rectangle are only recomputed when
+the camera model or the window geometry actually changes, and every conversion
+works on whole arrays of positions at once.
+'''
+
+import numpy as np
+import carb
+
+# Window title of Omniverse View, which has no dock splitter around the viewport
+VIEW_WINDOW_TITLE = "Omniverse View"
+
+
+class CameraTransform:
+
+    # Constructor, view and projection are the flat row-major camera matrices of the scene view
+    def __init__(self, view, projection):
+        self.view = np.array(view, dtype=np.float64).reshape(4, 4)
+        self.projection = np.array(projection, dtype=np.float64).reshape(4, 4)
+        self.inv_view = np.linalg.inv(self.view)
+        self.inv_projection = np.linalg.inv(self.projection)
+
+        # Camera position and forward axis in world space (row-vector matrices, forward is -Z)
+        self.position = self.inv_view[3, :3].copy()
+        self.forward = -self.inv_view[2, :3]
+        self.perspective = self.projection[2, 3] != 0.0
+
+        # Clip to world transform, applied to every unprojected position in one product
+        self.clip_to_world = self.inv_projection @ self.inv_view
+        self.view_projection = self.view @ self.projection
+
+    # Depth of world space points along the camera's forward axis
+    def depth(self, points):
+        return (np.asarray(points, dtype=np.float64).reshape(-1, 3) - self.position) @ self.forward
+
+
+class ViewportGeometry:
+
+    # Constructor, width and height are the window's, rect is its viewport texture rect
+    def __init__(self, width, height, tab_bar_visible, rect, dock_splitter_size):
+        # In kit, there may be a tab bar
+        tab_bar_height = 22 if tab_bar_visible else 0
+
+        # Remove dock splitter and tab bar from viewport window size
+        self.width = width - dock_splitter_size * 2
+        self.height = height - dock_splitter_size * 2 - tab_bar_height
+
+        # Height of the viewport texture in pixels
+        self.texture_height = max(float(rect[3] - rect[1]), 1.0)
+
+        # Fit the viewport texture into the window, keeping its aspect ratio
+        rect_w = float(rect[2] - rect[0])
+        rect_h = float(rect[3] - rect[1])
+        if rect_w / rect_h > self.width / self.height:
+            rect_h = rect_h / rect_w * self.width
+            h_diff = (self.height - rect_h) * 0.5
+            rect = [0, h_diff, self.width, self.height - h_diff]
+        else:
+            rect_w = rect_w / rect_h * self.height + dock_splitter_size * 2
+            w_diff = (self.width - rect_w) * 0.5
+            rect = [w_diff, 0, self.width - w_diff, self.height]
+        self.rect = np.array(rect, dtype=np.float64)
+
+    # Normalized window coordinates (N x 2, 0 to 1) to viewport NDC (-1 to 1, y up), NaN outside the viewport
+    def to_ndc(self, coords):
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        inside = ((coords >= 0.0) & (coords <= 1.0)).all(axis=1)
+
+        # Relative x,y position based on screen size, then the position inside the viewport rectangle
+        xy = coords * (self.width, self.height)
+        lo = self.rect[:2]
+        hi = self.rect[2:]
+        inside &= ((xy >= lo) & (xy <= hi)).all(axis=1)
+        ndc = (xy - lo) / (hi - lo) * 2.0 - 1.0
+        ndc[:, 1] = -ndc[:, 1]
+        ndc[~inside] = np.nan
+        return ndc
+
+
+class ViewTransformCache:
+
+    # Constructor, get_camera_model returns the scene view's camera model and viewport_window is the legacy viewport
+    # window
+    def __init__(self, get_camera_model, viewport_window):
+        self._get_camera_model = get_camera_model
+        self._viewport_window = viewport_window
+        self._camera_key = None
+        self._camera = None
+        self._viewport_key = None
+        self._viewport = None
+        self._dock_splitter_size = None
+
+        # Number of times each transform was recomputed, for checking that the cache holds
+        self.camera_updates = 0
+        self.viewport_updates = 0
+
+    # Camera matrices, recomputed only when the camera model's view or projection changed
+    def camera(self):
+        model = self._get_camera_model()
+        view = model.view
+        projection = model.projection
+        key = (id(model), tuple(view), tuple(projection))
+        if key != self._camera_key:
+            self._camera = CameraTransform(view, projection)
+            self._camera_key = key
+            self.camera_updates += 1
+        return self._camera
+
+    # Viewport rectangle, recomputed only when the window is resized or its tab bar or texture rect changes
+    def viewport(self):
+        window = self._viewport_window
+        if not window:
+            return None
+        rect = tuple(window.get_viewport_rect())
+        key = (window.width, window.height, window.dock_tab_bar_visible, rect)
+        if key != self._viewport_key:
+            if self._dock_splitter_size is None:
+                # Dock splitter is different between kit and view
+                window_title = carb.settings.get_settings().get("/app/window/title")
+                self._dock_splitter_size = 0 if window_title == VIEW_WINDOW_TITLE else 4
+            self._viewport = ViewportGeometry(
+                window.width, window.height, window.dock_tab_bar_visible, rect, self._dock_splitter_size
+            )
+            self._viewport_key = key
+            self.viewport_updates += 1
+        return self._viewport
+
+    # Viewport NDC for normalized window coordinates, NaN rows for positions outside the viewport
+    def to_ndc(self, coords):
+        viewport = self.viewport()
+        if viewport is None:
+            return np.full((len(np.asarray(coords).reshape(-1, 2)), 2), np.nan)
+        return viewport.to_ndc(coords)
+
+    # Rays for many viewport NDC positions (N x 2) at once, returns N x 3 origins and directions.
+    # Matches the single click unprojection: positions are scaled by the camera's z before unprojecting
+    # and every ray is cast along the camera's forward axis.
+    def screen_to_rays(self, points):
+        camera = self.camera()
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        homogeneous = np.ones((len(points), 4))
+        homogeneous[:, :2] = points * camera.position[2]
+        origins = (homogeneous @ camera.clip_to_world)[:, :3] + camera.position
+        dirs = np.broadcast_to(camera.forward, origins.shape).copy()
+        return origins, dirs
+
+    # Size of one viewport pixel in world units at the depth of each world space point
+    def world_units_per_pixel(self, points):
+        return self.pixel_size_function()(points)
+
+    # world_units_per_pixel bound to the current camera and viewport, safe to call later from a worker thread
+    def pixel_size_function(self):
+        camera = self.camera()
+        viewport = self.viewport()
+        height = viewport.texture_height if viewport is not None else 1.0
+        return lambda points: world_units_per_pixel(camera, height, points)
+
+
+# Size of one pixel of a viewport texture_height pixels high, in world units at the depth of each world space point
+def world_units_per_pixel(camera, texture_height, points):
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    depth = np.abs(camera.depth(points)) if camera.perspective else np.ones(len(points))
+    return 2.0 * depth / (abs(camera.projection[1, 1]) * texture_height)
+
@@ -83,6 +83,9 @@ class ViewportScene:
         self.destroy()
 
     def destroy(self):
+        if self._manipulator:
+            self._manipulator.destroy()
+            self._manipulator = None
         if self._scene_view:
             # Empty the SceneView of any elements it may have
             self._scene_view.scene.clear()
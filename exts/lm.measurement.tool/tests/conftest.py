@@ -0,0 +1,14 @@
+'''
+Registers the local fakes of the Kit modules before any test imports
+lm.measurement.tool, so the tests run outside Kit with numpy and usd-core.
+'''
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import fakes  # noqa: E402
+from pxr import Usd  # noqa: E402
+
+fakes.install(Usd.Stage.CreateInMemory())
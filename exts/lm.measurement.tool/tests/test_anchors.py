@@ -0,0 +1,80 @@
+'''
+PointAnchors: moving a prim only moves the points anchored at or under it,
+to where its new transform puts them, and segments moved by one prim carry that
+prim's change of transform.
+'''
+
+import numpy as np
+from pxr import Gf, Usd, UsdGeom
+
+from lm.measurement.tool.anchors import PointAnchors
+
+
+def make_stage():
+    stage = Usd.Stage.CreateInMemory()
+    for path in ("/World", "/World/A", "/World/A/Part", "/World/A10", "/World/B"):
+        UsdGeom.Xform.Define(stage, path)
+    return stage
+
+
+def translate(stage, path, offset):
+    UsdGeom.Xformable(stage.GetPrimAtPath(path)).AddTranslateOp().Set(Gf.Vec3d(*offset))
+
+
+def test_only_points_under_the_moved_prim_move():
+    stage = make_stage()
+    anchors = PointAnchors(stage)
+    anchors.add(1, 0, "/World/A", (1.0, 0.0, 0.0))
+    anchors.add(1, 1, "/World/A", (2.0, 0.0, 0.0))
+    anchors.add(1, 2, "/World/B", (3.0, 0.0, 0.0))
+    anchors.add(2, 0, "/World/A/Part", (0.0, 1.0, 0.0))
+    anchors.add(2, 1, "/World/A10", (0.0, 2.0, 0.0))
+    assert anchors.update() == [] and len(anchors) == 5
+    assert anchors.get_prim(2, 0) == "/World/A/Part"
+
+    translate(stage, "/World/A", (0.0, 0.0, 5.0))
+    moves = {move.group_id: move for move in anchors.update()}
+    assert set(moves) == {1, 2}
+    assert moves[1].indices.tolist() == [0, 1]
+    assert np.allclose(moves[1].positions, [(1.0, 0.0, 5.0), (2.0, 0.0, 5.0)])
+    assert moves[2].indices.tolist() == [0]
+    assert np.allclose(moves[2].positions, [(0.0, 1.0, 5.0)])
+
+    # Both points of segment 0 moved with /World/A, its transform is the translation
+    assert list(moves[1].segment_transforms) == [0]
+    assert np.allclose(moves[1].segment_transforms[0], np.array(Gf.Matrix4d().SetTranslate(Gf.Vec3d(0.0, 0.0, 5.0))))
+    assert moves[2].segment_transforms == {}
+    assert anchors.update() == []
+
+
+def test_points_follow_rotations_in_local_space():
+    stage = make_stage()
+    anchors = PointAnchors(stage)
+    translate(stage, "/World/B", (10.0, 0.0, 0.0))
+    anchors.update()
+    anchors.add(7, 0, "/World/B", (11.0, 0.0, 0.0))
+    anchors.update()
+    assert np.allclose(anchors.get_anchor(7, 0)[1], (1.0, 0.0, 0.0))
+
+    UsdGeom.Xformable(stage.GetPrimAtPath("/World/B")).AddRotateZOp().Set(90.0)
+    (move,) = anchors.update()
+    assert np.allclose(move.positions, [(10.0, 1.0, 0.0)])
+
+
+def test_removed_points_and_prims():
+    stage = make_stage()
+    anchors = PointAnchors(stage)
+    for index in range(3):
+        anchors.add(1, index, "/World/A", (float(index), 0.0, 0.0))
+    anchors.update()
+    anchors.remove(1, first=1)
+    assert len(anchors) == 1 and anchors.get_prim(1, 1) is None
+
+    translate(stage, "/World/A", (0.0, 3.0, 0.0))
+    (move,) = anchors.update()
+    assert move.indices.tolist() == [0]
+
+    # A prim that is gone leaves its points where they are
+    stage.RemovePrim("/World/A")
+    assert anchors.update() == []
+    assert anchors.get_prim(1, 0) == "/World/A"
@@ -0,0 +1,78 @@
+'''
+Area, volume and closedness of meshes with known answers.
+'''
+
+import numpy as np
+import pytest
+import scenes
+from lm.measurement.tool.area_volume import AreaVolumeCache, area_volume, is_closed
+from lm.measurement.tool.mesh_data import MeshData, triangulate
+
+CUBE_POINTS = np.array([[x, y, z] for z in (0.0, 2.0) for y in (0.0, 2.0) for x in (0.0, 2.0)])
+CUBE_FACES = [0, 2, 3, 1, 4, 5, 7, 6, 0, 1, 5, 4, 2, 6, 7, 3, 0, 4, 6, 2, 1, 3, 7, 5]
+
+
+def cube_triangles():
+    return triangulate(np.full(6, 4), CUBE_FACES)[0]
+
+
+# Cylinder side without caps, its area vectors sum to zero although it encloses nothing
+def tube(segments=32):
+    angles = np.linspace(0.0, 2.0 * np.pi, segments, endpoint=False)
+    ring = np.stack((np.cos(angles), np.sin(angles)), axis=1)
+    points = np.vstack((np.column_stack((ring, np.zeros(segments))), np.column_stack((ring, np.ones(segments)))))
+    j = np.arange(segments)
+    following = (j + 1) % segments
+    quads = np.stack((j, following, following + segments, j + segments), axis=1)
+    return points, triangulate(np.full(segments, 4), quads.ravel())[0]
+
+
+def test_cube():
+    triangles = cube_triangles()
+    area, volume, vector = area_volume(CUBE_POINTS, triangles)
+    assert area == pytest.approx(24.0)
+    assert abs(volume) == pytest.approx(8.0)
+    assert np.allclose(vector, 0.0)
+    assert is_closed(triangles, len(CUBE_POINTS))
+
+
+def test_sphere_approaches_the_exact_values():
+    sphere = scenes.make_sphere("/Sphere", 64, np.zeros(3))
+    area, volume, _ = area_volume(sphere.world_points, sphere.triangles)
+    assert area == pytest.approx(4.0 * np.pi * 100.0, rel=2e-3)
+    assert abs(volume) == pytest.approx(4.0 / 3.0 * np.pi * 1000.0, rel=3e-3)
+    assert is_closed(sphere.triangles, len(sphere.points))
+
+
+def test_open_tube_is_not_closed():
+    points, triangles = tube()
+    _, _, vector = area_volume(points, triangles)
+    assert np.linalg.norm(vector) < 1e-9
+    assert not is_closed(triangles, len(points))
+
+
+@pytest.mark.parametrize("edit", ["hole", "flipped", "doubled"])
+def test_broken_surfaces_are_not_closed(edit):
+    triangles = cube_triangles()
+    if edit == "hole":
+        triangles = triangles[1:]
+    elif edit == "flipped":
+        triangles = triangles.copy()
+        triangles[0] = triangles[0][::-1]
+    else:
+        triangles = np.vstack((triangles, triangles[:2], triangles[:2, ::-1]))
+    assert not is_closed(triangles, len(CUBE_POINTS))
+
+
+def test_cache_sums_only_closed_volumes():
+    points, triangles = tube()
+    meshes = [
+        MeshData("/World/Cube", CUBE_POINTS, np.full(6, 4), CUBE_FACES),
+        MeshData("/World/Tube", points, np.full(len(triangles), 3), triangles.ravel()),
+    ]
+    cache = AreaVolumeCache(scenes.MeshBackend(meshes))
+    result, = cache.measure(["/World"])
+    assert not result.closed
+    assert result.volume == pytest.approx(8.0)
+    assert result.area == pytest.approx(24.0 + 2.0 * np.pi, rel=1e-2)
+    cache.shutdown()
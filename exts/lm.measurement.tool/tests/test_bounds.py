@@ -0,0 +1,66 @@
+'''
+oriented_box: a rotated box's points give back that box, every point lies inside
+the box that is found, and it is never larger than a brute force rotation sweep.
+'''
+
+import numpy as np
+from bench_bounds import brute_force
+from pxr import Gf, UsdGeom
+
+from lm.measurement.tool.bounds import box_corners, dimension_order, oriented_box
+
+
+# Rotation matrix turning row vectors by the given Euler angles in degrees
+def rotation(angles):
+    return np.array(Gf.Matrix3d(
+        Gf.Rotation(Gf.Vec3d(1, 0, 0), angles[0])
+        * Gf.Rotation(Gf.Vec3d(0, 1, 0), angles[1])
+        * Gf.Rotation(Gf.Vec3d(0, 0, 1), angles[2])
+    ))
+
+
+# Coordinates of points in the box's frame, relative to its center
+def local(points, center, axes):
+    return (points - center) @ axes.T
+
+
+def test_rotated_box_is_recovered():
+    rng = np.random.default_rng(0)
+    size = np.array((40.0, 10.0, 3.0))
+    inside = rng.uniform(-0.5, 0.5, (2000, 3)) * size
+    corners = np.array([[x, y, z] for x in (-0.5, 0.5) for y in (-0.5, 0.5) for z in (-0.5, 0.5)]) * size
+    turn = rotation((25.0, -40.0, 70.0))
+    offset = np.array((5.0, -3.0, 12.0))
+    points = np.concatenate((inside, corners)) @ turn + offset
+
+    center, axes, found = oriented_box(points)
+    assert np.allclose(axes @ axes.T, np.identity(3), atol=1e-9)
+    assert np.allclose(np.sort(found), np.sort(size), rtol=1e-6)
+    assert np.allclose(center, offset, atol=1e-6)
+    assert np.all(np.abs(local(points, center, axes)) <= found * 0.5 + 1e-9)
+    assert np.allclose(box_corners(center, axes, found).mean(axis=0), center)
+
+
+def test_never_larger_than_a_rotation_sweep():
+    rng = np.random.default_rng(1)
+    for _ in range(3):
+        points = rng.normal(size=(300, 3)) * (20.0, 6.0, 2.0) @ rotation(rng.uniform(0.0, 180.0, 3))
+        center, axes, size = oriented_box(points)
+        assert np.all(np.abs(local(points, center, axes)) <= size * 0.5 + 1e-9)
+        assert np.prod(size) <= brute_force(points, steps=12) * (1.0 + 1e-9)
+
+
+def test_flat_and_tiny_point_sets():
+    square = np.array([(0.0, 0.0, 1.0), (2.0, 0.0, 1.0), (2.0, 2.0, 1.0), (0.0, 2.0, 1.0)]) @ rotation((0.0, 0.0, 30.0))
+    center, axes, size = oriented_box(square)
+    assert np.allclose(np.sort(size), (0.0, 2.0, 2.0), atol=1e-9)
+    assert np.allclose(center, square.mean(axis=0))
+
+    center, axes, size = oriented_box(np.array([(1.0, 2.0, 3.0), (4.0, 6.0, 3.0)]))
+    assert np.allclose(axes, np.identity(3)) and np.allclose(size, (3.0, 4.0, 0.0))
+
+
+def test_dimension_order_follows_the_up_axis():
+    axes = np.array([(0.0, 0.0, 1.0), (1.0, 0.0, 0.0), (0.0, 1.0, 0.0)])
+    assert dimension_order(axes) == (1, 2, 0)
+    assert dimension_order(axes, UsdGeom.Tokens.z) == (1, 0, 2)
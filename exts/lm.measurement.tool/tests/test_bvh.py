@@ -0,0 +1,80 @@
+'''
+The triangle BVH and the bvh raycast backend against brute force searches.
+'''
+
+import numpy as np
+import scenes
+from lm.measurement.tool.bvh import TriangleBvh, closest_points_on_triangles, ray_triangle_intersect
+from lm.measurement.tool.bvh_raycast import BvhMeshRaycast
+
+
+# Random triangles of mixed sizes in a unit box, with a few large ones across it
+def random_triangles(count, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.random((count, 1, 3))
+    sizes = np.where(rng.random((count, 1, 1)) < 0.02, 1.0, 0.05)
+    corners = centers + (rng.random((count, 3, 3)) - 0.5) * sizes
+    return corners.reshape(-1, 3), np.arange(count * 3).reshape(-1, 3)
+
+
+def brute_intersect(vertices, triangles, origins, dirs):
+    v0, v1, v2 = (vertices[triangles[:, k]] for k in range(3))
+    best = np.full(len(origins), np.inf)
+    for i in range(len(origins)):
+        t, hit = ray_triangle_intersect(
+            np.broadcast_to(origins[i], v0.shape), np.broadcast_to(dirs[i], v0.shape), v0, v1 - v0, v2 - v0
+        )
+        if hit.any():
+            best[i] = t[hit].min()
+    return best
+
+
+def test_intersect_matches_brute_force():
+    vertices, triangles = random_triangles(2000)
+    rng = np.random.default_rng(1)
+    origins = rng.random((300, 3)) * 2.0 - 0.5
+    dirs = rng.normal(size=(300, 3))
+    dirs /= np.linalg.norm(dirs, axis=1, keepdims=True)
+
+    t, hit_triangles, _, _ = TriangleBvh(vertices, triangles, leaf_size=4).intersect(origins, dirs)
+    expected = brute_intersect(vertices, triangles, origins, dirs)
+    assert np.array_equal(hit_triangles >= 0, np.isfinite(expected))
+    assert np.allclose(t[hit_triangles >= 0], expected[np.isfinite(expected)])
+
+
+def test_intersect_respects_max_dist():
+    vertices, triangles = random_triangles(500)
+    origins = np.tile((0.5, 0.5, -1.0), (50, 1))
+    dirs = np.tile((0.0, 0.0, 1.0), (50, 1))
+    _, hit_triangles, _, _ = TriangleBvh(vertices, triangles).intersect(origins, dirs, max_dist=0.5)
+    assert (hit_triangles == -1).all()
+
+
+def test_closest_points_match_brute_force():
+    vertices, triangles = random_triangles(1000, seed=2)
+    points = np.random.default_rng(3).random((200, 3)) * 1.5 - 0.25
+    distances, closest, _ = TriangleBvh(vertices, triangles).closest_points(points)
+
+    a, b, c = (vertices[triangles[:, k]] for k in range(3))
+    for point, distance, found in zip(points, distances, closest):
+        candidates = closest_points_on_triangles(np.broadcast_to(point, a.shape), a, b, c)
+        expected = np.linalg.norm(candidates - point, axis=1).min()
+        assert np.isclose(distance, expected)
+        assert np.isclose(np.linalg.norm(found - point), expected)
+
+
+def test_raycast_batch_matches_brute_force():
+    stage = scenes.make_stage(3, 12)
+    backend = BvhMeshRaycast(stage)
+    backend.createScene(None, None)
+    backend.update()
+    origins, dirs = scenes.make_rays(200, 3, seed=4)
+    result = backend.raycast_batch(origins, dirs, 1e9)
+
+    expected = np.full(len(origins), np.inf)
+    for path in backend.get_mesh_paths():
+        data = backend.get_mesh_data(path)
+        expected = np.minimum(expected, brute_intersect(data.world_points, data.triangles, origins, dirs))
+    hit = result["hit"]
+    assert np.array_equal(hit, np.isfinite(expected))
+    assert np.allclose(result["distance"][hit], expected[hit])
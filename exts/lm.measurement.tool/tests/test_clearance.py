@@ -0,0 +1,43 @@
+'''
+closest_pair: the BVH pair search finds the same clearance as checking every
+triangle pair, returns points that lie on the reported triangles, and gives up
+when nothing is closer than the limit.
+'''
+
+import numpy as np
+from bench_clearance import brute_force, make_mesh
+
+from lm.measurement.tool.bvh import closest_points_on_triangles
+
+LAYOUTS = {
+    "side by side": (3.0, (110.0, 5.0, 0.0)),
+    "parallel": (1.3, (3.0, 7.0, 12.0)),
+    "interpenetrating": (1.3, (3.0, 7.0, 2.0)),
+}
+
+
+# Distance from point to the given triangle of data
+def distance_to_triangle(data, triangle, point):
+    a, b, c = data.world_points[data.triangles[triangle]]
+    closest = closest_points_on_triangles(point[None], a[None], b[None], c[None])[0]
+    return np.linalg.norm(closest - point)
+
+
+def test_closest_pair_matches_brute_force():
+    base = make_mesh("/World/A", 12, 0.0, np.zeros(3))
+    for phase, offset in LAYOUTS.values():
+        other = make_mesh("/World/B", 12, phase, np.array(offset))
+        distance, point_a, point_b, tri_a, tri_b = base.bvh.closest_pair(other.bvh)
+        assert np.isclose(distance, brute_force(base, other), atol=1e-9)
+        assert np.isclose(np.linalg.norm(point_a - point_b), distance, atol=1e-9)
+        assert distance_to_triangle(base, tri_a, point_a) < 1e-9
+        assert distance_to_triangle(other, tri_b, point_b) < 1e-9
+
+
+def test_limit_stops_the_search():
+    base = make_mesh("/World/A", 8, 0.0, np.zeros(3))
+    other = make_mesh("/World/B", 8, 3.0, np.array((110.0, 5.0, 0.0)))
+    distance = brute_force(base, other)
+    assert np.isclose(base.bvh.closest_pair(other.bvh, distance * 1.01)[0], distance)
+    far, _, _, tri_a, tri_b = base.bvh.closest_pair(other.bvh, distance * 0.99)
+    assert far == np.inf and tri_a == tri_b == -1
@@ -0,0 +1,25 @@
+'''
+Closest points on the reference surface of a deviation map against the BVH,
+with one large triangle among many small ones.
+'''
+
+import numpy as np
+from lm.measurement.tool.bvh import TriangleBvh
+from lm.measurement.tool.deviation import ReferenceSurface
+
+
+def test_reference_surface_matches_bvh():
+    rng = np.random.default_rng(0)
+    corners = rng.random((5000, 1, 3)) + (rng.random((5000, 3, 3)) - 0.5) * 0.01
+    corners = np.vstack((corners, [[[0.0, 0.0, 0.5], [5.0, 0.0, 0.5], [0.0, 5.0, 0.6]]]))
+    points = corners.reshape(-1, 3)
+    triangles = np.arange(len(points)).reshape(-1, 3)
+    bvh = TriangleBvh(points, triangles)
+    surface = ReferenceSurface(points, triangles, bvh)
+
+    queries = rng.random((500, 3)) * 1.2
+    distance, closest, found = surface.closest(queries)
+    expected, _, _ = bvh.closest_points(queries)
+    assert (found >= 0).all()
+    assert np.allclose(distance, expected)
+    assert np.allclose(np.linalg.norm(closest - queries, axis=1), expected)
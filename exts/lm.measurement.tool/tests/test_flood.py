@@ -0,0 +1,85 @@
+'''
+stream_flood: the point cap keeps the first samples, the memory budget bounds
+the blocks sampled ahead of the consumer, and stopping early stops the workers.
+'''
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from lm.measurement.tool.flood import BYTES_PER_POINT, collect_flood, consume_flood, stream_flood
+
+
+class Sampler:
+
+    # Each mesh is sampled as chunks arrays of chunk_points points, numbered across meshes so their order can be checked
+    def __init__(self, chunks=10, chunk_points=100):
+        self.chunks = chunks
+        self.chunk_points = chunk_points
+        self.sampled = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, mesh_path, index):
+        for chunk in range(self.chunks):
+            with self._lock:
+                self.sampled += self.chunk_points
+            first = (index * self.chunks + chunk) * self.chunk_points
+            positions = np.arange(first, first + self.chunk_points, dtype=np.float64)[:, None].repeat(3, axis=1)
+            yield positions, -positions
+
+
+MESHES = [f"/World/Mesh_{i}" for i in range(4)]
+
+
+def test_cap_keeps_the_first_samples():
+    blocks = list(stream_flood(Sampler(), MESHES, max_points=2550, block_points=64))
+    positions, normals = collect_flood(blocks)
+    assert len(positions) == 2550 and max(len(block) for block in blocks) <= 64
+    assert np.array_equal(positions[:, 0], np.arange(2550))
+    assert np.array_equal(normals, -positions)
+    assert [block.mesh_path for block in blocks[:2]] == [MESHES[0]] * 2 and blocks[-1].mesh_path == MESHES[2]
+
+    assert list(stream_flood(Sampler(), MESHES, max_points=0)) == []
+    positions, _ = collect_flood(stream_flood(Sampler(), MESHES, workers=3))
+    assert sorted(positions[:, 0].tolist()) == list(range(4000))
+
+
+def test_budget_bounds_the_blocks_ahead_of_the_consumer():
+    sampler = Sampler()
+    budget = 200 * BYTES_PER_POINT
+    consumed = 0
+    for block in stream_flood(sampler, MESHES, memory_budget=budget):
+        assert len(block) <= 200
+        time.sleep(0.01)
+        consumed += len(block)
+
+        # One block queued, one waiting to be queued and the chunk being split ahead of what was consumed
+        assert sampler.sampled - consumed <= 2 * 200 + sampler.chunk_points
+    assert consumed == 4000
+
+
+def test_stopping_early_stops_the_workers():
+    sampler = Sampler(chunks=1000)
+    stream = stream_flood(sampler, MESHES, workers=2, block_points=100)
+    next(stream)
+    stream.close()
+    time.sleep(0.2)
+    sampled = sampler.sampled
+    time.sleep(0.1)
+    assert sampler.sampled == sampled < 400000
+
+
+def test_errors_and_consumers(tmp_path):
+    def broken(mesh_path, index):
+        yield np.zeros((5, 3)), np.zeros((5, 3))
+        raise ValueError(mesh_path)
+
+    with pytest.raises(ValueError):
+        list(stream_flood(broken, MESHES))
+
+    summary = consume_flood(stream_flood(Sampler(chunks=2), MESHES[:2]), tmp_path / "flood.csv")
+    assert summary.count == 400 and summary.mesh_counts == {MESHES[0]: 200, MESHES[1]: 200}
+    assert np.allclose(summary.centroid, 199.5)
+    assert len(np.loadtxt(tmp_path / "flood.csv", delimiter=",", skiprows=1)) == 400
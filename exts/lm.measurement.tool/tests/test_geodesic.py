@@ -0,0 +1,55 @@
+'''
+MeshGraph: the bucketed bidirectional A* finds paths exactly as long as a plain
+heap Dijkstra over the same CSR graph, and the polyline it returns adds up to
+that length.
+'''
+
+import heapq
+
+import numpy as np
+import scenes
+from lm.measurement.tool.geodesic import MeshGraph, polyline_length
+
+
+# Distances from source over the graph's own CSR edges, one heap pop per vertex
+def dijkstra(graph, source):
+    dist = np.full(len(graph.points), np.inf)
+    dist[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        d, vertex = heapq.heappop(heap)
+        if d > dist[vertex]:
+            continue
+        for slot in range(graph.indptr[vertex], graph.indptr[vertex + 1]):
+            target = graph.indices[slot]
+            candidate = d + graph.weights[slot]
+            if candidate < dist[target]:
+                dist[target] = candidate
+                heapq.heappush(heap, (candidate, target))
+    return dist
+
+
+def test_shortest_path_matches_dijkstra_between_vertices():
+    sphere = scenes.make_sphere("/World/Sphere", 24, np.zeros(3))
+    graph = MeshGraph(sphere.world_points, sphere.triangles)
+    rng = np.random.default_rng(0)
+    sources = rng.choice(len(graph.points), 4, replace=False)
+    for source in sources:
+        reference = dijkstra(graph, int(source))
+        for target in rng.choice(len(graph.points), 8, replace=False):
+            path, length = graph.shortest_path(graph.points[source], graph.points[target])
+            if path is None or len(path) == 2:
+                # Both points on one triangle, joined straight
+                continue
+            assert np.isclose(length, reference[target], rtol=1e-9, atol=1e-9)
+            assert np.isclose(polyline_length(path), length)
+            assert np.allclose(path[0], graph.points[source]) and np.allclose(path[-1], graph.points[target])
+
+
+def test_path_on_one_triangle_is_straight():
+    points = np.array([(0.0, 0.0, 0.0), (1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (1.0, 1.0, 0.0)])
+    graph = MeshGraph(points, np.array([(0, 1, 2), (1, 3, 2)]))
+    path, length = graph.shortest_path((0.1, 0.1, 0.0), (0.3, 0.2, 0.0))
+    assert len(path) == 2 and np.isclose(length, np.hypot(0.2, 0.1))
+    # Flat neighbours are joined across their shared edge's opposite corners
+    assert graph.edge_count == 6
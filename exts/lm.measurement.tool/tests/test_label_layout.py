@@ -0,0 +1,78 @@
+'''
+LabelLayout: labels behind the camera, off screen or on segments too short on
+screen are culled, and each screen cell keeps only its longest label, the same
+as projecting and comparing the labels one at a time.
+'''
+
+import numpy as np
+
+from fake_ui import CameraModel
+from lm.measurement.tool.label_layout import LabelLayout, LabelSet
+from lm.measurement.tool.view_transform import CameraTransform
+
+VIEWPORT = (200, 160)
+CELL = (40, 20)
+
+
+def make_layout(min_pixels=4.0, **camera):
+    model = CameraModel(aspect=VIEWPORT[0] / VIEWPORT[1], **camera)
+    return LabelLayout(CameraTransform(model.view, model.projection), VIEWPORT, min_pixels, CELL)
+
+
+# Cell of each label that survives culling, one label at a time, None when culled
+def reference_cells(layout, anchors, lengths):
+    camera = layout.camera
+    cells = []
+    for anchor, length in zip(anchors, lengths):
+        x, y, _, w = np.append(anchor, 1.0) @ camera.view_projection
+        pixel = 2.0 * w / (camera.projection[1, 1] * layout.height)
+        if w <= 1e-9 or abs(x) > w or abs(y) > w or length < layout.min_pixels * pixel:
+            cells.append(None)
+            continue
+        column = int((x / w + 1.0) * 0.5 * layout.width // layout.cell_width)
+        row = int((y / w + 1.0) * 0.5 * layout.height // layout.cell_height)
+        cells.append(row * layout._columns + column)
+    return cells
+
+
+def test_culling():
+    layout = make_layout()
+    anchors = np.array([(0.0, 0.0, 0.0), (0.0, 0.0, 150.0), (500.0, 0.0, 0.0), (20.0, 20.0, 0.0)])
+    lengths = np.array([10.0, 10.0, 10.0, 0.5])
+    changed = layout.place(anchors, lengths, ["shown", "behind", "off screen", "too short"])
+    assert len(changed) == 1
+    assert [text for _, _, text in layout.cells.values()] == ["shown"]
+    assert layout.place(np.zeros((0, 3)), np.zeros(0), []) == []
+
+
+def test_each_cell_keeps_its_longest_label():
+    layout = make_layout()
+    anchors = np.array([(1.0, 1.0, 0.0), (1.5, 1.2, 0.0), (1.2, 1.4, 0.0)])
+    assert len(layout.place(anchors, np.array([5.0, 9.0, 9.0]), ["a", "b", "c"])) == 1
+    assert [text for _, _, text in layout.cells.values()] == ["b"]
+
+    # A later label only takes the cell from a shorter one
+    assert layout.place(anchors[:1], np.array([7.0]), ["d"]) == []
+    key = layout.place(anchors[:1], np.array([12.0]), ["e"])[0]
+    assert layout.cells[key][2] == "e"
+
+
+def test_matches_labels_placed_one_at_a_time():
+    rng = np.random.default_rng(0)
+    labels = LabelSet()
+    for _ in range(3):
+        count = 400
+        anchors = rng.uniform((-90.0, -70.0, -80.0), (90.0, 70.0, 120.0), (count, 3))
+        lengths = rng.exponential(3.0, count)
+        labels.extend(anchors, lengths, [f"{length:.3f}" for length in lengths])
+    assert len(labels) == 1200 and labels.anchors.shape == (1200, 3)
+
+    for camera in ({}, {"orthographic_height": 150.0}):
+        layout = make_layout(**camera)
+        layout.place(labels.anchors, labels.lengths, labels.texts)
+        expected = {}
+        for i, key in enumerate(reference_cells(layout, labels.anchors, labels.lengths)):
+            if key is not None and (key not in expected or labels.lengths[i] > expected[key][0]):
+                expected[key] = (labels.lengths[i], labels.texts[i])
+        assert 0 < len(layout.cells) < len(labels)
+        assert {key: (length, text) for key, (length, _, text) in layout.cells.items()} == expected
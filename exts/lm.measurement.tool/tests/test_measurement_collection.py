@@ -0,0 +1,44 @@
+'''
+MeasurementCollection: deleted slots are reused from the free list, and the
+generation packed into each ID keeps stale IDs from resolving to the group that
+reused their slot.
+'''
+
+from lm.measurement.tool.measurement_collection import MeasurementCollection, SLOT_MASK
+
+
+def test_deleted_slots_are_reused_under_a_new_id():
+    groups = MeasurementCollection(capacity=4)
+    ids = [groups.add(name) for name in "abcd"]
+    assert len(groups) == 4 and groups.items() == list(zip(ids, "abcd"))
+
+    assert groups.remove(ids[1]) == "b"
+    assert ids[1] not in groups and groups.get(ids[1]) is None
+    reused = groups.add("e")
+    assert reused & SLOT_MASK == ids[1] & SLOT_MASK
+    assert reused != ids[1]
+    assert groups.get(reused) == "e" and groups.get(ids[1]) is None
+    assert groups.remove(ids[1]) is None
+    assert len(groups) == 4
+
+
+def test_growing_keeps_existing_ids():
+    groups = MeasurementCollection(capacity=2)
+    ids = [groups.add(k) for k in range(9)]
+    assert len(set(id_ & SLOT_MASK for id_ in ids)) == 9
+    assert [groups.get(id_) for id_ in ids] == list(range(9))
+
+
+def test_visibility_and_clear():
+    groups = MeasurementCollection()
+    ids = [groups.add(k) for k in range(3)]
+    assert groups.set_visible(ids[0], False)
+    assert groups.ids(visible_only=True) == ids[1:]
+    assert groups.ids() == ids
+
+    groups.clear()
+    assert len(groups) == 0 and groups.ids() == []
+    assert all(id_ not in groups for id_ in ids)
+    assert not groups.set_visible(ids[0], True)
+    fresh = groups.add("x")
+    assert fresh not in ids and groups.is_visible(fresh)
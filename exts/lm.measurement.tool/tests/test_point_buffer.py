@@ -0,0 +1,50 @@
+'''
+PointBuffer: the vectorized segment queries match a per-segment loop, and the
+buffer keeps its points as it grows past its capacity.
+'''
+
+import math
+
+import numpy as np
+
+from lm.measurement.tool.point_buffer import PointBuffer
+
+
+def polyline(count, seed=0):
+    return np.random.default_rng(seed).uniform(-50.0, 50.0, (count, 3))
+
+
+def test_segment_queries_match_a_loop():
+    points = polyline(40)
+    buffer = PointBuffer(capacity=4)
+    for point in points[:10]:
+        buffer.append(point)
+    buffer.extend(points[10:])
+
+    assert len(buffer) == len(points)
+    assert np.array_equal(buffer.array, points)
+    lengths = [math.dist(a, b) for a, b in zip(points[:-1], points[1:])]
+    assert np.allclose(buffer.distances(), lengths)
+    assert np.allclose(buffer.distances(first=5), lengths[5:])
+    assert np.allclose(buffer.midpoints(), [(a + b) * 0.5 for a, b in zip(points[:-1], points[1:])])
+    assert np.allclose(buffer.cumulative_lengths(), np.concatenate(([0.0], np.cumsum(lengths))))
+
+
+def test_short_buffers_have_no_segments():
+    buffer = PointBuffer()
+    assert len(buffer.distances()) == 0
+    assert np.array_equal(buffer.cumulative_lengths(), [])
+    buffer.append((1.0, 2.0, 3.0))
+    assert len(buffer.midpoints()) == 0
+    assert np.array_equal(buffer.cumulative_lengths(), [0.0])
+
+
+def test_array_is_a_read_only_view():
+    buffer = PointBuffer()
+    buffer.extend(polyline(3))
+    view = buffer.array
+    assert not view.flags.writeable
+    buffer.set([1], [[0.0, 0.0, 0.0]])
+    assert np.array_equal(buffer[1], [0.0, 0.0, 0.0])
+    buffer.clear()
+    assert len(buffer) == 0 and buffer.tolist() == []
@@ -0,0 +1,75 @@
+'''
+Point cloud picks against testing every point, memory-mapped indexes and the
+background builds of PointCloudCache.
+'''
+
+import os
+import threading
+
+import numpy as np
+from bench_point_cloud import brute_pick, make_pick_rays
+from lm.measurement.tool.point_cloud import PointCloudCache, build_point_index, mapped_point_index
+from pxr import Usd
+from scenes import add_points, make_scan
+
+GROWTH = 0.002
+
+
+def test_picks_match_brute_force():
+    points = make_scan(100000)
+    index = build_point_index(points)
+    origins, directions = make_pick_rays(points, 100)
+    for origin, direction in zip(origins, directions):
+        found = index.pick(origin, direction, 0.0, GROWTH)
+        expected = brute_pick(points, origin, direction, 0.0, GROWTH)
+        assert (found is None) == (expected is None)
+        if found is not None:
+            assert np.isclose(found[0], expected[0])
+
+
+def test_mapped_index_is_reused(tmp_path):
+    points = make_scan(20000, seed=1)
+    first = mapped_point_index(points, str(tmp_path))
+    second = mapped_point_index(points, str(tmp_path))
+    assert second.mapped and second.files == first.files
+    assert np.array_equal(np.asarray(second.points), build_point_index(points).points)
+
+
+def test_invalidating_one_cloud_keeps_the_other_builds(tmp_path):
+    stage = Usd.Stage.CreateInMemory()
+    add_points(stage, "/World/A", make_scan(5000, seed=2))
+    add_points(stage, "/World/B", make_scan(5000, seed=3))
+    cache = PointCloudCache(stage, cache_dir=str(tmp_path), mmap_points=1000)
+
+    # Both builds are queued behind the gate when A is invalidated
+    gate = threading.Event()
+    cache._pool.submit(gate.wait, 5.0)
+    cache.update()
+    cache.invalidate(["/World/A"])
+    gate.set()
+    cache.wait()
+    assert cache.get("/World/A") is None
+    assert cache.get("/World/B") is not None
+
+    cache.update()
+    cache.wait()
+    files = cache.get("/World/A").files
+    assert all(os.path.exists(path) for path in files)
+    cache.invalidate(["/World/A"])
+    assert not any(os.path.exists(path) for path in files)
+    assert all(os.path.exists(path) for path in cache.get("/World/B").files)
+    cache.shutdown()
+
+
+def test_old_index_files_are_removed(tmp_path):
+    stale = tmp_path / "stale.points.npy"
+    recent = tmp_path / "recent.levels.npz"
+    other = tmp_path / "notes.txt"
+    for path in (stale, recent, other):
+        path.write_bytes(b"")
+    os.utime(stale, (0, 0))
+    os.utime(other, (0, 0))
+    cache = PointCloudCache(cache_dir=str(tmp_path))
+    cache.wait()
+    assert not stale.exists() and recent.exists() and other.exists()
+    cache.shutdown()
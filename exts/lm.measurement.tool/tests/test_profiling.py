@@ -0,0 +1,55 @@
+'''
+Profiling: histogram percentiles cover the rolling window while count and
+total cover every sample, and a disabled profiler records nothing.
+'''
+
+import json
+
+import numpy as np
+
+from lm.measurement.tool.profiling import LatencyHistogram, Profiler
+
+
+def test_percentiles_cover_the_rolling_window():
+    histogram = LatencyHistogram(window=100)
+    samples = np.random.default_rng(0).exponential(0.01, 250)
+    for seconds in samples:
+        histogram.add(seconds)
+    stats = histogram.stats()
+
+    window = samples[-100:] * 1000.0
+    assert stats["count"] == 250
+    assert np.isclose(stats["total_ms"], samples.sum() * 1000.0)
+    assert np.isclose(stats["mean_ms"], window.mean())
+    assert np.isclose(stats["max_ms"], window.max())
+    for name, q in (("p50_ms", 50), ("p95_ms", 95), ("p99_ms", 99)):
+        assert np.isclose(stats[name], np.percentile(window, q))
+    assert stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"] <= stats["max_ms"]
+
+
+def test_partial_window_and_empty_histogram():
+    assert LatencyHistogram().stats() == {"count": 0}
+    histogram = LatencyHistogram(window=8)
+    for ms in (1.0, 2.0, 3.0):
+        histogram.add(ms / 1000.0)
+    assert np.isclose(histogram.stats()["p50_ms"], 2.0)
+
+
+def test_disabled_profiler_records_nothing(tmp_path):
+    profiler = Profiler(enabled=False)
+    with profiler.span("click"):
+        pass
+    profiler.record("click", 0.5)
+    profiler.count("hits")
+    assert profiler.snapshot() == {"enabled": False, "spans": {}, "counters": {}}
+
+    profiler.enabled = True
+    with profiler.span("click"):
+        pass
+    profiler.record("click", 0.5)
+    profiler.count("hits", 2)
+    path = profiler.dump(str(tmp_path / "profile.json"))
+    with open(path) as f:
+        snapshot = json.load(f)
+    assert snapshot["spans"]["click"]["count"] == 2
+    assert snapshot["counters"] == {"hits": 2}
@@ -0,0 +1,71 @@
+'''
+QueryExecutor: clicks are applied in submission order, other queries as soon
+as they finish, and a newer query under a key supersedes the older one.
+'''
+
+import threading
+
+from lm.measurement.tool.query_executor import QueryExecutor
+
+
+def blocked(gate, value):
+    gate.wait(5.0)
+    return value
+
+
+def test_ordered_queries_wait_for_earlier_ones():
+    executor = QueryExecutor(2)
+    gate = threading.Event()
+    applied = []
+    executor.submit(blocked, gate, 1, callback=applied.append, ordered=True)
+    second = executor.submit(lambda: 2, callback=applied.append, ordered=True)
+    second.future.result(5.0)
+    executor.poll()
+    assert applied == []
+    gate.set()
+    executor.wait(5.0)
+    assert applied == [1, 2]
+    executor.shutdown()
+
+
+def test_unordered_queries_do_not_wait_for_clicks():
+    executor = QueryExecutor(2)
+    gate = threading.Event()
+    applied = []
+    executor.submit(blocked, gate, "click", callback=applied.append, ordered=True)
+    hover = executor.submit(lambda: "hover", callback=applied.append, key="hover")
+    hover.future.result(5.0)
+    executor.poll()
+    assert applied == ["hover"]
+    gate.set()
+    executor.wait(5.0)
+    assert applied == ["hover", "click"]
+    executor.shutdown()
+
+
+def test_newer_query_under_a_key_cancels_the_older():
+    executor = QueryExecutor(1)
+    gate = threading.Event()
+    applied = []
+    executor.submit(blocked, gate, None)
+    first = executor.submit(lambda: 1, callback=applied.append, key="hover")
+    executor.submit(lambda: 2, callback=applied.append, key="hover")
+    assert first.cancelled and not executor.is_pending(first)
+    gate.set()
+    executor.wait(5.0)
+    assert applied == [2]
+    assert executor.cancelled == 1
+    executor.shutdown()
+
+
+def test_inline_executor_applies_immediately_and_counts_failures():
+    executor = QueryExecutor(0)
+    applied = []
+    executor.submit(lambda: 3, callback=applied.append)
+    assert applied == [3] and not executor.is_async
+
+    def fail():
+        raise RuntimeError("no hit")
+
+    executor.submit(fail, callback=applied.append)
+    assert applied == [3] and executor.failed == 1
@@ -0,0 +1,27 @@
+'''
+Incremental redraw: a click only creates the scene items of its new segment,
+however many segments are already drawn, and clearing drops them all.
+'''
+
+from bench_pipeline import PipelineHarness
+from fake_ui import count_items
+
+
+def test_clicks_rebuild_only_the_new_segment():
+    harness = PipelineHarness(2, 8, "bvh", async_workers=0)
+    manipulator = harness.manipulator
+    empty = count_items(manipulator._segment_root)
+
+    rebuilt = []
+    for x, y in harness.positions(20):
+        harness.click(x, y)
+        harness.frame()
+        rebuilt.append(manipulator.items_rebuilt)
+    assert len(harness.model.get_value(harness.model.get_item("points"))) == 20
+    assert len(set(rebuilt[1:])) == 1
+    assert rebuilt[-1] < harness.scene_items() // 10
+    assert manipulator.items_rebuilt_total >= sum(rebuilt)
+
+    harness.model.clear_points()
+    harness.frame()
+    assert count_items(manipulator._segment_root) == empty
@@ -0,0 +1,64 @@
+'''
+Cross sections with known answers, including planes through vertices and faces.
+'''
+
+import numpy as np
+import pytest
+import scenes
+from lm.measurement.tool.mesh_data import MeshData
+from lm.measurement.tool.section import SectionCache, SectionPlane
+
+OCTAHEDRON_POINTS = np.array([[1, 0, 0], [-1, 0, 0], [0, 1, 0], [0, -1, 0], [0, 0, 1], [0, 0, -1]], dtype=np.float64)
+OCTAHEDRON_FACES = [0, 2, 4, 2, 1, 4, 1, 3, 4, 3, 0, 4, 2, 0, 5, 1, 2, 5, 3, 1, 5, 0, 3, 5]
+
+CUBE_POINTS = np.array([[x, y, z] for z in (0.0, 2.0) for y in (0.0, 2.0) for x in (0.0, 2.0)])
+CUBE_FACES = [0, 2, 3, 1, 4, 5, 7, 6, 0, 1, 5, 4, 2, 6, 7, 3, 0, 4, 6, 2, 1, 3, 7, 5]
+
+
+def section(data, origin, normal=(0.0, 0.0, 1.0)):
+    cache = SectionCache(scenes.MeshBackend([data]))
+    return cache.section(["/World"], SectionPlane(origin, normal))
+
+
+def octahedron():
+    return MeshData("/World/Octahedron", OCTAHEDRON_POINTS, np.full(8, 3), OCTAHEDRON_FACES)
+
+
+def cube():
+    return MeshData("/World/Cube", CUBE_POINTS, np.full(6, 4), CUBE_FACES)
+
+
+# The plane through the octahedron's vertex ring, where the bounds center puts it by default
+@pytest.mark.parametrize("z", [0.0, 1e-9, -1e-9, 0.5])
+def test_octahedron(z):
+    result = section(octahedron(), (0.0, 0.0, z))
+    side = 1.0 - abs(z)
+    assert result.closed == [True]
+    assert np.isfinite(np.vstack(result.polylines)).all()
+    assert result.perimeter == pytest.approx(4.0 * np.sqrt(2.0) * side)
+    assert result.area == pytest.approx(2.0 * side * side)
+    assert result.width == pytest.approx(2.0 * side)
+
+
+def test_plane_through_apex_cuts_nothing():
+    for z in (1.0, -1.0):
+        result = section(octahedron(), (0.0, 0.0, z))
+        assert np.isfinite(result.perimeter) and result.area == 0.0
+
+
+@pytest.mark.parametrize("z", [1.0, 2.0])
+def test_cube_through_its_middle_and_its_top_face(z):
+    result = section(cube(), (1.0, 1.0, z))
+    assert result.closed == [True]
+    assert result.perimeter == pytest.approx(8.0)
+    assert result.area == pytest.approx(4.0)
+    assert result.width == pytest.approx(2.0 * np.sqrt(2.0))
+
+
+def test_oblique_cut_of_a_sphere_is_a_great_circle():
+    sphere = scenes.make_sphere("/World/Sphere", 64, np.zeros(3))
+    result = section(sphere, (0.0, 0.0, 0.0), (1.0, 2.0, 3.0))
+    assert all(result.closed)
+    assert result.perimeter == pytest.approx(2.0 * np.pi * 10.0, rel=5e-3)
+    assert result.area == pytest.approx(np.pi * 100.0, rel=5e-3)
+    assert result.width == pytest.approx(20.0, rel=5e-3)
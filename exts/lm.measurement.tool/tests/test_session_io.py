@@ -0,0 +1,97 @@
+'''
+Saving and loading measurement sessions as .npz files and USD layers, with
+surface paths and anchors, and through the manipulator.
+'''
+
+import numpy as np
+import pytest
+from bench_pipeline import PipelineHarness
+from lm.measurement.tool.session_io import SessionGroup, load_session, save_session
+from pxr import Gf, UsdGeom
+
+GROUPS = [
+    SessionGroup(
+        np.arange(12.0).reshape(4, 3),
+        {0: np.ones((5, 3)), 2: np.zeros((3, 3))},
+        {0: "/World/A", 3: "/World/B"},
+    ),
+    SessionGroup(np.full((2, 3), 7.0)),
+    SessionGroup(np.arange(9.0).reshape(3, 3), {1: np.full((4, 3), 2.0)}, {2: "/World/A"}),
+]
+
+
+@pytest.fixture(params=["session.npz", "session.usda"])
+def session_path(request, tmp_path):
+    return str(tmp_path / request.param)
+
+
+@pytest.fixture
+def harness():
+    harness = PipelineHarness(2, 8, "bvh")
+    yield harness
+    harness.manipulator.destroy()
+
+
+def test_round_trip(session_path):
+    save_session(session_path, GROUPS)
+    loaded = load_session(session_path)
+    assert len(loaded) == len(GROUPS)
+    for expected, group in zip(GROUPS, loaded):
+        assert np.array_equal(group.points, expected.points)
+        assert group.segment_paths.keys() == expected.segment_paths.keys()
+        for segment, path in expected.segment_paths.items():
+            assert np.array_equal(group.segment_paths[segment], path)
+        assert group.mesh_paths == expected.mesh_paths
+
+
+def test_plain_points_round_trip(session_path):
+    save_session(session_path, [np.zeros((2, 3))])
+    group, = load_session(session_path)
+    assert group.points.shape == (2, 3)
+    assert group.segment_paths == {} and group.mesh_paths == {}
+
+
+# Version 1 sessions stored only the points and the group counts
+def test_version_1_sessions_load(tmp_path):
+    path = str(tmp_path / "v1.npz")
+    with open(path, "wb") as f:
+        np.savez_compressed(f, version=np.int64(1), points=np.arange(15.0).reshape(5, 3), counts=np.array([3, 2]))
+    groups = load_session(path)
+    assert [len(group.points) for group in groups] == [3, 2]
+    assert all(not group.segment_paths and not group.mesh_paths for group in groups)
+
+
+def test_newer_versions_are_rejected(tmp_path):
+    path = str(tmp_path / "v99.npz")
+    with open(path, "wb") as f:
+        np.savez_compressed(f, version=np.int64(99), points=np.zeros((1, 3)), counts=np.array([1]))
+    with pytest.raises(ValueError):
+        load_session(path)
+
+
+def test_manipulator_restores_surface_paths_and_anchors(harness, session_path):
+    model, manipulator = harness.model, harness.manipulator
+    meshes = manipulator._mr.get_mesh_paths()
+    for point in ([10.0, 10.0, 0.0], [20.0, 10.0, 0.0]):
+        model.add_point(point, mesh_path=meshes[0])
+    model.set_segment_path(0, [[10.0, 10.0, 0.0], [15.0, 12.0, 0.0], [20.0, 10.0, 0.0]])
+    model.new_group()
+    model.add_point([130.0, 10.0, 0.0], mesh_path=meshes[1])
+    harness.frame()
+    distances = model.get_distances()
+
+    manipulator.save_session(session_path)
+    model.clear_points()
+    harness.frame()
+    manipulator.load_session(session_path)
+    harness.frame()
+
+    items = [model.get_group_item(group_id) for group_id in model.get_group_ids()]
+    assert np.allclose(model.get_distances(), distances)
+    assert [item.mesh_paths for item in items] == [{0: meshes[0], 1: meshes[0]}, {0: meshes[1]}]
+
+    # Loaded points follow the mesh they are anchored to
+    UsdGeom.XformCommonAPI(harness.stage.GetPrimAtPath(meshes[1])).SetTranslate(Gf.Vec3d(0.0, 0.0, 100.0))
+    harness.frame()
+    assert np.allclose(items[1].value.array, [[130.0, 10.0, 100.0]])
+    assert np.allclose(items[0].value.array[:, 2], 0.0)
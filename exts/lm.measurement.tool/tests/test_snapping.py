@@ -0,0 +1,80 @@
+'''
+Vertex and edge snapping against brute force searches, on meshes that mix
+short edges with a few long ones.
+'''
+
+import time
+
+import numpy as np
+from lm.measurement.tool.snapping import SnapIndex, closest_points_on_segments, face_edges
+from lm.measurement.tool.spatial_index import UniformGrid
+
+
+# Many short random edges plus a few long oblique ones across the whole box
+def mixed_edges(count, seed=0):
+    rng = np.random.default_rng(seed)
+    starts = rng.random((count, 3))
+    ends = starts + (rng.random((count, 3)) - 0.5) * 0.01
+    long_starts = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.2], [0.1, 1.0, 0.9]])
+    long_ends = np.array([[1.0, 1.0, 1.0], [0.0, 1.0, 0.7], [0.9, 0.0, 0.1]])
+    points = np.vstack((starts, long_starts, ends, long_ends))
+    n = count + len(long_starts)
+    return points, np.stack((np.arange(n), np.arange(n) + n), axis=1)
+
+
+def test_face_edges_are_unique():
+    edges = face_edges([4, 4], [0, 1, 2, 3, 1, 4, 5, 2])
+    assert len(edges) == 7
+    assert len({tuple(sorted(edge)) for edge in edges.tolist()}) == 7
+
+
+def test_nearest_vertex_matches_brute_force():
+    points, edges = mixed_edges(5000)
+    index = SnapIndex(points, edges)
+    queries = np.random.default_rng(1).random((300, 3))
+    for query in queries:
+        found, distance = index.nearest_vertex(query, 0.02)
+        distances = np.linalg.norm(points - query, axis=1)
+        if distances.min() > 0.02:
+            assert found == -1
+        else:
+            assert np.isclose(distance, distances.min())
+
+
+def test_nearest_edge_point_matches_brute_force():
+    points, edges = mixed_edges(5000, seed=2)
+    index = SnapIndex(points, edges)
+    queries = np.random.default_rng(3).random((300, 3))
+    for query in queries:
+        found, distance = index.nearest_edge_point(query, 0.02)
+        closest = closest_points_on_segments(query, points[edges[:, 0]], points[edges[:, 1]])
+        expected = np.linalg.norm(closest - query, axis=1).min()
+        if expected > 0.02:
+            assert found is None
+        else:
+            assert np.isclose(distance, expected)
+            assert np.isclose(np.linalg.norm(found - query), expected)
+
+
+def test_snap_prefers_vertices_over_edges():
+    points = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0]])
+    index = SnapIndex(points, [[0, 1]])
+    assert index.snap([0.01, 0.01, 0.0], 0.05)[1] == "vertex"
+    position, kind = index.snap([0.5, 0.01, 0.0], 0.05)
+    assert kind == "edge" and np.allclose(position, (0.5, 0.0, 0.0))
+    assert index.snap([0.5, 0.5, 0.0], 0.05)[1] is None
+
+
+# One long item among many tiny ones must not fill the grid with its box
+def test_grid_keeps_long_items_out_of_fine_cells():
+    rng = np.random.default_rng(4)
+    lo = rng.random((10000, 3)) * 0.01
+    hi = lo + 0.0001
+    lo = np.vstack((lo, [[0.0, 0.0, 0.0]]))
+    hi = np.vstack((hi, [[30.0, 30.0, 30.0]]))
+    start = time.perf_counter()
+    grid = UniformGrid(lo, hi, 0.0001)
+    assert time.perf_counter() - start < 1.0
+    assert len(grid._items) < 10 * len(lo)
+    found = grid.query_box(np.array([20.0, 20.0, 20.0]), np.array([20.0, 20.0, 20.0]))
+    assert 10000 in found.tolist()
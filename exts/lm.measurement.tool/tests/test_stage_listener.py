@@ -0,0 +1,57 @@
+'''
+Stage listener: change notices are reduced to geometry, transform and resync
+paths, and resolve_changes turns them into exactly the meshes to rebuild.
+'''
+
+from pxr import Gf, Usd, UsdGeom
+
+from lm.measurement.tool.stage_listener import StageChanges, StageListener, paths_under, resolve_changes
+
+MESHES = ["/World/A/Mesh_1", "/World/A/Mesh_10", "/World/B/Mesh_2", "/World/B/Sub/Mesh_3", "/Other/Mesh_4"]
+
+
+def test_paths_under_matches_whole_path_components():
+    assert paths_under(MESHES, ["/World/A/Mesh_1"]) == ["/World/A/Mesh_1"]
+    assert paths_under(MESHES, ["/World/B"]) == ["/World/B/Mesh_2", "/World/B/Sub/Mesh_3"]
+    assert paths_under(MESHES, ["/World/B", "/World/B/Sub"]) == ["/World/B/Mesh_2", "/World/B/Sub/Mesh_3"]
+    assert paths_under(MESHES, ["/World/A/Mesh"]) == []
+    assert paths_under(MESHES, ["/"]) == MESHES
+    assert paths_under(MESHES, []) == []
+
+
+def test_resolve_changes():
+    changes = StageChanges()
+    changes.geometry = {"/World/A/Mesh_10", "/World/Unknown"}
+    changes.transforms = {"/World/B/Sub"}
+    changes.resynced = {"/Other", "/Other/Mesh_4"}
+    dirty, roots = resolve_changes(changes, MESHES)
+    assert dirty == {"/World/A/Mesh_10", "/World/B/Sub/Mesh_3", "/Other/Mesh_4"}
+    assert roots == ["/Other"]
+    assert resolve_changes(StageChanges(), MESHES) == (set(), [])
+
+
+def test_listener_sorts_notices_by_kind():
+    stage = Usd.Stage.CreateInMemory()
+    UsdGeom.Xform.Define(stage, "/World")
+    mesh = UsdGeom.Mesh.Define(stage, "/World/Mesh")
+    mesh.CreatePointsAttr([(0, 0, 0), (1, 0, 0), (0, 1, 0)])
+    listener = StageListener(stage)
+    assert not listener.has_changes()
+
+    mesh.GetPointsAttr().Set([(0, 0, 0), (2, 0, 0), (0, 2, 0)])
+    UsdGeom.Xformable(stage.GetPrimAtPath("/World")).AddTranslateOp().Set(Gf.Vec3d(1, 2, 3))
+    mesh.CreateDisplayColorAttr([(1, 0, 0)])
+    changes = listener.take()
+    assert changes.geometry == {"/World/Mesh"}
+    assert changes.transforms == {"/World"}
+    assert changes.resynced == set()
+    assert not listener.has_changes()
+
+    UsdGeom.Mesh.Define(stage, "/World/Added")
+    changes = listener.take()
+    assert "/World/Added" in changes.resynced
+    assert resolve_changes(changes, ["/World/Mesh", "/World/Added"])[0] == {"/World/Added"}
+
+    listener.revoke()
+    mesh.GetPointsAttr().Set([(0, 0, 0)])
+    assert not listener.has_changes()
@@ -0,0 +1,52 @@
+'''
+Tracks: evaluate_points places anchored points over time exactly like computing
+each prim's transform at every time code, and a snapshot read before a stage
+edit is not cached.
+'''
+
+import numpy as np
+from bench_tracks import animate, python_track
+from pxr import Gf, UsdGeom
+from scenes import make_stage
+
+from lm.measurement.tool.tracks import TrackCache, evaluate_points, track_times
+
+
+def test_evaluate_points_matches_per_frame_transforms():
+    stage = make_stage(3, 2)
+    animate(stage, 3, 60)
+    rng = np.random.default_rng(0)
+    points = [(f"/World/Mesh_{k % 3}", rng.random(3) * 100.0) for k in range(7)]
+    times = track_times(0, 59, 1.5)
+
+    world = evaluate_points(stage, points, times)
+    assert world.shape == (len(times), 7, 3)
+    distances = np.sqrt(((world[:, 1:] - world[:, :-1]) ** 2).sum(axis=2))
+    assert np.allclose(distances, python_track(stage, points, times), atol=1e-9)
+    track = TrackCache(stage).get(points, 0, 59, 1.5)
+    assert np.allclose(track.distances, distances)
+
+
+def test_static_and_free_points():
+    stage = make_stage(2, 2)
+    UsdGeom.Xformable(stage.GetPrimAtPath("/World/Mesh_1")).AddTranslateOp().Set(Gf.Vec3d(0.0, 0.0, 10.0))
+    points = [("/World/Mesh_1", (1.0, 2.0, 3.0)), (None, (4.0, 5.0, 6.0)), ("/World/Missing", (7.0, 8.0, 9.0))]
+    world = evaluate_points(stage, points, track_times(0, 3))
+    assert world.shape == (4, 3, 3)
+    assert np.allclose(world, [(1.0, 2.0, 13.0), (4.0, 5.0, 6.0), (7.0, 8.0, 9.0)])
+    assert track_times(5, 2).tolist() == [5.0]
+
+
+def test_stale_snapshot_is_not_cached():
+    stage = make_stage(2, 2)
+    points = [("/World/Mesh_0", (0.0, 0.0, 0.0)), ("/World/Mesh_1", (1.0, 0.0, 0.0))]
+    cache = TrackCache(stage)
+    snapshot = cache.snapshot(points, 0, 10)
+    UsdGeom.Xformable(stage.GetPrimAtPath("/World/Mesh_1")).AddTranslateOp().Set(Gf.Vec3d(3.0, 0.0, 0.0))
+    assert cache.update()
+    cache.compute(snapshot)
+    assert cache.peek(points, 0, 10) is None
+
+    track = cache.get(points, 0, 10)
+    assert cache.peek(points, 0, 10) is track
+    assert np.allclose(track.minimum, 4.0) and track.closest_time.tolist() == [0.0]
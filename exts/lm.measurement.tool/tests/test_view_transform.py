@@ -0,0 +1,66 @@
+'''
+ViewTransformCache: screen_to_rays unprojects many positions at once exactly
+like the original per click Gf unprojection, and the camera matrices are only
+inverted again when the camera changes.
+'''
+
+from types import SimpleNamespace
+
+import numpy as np
+from pxr import Gf
+
+from fake_ui import CameraModel
+from lm.measurement.tool.view_transform import ViewTransformCache
+
+
+# Camera at eye, turned by the given Euler angles in degrees, as a scene view camera model
+def turned_camera(eye, angles, orthographic_height=None):
+    camera = CameraModel(orthographic_height=orthographic_height)
+    rotation = Gf.Matrix4d().SetRotate(
+        Gf.Rotation(Gf.Vec3d(1, 0, 0), angles[0])
+        * Gf.Rotation(Gf.Vec3d(0, 1, 0), angles[1])
+        * Gf.Rotation(Gf.Vec3d(0, 0, 1), angles[2])
+    )
+    camera_to_world = rotation * Gf.Matrix4d().SetTranslate(Gf.Vec3d(*eye))
+    view = camera_to_world.GetInverse()
+    return SimpleNamespace(view=[view[i][j] for i in range(4) for j in range(4)], projection=list(camera.projection))
+
+
+# The unprojection click_ray did per click before the cache, one position at a time through Gf
+def click_ray_reference(model, pos):
+    inv_proj = Gf.Matrix4d(*model.projection).GetInverse()
+    inv_view = Gf.Matrix4d(*model.view).GetInverse()
+    world_cam = Gf.Vec4d(inv_view[3][0], inv_view[3][1], inv_view[3][2], 1)
+    position = Gf.Vec4d(pos[0] * world_cam[2], pos[1] * world_cam[2], 1, 1)
+    world = position * inv_proj * inv_view
+    origin = (world[0] + world_cam[0], world[1] + world_cam[1], world[2] + world_cam[2])
+    forward = Gf.Vec3d(inv_view[2][0], inv_view[2][1], inv_view[2][2])
+    return np.array(origin), -np.array(forward)
+
+
+def test_screen_to_rays_matches_click_ray():
+    positions = np.random.default_rng(0).uniform(-1.0, 1.0, (50, 2))
+    for model in (
+        turned_camera((10.0, -20.0, 150.0), (20.0, -35.0, 10.0)),
+        turned_camera((0.0, 40.0, 80.0), (-60.0, 0.0, 45.0), orthographic_height=120.0),
+    ):
+        cache = ViewTransformCache(lambda: model, None)
+        origins, dirs = cache.screen_to_rays(positions)
+        for pos, origin, direction in zip(positions, origins, dirs):
+            expected_origin, expected_dir = click_ray_reference(model, pos)
+            assert np.allclose(origin, expected_origin, atol=1e-9)
+            assert np.allclose(direction, expected_dir, atol=1e-12)
+
+
+def test_camera_is_only_inverted_when_it_changes():
+    model = CameraModel(eye=(5.0, 5.0, 100.0))
+    cache = ViewTransformCache(lambda: model, None)
+    first = cache.camera()
+    cache.screen_to_rays([(0.1, 0.2), (0.3, -0.4)])
+    cache.screen_to_rays([(0.5, 0.5)])
+    assert cache.camera() is first and cache.camera_updates == 1
+
+    model.view = type(model.view)([1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, -5.0, -5.0, -90.0, 1])
+    origins, _ = cache.screen_to_rays([(0.0, 0.0)])
+    assert cache.camera_updates == 2
+    assert np.allclose(origins[0][:2], (5.0, 5.0))